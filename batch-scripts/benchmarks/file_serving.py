@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Compare the throughput of Paste's FileApp and MediaDrop's FileServer for
+concurrent range requests (like video players seeking in a file).
+
+Each thread sends requests for random ranges of a temporary file: half of
+them are open-ended (``bytes=N-``, sent via ``wsgi.file_wrapper`` if
+``--file-wrapper`` is given), the others read ``--range-size`` bytes.
+
+    python batch-scripts/benchmarks/file_serving.py --threads 8 --requests 500
+"""
+
+from optparse import OptionParser
+import os
+import random
+import tempfile
+import threading
+import time
+
+from paste.fileapp import FileApp
+
+from mediadrop.lib.file_serving import file_info, FileServer
+
+
+class FileWrapper(object):
+    """Stand-in for the server's wsgi.file_wrapper."""
+    def __init__(self, file, block_size=8192):
+        self.file = file
+        self.block_size = block_size
+
+    def __iter__(self):
+        return iter(lambda: self.file.read(self.block_size), '')
+
+    def close(self):
+        self.file.close()
+
+def create_file(size_mb):
+    fd, path = tempfile.mkstemp()
+    block = os.urandom(1024 * 1024)
+    for i in range(size_mb):
+        os.write(fd, block)
+    os.close(fd)
+    return path
+
+def random_range(size, range_size):
+    start = random.randint(0, size - 1)
+    if random.random() < 0.5:
+        return 'bytes=%d-' % start
+    return 'bytes=%d-%d' % (start, start + range_size - 1)
+
+def request(app, range_header, file_wrapper):
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': '/',
+        'SCRIPT_NAME': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'HTTP_RANGE': range_header,
+        'wsgi.url_scheme': 'http',
+    }
+    if file_wrapper:
+        environ['wsgi.file_wrapper'] = FileWrapper
+    body = app(environ, lambda status, headers: None)
+    nr_bytes = 0
+    for data in body:
+        nr_bytes += len(data)
+    if hasattr(body, 'close'):
+        body.close()
+    return nr_bytes
+
+def run(label, create_app, path, options):
+    size = os.stat(path).st_size
+    transferred = [0]
+    lock = threading.Lock()
+    def worker():
+        nr_bytes = 0
+        for i in range(options.requests):
+            range_header = random_range(size, options.range_size)
+            nr_bytes += request(create_app(), range_header, options.file_wrapper)
+        with lock:
+            transferred[0] += nr_bytes
+
+    threads = [threading.Thread(target=worker) for i in range(options.threads)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.time() - start
+    nr_requests = options.threads * options.requests
+    print '%-12s %8.1f requests/s %8.1f MB/s' % (label,
+        nr_requests / duration, transferred[0] / duration / 1024**2)
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--size', dest='size', type='int', default=64,
+        help='Size of the served file in MB (default: %default)')
+    parser.add_option('--threads', dest='threads', type='int', default=8)
+    parser.add_option('--requests', dest='requests', type='int', default=200,
+        help='Requests per thread (default: %default)')
+    parser.add_option('--range-size', dest='range_size', type='int',
+        default=256 * 1024)
+    parser.add_option('--file-wrapper', dest='file_wrapper',
+        action='store_true', default=False)
+    options, args = parser.parse_args()
+
+    path = create_file(options.size)
+    try:
+        run('FileApp', lambda: FileApp(path, content_type='video/mp4'),
+            path, options)
+        run('FileServer', lambda: FileServer(file_info(path), 'video/mp4'),
+            path, options)
+    finally:
+        os.remove(path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Compare the LIKE search fallback with the inverted index search backend.
+
+Creates media with random titles and descriptions, builds the inverted
+index and reports how many searches per second each strategy can handle
+(including the final query for the matching media rows).
+
+    python batch-scripts/benchmarks/search.py --media 20000 \
+        --url sqlite:////tmp/search.sqlite
+"""
+
+from optparse import OptionParser
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, sql
+
+from mediadrop.lib.search.inverted_index import InvertedIndex
+from mediadrop.model.media import media
+from mediadrop.model.meta import metadata
+
+
+def random_text(vocabulary, nr_words):
+    # word frequencies roughly follow Zipf's law
+    return u' '.join(vocabulary[int(random.paretovariate(1.0)) % len(vocabulary)]
+                     for i in range(nr_words))
+
+def create_media(engine, nr_media, vocabulary):
+    metadata.create_all(bind=engine)
+    engine.execute(media.delete())
+    rows = [dict(id=i, slug=u'media-%d' % i, title=random_text(vocabulary, 5),
+                 description_plain=random_text(vocabulary, 80),
+                 author_name=u'Joe', author_email=u'joe@site.example')
+            for i in range(1, nr_media+1)]
+    engine.execute(media.insert(), rows)
+
+def build_index(engine, filename):
+    index = InvertedIndex(filename)
+    rows = engine.execute(sql.select([media.c.id, media.c.title,
+        media.c.description_plain]))
+    index.rebuild((id, dict(title=title, description=description))
+                  for id, title, description in rows)
+    return index
+
+def like_search(engine, term, limit):
+    pattern = '%%%s%%' % term
+    query = sql.select([media.c.id],
+        sql.or_(media.c.title.ilike(pattern),
+                media.c.description_plain.ilike(pattern))).limit(limit)
+    return engine.execute(query).fetchall()
+
+def index_search(engine, index, term, limit):
+    results = index.search(term, ('title', 'description'), limit=limit)
+    if not results:
+        return []
+    media_ids = [media_id for media_id, score in results]
+    return engine.execute(sql.select([media.c.id],
+        media.c.id.in_(media_ids))).fetchall()
+
+def run(label, func, terms):
+    start = time.time()
+    for term in terms:
+        func(term)
+    duration = time.time() - start
+    print '%-20s %8.1f searches/s' % (label, len(terms) / duration)
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--url', dest='url', default='sqlite:////tmp/mediadrop-search.sqlite',
+        help='SQLAlchemy database URL (default: %default)')
+    parser.add_option('--media', dest='media', type='int', default=10000)
+    parser.add_option('--searches', dest='searches', type='int', default=200)
+    parser.add_option('--vocabulary', dest='vocabulary', type='int', default=5000)
+    parser.add_option('--limit', dest='limit', type='int', default=50)
+    options, args = parser.parse_args()
+
+    vocabulary = [u'word%d' % i for i in range(options.vocabulary)]
+    engine = create_engine(options.url)
+    create_media(engine, options.media, vocabulary)
+
+    fd, index_file = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+    try:
+        start = time.time()
+        index = build_index(engine, index_file)
+        print 'indexed %d media in %.1fs' % (index.document_count(),
+            time.time() - start)
+
+        terms = [random.choice(vocabulary) for i in range(options.searches)]
+        run('LIKE', lambda term: like_search(engine, term, options.limit), terms)
+        run('inverted index', lambda term: index_search(engine, index, term,
+            options.limit), terms)
+    finally:
+        os.remove(index_file)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Compare template rendering with auto reload (and a cache for 100 templates)
+with the production mode of the TemplateLoader.
+
+Creates a number of page templates which include a layout and a few shared
+partials (like MediaDrop's templates do) and renders them round-robin from
+several threads. With more pages than cache slots the LRU cache has to
+reparse templates all the time.
+
+    python batch-scripts/benchmarks/templates.py --pages 150 --threads 4
+"""
+
+from optparse import OptionParser
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from mediadrop.lib.templating import TemplateLoader
+
+
+PAGE = u"""<html xmlns="http://www.w3.org/1999/xhtml"
+      xmlns:py="http://genshi.edgewall.org/"
+      xmlns:xi="http://www.w3.org/2001/XInclude" py:strip="">
+  <xi:include href="layout.html" />
+  <xi:include href="helpers/media.html" />
+  <xi:include href="helpers/pager.html" />
+  <head><title>Page %(nr)d</title></head>
+  <body>
+    <h1>Page %(nr)d</h1>
+    ${media_list(items)}
+    ${pager(3, 10)}
+  </body>
+</html>
+"""
+
+LAYOUT = u"""<html xmlns="http://www.w3.org/1999/xhtml"
+      xmlns:py="http://genshi.edgewall.org/" py:strip="">
+  <py:match path="body" once="true">
+    <body><div id="content">${select('*|text()')}</div></body>
+  </py:match>
+</html>
+"""
+
+MEDIA_HELPER = u"""<html xmlns="http://www.w3.org/1999/xhtml"
+      xmlns:py="http://genshi.edgewall.org/" py:strip="">
+  <ul py:def="media_list(items)">
+    <li py:for="item in items"><a href="/media/${item}">Media ${item}</a></li>
+  </ul>
+</html>
+"""
+
+PAGER_HELPER = u"""<html xmlns="http://www.w3.org/1999/xhtml"
+      xmlns:py="http://genshi.edgewall.org/" py:strip="">
+  <div py:def="pager(page, page_count)" class="pager">
+    <a py:for="nr in range(1, page_count + 1)" href="?page=${nr}"
+       class="${nr == page and 'active' or None}">${nr}</a>
+  </div>
+</html>
+"""
+
+def create_templates(directory, nr_pages):
+    files = {
+        'layout.html': LAYOUT,
+        'helpers/media.html': MEDIA_HELPER,
+        'helpers/pager.html': PAGER_HELPER,
+    }
+    for nr in range(nr_pages):
+        files['pages/page%d.html' % nr] = PAGE % dict(nr=nr)
+    for name, content in files.items():
+        path = os.path.join(directory, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        template_file = open(path, 'wb')
+        template_file.write(content.encode('utf-8'))
+        template_file.close()
+    return ['pages/page%d.html' % nr for nr in range(nr_pages)]
+
+def render_all(loader, names, renders, nr_threads):
+    items = range(20)
+    def worker():
+        for i in range(renders // nr_threads):
+            name = names[i % len(names)]
+            loader.load(name).generate(items=items).render('xhtml', encoding=None)
+    threads = [threading.Thread(target=worker) for i in range(nr_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def run(label, loader, names, options, precompile_dirs=None):
+    if precompile_dirs:
+        start = time.time()
+        loader.precompile(precompile_dirs)
+        print '%-24s precompiled in %.2fs' % (label, time.time() - start)
+    start = time.time()
+    render_all(loader, names, options.renders, options.threads)
+    duration = time.time() - start
+    print '%-24s %8.0f renders/s' % (label, options.renders / duration)
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--pages', dest='pages', type='int', default=150,
+        help='Number of page templates (default: %default)')
+    parser.add_option('--renders', dest='renders', type='int', default=3000)
+    parser.add_option('--threads', dest='threads', type='int', default=4)
+    options, args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        names = create_templates(directory, options.pages)
+        run('auto reload, cache 100',
+            TemplateLoader(search_path=[directory], auto_reload=True,
+                           max_cache_size=100),
+            names, options)
+        run('production',
+            TemplateLoader(search_path=[directory], auto_reload=False,
+                           max_cache_size=0),
+            names, options)
+        run('production, precompiled',
+            TemplateLoader(search_path=[directory], auto_reload=False,
+                           max_cache_size=0),
+            names, options, precompile_dirs=[('', directory)])
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Compare generating the StorageURIs of media files for every call with the
+per-request and the shared URI cache.
+
+Simulates a listing page with 50 media (each with two local files) which
+needs the URIs four times per media (player selection, player markup,
+podcast file, download link), like MediaDrop's templates do. Every page is
+a new request.
+
+    python batch-scripts/benchmarks/uris.py --media 50 --pages 200
+"""
+
+from optparse import OptionParser
+import shutil
+import tempfile
+import time
+
+from pylons import request
+
+from mediadrop.lib.storage import LocalFileStorage
+from mediadrop.lib.test.support import (fake_request,
+    setup_environment_and_database)
+from mediadrop.lib.uri_cache import REQUEST_CACHE, use_shared_uri_cache
+from mediadrop.model import DBSession, Media, MediaFile
+from mediadrop.websetup import add_default_data
+
+
+USES_PER_PAGE = 4
+
+def create_media(nr_media):
+    storage = DBSession.query(LocalFileStorage).first()
+    media = []
+    for i in range(nr_media):
+        item = Media.example(title=u'Media %d' % i)
+        for container in ('mp4', 'webm'):
+            media_file = MediaFile()
+            media_file.media = item
+            media_file.storage = storage
+            media_file.type = u'video'
+            media_file.container = container
+            media_file.display_name = u'media-%d.%s' % (i, container)
+            media_file.unique_id = u'%d-media.%s' % (i, container)
+            DBSession.add(media_file)
+        media.append(item)
+    DBSession.commit()
+    return media
+
+def uncached_uris(item):
+    uris = []
+    for media_file in item.files:
+        uris.extend(media_file.storage.get_uris(media_file))
+    return uris
+
+def render_page(media, get_uris):
+    # a new request starts with an empty per-request cache
+    request.environ.pop(REQUEST_CACHE, None)
+    for item in media:
+        for i in range(USES_PER_PAGE):
+            get_uris(item)
+
+def run(label, media, get_uris, nr_pages):
+    render_page(media, get_uris)
+    start = time.time()
+    for i in range(nr_pages):
+        render_page(media, get_uris)
+    duration = time.time() - start
+    print '%-20s %8.1f pages/s' % (label, nr_pages / duration)
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--media', dest='media', type='int', default=50,
+        help='Number of media on the listing page (default: %default)')
+    parser.add_option('--pages', dest='pages', type='int', default=200)
+    options, args = parser.parse_args()
+
+    env_dir = tempfile.mkdtemp()
+    try:
+        pylons_config = setup_environment_and_database(env_dir)
+        add_default_data()
+        DBSession.commit()
+        fake_request(pylons_config)
+        media = create_media(options.media)
+
+        run('uncached', media, uncached_uris, options.pages)
+        run('per request', media, Media.get_uris, options.pages)
+        use_shared_uri_cache(True)
+        run('shared', media, Media.get_uris, options.pages)
+    finally:
+        shutil.rmtree(env_dir)
+
+if __name__ == '__main__':
+    main()
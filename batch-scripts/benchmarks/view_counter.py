@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Compare per-request view counting with the write-behind view counter.
+
+Simulates a number of page views spread over a few "hot" media items and
+reports how many views and database commits per second each strategy needs.
+
+    python batch-scripts/benchmarks/view_counter.py --views 20000 \
+        --url sqlite:////tmp/views.sqlite
+"""
+
+from optparse import OptionParser
+import random
+import time
+
+from sqlalchemy import create_engine, event
+
+from mediadrop.lib.view_counter import MemoryViewCountSpool, ViewCounter
+from mediadrop.model.media import media
+from mediadrop.model.meta import metadata
+
+
+def count_commits(engine):
+    commits = [0]
+    def on_commit(connection):
+        commits[0] += 1
+    event.listen(engine, 'commit', on_commit)
+    return commits
+
+def create_media(engine, nr_media):
+    metadata.create_all(bind=engine)
+    engine.execute(media.delete())
+    rows = [dict(id=i, slug=u'media-%d' % i, title=u'Media %d' % i,
+                 author_name=u'Joe', author_email=u'joe@site.example')
+            for i in range(1, nr_media+1)]
+    engine.execute(media.insert(), rows)
+
+def per_request_update(engine, media_ids):
+    for media_id in media_ids:
+        connection = engine.connect()
+        transaction = connection.begin()
+        connection.execute(media.update()\
+            .values(views=media.c.views + 1)\
+            .where(media.c.id == media_id))
+        transaction.commit()
+        connection.close()
+
+def write_behind(engine, media_ids, flush_threshold):
+    counter = ViewCounter(MemoryViewCountSpool(), bind=engine,
+        flush_threshold=flush_threshold)
+    for media_id in media_ids:
+        counter.increment(media_id)
+    counter.flush()
+
+def run(label, func, engine, *args):
+    commits = count_commits(engine)
+    start = time.time()
+    func(engine, *args)
+    duration = time.time() - start
+    nr_views = len(args[0])
+    print '%-20s %8.0f views/s %8.1f commits/s (%d commits)' % (label,
+        nr_views / duration, commits[0] / duration, commits[0])
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--url', dest='url', default='sqlite:////tmp/mediadrop-views.sqlite',
+        help='SQLAlchemy database URL (default: %default)')
+    parser.add_option('--views', dest='views', type='int', default=10000)
+    parser.add_option('--media', dest='media', type='int', default=50)
+    parser.add_option('--threshold', dest='threshold', type='int', default=100)
+    options, args = parser.parse_args()
+
+    engine = create_engine(options.url)
+    create_media(engine, options.media)
+    # most views go to a few popular items
+    media_ids = [int(random.paretovariate(1.2)) % options.media + 1
+                 for i in range(options.views)]
+
+    run('per request UPDATE', per_request_update, engine, media_ids)
+    run('write-behind', write_behind, engine, media_ids, options.threshold)
+
+    total = engine.execute('SELECT SUM(views) FROM %s' % media.name).scalar()
+    assert total == 2 * options.views, 'lost views: %r' % total
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from mediadrop.lib.cli_commands import LoadAppCommand, load_app
+
+_script_name = "Sitemap Generation Script"
+_script_description = """Use this script to pre-generate the Google video
+sitemap and the MediaRSS sitemap on disk.
+
+Specify your ini config file as the first argument to this script. The files
+are written to the directory configured as 'sitemaps.static_dir' and served
+from there by MediaDrop. Run this script regularly (e.g. from cron) to
+refresh the sitemaps."""
+
+if __name__ == "__main__":
+    cmd = LoadAppCommand(_script_name, _script_description)
+    cmd.parser.add_option('--server-name',
+        dest='server_name',
+        help='Host name (and port) used for the URLs in the sitemaps, e.g. "media.site.example".',
+        default=None
+    )
+    cmd.parser.add_option('--limit',
+        dest='limit',
+        type='int',
+        help='Maximum number of media per sitemap page (default: %default).',
+        default=10000
+    )
+    load_app(cmd)
+
+# BEGIN SCRIPT & SCRIPT SPECIFIC IMPORTS
+import sys
+
+from pylons import config, request
+
+from mediadrop.lib.auth.permission_system import MediaDropPermissionSystem
+from mediadrop.lib.sitemaps import write_static_sitemaps
+from mediadrop.lib.test import fake_request
+from mediadrop.model import DBSession
+
+
+def main(parser, options, args):
+    static_dir = config.get('sitemaps.static_dir')
+    if not static_dir:
+        print >> sys.stderr, "Please set 'sitemaps.static_dir' in your ini file."
+        sys.exit(1)
+    if not options.server_name:
+        parser.print_help()
+        sys.exit(1)
+
+    fake_request(config, server_name=options.server_name,
+        registry=config['paste.registry'])
+    # sitemaps contain only media which anonymous visitors can view
+    request.perm = MediaDropPermissionSystem.permissions_for_request(
+        request.environ, config)
+    try:
+        filenames = write_static_sitemaps(static_dir, limit=options.limit)
+    finally:
+        DBSession.remove()
+    for filename in filenames:
+        print 'wrote %s' % filename
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main(cmd.parser, cmd.options, cmd.args)
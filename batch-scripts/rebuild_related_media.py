@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from mediadrop.lib.cli_commands import LoadAppCommand, load_app
+
+_script_name = "Related Media Rebuild Script"
+_script_description = """Use this script to (re)compute the related media of all
+published media.
+
+Specify your ini config file as the first argument to this script. The
+script is only needed if 'related_media.precomputed' is enabled. Changed
+media are only compared to media with a common tag or category, run this
+script regularly (e.g. nightly from cron) to recompute all lists."""
+
+if __name__ == "__main__":
+    cmd = LoadAppCommand(_script_name, _script_description)
+    cmd.parser.add_option('--batch-size',
+        dest='batch_size',
+        type='int',
+        help='Number of media processed per batch (default: %default).',
+        default=500
+    )
+    load_app(cmd)
+
+# BEGIN SCRIPT & SCRIPT SPECIFIC IMPORTS
+import sys
+
+from mediadrop.lib.related_media import rebuild_related_media
+from mediadrop.model import DBSession
+
+
+def print_progress(done, total):
+    print 'processed %d/%d media' % (done, total)
+
+def main(parser, options, args):
+    try:
+        rebuild_related_media(batch_size=options.batch_size,
+            progress=print_progress)
+        DBSession.commit()
+    finally:
+        DBSession.remove()
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main(cmd.parser, cmd.options, cmd.args)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from mediadrop.lib.cli_commands import LoadAppCommand, load_app
+
+_script_name = "Search Index Rebuild Script"
+_script_description = """Use this script to (re)build the search index for all
+media.
+
+Specify your ini config file as the first argument to this script. The
+script is only needed if 'search.backend = index' is configured. Afterwards
+the index is updated automatically whenever media are changed."""
+
+if __name__ == "__main__":
+    cmd = LoadAppCommand(_script_name, _script_description)
+    load_app(cmd)
+
+# BEGIN SCRIPT & SCRIPT SPECIFIC IMPORTS
+import sys
+
+from pylons import config
+
+from mediadrop.lib.search import setup_search_backend
+from mediadrop.model import DBSession, Media
+
+
+def main(parser, options, args):
+    backend = setup_search_backend(config)
+    if not backend.uses_index:
+        print >> sys.stderr, "The search backend %r does not use an index." % \
+            backend.backend_type
+        sys.exit(1)
+    try:
+        backend.rebuild_index(Media.query)
+        print 'indexed %d media' % backend.index.document_count()
+    finally:
+        DBSession.remove()
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main(cmd.parser, cmd.options, cmd.args)
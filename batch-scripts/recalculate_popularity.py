@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from mediadrop.lib.cli_commands import LoadAppCommand, load_app
+
+_script_name = "Popularity Recalculation Script"
+_script_description = """Use this script to recalculate the popularity points
+of all media with the current popularity settings.
+
+Specify your ini config file as the first argument to this script. Saving the
+popularity settings in the admin panel does the same but running this script
+(e.g. from cron) does not block a web request on large media libraries."""
+
+if __name__ == "__main__":
+    cmd = LoadAppCommand(_script_name, _script_description)
+    cmd.parser.add_option('--chunk-size',
+        dest='chunk_size',
+        type='int',
+        help='Number of media updated per chunk (default: %default).',
+        default=500
+    )
+    load_app(cmd)
+
+# BEGIN SCRIPT & SCRIPT SPECIFIC IMPORTS
+import sys
+
+from mediadrop.lib.popularity import recalculate_popularity
+from mediadrop.lib.settings_store import Settings
+from mediadrop.model import DBSession, Setting
+
+
+def print_progress(done, total):
+    print 'updated %d/%d media' % (done, total)
+
+def main(parser, options, args):
+    settings = Settings(DBSession.query(Setting.key, Setting.value))
+    try:
+        recalculate_popularity(settings, chunk_size=options.chunk_size,
+            progress=print_progress)
+        DBSession.commit()
+    finally:
+        DBSession.remove()
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main(cmd.parser, cmd.options, cmd.args)
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from mediadrop.lib.cli_commands import LoadAppCommand, load_app
+
+_script_name = "Counter Reconciliation Script"
+_script_description = """Use this script to recount the stored media counts of
+all tags and categories and the comment counts of all media.
+
+Specify your ini config file as the first argument to this script. The
+counters are updated automatically when media or comments are changed but
+published counts also change when media reach their publish date. Run this
+script regularly (e.g. from cron) if 'counters.materialized' is enabled."""
+
+if __name__ == "__main__":
+    cmd = LoadAppCommand(_script_name, _script_description)
+    load_app(cmd)
+
+# BEGIN SCRIPT & SCRIPT SPECIFIC IMPORTS
+import sys
+
+from mediadrop.model import DBSession, reconcile_counters
+
+
+def main(parser, options, args):
+    try:
+        reconcile_counters()
+        DBSession.commit()
+    finally:
+        DBSession.remove()
+    print 'recounted all counters'
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main(cmd.parser, cmd.options, cmd.args)
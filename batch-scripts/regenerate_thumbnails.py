@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from mediadrop.lib.cli_commands import LoadAppCommand, load_app
+
+_script_name = "Thumbnail Regeneration Script"
+_script_description = """Use this script to regenerate the thumbnails of all
+media and podcasts from their original images (e.g. after changing the
+'thumb_sizes').
+
+Specify your ini config file as the first argument to this script.
+Thumbnails which are newer than the original image and have the configured
+size are skipped unless --force is given. Items without an original image
+(e.g. with default thumbnails) are not changed."""
+
+if __name__ == "__main__":
+    cmd = LoadAppCommand(_script_name, _script_description)
+    cmd.parser.add_option('--processes',
+        dest='processes',
+        type='int',
+        help='Number of worker processes (default: number of CPUs).',
+        default=None,
+    )
+    cmd.parser.add_option('--force',
+        action='store_true',
+        dest='force',
+        help='Regenerate all thumbnails, even if they are up to date.',
+        default=False,
+    )
+    load_app(cmd)
+
+# BEGIN SCRIPT & SCRIPT SPECIFIC IMPORTS
+import sys
+import time
+
+from mediadrop.lib.thumbnails import regenerate_thumbs
+from mediadrop.model import DBSession, Media, Podcast
+
+
+def print_progress(done, total):
+    if done % 100 == 0 or done == total:
+        print '  processed %d/%d' % (done, total)
+
+def main(parser, options, args):
+    exit_code = 0
+    try:
+        for item_cls in (Media, Podcast):
+            image_dir = item_cls._thumb_dir
+            item_ids = [item_id for item_id, in DBSession.query(item_cls.id)]
+            print '%s:' % image_dir
+            start = time.time()
+            stats = regenerate_thumbs(image_dir, item_ids,
+                processes=options.processes, force=options.force,
+                progress=print_progress)
+            duration = max(time.time() - start, 0.001)
+            print '  %d items, %d without original image, %d up to date' % \
+                (stats['items'], stats['missing'], stats['skipped'])
+            print '  regenerated %d items (%d thumbnails) in %.1fs: ' \
+                '%.1f items/s, %.1f thumbnails/s' % (stats['regenerated'],
+                stats['thumbs'], duration, stats['regenerated'] / duration,
+                stats['thumbs'] / duration)
+            for orig_path, error in stats['errors']:
+                print '  error: %s: %s' % (orig_path, error)
+                exit_code = 1
+    finally:
+        DBSession.remove()
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main(cmd.parser, cmd.options, cmd.args)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from mediadrop.lib.cli_commands import LoadAppCommand, load_app
+
+_script_name = "Background Job Worker"
+_script_description = """Use this script to run queued background jobs
+(thumbnail downloads, post-processing and transcoding of new media files,
+updates of the precomputed related media).
+
+Specify your ini config file as the first argument to this script. The
+script is only needed if 'background_jobs.enabled' is set. Run it as a
+service (it processes the queue until it is stopped), start several
+instances to work on several jobs in parallel."""
+
+if __name__ == "__main__":
+    cmd = LoadAppCommand(_script_name, _script_description)
+    cmd.parser.add_option('--once',
+        action='store_true',
+        dest='once',
+        help='Run all due jobs and exit.',
+        default=False,
+    )
+    cmd.parser.add_option('--poll-interval',
+        dest='poll_interval',
+        type='int',
+        help='Seconds to wait when the queue is empty (default: %default).',
+        default=5,
+    )
+    cmd.parser.add_option('--retry-failed',
+        action='store_true',
+        dest='retry_failed',
+        help='Queue all failed jobs again before starting.',
+        default=False,
+    )
+    cmd.parser.add_option('--keep-days',
+        dest='keep_days',
+        type='int',
+        help='Delete finished jobs after this many days (default: %default).',
+        default=7,
+    )
+    load_app(cmd)
+
+# BEGIN SCRIPT & SCRIPT SPECIFIC IMPORTS
+import sys
+
+from mediadrop.lib.jobs import (delete_finished_jobs, JobWorker,
+    retry_failed_jobs)
+# registers the handlers for the jobs of new media files and related media
+import mediadrop.lib.related_media
+import mediadrop.lib.storage.jobs
+from mediadrop.model import DBSession
+
+
+def main(parser, options, args):
+    worker = JobWorker()
+    try:
+        if options.retry_failed:
+            print 'queued %d failed jobs again' % retry_failed_jobs()
+        delete_finished_jobs(days=options.keep_days)
+        DBSession.commit()
+        if options.once:
+            worker.requeue_stale_jobs()
+            print 'ran %d jobs' % worker.run_pending()
+        else:
+            worker.run_forever(poll_interval=options.poll_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        DBSession.remove()
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main(cmd.parser, cmd.options, cmd.args)
@@ -11,15 +11,20 @@ import os
 from formencode.api import get_localedir as get_formencode_localedir
 from genshi.filters.i18n import Translator
 import pylons
+from paste.deploy.converters import asbool, asint
 from pylons.configuration import PylonsConfig
 from sqlalchemy import engine_from_config
 
 from mediadrop.lib.app_globals import Globals
 import mediadrop.lib.helpers
+from mediadrop.lib.jobs import use_background_jobs
+from mediadrop.lib.related_media import use_precomputed_related_media
+from mediadrop.lib.uri_cache import use_shared_uri_cache
 
 from mediadrop.config.routing import create_mapper, add_routes
 from mediadrop.lib.templating import TemplateLoader
-from mediadrop.model import Media, Podcast, init_model
+from mediadrop.model import (Media, Podcast, init_model,
+    use_materialized_counters)
 from mediadrop.plugin import PluginManager, events
 
 def load_environment(global_conf, app_conf):
@@ -66,17 +71,34 @@ def load_environment(global_conf, app_conf):
         translations = Translator(pylons.translator)
         translations.setup(template)
 
-    # Create the Genshi TemplateLoader
+    # Create the Genshi TemplateLoader. Checking every template file for
+    # changes on each render is only useful during development.
+    auto_reload = asbool(config.get('templates.auto_reload', config['debug']))
     globals_.genshi_loader = TemplateLoader(
         search_path=paths['templates'] + plugin_mgr.template_loaders(),
-        auto_reload=True,
-        max_cache_size=100,
+        auto_reload=auto_reload,
+        max_cache_size=asint(config.get('templates.max_cache_size', 0)),
         callback=enable_i18n_for_template,
     )
+    if asbool(config.get('templates.precompile', False)):
+        template_dirs = [('', path) for path in paths['templates']]
+        for name, plugin in plugin_mgr.plugins.iteritems():
+            if plugin.templates_path:
+                template_dirs.append((name + '/', plugin.templates_path))
+        globals_.genshi_loader.precompile(template_dirs)
 
     # Setup the SQLAlchemy database engine
     engine = engine_from_config(config, 'sqlalchemy.')
     init_model(engine, config.get('db_table_prefix', None))
+    if asbool(config.get('counters.materialized', False)):
+        use_materialized_counters()
+    use_precomputed_related_media(
+        asbool(config.get('related_media.precomputed', False)))
+    use_shared_uri_cache(asbool(config.get('uri_cache.shared', False)),
+        expire=asint(config.get('uri_cache.expire', 3600)))
+    use_background_jobs(asbool(config.get('background_jobs.enabled', False)),
+        max_attempts=asint(config.get('background_jobs.max_attempts', 5)),
+        retry_delay=asint(config.get('background_jobs.retry_delay', 60)))
     events.Environment.init_model()
 
     # CONFIGURATION OPTIONS HERE (note: all config options will override
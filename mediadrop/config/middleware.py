@@ -19,6 +19,7 @@ from paste.registry import RegistryManager
 from paste.response import header_value, remove_header
 from paste.urlmap import URLMap
 from paste.urlparser import StaticURLParser
+from paste.wsgilib import add_close
 from paste.deploy.converters import asbool
 from paste.deploy.config import PrefixMiddleware
 from pylons.middleware import ErrorHandler, StatusCodeRedirect
@@ -33,6 +34,7 @@ import tw.api
 from mediadrop import monkeypatch_method
 from mediadrop.config.environment import load_environment
 from mediadrop.lib.auth import add_auth
+from mediadrop.lib.settings_store import Settings
 from mediadrop.migrations.util import MediaDropMigrator
 from mediadrop.model import metadata, DBSession
 from mediadrop.plugin import events
@@ -56,9 +58,9 @@ class PylonsApp(_PylonsApp):
             # This is a dummy request, probably used inside a test or to build
             # documentation, so we're not guaranteed to have a database
             # connection with which to get the settings.
-            request.settings = {
+            request.settings = Settings({
                 'intentionally_empty': 'see mediadrop.config.middleware',
-            }
+            })
         else:
             request.settings = self.globals.settings
 
@@ -74,15 +76,24 @@ def setup_prefix_middleware(app, global_conf, proxy_prefix):
     return app
 
 class DBSessionRemoverMiddleware(object):
-    """Ensure the contextual session ends at the end of the request."""
+    """Ensure the contextual session ends at the end of the request.
+
+    Streamed responses (e.g. sitemaps) may still query the database while
+    the response is iterated so the session is removed when the response
+    is closed in that case."""
     def __init__(self, app):
         self.app = app
 
     def __call__(self, environ, start_response):
         try:
-            return self.app(environ, start_response)
-        finally:
+            app_iter = self.app(environ, start_response)
+        except:
             DBSession.remove()
+            raise
+        if isinstance(app_iter, (list, tuple)):
+            DBSession.remove()
+            return app_iter
+        return add_close(app_iter, DBSession.remove)
 
 class FastCGIScriptStripperMiddleware(object):
     """Strip the given fcgi_script_name from the end of environ['SCRIPT_NAME'].
@@ -169,14 +180,23 @@ class DBSanityCheckingMiddleware(object):
 
     def __call__(self, environ, start_response):
         try:
-            return self.app(environ, start_response)
-        finally:
-            leaked_connections = len(self.connections)
-            if leaked_connections > 0:
-                msg = 'DB connection leakage detected: ' + \
-                    '%d db connection(s) not returned to the pool' % leaked_connections
-                log.error(msg)
-                self.connections.clear()
+            app_iter = self.app(environ, start_response)
+        except:
+            self.check_for_leaked_connections()
+            raise
+        if isinstance(app_iter, (list, tuple)):
+            self.check_for_leaked_connections()
+            return app_iter
+        # streamed response, connections are returned after the iteration
+        return add_close(app_iter, self.check_for_leaked_connections)
+
+    def check_for_leaked_connections(self):
+        leaked_connections = len(self.connections)
+        if leaked_connections > 0:
+            msg = 'DB connection leakage detected: ' + \
+                '%d db connection(s) not returned to the pool' % leaked_connections
+            log.error(msg)
+            self.connections.clear()
     
     def tear_down(self):
         pool = self._pool()
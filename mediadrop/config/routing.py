@@ -102,6 +102,11 @@ def add_routes(map):
         controller='media',
         action='serve',
         requirements={'id': r'\d+'})
+    map.connect('/thumbs/{image_dir}/{id}-{size}.{format}',
+        controller='thumbnails',
+        action='derive',
+        requirements={'image_dir': 'media|podcasts', 'id': r'\d+',
+                      'size': r'\d+x\d+|[a-z]+', 'format': r'[a-z]+'})
     map.connect('/upload/{action}',
         controller='upload',
         action='index')
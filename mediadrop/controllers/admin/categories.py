@@ -6,11 +6,12 @@
 # See LICENSE.txt in the main project directory, for more information.
 
 from pylons import request, tmpl_context
-from sqlalchemy import orm
 
 from mediadrop.forms.admin.categories import CategoryForm, CategoryRowForm
 from mediadrop.lib.auth import has_permission
 from mediadrop.lib.base import BaseController
+from mediadrop.lib.cache_tags import invalidate_cache_tags
+from mediadrop.lib.category_tree import category_tree, invalidate_category_tree
 from mediadrop.lib.decorators import (autocommit, expose, observable, paginate, 
     validate)
 from mediadrop.lib.helpers import redirect, url_for
@@ -42,13 +43,8 @@ class CategoriesController(BaseController):
                 The :class:`~mediadrop.forms.admin.settings.categories.CategoryForm` instance.
 
         """
-        categories = Category.query\
-            .order_by(Category.name)\
-            .options(orm.undefer('media_count'))\
-            .populated_tree()
-
         return dict(
-            categories = categories,
+            categories = category_tree().roots,
             category_form = category_form,
             category_row_form = category_row_form,
         )
@@ -164,6 +160,9 @@ class CategoriesController(BaseController):
         if type == 'delete':
             Category.query.filter(Category.id.in_(ids)).delete(False)
             DBSession.commit()
+            # Query.delete() does not trigger the mapper events
+            invalidate_cache_tags('categories')
+            invalidate_category_tree()
             success = True
         else:
             success = False
@@ -20,11 +20,13 @@ from mediadrop.forms.admin.media import AddFileForm, EditFileForm, MediaForm, Up
 from mediadrop.lib import helpers
 from mediadrop.lib.auth import has_permission
 from mediadrop.lib.base import BaseController
+from mediadrop.lib.category_tree import category_tree
 from mediadrop.lib.decorators import (autocommit, expose, expose_xhr,
     observable, paginate, validate, validate_xhr)
 from mediadrop.lib.helpers import redirect, url_for
 from mediadrop.lib.i18n import _
-from mediadrop.lib.storage import add_new_media_file, UserStorageError
+from mediadrop.lib.storage import (add_new_media_file, completed_upload,
+    handle_chunk_request, UserStorageError)
 from mediadrop.lib.templating import render
 from mediadrop.lib.thumbnails import thumb_path, thumb_paths, create_thumbs_for, create_default_thumbs_for, has_thumbs, has_default_thumbs, delete_thumbs
 from mediadrop.model import (Author, Category, Media, Podcast, Tag, fetch_row,
@@ -71,14 +73,8 @@ class MediaController(BaseController):
                 The podcast object for rendering if filtering by podcast.
 
         """
-        media = Media.query.options(orm.undefer('comment_count_published'))
-
-        if search:
-            media = media.admin_search(search)
-        else:
-            media = media.order_by_status()\
-                         .order_by(Media.publish_on.desc(),
-                                   Media.modified_on.desc())
+        media = Media.query.options(orm.undefer('comment_count_published'),
+            orm.undefer('jobs_pending'), orm.undefer('jobs_failed'))
 
         if not filter:
             pass
@@ -101,6 +97,14 @@ class MediaController(BaseController):
             podcast = fetch_row(Podcast, slug=podcast)
             media = media.filter(Media.podcast == podcast)
 
+        # search last so the filters above are applied to all matches
+        if search:
+            media = media.admin_search(search)
+        else:
+            media = media.order_by_status()\
+                         .order_by(Media.publish_on.desc(),
+                                   Media.modified_on.desc())
+
         return dict(
             media = media,
             search = search,
@@ -186,7 +190,7 @@ class MediaController(BaseController):
             media_form = media_form,
             media_action = url_for(action='save'),
             media_values = media_values,
-            category_tree = Category.query.order_by(Category.name).populated_tree(),
+            category_tree = category_tree().roots,
             file_add_form = add_file_form,
             file_add_action = url_for(action='add_file'),
             file_edit_form = edit_file_form,
@@ -255,15 +259,37 @@ class MediaController(BaseController):
             redirect(action='edit', id=media.id)
 
 
+    @expose('json')
+    @observable(events.Admin.MediaController.upload_chunk)
+    def upload_chunk(self, upload_id=None, offset=None, filename=None,
+                     size=None, **kwargs):
+        """Start, continue or check a chunked upload for :meth:`add_file`.
+
+        See :mod:`mediadrop.lib.storage.chunked_uploads` for the protocol.
+
+        :rtype: JSON dict
+        :returns:
+            success
+                bool
+            message
+                Error message, if unsuccessful
+            upload_id, offset, size, complete, checksum
+                The state of the upload.
+
+        """
+        max_size = request.settings.as_int('max_upload_size')
+        return handle_chunk_request(request, upload_id, offset, filename,
+            size, max_size=max_size)
+
     @expose('json', request_method='POST')
     @validate(add_file_form, error_handler=json_error)
     @autocommit
     @observable(events.Admin.MediaController.add_file)
-    def add_file(self, id, file=None, url=None, **kwargs):
+    def add_file(self, id, file=None, url=None, upload_id=None, **kwargs):
         """Save action for the :class:`~mediadrop.forms.admin.media.AddFileForm`.
 
         Creates a new :class:`~mediadrop.model.media.MediaFile` from the
-        uploaded file or the local or remote URL.
+        uploaded file, a completed chunked upload or the local or remote URL.
 
         :param id: Media ID. If ``"new"`` a new Media stub is created.
         :type id: :class:`int` or ``"new"``
@@ -271,6 +297,9 @@ class MediaController(BaseController):
         :type file: :class:`cgi.FieldStorage` or ``None``
         :param url: A URL to a recognizable audio or video file
         :type url: :class:`unicode` or ``None``
+        :param upload_id: The ID of a completed chunked upload, see
+            :meth:`upload_chunk`.
+        :type upload_id: :class:`unicode` or ``None``
         :rtype: JSON dict
         :returns:
             success
@@ -290,6 +319,12 @@ class MediaController(BaseController):
                 The rendered XHTML :class:`~mediadrop.forms.admin.media.UpdateStatusForm`
 
         """
+        if upload_id:
+            try:
+                file = completed_upload(upload_id)
+            except UserStorageError as e:
+                return dict(success=False, message=e.message)
+
         if id == 'new':
             media = Media()
             user = request.perm.user
@@ -537,6 +572,12 @@ class MediaController(BaseController):
                 important if a new media has just been created.
 
         """
+        if upload_id:
+            try:
+                file = completed_upload(upload_id)
+            except UserStorageError as e:
+                return dict(success=False, message=e.message)
+
         if id == 'new':
             media = Media()
             user = request.perm.user
@@ -19,7 +19,8 @@ from mediadrop.lib.base import BaseSettingsController
 from mediadrop.lib.decorators import autocommit, expose, observable, validate
 from mediadrop.lib.helpers import filter_vulgarity, redirect, url_for
 from mediadrop.lib.i18n import LanguageError, Translator
-from mediadrop.model import Comment, Media
+from mediadrop.lib.popularity import recalculate_popularity
+from mediadrop.model import Comment
 from mediadrop.model.meta import DBSession
 from mediadrop.plugin import events
 from mediadrop.websetup import appearance_settings, generate_appearance_css
@@ -151,9 +152,7 @@ class SettingsController(BaseSettingsController):
         # correctly.
         for key in ('popularity_decay_exponent', 'popularity_decay_lifetime'):
             request.settings[key] = kwargs['popularity.'+key]
-        for m in Media.query:
-            m.update_popularity()
-            DBSession.add(m)
+        recalculate_popularity(request.settings)
         redirect(action='popularity')
 
     @expose('admin/settings/upload.html')
@@ -5,9 +5,12 @@
 # (at your option) any later version.
 # See LICENSE.txt in the main project directory, for more information.
 
+import base64
+from datetime import datetime
+
 from decorator import decorator
-from paste.util.converters import asbool
 from pylons import request
+import simplejson
 from sqlalchemy import sql
 
 class APIException(Exception):
@@ -44,11 +47,56 @@ def get_order_by(order, columns):
 
     return order
 
+def encode_cursor(offset=None, keys=None, order=None):
+    """Return an opaque continuation token.
+
+    A cursor either contains the sort keys of the last returned item (so
+    the next page can be fetched by seeking past it) or a plain offset if
+    the ordering does not allow that (e.g. search relevance)."""
+    data = dict(order=order)
+    if keys is not None:
+        data['keys'] = [_encode_cursor_value(value) for value in keys]
+    else:
+        data['offset'] = offset
+    return base64.urlsafe_b64encode(simplejson.dumps(data)).rstrip('=')
+
+def decode_cursor(cursor):
+    """Return a dict with the 'order' and either 'keys' or 'offset' of the
+    given continuation token (see :func:`encode_cursor`).
+
+    :raises APIException: If the cursor is invalid.
+    """
+    try:
+        cursor = str(cursor)
+        padding = '=' * (-len(cursor) % 4)
+        data = simplejson.loads(base64.urlsafe_b64decode(cursor + padding))
+        if 'keys' in data:
+            data['keys'] = [_decode_cursor_value(value) for value in data['keys']]
+        else:
+            data['offset'] = int(data['offset'])
+            assert data['offset'] >= 0
+    except Exception:
+        raise APIException, 'Invalid cursor "%s"' % cursor
+    return data
+
+CURSOR_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+def _encode_cursor_value(value):
+    if isinstance(value, datetime):
+        return {'datetime': value.strftime(CURSOR_DATETIME_FORMAT)}
+    return value
+
+def _decode_cursor_value(value):
+    if isinstance(value, dict):
+        return datetime.strptime(value['datetime'], CURSOR_DATETIME_FORMAT)
+    assert isinstance(value, (int, long, basestring))
+    return value
+
 @decorator
 def require_api_key_if_necessary(func, *args, **kwargs):
     api_key = kwargs.get('api_key')
     
-    if asbool(request.settings['api_secret_key_required']) \
+    if request.settings.as_bool('api_secret_key_required') \
         and api_key != request.settings['api_secret_key']:
         return dict(error='Authentication Error')
     
@@ -150,8 +150,8 @@ class CategoriesController(BaseController):
         query = query.order_by(get_order_by(order, order_columns))
 
         start = int(offset)
-        limit = min(int(limit), int(request.settings['api_media_max_results']))
-        depth = min(int(depth), int(request.settings['api_tree_max_depth']))
+        limit = min(int(limit), request.settings.as_int('api_media_max_results'))
+        depth = min(int(depth), request.settings.as_int('api_tree_max_depth'))
 
         # get the total of all the matches
         count = query.count()
@@ -167,7 +167,7 @@ class CategoriesController(BaseController):
     def _get_query(self, id=None, name=None, slug=None, tree=False, depth=10, **kwargs):
         """Query for a specific category item by ID, name or slug and optionally expand the children of this category."""
         query = Category.query
-        depth = min(int(depth), int(request.settings['api_tree_max_depth']))
+        depth = min(int(depth), request.settings.as_int('api_tree_max_depth'))
 
         if id:
             query = query.filter_by(id=id)
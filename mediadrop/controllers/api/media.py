@@ -7,18 +7,23 @@
 
 import logging
 from datetime import datetime, timedelta
+import hashlib
 
 from paste.util.converters import asbool
 from pylons import app_globals, config, request, response, session, tmpl_context
 from sqlalchemy import orm, sql
 
-from mediadrop.controllers.api import APIException, get_order_by, require_api_key_if_necessary
+from mediadrop.controllers.api import (APIException, decode_cursor,
+    encode_cursor, get_order_by, require_api_key_if_necessary)
+from mediadrop.lib.auth.query_result_proxy import (keyset_from_clauses,
+    seek_condition)
 from mediadrop.lib import helpers
 from mediadrop.lib.base import BaseController
 from mediadrop.lib.decorators import expose, expose_xhr, observable, paginate, validate
 from mediadrop.lib.helpers import get_featured_category, url_for, url_for_media
-from mediadrop.lib.thumbnails import thumb
+from mediadrop.lib.thumbnails import ThumbTemplates
 from mediadrop.model import Category, Media, Podcast, Tag, fetch_row, get_available_slug
+from mediadrop.model.media import preload_relations
 from mediadrop.model.meta import DBSession
 from mediadrop.plugin import events
 
@@ -38,8 +43,18 @@ order_columns = {
     'comment_count': 'comment_count_published %s'
 }
 
+# Orderings which are unique (with the id as tie breaker) and never NULL for
+# published media so the next page can be fetched by seeking past the last
+# item instead of using an OFFSET.
+keyset_order_columns = ('id', 'slug', 'publish_on', 'duration', 'views',
+    'likes', 'popularity')
+
+COUNT_CACHE_EXPIRE = 60 * 5
+
 AUTHERROR = "Authentication Error"
 INVALIDFORMATERROR = "Invalid format (%s). Only json and mrss are supported"
+INVALIDCOUNTERROR = "Invalid count (%s). Only exact, estimate and none are supported"
+INVALIDCURSORERROR = "Invalid cursor. Cursors are only valid for the same order"
 
 class MediaController(BaseController):
     """
@@ -52,7 +67,8 @@ class MediaController(BaseController):
     def index(self, type=None, podcast=None, tag=None, category=None, search=None,
               max_age=None, min_age=None, order=None, offset=0, limit=10,
               published_after=None, published_before=None, featured=False,
-              id=None, slug=None, include_embed=False, format="json", **kwargs):
+              id=None, slug=None, include_embed=False, format="json",
+              count="exact", cursor=None, **kwargs):
         """Query for a list of media.
 
         :param type:
@@ -104,7 +120,7 @@ class MediaController(BaseController):
             Where in the complete resultset to start returning results.
             Defaults to 0, the very beginning. This is useful if you've
             already fetched the first 50 results and want to fetch the
-            next 50 and so on.
+            next 50 and so on. For large offsets use the cursor instead.
         :type offset: int
 
         :param limit:
@@ -133,6 +149,20 @@ class MediaController(BaseController):
             Note that we still return a list.
         :type slug: unicode or None
 
+        :param count:
+            How to determine the total number of results: 'exact' (the
+            default) counts them, 'estimate' returns a count which may be
+            up to a few minutes old and 'none' does not count at all
+            (the returned count is null). Counting can be as expensive as
+            the actual query, especially for searches.
+        :type count: str
+
+        :param cursor:
+            The 'next_cursor' returned by a previous query to fetch the
+            next results. The query params must be the same as for the
+            previous query, offset is ignored.
+        :type cursor: unicode or None
+
         :param api_key:
             The api access key if required in settings
         :type api_key: unicode or None
@@ -143,8 +173,11 @@ class MediaController(BaseController):
         :rtype: JSON-ready dict
         :returns: The returned dict has the following fields:
 
-            count (int)
+            count (int or None)
                 The total number of results that match this query.
+            next_cursor (unicode or None)
+                A token to fetch the next results (see the 'cursor' param)
+                or None if there are no more results.
             media (list of dicts)
                 A list of **media_info** dicts, as generated by the
                 :meth:`_info <mediadrop.controllers.api.media.MediaController._info>`
@@ -158,6 +191,16 @@ class MediaController(BaseController):
 
         if format not in ("json", "mrss"):
             return dict(error= INVALIDFORMATERROR % format)
+        if count not in ("exact", "estimate", "none"):
+            return dict(error= INVALIDCOUNTERROR % count)
+        order = order or None
+
+        # Only the filters determine the number of results so an estimated
+        # count is shared by all pages and orderings.
+        count_filters = dict(type=type, podcast=podcast, tag=tag,
+            category=category, search=search, max_age=max_age, min_age=min_age,
+            published_after=published_after, published_before=published_before,
+            featured=featured, id=id, slug=slug)
 
         query = Media.query\
             .published()\
@@ -199,38 +242,112 @@ class MediaController(BaseController):
         if published_before:
             query = query.filter(Media.publish_on <= published_before)
 
-        query = query.order_by(get_order_by(order, order_columns))
-
-        # Search will supercede the ordering above
-        if search:
-            query = query.search(search)
-
         if featured:
             featured_cat = get_featured_category()
             if featured_cat:
                 query = query.in_category(featured_cat)
 
-        # Preload podcast slugs so we don't do n+1 queries
-        podcast_slugs = dict(DBSession.query(Podcast.id, Podcast.slug))
+        order_by = get_order_by(order, order_columns)
+        query = query.order_by(order_by)
 
-        # Rudimentary pagination support
+        # Search will supercede the ordering above (it is applied after all
+        # other filters, the number of search results is limited)
+        if search:
+            keyset = None
+            query = query.search(search)
+        else:
+            keyset = self._keyset(order, order_by)
+            if keyset:
+                query = query.order_by(None)
+                for column, descending in keyset:
+                    if descending:
+                        query = query.order_by(column.desc())
+                    else:
+                        query = query.order_by(column.asc())
+
+        # Pagination support
         start = int(offset)
-        end = start + min(int(limit), int(request.settings['api_media_max_results']))
+        limit = min(int(limit), request.settings.as_int('api_media_max_results'))
+        page_query = query
+        if cursor:
+            try:
+                position = decode_cursor(cursor)
+            except APIException:
+                return dict(error=INVALIDCURSORERROR)
+            if position['order'] != order:
+                return dict(error=INVALIDCURSORERROR)
+            if 'offset' in position:
+                start = position['offset']
+            elif keyset and len(position['keys']) == len(keyset):
+                start = 0
+                page_query = query.filter(seek_condition(keyset, position['keys']))
+            else:
+                return dict(error=INVALIDCURSORERROR)
+
+        # fetch one more item to know if there is a next page
+        items = page_query[start:start + limit + 1]
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            if keyset:
+                next_cursor = encode_cursor(order=order,
+                    keys=self._keys_for(items[-1], keyset))
+            else:
+                next_cursor = encode_cursor(order=order, offset=start + limit)
 
         if format == "mrss":
             request.override_template = "sitemaps/mrss.xml"
             return dict(
-                media = query[start:end],
+                media = preload_relations(items,
+                    files=True, tags=True, categories=True),
                 title = "Media Feed",
             )
 
-        media = [self._info(m, podcast_slugs, include_embed) for m in query[start:end]]
+        if (not cursor) and (next_cursor is None) and (items or start == 0):
+            # this is the last page so we know the count already
+            total = start + len(items)
+        elif count == "none":
+            total = None
+        elif count == "estimate":
+            total = self._estimated_count(query, count_filters)
+        else:
+            total = query.count()
 
         return dict(
-            media = media,
-            count = query.count(),
+            media = self._info_list(items, include_embed),
+            count = total,
+            next_cursor = next_cursor,
         )
 
+    def _keyset(self, order, order_by):
+        """Return the keyset for the given ordering (see
+        :func:`mediadrop.lib.auth.query_result_proxy.keyset_from_clauses`)
+        or None if the next page must be fetched with an OFFSET."""
+        column_name = (order or 'publish_on').strip().lower().split(' ')[0]
+        if column_name not in keyset_order_columns:
+            return None
+        keyset = keyset_from_clauses([order_by])
+        if column_name != 'id':
+            # same direction as the ordering so "ORDER BY x DESC, id DESC"
+            # can use a single index
+            descending = keyset[0][1]
+            keyset.append((Media.id.__clause_element__(), descending))
+        return keyset
+
+    def _keys_for(self, media, keyset):
+        mapper = orm.class_mapper(Media)
+        return [getattr(media, mapper.get_property_by_column(column).key)
+                for column, descending in keyset]
+
+    def _estimated_count(self, query, filters):
+        """Return the (cached) number of results for the given filters."""
+        normalized = sorted((name, unicode(value).strip().lower())
+                            for name, value in filters.items() if value)
+        key = hashlib.sha1(repr(normalized)).hexdigest()
+        count_cache = app_globals.cache.get_cache(
+            'mediadrop.controllers.api.media.count', expire=COUNT_CACHE_EXPIRE)
+        return count_cache.get(key=key, createfunc=query.count)
+
 
     @expose('json')
     @require_api_key_if_necessary
@@ -278,7 +395,26 @@ class MediaController(BaseController):
         return self._info(media, include_embed=True)
 
 
-    def _info(self, media, podcast_slugs=None, include_embed=False):
+    def _info_list(self, media, include_embed=False):
+        """
+        Return a list of **media_info** dicts for the given media.
+
+        Instead of querying the categories and the podcast of each media
+        separately these are loaded for all media at once (a fixed number of
+        queries per page). The thumbnail URLs are built from templates which
+        are generated once per call.
+
+        :rtype: list of JSON-ready dicts
+        :returns: A list of dicts as generated by
+            :meth:`_info <mediadrop.controllers.api.media.MediaController._info>`.
+        """
+        media = preload_relations(media, categories=True, podcast=True)
+        thumb_templates = ThumbTemplates(Media._thumb_dir, qualified=True)
+        return [self._info(m, include_embed=include_embed,
+                           thumb_templates=thumb_templates)
+                for m in media]
+
+    def _info(self, media, include_embed=False, thumb_templates=None):
         """
         Return a **media_info** dict--a JSON-ready dict for describing a media instance.
 
@@ -345,23 +481,21 @@ class MediaController(BaseController):
                     medium_width = thumbs['m']['x']
                     medium_height = thumbs['m']['y']
         """
-        if media.podcast_id:
-            media_url = url_for(controller='/media', action='view', slug=media.slug,
-                                podcast_slug=media.podcast.slug, qualified=True)
-        else:
-            media_url = url_for_media(media, qualified=True)
-
         if media.podcast_id is None:
             podcast_slug = None
-        elif podcast_slugs:
-            podcast_slug = podcast_slugs[media.podcast_id]
         else:
-            podcast_slug = DBSession.query(Podcast.slug)\
-                .filter_by(id=media.podcast_id).scalar()
+            # preloaded for all media of a page by _info_list
+            podcast_slug = media.podcast.slug
+
+        if podcast_slug:
+            media_url = url_for(controller='/media', action='view', slug=media.slug,
+                                podcast_slug=podcast_slug, qualified=True)
+        else:
+            media_url = url_for_media(media, qualified=True)
 
-        thumbs = {}
-        for size in config['thumb_sizes'][media._thumb_dir].iterkeys():
-            thumbs[size] = thumb(media, size, qualified=True)
+        if thumb_templates is None:
+            thumb_templates = ThumbTemplates(media._thumb_dir, qualified=True)
+        thumbs = thumb_templates.thumbs(media)
 
         info = dict(
             id = media.id,
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from datetime import datetime, timedelta
+
+from pylons import app_globals, request as pylons_request
+
+from mediadrop.lib.app_globals import is_object_registered
+from mediadrop.lib.test import *
+from mediadrop.lib.thumbnails import thumb
+from mediadrop.model import Category, DBSession, Media, Podcast
+from ..media import MediaController
+
+
+__all__ = ['APIMediaInfoTest']
+
+class APIMediaInfoTest(ControllerTestCase, RequestMixin):
+    def setUp(self):
+        super(APIMediaInfoTest, self).setUp()
+        app_globals.settings['api_secret_key_required'] = 'false'
+        # get rid of default media (sqlite does not cascade the deletion so
+        # the categories must be removed explicitly)
+        for media in Media.query:
+            media.categories = []
+            DBSession.delete(media)
+        DBSession.commit()
+
+    def tearDown(self):
+        # every fake request registered its own globals
+        while is_object_registered(pylons_request):
+            self.remove_globals()
+        super(APIMediaInfoTest, self).tearDown()
+
+    def _create_media(self, count, podcast=None, category=None):
+        yesterday = datetime.now() - timedelta(days=1)
+        for i in range(count):
+            media = Media.example(title=u'Media %d' % i, reviewed=True,
+                encoded=True, publishable=True, publish_on=yesterday)
+            media.podcast = podcast
+            if category is not None:
+                media.categories.append(category)
+        DBSession.commit()
+
+    def _list_media(self, include_embed=False):
+        request_uri = '/api/media/index?limit=50'
+        if include_embed:
+            request_uri += '&include_embed=1'
+        request = self.init_fake_request(method='GET', request_uri=request_uri)
+        with QueryCounter() as counter:
+            response = self.call_controller(MediaController, request)
+        assert_equals(200, response.status_int)
+        return response.json, counter.count
+
+    def test_number_of_queries_does_not_depend_on_number_of_media(self):
+        first_podcast = Podcast.example(title=u'First')
+        self._create_media(2, first_podcast, Category.example(name=u'First'))
+        # the first request populates the settings cache
+        self._list_media(include_embed=True)
+        result, queries_for_two = self._list_media(include_embed=True)
+        assert_length(2, result['media'])
+
+        second_podcast = Podcast.example(title=u'Second')
+        self._create_media(10, second_podcast, Category.example(name=u'Second'))
+        self._create_media(3)
+        result, queries = self._list_media(include_embed=True)
+        assert_length(15, result['media'])
+        assert_equals(queries_for_two, queries)
+
+    def test_returns_podcast_categories_and_thumbs(self):
+        podcast = Podcast.example(title=u'Some Podcast')
+        category = Category.example(name=u'Some Category')
+        self._create_media(1, podcast, category)
+        media = Media.query.one()
+
+        result, queries = self._list_media()
+        info = result['media'][0]
+        assert_equals(media.id, info['id'])
+        assert_equals(podcast.slug, info['podcast'])
+        assert_equals({category.slug: category.name}, info['categories'])
+        assert_contains(podcast.slug, info['url'])
+        assert_equals(dict(thumb(media, 's', qualified=True)), info['thumbs']['s'])
+        assert_equals(dict(thumb(media, 'l', qualified=True)), info['thumbs']['l'])
+
+
+def suite():
+    import unittest
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(APIMediaInfoTest))
+    return suite
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from datetime import datetime, timedelta
+
+from pylons import app_globals, request as pylons_request
+
+from mediadrop.lib.app_globals import is_object_registered
+from mediadrop.lib.test import *
+from mediadrop.model import DBSession, Media
+from .. import APIException, decode_cursor, encode_cursor
+from ..media import MediaController
+
+
+__all__ = ['APIMediaPaginationTest']
+
+class APIMediaPaginationTest(ControllerTestCase, RequestMixin):
+    def setUp(self):
+        super(APIMediaPaginationTest, self).setUp()
+        app_globals.settings['api_secret_key_required'] = 'false'
+        # get rid of default media (sqlite does not cascade the deletion so
+        # the categories must be removed explicitly)
+        for media in Media.query:
+            media.categories = []
+            DBSession.delete(media)
+        self.yesterday = datetime.now() - timedelta(days=1)
+        for i in range(5):
+            self._create_media(i)
+        DBSession.commit()
+
+    def tearDown(self):
+        # every fake request registered its own globals
+        while is_object_registered(pylons_request):
+            self.remove_globals()
+        super(APIMediaPaginationTest, self).tearDown()
+
+    def _create_media(self, views):
+        # all media have the same publish date so the id is the tie breaker
+        return Media.example(title=u'Media %d' % views, reviewed=True,
+            encoded=True, publishable=True, publish_on=self.yesterday,
+            views=views)
+
+    def _list_media(self, query_string):
+        request = self.init_fake_request(method='GET',
+            request_uri='/api/media/index?' + query_string)
+        response = self.call_controller(MediaController, request)
+        assert_equals(200, response.status_int)
+        assert_not_contains('error', response.json)
+        return response.json
+
+    def _ids(self, result):
+        return [info['id'] for info in result['media']]
+
+    def _ids_via_cursor(self, query_string):
+        ids = []
+        result = self._list_media(query_string)
+        while True:
+            ids.extend(self._ids(result))
+            if not result['next_cursor']:
+                return ids
+            result = self._list_media(query_string + '&cursor=' + str(result['next_cursor']))
+
+    def test_cursor_returns_same_items_as_offset(self):
+        for order in ('', 'views+asc', 'views+desc', 'comment_count+desc'):
+            query_string = 'limit=2&count=none&order=' + order
+            expected_ids = self._ids(self._list_media('limit=50&order=' + order))
+            assert_length(5, expected_ids)
+            assert_equals(expected_ids, self._ids_via_cursor(query_string))
+
+    def test_can_skip_count(self):
+        result = self._list_media('limit=2&count=none')
+        assert_none(result['count'])
+        assert_not_none(result['next_cursor'])
+
+    def test_knows_count_on_last_page(self):
+        result = self._list_media('limit=50&count=none&offset=3')
+        assert_equals(5, result['count'])
+        assert_none(result['next_cursor'])
+
+    def test_estimated_count_is_cached(self):
+        assert_equals(5, self._list_media('limit=2&count=estimate')['count'])
+
+        self._create_media(5)
+        DBSession.commit()
+        assert_equals(5, self._list_media('limit=2&count=estimate')['count'])
+        assert_equals(5, self._list_media('limit=3&count=estimate&order=views+asc')['count'])
+        assert_equals(6, self._list_media('limit=2&count=exact')['count'])
+
+    def test_rejects_cursor_for_different_order(self):
+        result = self._list_media('limit=2&order=views+asc')
+        request = self.init_fake_request(method='GET',
+            request_uri='/api/media/index?limit=2&cursor=' + str(result['next_cursor']))
+        response = self.call_controller(MediaController, request)
+        assert_contains('error', response.json)
+
+    def test_can_decode_encoded_cursor(self):
+        keys = [datetime(2015, 1, 2, 3, 4, 5, 6), 42, u'foo']
+        cursor = encode_cursor(order='publish_on desc', keys=keys)
+        assert_equals(dict(order='publish_on desc', keys=keys), decode_cursor(cursor))
+        assert_equals(dict(order=None, offset=20),
+            decode_cursor(encode_cursor(offset=20)))
+        assert_raises(APIException, lambda: decode_cursor('invalid'))
+
+
+def suite():
+    import unittest
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(APIMediaPaginationTest))
+    return suite
@@ -7,11 +7,12 @@
 
 from pylons import request, response, tmpl_context as c
 from pylons.controllers.util import abort
-from sqlalchemy import orm
 
 from mediadrop.lib.base import BaseController
+from mediadrop.lib.cache_tags import add_cache_tags, until_next_publication
+from mediadrop.lib.category_tree import category_tree
 from mediadrop.lib.decorators import (beaker_cache, expose, observable, 
-    paginate, validate)
+    page_cache, paginate, validate)
 from mediadrop.lib.helpers import content_type_for_response, url_for, viewable_media
 from mediadrop.lib.i18n import _
 from mediadrop.model import Category, Media, fetch_row
@@ -34,26 +35,17 @@ class CategoriesController(BaseController):
         """Load all our category data before each request."""
         BaseController.__before__(self, *args, **kwargs)
 
-        c.categories = Category.query\
-            .order_by(Category.name)\
-            .options(orm.undefer('media_count_published'))\
-            .populated_tree()
-
-        counts = dict((cat.id, cat.media_count_published)
-                      for cat, depth in c.categories.traverse())
-        c.category_counts = counts.copy()
-        for cat, depth in c.categories.traverse():
-            count = counts[cat.id]
-            if count:
-                for ancestor in cat.ancestors():
-                    c.category_counts[ancestor.id] += count
+        tree = category_tree()
+        c.categories = tree.roots
+        c.category_counts = tree.published_counts
 
         category_slug = request.environ['pylons.routes_dict'].get('slug', None)
         if category_slug:
             c.category = fetch_row(Category, slug=category_slug)
-            c.breadcrumb = c.category.ancestors()
-            c.breadcrumb.append(c.category)
+            c.breadcrumb = tree.ancestors(c.category.id)
+            c.breadcrumb.append(tree.get(c.category.id) or c.category)
 
+    @page_cache(expire=60 * 5)
     @expose('categories/index.html')
     @observable(events.CategoriesController.index)
     def index(self, slug=None, **kwargs):
@@ -78,6 +70,7 @@ class CategoriesController(BaseController):
             popular = popular,
         )
 
+    @page_cache(expire=60 * 5)
     @expose('categories/more.html')
     @paginate('media', items_per_page=20)
     @observable(events.CategoriesController.more)
@@ -96,7 +89,8 @@ class CategoriesController(BaseController):
         )
 
     @validate(validators={'limit': LimitFeedItemsValidator()})
-    @beaker_cache(expire=60 * 3, query_args=True)
+    @beaker_cache(expire=until_next_publication, query_args=True,
+        tags=['settings'])
     @expose('sitemaps/mrss.xml')
     @observable(events.CategoriesController.feed)
     def feed(self, limit=None, **kwargs):
@@ -105,7 +99,7 @@ class CategoriesController(BaseController):
         :param limit: the max number of results to return. Defaults to 30
 
         """
-        if request.settings['rss_display'] != 'True':
+        if not request.settings.as_bool('rss_display'):
             abort(404)
 
         response.content_type = content_type_for_response(
@@ -114,7 +108,10 @@ class CategoriesController(BaseController):
         media = Media.query.published()
 
         if c.category:
+            add_cache_tags('category:%s' % c.category.id)
             media = media.in_category(c.category)
+        else:
+            add_cache_tags('media')
 
         media_query = media.order_by(Media.publish_on.desc())
         media = viewable_media(media_query)
@@ -13,8 +13,7 @@ import os.path
 
 from akismet import Akismet
 from paste.fileapp import FileApp
-from paste.util import mimeparse
-from pylons import config, request, response
+from pylons import app_globals, config, request, response
 from pylons.controllers.util import abort, forward
 from sqlalchemy import orm, sql
 from sqlalchemy.exc import OperationalError
@@ -24,26 +23,48 @@ from mediadrop import USER_AGENT
 from mediadrop.forms.comments import PostCommentSchema
 from mediadrop.lib import helpers
 from mediadrop.lib.base import BaseController
-from mediadrop.lib.decorators import expose, expose_xhr, observable, paginate, validate_xhr, autocommit
+from mediadrop.lib.category_tree import category_tree
+from mediadrop.lib.decorators import (autocommit, expose, expose_xhr,
+    observable, page_cache, paginate, validate_xhr)
 from mediadrop.lib.email import send_comment_notification
+from mediadrop.lib.file_serving import accepts, file_info, FileServer
 from mediadrop.lib.helpers import (filter_vulgarity, redirect, url_for, 
     viewable_media)
 from mediadrop.lib.i18n import _
 from mediadrop.lib.services import Facebook
 from mediadrop.lib.templating import render
 from mediadrop.model import (DBSession, fetch_row, Media, MediaFile, Comment, 
-    Tag, Category, AuthorWithIP, Podcast)
+    Tag, AuthorWithIP, Podcast)
+from mediadrop.model.media import media as media_table
 from mediadrop.plugin import events
 
 log = logging.getLogger(__name__)
 
 comment_schema = PostCommentSchema()
 
+def _count_cached_view(self, slug, **kwargs):
+    """Count a view of a media page which was served from the page cache."""
+    media_id = DBSession.query(Media.id).filter(Media.slug == slug).scalar()
+    if media_id is None:
+        return
+    view_counter = app_globals.view_counter
+    if view_counter is not None:
+        view_counter.increment(media_id)
+        return
+    try:
+        DBSession.execute(media_table.update()\
+            .values(views=media_table.c.views + 1)\
+            .where(media_table.c.id == media_id))
+        DBSession.commit()
+    except OperationalError:
+        DBSession.rollback()
+
 class MediaController(BaseController):
     """
     Media actions -- for both regular and podcast media
     """
 
+    @page_cache(expire=60 * 2)
     @expose('media/index.html')
     @paginate('media', items_per_page=10)
     @observable(events.MediaController.index)
@@ -76,14 +97,15 @@ class MediaController(BaseController):
 
         media, show = helpers.filter_library_controls(media, show)
 
-        if q:
-            media = media.search(q, bool=True)
-
         if tag:
             tag = fetch_row(Tag, slug=tag)
             media = media.filter(Media.tags.contains(tag))
 
-        if (request.settings['rss_display'] == 'True') and (not (q or tag)):
+        # search last so the other filters are applied to all matches
+        if q:
+            media = media.search(q, bool=True)
+
+        if request.settings.as_bool('rss_display') and (not (q or tag)):
             if show == 'latest':
                 response.feed_links.extend([
                     (url_for(controller='/sitemaps', action='latest'), _(u'Latest RSS')),
@@ -112,6 +134,7 @@ class MediaController(BaseController):
             tags = tags,
         )
 
+    @page_cache(expire=60 * 5)
     @expose('media/explore.html')
     @observable(events.MediaController.explore)
     def explore(self, **kwargs):
@@ -139,12 +162,12 @@ class MediaController(BaseController):
 
         latest = viewable_media(latest.exclude(featured))[:8]
         popular = viewable_media(popular.exclude(featured, latest))[:5]
-        if request.settings['sitemaps_display'] == 'True':
+        if request.settings.as_bool('sitemaps_display'):
             response.feed_links.extend([
                 (url_for(controller='/sitemaps', action='google'), _(u'Sitemap XML')),
                 (url_for(controller='/sitemaps', action='mrss'), _(u'Sitemap RSS')),
             ])
-        if request.settings['rss_display'] == 'True':
+        if request.settings.as_bool('rss_display'):
             response.feed_links.extend([
                 (url_for(controller='/sitemaps', action='latest'), _(u'Latest RSS')),
             ])
@@ -153,7 +176,7 @@ class MediaController(BaseController):
             featured = featured,
             latest = latest,
             popular = popular,
-            categories = Category.query.populated_tree(),
+            categories = category_tree().roots,
         )
 
     @expose()
@@ -172,6 +195,7 @@ class MediaController(BaseController):
             podcast_slug = None
         redirect(action='view', slug=media.slug, podcast_slug=podcast_slug)
 
+    @page_cache(expire=60 * 5, on_hit=_count_cached_view)
     @expose('media/view.html')
     @observable(events.MediaController.view)
     def view(self, slug, podcast_slug=None, **kwargs):
@@ -211,11 +235,15 @@ class MediaController(BaseController):
             if url_for() != url_for(podcast_slug=media.podcast.slug):
                 redirect(podcast_slug=media.podcast.slug)
 
-        try:
-            media.increment_views()
-            DBSession.commit()
-        except OperationalError:
-            DBSession.rollback()
+        view_counter = app_globals.view_counter
+        if view_counter is not None:
+            media.increment_views(view_counter)
+        else:
+            try:
+                media.increment_views()
+                DBSession.commit()
+            except OperationalError:
+                DBSession.rollback()
 
         if request.settings['comments_engine'] == 'facebook':
             response.facebook = Facebook(request.settings['facebook_appid'])
@@ -258,11 +286,11 @@ class MediaController(BaseController):
         request.perm.assert_permission(u'view', media.resource)
 
         if up:
-            if not request.settings['appearance_show_like']:
+            if not request.settings.as_bool('appearance_show_like'):
                 abort(status_code=403)
             media.increment_likes()
         elif down:
-            if not request.settings['appearance_show_dislike']:
+            if not request.settings.as_bool('appearance_show_dislike'):
                 abort(status_code=403)
             media.increment_dislikes()
 
@@ -355,7 +383,13 @@ class MediaController(BaseController):
             match, then a 406 (not acceptable) response is returned.
 
         """
-        file = fetch_row(MediaFile, id=id)
+        # load the file, its media and storage engine with one query
+        file = MediaFile.query\
+            .options(orm.joinedload('media'), orm.joinedload('storage'))\
+            .filter(MediaFile.id == id)\
+            .first()
+        if file is None:
+            raise HTTPNotFound()
         request.perm.assert_permission(u'view', file.media.resource)
 
         file_type = file.mimetype.encode('utf-8')
@@ -367,13 +401,14 @@ class MediaController(BaseController):
             raise HTTPNotFound()
         file_path = file_path.encode('utf-8')
 
-        if not os.path.exists(file_path):
+        info = file_info(file_path)
+        if info is None:
             log.warn('No such file or directory: %r', file_path)
             raise HTTPNotFound()
 
         # Ensure the request accepts files with this container
         accept = request.environ.get('HTTP_ACCEPT', '*/*')
-        if not mimeparse.best_match([file_type], accept):
+        if not accepts(file_type, accept):
             raise HTTPNotAcceptable() # 406
 
         method = config.get('file_serve_method', None)
@@ -406,10 +441,14 @@ class MediaController(BaseController):
             response.headers['X-Accel-Redirect'] = redirect_filename
 
 
-        else:
+        elif method == 'paste_fileapp':
             app = FileApp(file_path, headers, content_type=file_type)
             return forward(app)
 
+        else:
+            app = FileServer(info, file_type, headers)
+            return forward(app)
+
         response.headers['Content-Type'] = file_type
         for header, value in headers:
             response.headers[header] = value
@@ -11,8 +11,9 @@ from sqlalchemy import orm
 from mediadrop.lib.auth.util import viewable_media
 from mediadrop.lib import helpers
 from mediadrop.lib.base import BaseController
+from mediadrop.lib.cache_tags import add_cache_tags, until_next_publication
 from mediadrop.lib.decorators import (beaker_cache, expose, observable, 
-    paginate, validate)
+    page_cache, paginate, validate)
 from mediadrop.lib.helpers import content_type_for_response, url_for, redirect
 from mediadrop.model import Media, Podcast, fetch_row
 from mediadrop.plugin import events
@@ -29,6 +30,7 @@ class PodcastsController(BaseController):
     regular media by :mod:`mediadrop.controllers.media`.
     """
 
+    @page_cache(expire=60 * 10)
     @expose('podcasts/index.html')
     @observable(events.PodcastsController.index)
     def index(self, **kwargs):
@@ -58,6 +60,7 @@ class PodcastsController(BaseController):
         )
 
 
+    @page_cache(expire=60 * 5)
     @expose('podcasts/view.html')
     @paginate('episodes', items_per_page=10)
     @observable(events.PodcastsController.view)
@@ -85,7 +88,7 @@ class PodcastsController(BaseController):
 
         episodes = viewable_media(episodes)
         
-        if request.settings['rss_display'] == 'True':
+        if request.settings.as_bool('rss_display'):
             response.feed_links.append(
                (url_for(action='feed'), podcast.title)
             )
@@ -98,7 +101,7 @@ class PodcastsController(BaseController):
         )
 
     @validate(validators={'limit': LimitFeedItemsValidator()})
-    @beaker_cache(expire=60 * 20)
+    @beaker_cache(expire=until_next_publication, tags=['settings'])
     @expose('podcasts/feed.xml')
     @observable(events.PodcastsController.feed)
     def feed(self, slug, limit=None, **kwargs):
@@ -122,6 +125,7 @@ class PodcastsController(BaseController):
 
         """
         podcast = fetch_row(Podcast, slug=slug)
+        add_cache_tags('podcast:%s' % podcast.id)
 
         if (podcast.feedburner_url
             and not 'feedburner' in request.environ.get('HTTP_USER_AGENT', '').lower()
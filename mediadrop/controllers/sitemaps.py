@@ -9,7 +9,6 @@
 Sitemaps Controller
 """
 import logging
-import math
 import os
 
 from formencode import validators
@@ -20,9 +19,13 @@ from webob.exc import HTTPNotFound
 
 from mediadrop.plugin import events
 from mediadrop.lib.base import BaseController
+from mediadrop.lib.cache_tags import add_cache_tags, until_next_publication
 from mediadrop.lib.decorators import expose, beaker_cache, observable, validate
 from mediadrop.lib.helpers import (content_type_for_response, 
     get_featured_category, url_for, viewable_media)
+from mediadrop.lib.sitemaps import (google_sitemap_filename,
+    google_sitemap_vars, mrss_sitemap_vars, static_sitemap_file)
+from mediadrop.lib.templating import render_iter, stream_response
 from mediadrop.model import Media
 from mediadrop.validation import LimitFeedItemsValidator
 
@@ -36,15 +39,21 @@ crossdomain_app = None
 class SitemapsController(BaseController):
     """
     Sitemap generation
+
+    Cached feeds are kept until the media they depend on is changed (see
+    :mod:`mediadrop.lib.cache_tags`) or until the next media with a publish
+    date in the future is published.
+
+    The sitemaps of the whole library are streamed while they are rendered
+    (see :mod:`mediadrop.lib.sitemaps`) and cached once they are complete.
+    Pre-generated sitemaps in ``sitemaps.static_dir`` take precedence.
     """
 
     @validate(validators={
         'page': validators.Int(if_empty=None, if_missing=None, if_invalid=None), 
         'limit': validators.Int(if_empty=10000, if_missing=10000, if_invalid=10000)
     })
-    @beaker_cache(expire=60 * 60 * 4)
-    @expose('sitemaps/google.xml')
-    @observable(events.SitemapsController.google)
+    @expose()
     def google(self, page=None, limit=10000, **kwargs):
         """Generate a sitemap which contains googles Video Sitemap information.
 
@@ -52,72 +61,73 @@ class SitemapsController(BaseController):
         on how many media items are in the database, and the values of the
         page and limit params.
 
+        The output is streamed and cached (or served from
+        ``sitemaps.static_dir`` if the sitemaps were pre-generated).
+
         :param page: Page number, defaults to 1.
         :type page: int
         :param page: max records to display on page, defaults to 10000.
         :type page: int
 
         """
-        if request.settings['sitemaps_display'] != 'True':
+        if not request.settings.as_bool('sitemaps_display'):
             abort(404)
 
+        static_file = static_sitemap_file(google_sitemap_filename(page))
+        if static_file:
+            return forward(FileApp(static_file, content_type='application/xml'))
+
         response.content_type = \
             content_type_for_response(['application/xml', 'text/xml'])
+        return stream_response(self._google(page=page, limit=limit, **kwargs))
 
-        media = viewable_media(Media.query.published())
+    @beaker_cache(expire=until_next_publication, tags=['media', 'settings'],
+        stream=True)
+    def _google(self, page=None, limit=10000, **kwargs):
+        tmpl_vars = self._google_vars(page=page, limit=limit, **kwargs)
+        return render_iter('sitemaps/google.xml', tmpl_vars)
 
-        if page is None:
-            if media.count() > limit:
-                return dict(pages=math.ceil(media.count() / float(limit)))
-        else:
+    @observable(events.SitemapsController.google)
+    def _google_vars(self, page=None, limit=10000, **kwargs):
+        if page is not None:
             page = int(page)
-            media = media.offset(page * limit).limit(limit)
-
-        if page:
-            links = []
-        else:
-            links = [
-                url_for(controller='/', qualified=True),
-                url_for(controller='/media', show='popular', qualified=True),
-                url_for(controller='/media', show='latest', qualified=True),
-                url_for(controller='/categories', qualified=True),
-            ]
-
-        return dict(
-            media = media,
-            page = page,
-            links = links,
-        )
+        return google_sitemap_vars(page=page, limit=limit)
 
-    @beaker_cache(expire=60 * 60, query_args=True)
-    @expose('sitemaps/mrss.xml')
-    @observable(events.SitemapsController.mrss)
+    @expose()
     def mrss(self, **kwargs):
         """Generate a media rss (mRSS) feed of all the sites media."""
-        if request.settings['sitemaps_display'] != 'True':
+        if not request.settings.as_bool('sitemaps_display'):
             abort(404)
 
+        static_file = static_sitemap_file('mrss.xml')
+        if static_file:
+            return forward(FileApp(static_file,
+                content_type='application/rss+xml'))
 
         response.content_type = content_type_for_response(
             ['application/rss+xml', 'application/xml', 'text/xml'])
+        return stream_response(self._mrss(**kwargs))
 
-        media = viewable_media(Media.query.published())
+    @beaker_cache(expire=until_next_publication, query_args=True,
+        tags=['media', 'settings'], stream=True)
+    def _mrss(self, **kwargs):
+        tmpl_vars = self._mrss_vars(**kwargs)
+        return render_iter('sitemaps/mrss.xml', tmpl_vars)
 
-        return dict(
-            media = media,
-            title = 'MediaRSS Sitemap',
-        )
+    @observable(events.SitemapsController.mrss)
+    def _mrss_vars(self, **kwargs):
+        return mrss_sitemap_vars()
 
     @validate(validators={
         'limit': LimitFeedItemsValidator(),
         'skip': validators.Int(if_empty=0, if_missing=0, if_invalid=0)
     })
-    @beaker_cache(expire=60 * 3)
+    @beaker_cache(expire=until_next_publication, tags=['media', 'settings'])
     @expose('sitemaps/mrss.xml')
     @observable(events.SitemapsController.latest)
     def latest(self, limit=None, skip=0, **kwargs):
         """Generate a media rss (mRSS) feed of all the sites media."""
-        if request.settings['rss_display'] != 'True':
+        if not request.settings.as_bool('rss_display'):
             abort(404)
 
         response.content_type = content_type_for_response(
@@ -140,18 +150,21 @@ class SitemapsController(BaseController):
         'limit': LimitFeedItemsValidator(),
         'skip': validators.Int(if_empty=0, if_missing=0, if_invalid=0)
     })
-    @beaker_cache(expire=60 * 3)
+    @beaker_cache(expire=until_next_publication, tags=['settings'])
     @expose('sitemaps/mrss.xml')
     @observable(events.SitemapsController.featured)
     def featured(self, limit=None, skip=0, **kwargs):
         """Generate a media rss (mRSS) feed of the sites featured media."""
-        if request.settings['rss_display'] != 'True':
+        if not request.settings.as_bool('rss_display'):
             abort(404)
 
         response.content_type = content_type_for_response(
             ['application/rss+xml', 'application/xml', 'text/xml'])
 
-        media_query = Media.query.in_category(get_featured_category())\
+        featured_category = get_featured_category()
+        if featured_category is not None:
+            add_cache_tags('category:%s' % featured_category.id)
+        media_query = Media.query.in_category(featured_category)\
             .published()\
             .order_by(Media.publish_on.desc())
         media = viewable_media(media_query)
@@ -176,7 +189,7 @@ class SitemapsController(BaseController):
         """
         global crossdomain_app
 
-        if not request.settings['appearance_enable_cooliris']:
+        if not request.settings.as_bool('appearance_enable_cooliris'):
             # Ensure the cache is cleared if cooliris is suddenly disabled
             if crossdomain_app:
                 crossdomain_app = None
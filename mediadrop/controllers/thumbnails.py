@@ -0,0 +1,65 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+"""
+Thumbnails Controller
+"""
+import logging
+
+from pylons.controllers.util import forward
+from webob.exc import HTTPNotFound
+
+from mediadrop.lib.base import BaseController
+from mediadrop.lib.decorators import expose
+from mediadrop.lib.derived_thumbs import derived_thumbs, FORMATS
+from mediadrop.lib.file_serving import file_info, FileServer
+
+log = logging.getLogger(__name__)
+
+# URLs with the current version change when the image is replaced.
+VERSIONED_MAX_AGE = 365 * 24 * 3600
+UNVERSIONED_MAX_AGE = 24 * 3600
+
+
+class ThumbnailsController(BaseController):
+    """
+    Thumbnails in other sizes or formats than ``thumb_sizes``, see
+    :mod:`mediadrop.lib.derived_thumbs`.
+    """
+
+    @expose()
+    def derive(self, image_dir, id, size, format, v=None, **kwargs):
+        """Serve the thumbnail of a media or podcast in the given size and
+        format, it is rendered from the original image if needed.
+
+        :param image_dir: ``media`` or ``podcasts``
+        :param id: The id of the media or podcast.
+        :param size: The name of a ``thumb_sizes`` size or
+            ``<width>x<height>`` from ``thumbnails.derived_sizes``.
+        :param format: An extension from ``thumbnails.derived_formats``.
+        :param v: The version of the image (see
+            :func:`~mediadrop.lib.derived_thumbs.derived_thumb_url`).
+        :raises webob.exc.HTTPNotFound: If the size or format is not allowed
+            or the item has no image.
+
+        """
+        thumbs = derived_thumbs()
+        xy = thumbs.resolve_size(image_dir, size)
+        if xy is None or format not in thumbs.formats:
+            raise HTTPNotFound()
+        path = thumbs.derive(image_dir, int(id), xy, format)
+        info = path and file_info(path)
+        if info is None:
+            raise HTTPNotFound()
+
+        # an outdated (or made up) version must not be cached for long
+        if v and v == thumbs.version(image_dir, int(id)):
+            max_age = VERSIONED_MAX_AGE
+        else:
+            max_age = UNVERSIONED_MAX_AGE
+        headers = [('Cache-Control', 'public, max-age=%d' % max_age)]
+        return forward(FileServer(info, FORMATS[format][1], headers))
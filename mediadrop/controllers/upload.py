@@ -15,7 +15,8 @@ from mediadrop.lib import email
 from mediadrop.lib.base import BaseController
 from mediadrop.lib.decorators import autocommit, expose, observable, validate
 from mediadrop.lib.helpers import redirect, url_for
-from mediadrop.lib.storage import add_new_media_file
+from mediadrop.lib.storage import (add_new_media_file, completed_upload,
+    handle_chunk_request, UserStorageError)
 from mediadrop.lib.thumbnails import create_default_thumbs_for, has_thumbs
 from mediadrop.model import Author, DBSession, get_available_slug, Media
 from mediadrop.plugin import events
@@ -34,7 +35,7 @@ class UploadController(BaseController):
     """
 
     def __before__(self, *args, **kwargs):
-        if not request.settings['appearance_enable_user_uploads']:
+        if not request.settings.as_bool('appearance_enable_user_uploads'):
             abort(404)
         result = BaseController.__before__(self, *args, **kwargs)
         # BareBonesController will set request.perm
@@ -123,11 +124,15 @@ class UploadController(BaseController):
             else:
                 # else actually save it!
                 kwargs.setdefault('name')
+                try:
+                    uploaded_file = self._uploaded_file(kwargs)
+                except UserStorageError, e:
+                    return dict(success=False, err={'file': e.message})
 
                 media_obj = self.save_media_obj(
                     kwargs['name'], kwargs['email'],
                     kwargs['title'], kwargs['description'],
-                    None, kwargs['file'], kwargs['url'],
+                    None, uploaded_file, kwargs['url'],
                 )
                 email.send_media_notification(media_obj)
                 data = dict(
@@ -137,6 +142,35 @@ class UploadController(BaseController):
 
         return data
 
+    @expose('json')
+    @observable(events.UploadController.chunk)
+    def chunk(self, upload_id=None, offset=None, filename=None, size=None,
+              **kwargs):
+        """Start, continue or check a chunked upload.
+
+        See :mod:`mediadrop.lib.storage.chunked_uploads` for the protocol.
+        When the upload is complete, :meth:`submit_async` or :meth:`submit`
+        can be called with the ``upload_id`` instead of a ``file``.
+
+        :param upload_id: The ID of an upload, omit it to start a new one.
+        :param offset: The position in the file of the chunk (sent as
+            request body).
+        :param filename: The name of the file (to start an upload).
+        :param size: The size of the file in bytes (to start an upload).
+        :rtype: JSON dict
+        :returns:
+            success
+                bool
+            message
+                Error message, if unsuccessful
+            upload_id, offset, size, complete, checksum
+                The state of the upload.
+
+        """
+        max_size = request.settings.as_int('max_upload_size')
+        return handle_chunk_request(request, upload_id, offset, filename,
+            size, max_size=max_size)
+
     @expose(request_method='POST')
     @validate(upload_form, error_handler=index)
     @autocommit
@@ -145,12 +179,16 @@ class UploadController(BaseController):
         """
         """
         kwargs.setdefault('name')
+        try:
+            uploaded_file = self._uploaded_file(kwargs)
+        except UserStorageError:
+            redirect(action='failure')
 
         # Save the media_obj!
         media_obj = self.save_media_obj(
             kwargs['name'], kwargs['email'],
             kwargs['title'], kwargs['description'],
-            None, kwargs['file'], kwargs['url'],
+            None, uploaded_file, kwargs['url'],
         )
         email.send_media_notification(media_obj)
 
@@ -167,6 +205,13 @@ class UploadController(BaseController):
     def failure(self, **kwargs):
         return dict()
 
+    def _uploaded_file(self, kwargs):
+        """Return the uploaded file or the completed chunked upload."""
+        upload_id = kwargs.get('upload_id')
+        if upload_id:
+            return completed_upload(upload_id)
+        return kwargs['file']
+
     def save_media_obj(self, name, email, title, description, tags, uploaded_file, url):
         # create our media object as a status-less placeholder initially
         media_obj = Media()
@@ -9,9 +9,9 @@ from tw.api import WidgetsList
 from tw.forms import CheckBoxList, HiddenField, SingleSelectField
 from tw.forms.validators import NotEmpty
 
-from mediadrop.model.categories import Category
 from mediadrop.forms import Form, ListForm, ResetButton, SubmitButton, TextField
 from mediadrop.lib import helpers
+from mediadrop.lib.category_tree import category_tree
 from mediadrop.lib.i18n import N_
 from mediadrop.plugin import events
 
@@ -21,7 +21,7 @@ def option_tree(cats):
         [(c.id, indent * depth + c.name) for c, depth in cats.traverse()]
 
 def category_options():
-    return option_tree(Category.query.order_by(Category.name.asc()).populated_tree())
+    return option_tree(category_tree().roots)
 
 class CategoryForm(ListForm):
     template = 'admin/tags_and_categories_form.html'
@@ -112,7 +112,7 @@ class AddFileForm(ListForm):
         TextField('url', validator=URIValidator, suppress_label=True, attrs=lambda: {'title': _('YouTube, Vimeo, Amazon S3 or any other link')}, maxlength=255),
     ]
 
-file_type_options = lambda: registered_media_types()
+file_type_options = lambda: [(id, _(name)) for id, name in registered_media_types()]
 file_types = lambda: (id for id, name in registered_media_types())
 file_type_validator = OneOfGenerator(file_types, if_missing=None)
 
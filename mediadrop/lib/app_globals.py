@@ -9,6 +9,9 @@
 from beaker.cache import CacheManager
 from beaker.util import parse_cache_config_options
 
+from mediadrop.lib.settings_store import setup_settings_store
+from mediadrop.lib.view_counter import setup_view_counter
+
 
 __all__ = ['is_object_registered', 'Globals']
 
@@ -29,9 +32,24 @@ class Globals(object):
 
         """
         self.cache = cache = CacheManager(**parse_cache_config_options(config))
-        self.settings_cache = cache.get_cache('app_settings',
-                                              expire=3600,
-                                              type='memory')
+        self.settings_store = setup_settings_store(config)
+        self.view_counter = setup_view_counter(config)
+        # created on first use, see mediadrop.lib.cache_tags
+        self.cache_tag_stamps = None
+        # created on first use, see mediadrop.lib.search.search_backend
+        self.search_backend = None
+        # created on first use, see mediadrop.lib.category_tree.category_tree
+        self.category_tree = None
+        # created on first use, see mediadrop.lib.fragment_cache.fragment_cache
+        self.fragment_cache = None
+        # created on first use, see mediadrop.lib.file_serving.stat_cache
+        self.file_stat_cache = None
+        # created on first use, see mediadrop.lib.derived_thumbs.derived_thumbs
+        self.derived_thumbs = None
+        # created on first use, see mediadrop.lib.thumb_manifest.thumb_manifest
+        self.thumb_manifest = None
+        # see mediadrop.lib.registry
+        self.registries = {}
 
         # We'll store the primary translator here for sharing between requests
         self.primary_language = None
@@ -39,8 +57,4 @@ class Globals(object):
 
     @property
     def settings(self):
-        def fetch_settings():
-            from mediadrop.model import DBSession, Setting
-            settings_dict = dict(DBSession.query(Setting.key, Setting.value))
-            return settings_dict
-        return self.settings_cache.get(createfunc=fetch_settings, key=None)
+        return self.settings_store.settings()
@@ -5,8 +5,10 @@
 # (at your option) any later version.
 # See LICENSE.txt in the main project directory, for more information.
 
+import os
 import re
 
+from paste.deploy.converters import asint
 from repoze.who.classifiers import default_request_classifier
 from repoze.who.middleware import PluggableAuthenticationMiddleware
 from repoze.who.plugins.auth_tkt import AuthTktCookiePlugin
@@ -17,6 +19,7 @@ from webob.request import Request
 from mediadrop.config.routing import login_form_url, login_handler_url, \
     logout_handler_url, post_login_url, post_logout_url
 
+from mediadrop.lib.auth.permission_cache import permission_cache
 from mediadrop.lib.auth.permission_system import MediaDropPermissionSystem
 
 
@@ -127,6 +130,11 @@ class AuthorizationMiddleware(object):
     def __init__(self, app, config):
         self.app = app
         self.config = config
+        permission_cache.ttl = asint(config.get('permission_cache.ttl', 300))
+        stamp_file = config.get('permission_cache.stamp_file')
+        if not stamp_file and config.get('cache_dir'):
+            stamp_file = os.path.join(config['cache_dir'], 'permissions.stamp')
+        permission_cache.stamp_file = stamp_file
     
     def __call__(self, environ, start_response):
         environ['mediadrop.perm'] = \
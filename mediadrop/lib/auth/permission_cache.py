@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code in this file is dual licensed under the MIT license or
+# the GPLv3 or (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+import threading
+import time
+
+from sqlalchemy import sql
+
+from mediadrop.lib.stamp_files import StampFile
+from mediadrop.lib.transactions import call_after_commit
+from mediadrop.model.auth import groups, groups_permissions, permissions
+from mediadrop.model.meta import DBSession
+from mediadrop.plugin import events
+from mediadrop.plugin.events import observes
+
+
+__all__ = ['PermissionCache', 'permission_cache', 'PermissionSnapshot',
+    'ResolvedPermissions']
+
+class ResolvedPermissions(object):
+    """The groups and permissions of a single user (as stored in the
+    :class:`PermissionCache`). Does not reference any ORM objects so it can
+    be shared between requests/threads."""
+    def __init__(self, user_id, group_ids, permission_names):
+        self.user_id = user_id
+        self.group_ids = frozenset(group_ids)
+        self.permission_names = frozenset(permission_names)
+
+
+class PermissionSnapshot(object):
+    """Immutable view of all groups and the permissions granted to them.
+
+    The snapshot is built with three plain SQL queries and contains only
+    names, ids and frozensets so permission checks are simple set lookups
+    without ORM objects."""
+    def __init__(self, permission_names, group_ids_by_name, group_permissions):
+        self.permission_names = frozenset(permission_names)
+        self.group_ids_by_name = dict(group_ids_by_name)
+        self.group_permissions = dict([(group_id, frozenset(names))
+            for group_id, names in group_permissions.items()])
+    
+    @classmethod
+    def from_db(cls, session=None):
+        session = session or DBSession
+        # dict(ResultProxy) fails (it has keys() but no __getitem__)
+        permission_names = dict(session.execute(sql.select(
+            [permissions.c.permission_id, permissions.c.permission_name])).fetchall())
+        group_ids_by_name = dict(session.execute(sql.select(
+            [groups.c.group_name, groups.c.group_id])).fetchall())
+        group_permissions = dict([(group_id, set()) for group_id in group_ids_by_name.values()])
+        grants = session.execute(sql.select(
+            [groups_permissions.c.group_id, groups_permissions.c.permission_id]))
+        for group_id, permission_id in grants:
+            if (group_id in group_permissions) and (permission_id in permission_names):
+                group_permissions[group_id].add(permission_names[permission_id])
+        return cls(permission_names.values(), group_ids_by_name, group_permissions)
+    
+    def meta_group_ids(self, authenticated=False):
+        """Return the ids of the 'anonymous' (and 'authenticated') groups
+        which exist in the database."""
+        group_names = [u'anonymous']
+        if authenticated:
+            group_names.append(u'authenticated')
+        return [self.group_ids_by_name[name] for name in group_names
+                if name in self.group_ids_by_name]
+    
+    def permissions_for_groups(self, group_ids):
+        names = set()
+        for group_id in group_ids:
+            names.update(self.group_permissions.get(group_id, ()))
+        return frozenset(names)
+    
+    def resolve(self, user_id, group_ids):
+        return ResolvedPermissions(user_id, group_ids,
+            self.permissions_for_groups(group_ids))
+
+
+class PermissionCache(object):
+    """Process-wide cache for resolved permissions.
+
+    Entries expire after ``ttl`` seconds. Any change to users, groups or
+    permissions increments the ``version`` which invalidates all entries
+    immediately and replaces the ``stamp_file`` (if any). Other processes
+    which use the same stamp file drop their entries on their next lookup,
+    processes without a (shared) stamp file have to wait for the ttl.
+    A ttl of 0 disables the cache.
+    """
+    def __init__(self, ttl=300, clock=time.time, stamp_file=None):
+        self.ttl = ttl
+        self.stamp_file = stamp_file
+        self.version = 0
+        self._stamp = None
+        self._clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, key, create_func):
+        if not self.ttl:
+            return create_func()
+        self._check_stamp()
+        now = self._clock()
+        entry = self._entries.get(key)
+        if entry is not None:
+            version, expires, value = entry
+            if (version == self.version) and (expires > now):
+                return value
+        # If the cache is invalidated while we are building the new value
+        # the entry is stored with the old version and won't be used.
+        version = self.version
+        value = create_func()
+        self._entries[key] = (version, now + self.ttl, value)
+        return value
+
+    def snapshot(self):
+        """Return the current :class:`PermissionSnapshot`."""
+        return self.lookup(('snapshot', ), PermissionSnapshot.from_db)
+
+    def _check_stamp(self):
+        if not self.stamp_file:
+            return
+        stamp = StampFile(self.stamp_file).read()
+        if stamp != self._stamp:
+            # another process changed users, groups or permissions
+            self._drop_entries()
+            self._stamp = stamp
+
+    def _drop_entries(self):
+        self._lock.acquire()
+        try:
+            self.version += 1
+            self._entries = {}
+        finally:
+            self._lock.release()
+
+    def invalidate(self, instance=None):
+        """Drop all entries (in all processes which use the same stamp
+        file)."""
+        self._drop_entries()
+        if self.stamp_file:
+            StampFile(self.stamp_file).touch()
+
+permission_cache = PermissionCache()
+
+@observes(
+    events.User.after_insert, events.User.after_update, events.User.after_delete,
+    events.Group.after_insert, events.Group.after_update, events.Group.after_delete,
+    events.Permission.after_insert, events.Permission.after_update,
+    events.Permission.after_delete,
+)
+def invalidate_permission_cache(instance):
+    permission_cache.invalidate()
+    # Concurrent requests might cache the old permissions again before the
+    # transaction is committed (or rolled back).
+    call_after_commit(permission_cache.invalidate, rollback=True)
+
+@observes(events.Environment.database_ready)
+def build_permission_snapshot():
+    permission_cache.snapshot()
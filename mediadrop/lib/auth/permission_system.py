@@ -8,15 +8,18 @@
 import re
 
 from pylons.controllers.util import abort
-from sqlalchemy import or_
+from sqlalchemy import or_, sql
 
 from mediadrop.lib.auth.api import PermissionSystem, UserPermissions
+from mediadrop.lib.auth.permission_cache import permission_cache
 from mediadrop.lib.auth.query_result_proxy import QueryResultProxy, StaticQuery
 from mediadrop.model import DBSession, Group, User
+from mediadrop.model.auth import users, users_groups
 from mediadrop.plugin.abc import AbstractClass, abstractmethod
 
 
-__all__ = ['MediaDropPermissionSystem', 'PermissionPolicies']
+__all__ = ['CachedUserPermissions', 'MediaDropPermissionSystem',
+    'PermissionPolicies']
 
 class PermissionPolicies(AbstractClass):
     @abstractmethod
@@ -45,6 +48,47 @@ class PermissionPolicies(AbstractClass):
         return map(policy_from_name, policy_names)
 
 
+def anonymous_user():
+    user = User()
+    user.display_name = u'Anonymous User'
+    user.user_name = u'anonymous'
+    user.email_address = 'invalid@mediadrop.example'
+    return user
+
+
+class CachedUserPermissions(UserPermissions):
+    """UserPermissions based on :class:`ResolvedPermissions`.
+
+    The ``user`` and ``groups`` ORM objects are only loaded when they are
+    accessed, checking the permissions does not need them."""
+    def __init__(self, resolved, permission_system, user=None):
+        self.resolved = resolved
+        self.permission_system = permission_system
+        self.data = {'permissions': resolved.permission_names}
+        self._user = user
+        self._groups = None
+    
+    @property
+    def user(self):
+        if self._user is None:
+            user_id = self.resolved.user_id
+            if user_id is None:
+                self._user = anonymous_user()
+            else:
+                self._user = DBSession.query(User).get(user_id)
+        return self._user
+    
+    @property
+    def groups(self):
+        if self._groups is None:
+            group_ids = self.resolved.group_ids
+            self._groups = set()
+            if group_ids:
+                query = Group.query.filter(Group.group_id.in_(group_ids))
+                self._groups = set(query)
+        return self._groups
+
+
 class MediaDropPermissionSystem(PermissionSystem):
     def __init__(self, config):
         policies = PermissionPolicies.configured_policies(config)
@@ -52,34 +96,55 @@ class MediaDropPermissionSystem(PermissionSystem):
     
     @classmethod
     def permissions_for_request(cls, environ, config):
+        """Return the :class:`CachedUserPermissions` for the current user.
+
+        The groups and permissions are resolved once and then kept in the
+        process-wide ``permission_cache`` (keyed by user id) so most requests
+        don't need any database queries for authorization."""
         identity = environ.get('repoze.who.identity', {})
         user_id = identity.get('repoze.who.userid')
-        user = None
-        if user_id is not None:
-            user = DBSession.query(User).filter(User.id==user_id).first()
-        return cls.permissions_for_user(user, config)
+        resolve = lambda: cls._resolve_permissions(user_id)
+        resolved = permission_cache.lookup(user_id, resolve)
+        return CachedUserPermissions(resolved, cls(config))
+    
+    @classmethod
+    def _resolve_permissions(cls, user_id):
+        snapshot = permission_cache.snapshot()
+        if user_id is None:
+            return snapshot.resolve(None, snapshot.meta_group_ids())
+        # a single query to check the user exists and to get the user's groups
+        rows = DBSession.execute(sql.select(
+            [users.c.user_id, users_groups.c.group_id],
+            users.c.user_id == user_id,
+            from_obj=users.outerjoin(users_groups),
+        )).fetchall()
+        if len(rows) == 0:
+            return snapshot.resolve(None, snapshot.meta_group_ids())
+        group_ids = [group_id for (user_id_, group_id) in rows if group_id is not None]
+        group_ids += snapshot.meta_group_ids(authenticated=True)
+        return snapshot.resolve(rows[0][0], group_ids)
     
     @classmethod
     def permissions_for_user(cls, user, config):
+        snapshot = permission_cache.snapshot()
         if user is None:
-            user = User()
-            user.display_name = u'Anonymous User'
-            user.user_name = u'anonymous'
-            user.email_address = 'invalid@mediadrop.example'
-            anonymous_group = Group.by_name(u'anonymous')
-            groups = filter(None, [anonymous_group])
+            resolved = snapshot.resolve(None, snapshot.meta_group_ids())
         else:
-            meta_groups = Group.query.filter(Group.group_name.in_([u'anonymous', u'authenticated']))
-            groups = list(user.groups) + list(meta_groups)
-        return UserPermissions(user, cls(config), groups=groups)
+            group_ids = [group.group_id for group in user.groups]
+            group_ids += snapshot.meta_group_ids(authenticated=True)
+            resolved = snapshot.resolve(user.id, group_ids)
+        return CachedUserPermissions(resolved, cls(config), user=user)
     
-    def filter_restricted_items(self, query, permission_name, perm):
+    def filter_restricted_items(self, query, permission_name, perm, keyset=None,
+                                default_fetch=10):
         if self._can_apply_access_restrictions_to_query(query, permission_name):
-            return self._apply_access_restrictions_to_query(query, permission_name, perm)
+            return self._apply_access_restrictions_to_query(query, permission_name, perm,
+                keyset=keyset, default_fetch=default_fetch)
         
         can_access_item = \
             lambda item: perm.contains_permission(permission_name, item.resource)
-        return QueryResultProxy(query, filter_=can_access_item)
+        return QueryResultProxy(query, filter_=can_access_item, keyset=keyset,
+            default_fetch=default_fetch)
     
     def raise_error(self, permission, resource):
         abort(404)
@@ -91,12 +156,14 @@ class MediaDropPermissionSystem(PermissionSystem):
                 return False
         return True
     
-    def _apply_access_restrictions_to_query(self, query, permission_name, perm):
+    def _apply_access_restrictions_to_query(self, query, permission_name, perm,
+                                            keyset=None, default_fetch=10):
         conditions = []
         for policy in self.policies_for_permission(permission_name):
             result = policy.access_condition_for_query(query, permission_name, perm)
             if result == True:
-                return QueryResultProxy(query)
+                return QueryResultProxy(query, keyset=keyset,
+                    default_fetch=default_fetch)
             elif result == False:
                 return StaticQuery([])
             elif result is None:
@@ -112,5 +179,6 @@ class MediaDropPermissionSystem(PermissionSystem):
             # we should not return any items
             return StaticQuery([])
         restricted_query = query.distinct().filter(or_(*conditions))
-        return QueryResultProxy(restricted_query)
+        return QueryResultProxy(restricted_query, keyset=keyset,
+            default_fetch=default_fetch)
 
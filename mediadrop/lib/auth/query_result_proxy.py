@@ -6,18 +6,155 @@
 # the GPLv3 or (at your option) any later version.
 # See LICENSE.txt in the main project directory, for more information.
 
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import class_mapper
+from sqlalchemy.orm.exc import UnmappedClassError, UnmappedColumnError
+from sqlalchemy.sql import expression, operators
+
+
+__all__ = ['keyset_from_clauses', 'QueryResultProxy', 'seek_condition',
+    'StaticQuery']
+
+def keyset_from_clauses(clauses):
+    """Return a list of (column, descending) tuples for the given ORDER BY
+    clauses or None if one of the clauses is not a simple (maybe asc/desc
+    modified) column."""
+    keyset = []
+    for clause in clauses:
+        modifier = getattr(clause, 'modifier', None)
+        descending = (modifier is operators.desc_op)
+        if modifier in (operators.desc_op, operators.asc_op):
+            clause = clause.element
+        if not hasattr(clause, 'table') or not hasattr(clause, 'key'):
+            # e.g. func.random() or a full text relevance
+            return None
+        keyset.append((clause, descending))
+    return keyset
+
+# comparisons which are never true for NULL values
+_null_rejecting_operators = (operators.eq, operators.ne, operators.lt,
+    operators.le, operators.gt, operators.ge)
+
+def _same_column(column, other):
+    return (getattr(other, 'table', None) is column.table) and \
+        (getattr(other, 'key', None) == column.key)
+
+def _excludes_null(criterion, column):
+    """Return True if the WHERE clause ``criterion`` can only match rows
+    where ``column`` is not NULL (e.g. ``Media.publish_on <= now`` as used by
+    ``Media.query.published()``)."""
+    if criterion is None:
+        return False
+    operator = getattr(criterion, 'operator', None)
+    if operator is operators.and_:
+        for clause in criterion.clauses:
+            if _excludes_null(clause, column):
+                return True
+        return False
+    left = getattr(criterion, 'left', None)
+    right = getattr(criterion, 'right', None)
+    if not (_same_column(column, left) or _same_column(column, right)):
+        return False
+    if operator in _null_rejecting_operators:
+        return True
+    return (operator is operators.isnot) and isinstance(right, expression._Null)
+
+def _detect_keyset(query):
+    """Derive a keyset from the ORDER BY clauses of the given query.
+
+    Keyset pagination is only possible if the ordering is explicit, uses
+    only columns of the queried entity which are NOT NULL (a NULL value
+    would never match the seek condition) either by definition or because
+    of the WHERE clause and yields a unique order. The primary key is
+    appended as a tie breaker if it is not part of the ordering already.
+    """
+    order_by = query._order_by
+    if not order_by:
+        return None
+    descriptions = query.column_descriptions
+    if len(descriptions) != 1:
+        return None
+    try:
+        mapper = class_mapper(descriptions[0]['type'])
+    except UnmappedClassError:
+        return None
+    keyset = keyset_from_clauses(order_by)
+    if keyset is None:
+        return None
+    criterion = query.whereclause
+    for column, descending in keyset:
+        if column.nullable and not _excludes_null(criterion, column):
+            return None
+    keyset_columns = set([column.key for column, descending in keyset])
+    for pk_column in mapper.primary_key:
+        if pk_column.key not in keyset_columns:
+            keyset.append((pk_column, keyset[-1][1]))
+    return keyset
+
+def seek_condition(keyset, keys):
+    """Return a WHERE clause which matches all rows after the row with the
+    given keys (in the order defined by ``keyset``, a list of (column,
+    descending) tuples as returned by :func:`keyset_from_clauses`)."""
+    # (a, b) > (x, y) is expressed as "a > x OR (a = x AND b > y)" as
+    # row value comparisons are not supported by all databases.
+    conditions = []
+    for i, (column, descending) in enumerate(keyset):
+        value = keys[i]
+        criteria = [c == v for (c, d), v in zip(keyset[:i], keys[:i])]
+        if descending:
+            criteria.append(column < value)
+        else:
+            criteria.append(column > value)
+        conditions.append(and_(*criteria))
+    return or_(*conditions)
 
-__all__ = ['QueryResultProxy', 'StaticQuery']
 
 class QueryResultProxy(object):
-    def __init__(self, query, start=0, filter_=None, default_fetch=10):
+    """Iterate over the results of a query, optionally filtering the items
+    with a Python callable.
+
+    By default the proxy pages through the query using OFFSET/LIMIT. If the
+    ordering of the query is known (either passed explicitly as ``keyset`` or
+    detected from the query's ORDER BY clauses) subsequent batches are
+    fetched by seeking past the last item seen (``WHERE (publish_on, id) <
+    (:last_publish_on, :last_id)``) which does not get slower for later
+    batches.
+
+    :param keyset: a list of order by clauses (e.g.
+        ``[Media.publish_on.desc(), Media.id.desc()]``) which define a unique
+        order of the query results. The query is ordered by these clauses.
+        All columns must be NOT NULL for the queried rows. ``None`` tries to
+        detect a keyset automatically, an empty list disables keyset
+        pagination.
+    """
+    def __init__(self, query, start=0, filter_=None, default_fetch=10,
+                 keyset=None):
+        if keyset is None:
+            keyset = _detect_keyset(query)
+        elif keyset:
+            keyset = keyset_from_clauses(keyset)
+        if keyset:
+            query = query.order_by(None).order_by(*self._order_by(keyset))
         self.query = query
+        self._keyset = keyset or None
+        self._last_keys = None
+        self._start = start
         self._items_retrieved = start
         self._items_returned = 0
         self._limit = None
         self._filter = filter_
         self._default_fetch = default_fetch
         self._prefetched_items = []
+        self._count = None
+
+    def _order_by(self, keyset):
+        clauses = []
+        for column, descending in keyset:
+            if descending:
+                clauses.append(column.desc())
+            else:
+                clauses.append(column.asc())
+        return clauses
     
     def fetch(self, n=1):
         assert n >= 1
@@ -51,10 +188,37 @@ class QueryResultProxy(object):
         return items
     
     def _fetch(self, n):
-        fetched_items = self.query.offset(self._items_retrieved).limit(n).all()
+        fetched_items = self._seek_query().limit(n).all()
         self._items_retrieved += len(fetched_items)
+        if self._keyset and fetched_items:
+            self._last_keys = self._keys_for(fetched_items[-1])
         return fetched_items
-    
+
+    def _seek_query(self, skip=0):
+        """Return the query for all items after the last retrieved item
+        (plus ``skip`` items)."""
+        if self._last_keys is None:
+            return self.query.offset(self._items_retrieved + skip)
+        query = self.query.filter(seek_condition(self._keyset, self._last_keys))
+        if skip:
+            query = query.offset(skip)
+        return query
+
+    def _keys_for(self, item):
+        try:
+            mapper = class_mapper(item.__class__)
+            keys = []
+            for column, descending in self._keyset:
+                attribute = mapper.get_property_by_column(column).key
+                keys.append(getattr(item, attribute))
+        except UnmappedColumnError:
+            keys = [None]
+        if None in keys:
+            # can not seek past a NULL value, continue with OFFSET instead
+            self._keyset = None
+            return None
+        return keys
+
     def more_available(self):
         if len(self._prefetched_items) == 0:
             next_items = self.fetch(n=1)
@@ -72,6 +236,16 @@ class QueryResultProxy(object):
             return None
         return item[0]
     
+    def chunks(self, size):
+        """Iterate over the remaining items in lists of up to ``size`` items.
+        Each list is retrieved with (usually) a single query so callers can
+        process large results without loading all items at once."""
+        while True:
+            items = self.fetch(size)
+            if len(items) == 0:
+                break
+            yield items
+    
     # --- pagination support ---------------------------------------------------
     
     def __iter__(self):
@@ -84,7 +258,6 @@ class QueryResultProxy(object):
         raise StopIteration
     
     def _prefetch_all(self):
-        # yes, that's very inefficient but works for now
         prefetched_items = []
         def _prefetch():
             next_items = self.fetch(n=1000)
@@ -97,7 +270,35 @@ class QueryResultProxy(object):
             pass
         self._prefetched_items = prefetched_items
     
+    def _prefetch(self, n):
+        """Ensure that at least n items are prefetched (if available) without
+        returning them."""
+        while len(self._prefetched_items) < n:
+            missing = n - len(self._prefetched_items)
+            if self._limit is not None:
+                missing = min(missing,
+                    self._limit - self._items_returned - len(self._prefetched_items))
+                if missing < 1:
+                    break
+            number_of_items_to_fetch = max(missing, self._default_fetch)
+            fetched_items = self._fetch(number_of_items_to_fetch)
+            self._prefetched_items.extend(filter(self._filter, fetched_items))
+            if len(fetched_items) < number_of_items_to_fetch:
+                break
+
+    def _count_in_db(self):
+        # All items are acceptable so the database can count them without
+        # loading them.
+        if self._count is None:
+            self._count = self.query.order_by(None).count()
+        count = max(self._count - self._start, 0)
+        if self._limit is not None:
+            count = min(count, self._limit)
+        return count
+
     def __len__(self):
+        if self._filter is None:
+            return self._count_in_db()
         if self.more_available():
             self._prefetch_all()
         return self._items_returned + len(self._prefetched_items)
@@ -108,10 +309,24 @@ class QueryResultProxy(object):
             return hasattr(key, 'indices')
         
         if is_slice(key):
-            start, stop, step = key.indices(len(self))
+            start, stop = key.start or 0, key.stop
+            if (start < 0) or (stop is None) or (stop < 0):
+                # the length is only needed for relative indices (this loads
+                # all items if there is a filter)
+                start, stop, step = key.indices(len(self))
+            elif self._limit is not None:
+                stop = min(stop, self._limit)
             # TODO: if start < self._items_returned
             index_start = start - self._items_returned
             index_stop = index_start + (stop - start)
+            if index_stop <= index_start:
+                return []
+            if (self._filter is None) and (index_start >= len(self._prefetched_items)):
+                # no need to load the skipped items if there is no filter
+                skip = index_start - len(self._prefetched_items)
+                query = self._seek_query(skip=skip)
+                return query.limit(index_stop - index_start).all()
+            self._prefetch(index_stop)
             
             # TODO: support step
             return self._prefetched_items[index_start:index_stop]
@@ -129,6 +344,7 @@ class QueryResultProxy(object):
         assert self._items_retrieved == 0
         assert self._items_returned == 0
         self._items_retrieved = n
+        self._start = n
         return self
 
 
@@ -195,4 +411,10 @@ class StaticQuery(object):
             return self.next()
         except StopIteration:
             return None
+    
+    def chunks(self, size):
+        while len(self.items) > 0:
+            items = self.items[:size]
+            self._items_returned += len(items)
+            yield items
 
@@ -5,6 +5,8 @@
 # (at your option) any later version.
 # See LICENSE.txt in the main project directory, for more information.
 
+from datetime import datetime, timedelta
+
 from mediadrop.lib.auth.api import IPermissionPolicy, UserPermissions
 from mediadrop.lib.auth.group_based_policy import GroupBasedPermissionsPolicy
 from mediadrop.lib.auth.permission_system import MediaDropPermissionSystem, PermissionPolicies
@@ -138,6 +140,22 @@ class FilteringRestrictedItemsTest(DBTestCase):
         assert_equals(1, results.count())
         assert_equals(self.private_media, results.first())
     
+    def test_pages_published_media_by_publish_date(self):
+        # publish_on is nullable but published() only matches media with a
+        # publish date so the results can be fetched by seeking
+        for days, media in enumerate((self.private_media, self.public_media)):
+            media.reviewed = media.encoded = media.publishable = True
+            media.publish_on = datetime.now() - timedelta(days=days + 1)
+        Media.example(slug=u'draft')
+        DBSession.flush()
+        self.permission_system.policies = [self._fake_view_policy(lambda media: True)]
+        query = Media.query.published().order_by(Media.publish_on.desc())
+        
+        results = self.permission_system.filter_restricted_items(query, u'view', self.perm)
+        assert_not_none(results._keyset)
+        assert_equals([self.private_media], results.fetch(1))
+        assert_equals([self.public_media], list(results))
+    
     # --- helpers -------------------------------------------------------------
     
     def _media_query_results(self, permission):
@@ -7,11 +7,12 @@
 
 from mediadrop.lib.auth.api import UserPermissions
 from mediadrop.lib.auth.group_based_policy import GroupBasedPermissionsPolicy
+from mediadrop.lib.auth.permission_cache import permission_cache
 from mediadrop.lib.auth.permission_system import (MediaDropPermissionSystem,
     PermissionPolicies)
 from mediadrop.lib.test.pythonic_testcase import *
 from mediadrop.lib.test.db_testcase import DBTestCase
-from mediadrop.model import DBSession, Media, Permission, User
+from mediadrop.model import DBSession, Group, Media, Permission, User
 
 
 class GroupBasedPermissionsPolicyTest(DBTestCase):
@@ -26,6 +27,26 @@ class GroupBasedPermissionsPolicyTest(DBTestCase):
         assert_contains(u'admin', self.policy.permissions)
         assert_contains(u'custom', self.policy.permissions)
     
+    def test_uses_snapshot_of_group_permissions(self):
+        snapshot = permission_cache.snapshot()
+        anonymous_id = Group.by_name(u'anonymous').group_id
+        editors_id = Group.by_name(u'editors').group_id
+        
+        assert_equals([anonymous_id], snapshot.meta_group_ids())
+        assert_contains(u'view', snapshot.group_permissions[anonymous_id])
+        assert_not_contains(u'edit', snapshot.group_permissions[anonymous_id])
+        assert_contains(u'edit', snapshot.permissions_for_groups([anonymous_id, editors_id]))
+        assert_true(snapshot is permission_cache.snapshot())
+    
+    def test_rebuilds_snapshot_when_permissions_change(self):
+        snapshot = permission_cache.snapshot()
+        Permission.example(name=u'custom', groups=[Group.by_name(u'editors')])
+        
+        new_snapshot = permission_cache.snapshot()
+        assert_false(snapshot is new_snapshot)
+        editors_id = Group.by_name(u'editors').group_id
+        assert_contains(u'custom', new_snapshot.group_permissions[editors_id])
+    
     def perm(self):
         system = MediaDropPermissionSystem(self.pylons_config)
         system.policies = [self.policy]
@@ -5,10 +5,15 @@
 # (at your option) any later version.
 # See LICENSE.txt in the main project directory, for more information.
 
+import os
+import shutil
+import tempfile
+
+from mediadrop.lib.auth.permission_cache import PermissionCache
 from mediadrop.lib.auth.permission_system import MediaDropPermissionSystem
 from mediadrop.lib.test.db_testcase import DBTestCase
 from mediadrop.lib.test.pythonic_testcase import *
-from mediadrop.model.auth import Group, User
+from mediadrop.model.auth import Group, Permission, User
 from mediadrop.model.meta import DBSession
 
 
@@ -34,17 +39,101 @@ class MediaDropPermissionSystemTest(DBTestCase):
         user = User.example()
         self.assert_user_groups([], user)
     
+    # --- permission cache ----------------------------------------------------
+    
+    def test_caches_resolved_permissions_per_user(self):
+        user = User.example()
+        anonymous_perm = self.perm_for_request(None)
+        user_perm = self.perm_for_request(user)
+        
+        assert_true(anonymous_perm.resolved is self.perm_for_request(None).resolved)
+        assert_true(user_perm.resolved is self.perm_for_request(user).resolved)
+        assert_false(anonymous_perm.resolved is user_perm.resolved)
+    
+    def test_cached_permissions_provide_user_and_groups(self):
+        user = User.example()
+        perm = self.perm_for_request(user)
+        assert_equals(user, perm.user)
+        assert_equals(set([self.anonymous, self.authenticated]), perm.groups)
+        
+        anonymous_perm = self.perm_for_request(None)
+        assert_equals(u'anonymous', anonymous_perm.user.user_name)
+        assert_equals(set([self.anonymous]), anonymous_perm.groups)
+    
+    def test_invalidates_cached_permissions_when_permissions_change(self):
+        assert_false(self.perm_for_request(None).contains_permission(u'custom'))
+        
+        Permission.example(name=u'custom', groups=[self.anonymous])
+        assert_true(self.perm_for_request(None).contains_permission(u'custom'))
+    
+    def test_invalidates_cached_permissions_when_group_membership_changes(self):
+        user = User.example()
+        assert_false(self.perm_for_request(user).contains_permission(u'admin'))
+        
+        user.groups.append(Group.by_name(u'admins'))
+        DBSession.flush()
+        assert_true(self.perm_for_request(user).contains_permission(u'admin'))
+    
     # --- helpers -------------------------------------------------------------
     
     def assert_user_groups(self, groups, user):
         perm = MediaDropPermissionSystem.permissions_for_user(user, self.pylons_config)
         assert_equals(set(groups), set(perm.groups))
+    
+    def perm_for_request(self, user):
+        environ = {}
+        if user is not None:
+            environ['repoze.who.identity'] = {'repoze.who.userid': user.id}
+        return MediaDropPermissionSystem.permissions_for_request(environ, self.pylons_config)
+
+
+class PermissionCacheTest(PythonicTestCase):
+    def setUp(self):
+        self.now = 0
+        self.cache = PermissionCache(ttl=60, clock=lambda: self.now)
+        self.calls = []
+    
+    def create(self):
+        self.calls.append(True)
+        return len(self.calls)
+    
+    def test_returns_cached_value_until_ttl_expires(self):
+        assert_equals(1, self.cache.lookup(42, self.create))
+        self.now = 59
+        assert_equals(1, self.cache.lookup(42, self.create))
+        self.now = 60
+        assert_equals(2, self.cache.lookup(42, self.create))
+    
+    def test_can_invalidate_all_entries(self):
+        self.cache.lookup(42, self.create)
+        self.cache.invalidate()
+        assert_equals(2, self.cache.lookup(42, self.create))
+    
+    def test_notices_invalidation_by_other_processes(self):
+        directory = tempfile.mkdtemp()
+        try:
+            stamp_file = os.path.join(directory, 'permissions.stamp')
+            self.cache.stamp_file = stamp_file
+            self.cache.lookup(42, self.create)
+            assert_equals(1, self.cache.lookup(42, self.create))
+
+            PermissionCache(stamp_file=stamp_file).invalidate()
+            assert_equals(2, self.cache.lookup(42, self.create))
+            assert_equals(2, self.cache.lookup(42, self.create))
+        finally:
+            shutil.rmtree(directory)
+    
+    def test_can_disable_caching(self):
+        self.cache.ttl = 0
+        self.cache.lookup(42, self.create)
+        assert_equals(2, self.cache.lookup(42, self.create))
 
 
 import unittest
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(MediaDropPermissionSystemTest))
+    suite.addTest(unittest.makeSuite(PermissionCacheTest))
     return suite
 
 if __name__ == '__main__':
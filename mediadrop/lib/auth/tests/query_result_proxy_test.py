@@ -196,7 +196,89 @@ class QueryResultProxyTest(PythonicTestCase):
         
         assert_equals(['baz', 'quux', 'quuux'], self._names(self.proxy[2:5]))
     
+    def test_can_slice_without_prefetching_unfiltered_items(self):
+        assert_equals(['quux', 'quuux'], self._names(self.proxy[3:5]))
+        assert_equals([], self.proxy._prefetched_items)
+        assert_equals(['foo'], self._names([self.proxy.next()]))
+    
+    def test_can_slice_filtered_items(self):
+        filter_ = lambda item: item.activity % 2 == 0
+        self.proxy = QueryResultProxy(self.query, filter_=filter_, default_fetch=2)
+        assert_equals(['foo'], self._names(self.proxy[0:1]))
+        # only the items needed for the slice were loaded
+        assert_equals(2, self.proxy._items_retrieved)
+        assert_equals(['foo', 'baz', 'quuux'], self._names(self.proxy))
+    
+    def test_respects_limit_when_slicing(self):
+        self.proxy = QueryResultProxy(self.query).limit(2)
+        assert_equals(['foo', 'bar'], self._names(self.proxy[0:5]))
+    
     # TODO: slice before start
+    
+    # --- counting -------------------------------------------------------------
+    
+    def test_counts_unfiltered_items_in_database(self):
+        assert_length(5, self.proxy)
+        assert_equals([], self.proxy._prefetched_items)
+        
+        assert_length(3, QueryResultProxy(self.query).offset(2))
+        assert_length(2, QueryResultProxy(self.query).limit(2))
+    
+    # --- keyset pagination ----------------------------------------------------
+    
+    def test_uses_keyset_pagination_if_query_is_ordered_by_primary_key(self):
+        self.proxy = QueryResultProxy(self.query, default_fetch=2)
+        assert_not_none(self.proxy._keyset)
+        assert_equals(['foo', 'bar'], self._next_names(n=2))
+        assert_equals([3], self.proxy._last_keys)
+        assert_equals(['baz', 'quux', 'quuux'], self._next_names(n=5))
+    
+    def test_appends_primary_key_to_ensure_unique_order(self):
+        query = self.session.query(User).filter(User.name != None) \
+            .order_by(User.name.desc())
+        self.proxy = QueryResultProxy(query, default_fetch=2)
+        assert_length(2, self.proxy._keyset)
+        assert_equals(['quux', 'quuux', 'foo', 'baz', 'bar'], self._names(self.proxy))
+    
+    def test_uses_offset_if_ordered_by_nullable_columns(self):
+        query = self.session.query(User).order_by(User.activity.desc())
+        self.proxy = QueryResultProxy(query, default_fetch=2)
+        assert_none(self.proxy._keyset)
+        assert_equals(['quuux', 'quux', 'baz', 'bar', 'foo'], self._names(self.proxy))
+    
+    def test_uses_keyset_pagination_if_filter_excludes_null_values(self):
+        # like Media.query.published().order_by(Media.publish_on.desc())
+        self.session.add(User(u'draft', None))
+        self.session.commit()
+        query = self.session.query(User).filter(User.activity <= 10) \
+            .order_by(User.activity.desc())
+        self.proxy = QueryResultProxy(query, default_fetch=2)
+        assert_length(2, self.proxy._keyset)
+        assert_equals(['quuux', 'quux'], self._next_names(n=2))
+        assert_equals([2, 3], self.proxy._last_keys)
+        assert_equals(['baz', 'bar', 'foo'], self._names(self.proxy))
+    
+    def test_can_specify_keyset_explicitely(self):
+        filter_ = lambda item: item.activity != 3
+        keyset = [User.activity.desc(), User.id.desc()]
+        self.proxy = QueryResultProxy(self.query, filter_=filter_,
+            default_fetch=2, keyset=keyset)
+        assert_equals(['quuux', 'baz'], self._next_names(n=2))
+        assert_equals([2, 3], self.proxy._last_keys)
+        assert_equals(['bar', 'foo'], self._next_names(n=2))
+    
+    def test_can_combine_keyset_pagination_with_offset(self):
+        self.proxy = QueryResultProxy(self.query, default_fetch=2).offset(1)
+        assert_equals(['bar', 'baz', 'quux', 'quuux'], self._names(self.proxy))
+    
+    def test_can_disable_keyset_pagination(self):
+        self.proxy = QueryResultProxy(self.query, keyset=())
+        assert_none(self.proxy._keyset)
+        assert_equals(['foo', 'bar'], self._next_names(n=2))
+    
+    def test_can_iterate_over_chunks(self):
+        chunks = [self._names(chunk) for chunk in self.proxy.chunks(2)]
+        assert_equals([['foo', 'bar'], ['baz', 'quux'], ['quuux']], chunks)
 
 import unittest
 def suite():
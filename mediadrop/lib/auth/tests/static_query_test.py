@@ -36,6 +36,9 @@ class StaticQueryTest(PythonicTestCase):
         assert_equals([3, 4, 5], self.query[2:])
         assert_equals(3, self.query.offset(1)[2])
     
+    def test_can_iterate_over_chunks(self):
+        assert_equals([[2, 3], [4, 5]], list(self.query.offset(1).chunks(2)))
+    
     def test_can_return_first_item(self):
         assert_equals(1, self.query.first())
         list(self.query) # consume all other items
@@ -12,7 +12,8 @@ from mediadrop.lib.auth.permission_system import MediaDropPermissionSystem
 
 __all__ = ['viewable_media']
 
-def viewable_media(query):
+def viewable_media(query, keyset=None, default_fetch=10):
     permission_system = MediaDropPermissionSystem(config)
-    return permission_system.filter_restricted_items(query, u'view', request.perm)
+    return permission_system.filter_restricted_items(query, u'view', request.perm,
+        keyset=keyset, default_fetch=default_fetch)
 
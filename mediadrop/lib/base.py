@@ -14,7 +14,7 @@ import time
 import urllib2
 
 from paste.deploy.converters import asbool
-from pylons import app_globals, config, request, response, tmpl_context
+from pylons import config, request, response, tmpl_context
 from pylons.controllers import WSGIController
 from pylons.controllers.util import abort
 from tw.forms.fields import ContainerMixin as _ContainerMixin
@@ -231,25 +231,10 @@ class BaseSettingsController(BaseController):
             if setting.value != value:
                 setting.value = value
                 DBSession.add(setting)
+        # All processes reload the settings once the changes are committed,
+        # see mediadrop.lib.settings_store
         DBSession.flush()
 
-        # Clear the settings cache unless there are multiple processes.
-        # We have no way of notifying the other processes that they need
-        # to clear their caches too, so we've just gotta let it play out
-        # until all the caches expire.
-        if not request.environ.get('wsgi.multiprocess', False):
-            app_globals.settings_cache.clear()
-        else:
-            # uWSGI provides an automagically included module
-            # that we can use to call a graceful restart of all
-            # the uwsgi processes.
-            # http://projects.unbit.it/uwsgi/wiki/uWSGIReload
-            try:
-                import uwsgi
-                uwsgi.reload()
-            except ImportError:
-                pass
-
     def _display(self, form, values=None, action=None):
         """Return the template variables for display of the form.
 
@@ -0,0 +1,251 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Tag-based Cache Invalidation
+
+Values cached with :func:`mediadrop.lib.decorators.beaker_cache` can declare
+the data they depend on as tags, e.g. ``media``, ``podcast:3`` or
+``category:12``. Whenever a model instance is changed the mapper observers
+below invalidate the tags of that instance so only the affected cache
+entries are regenerated.
+
+Invalidating a tag stores the current time. A cached value is stale if one
+of its tags was invalidated after the value was created. With the default
+(per process) memory cache the time is stored as a stamp file per tag in
+``cache_tags.stamp_dir`` (default: ``<cache_dir>/cache_tags``) so all
+processes which share that directory see the invalidation. With a shared
+cache backend (e.g. ``beaker.cache.type = ext:memcached``) the time is
+stored in the cache itself.
+
+Tags can be passed to the decorator (``beaker_cache(tags=['media'])``) or
+added while the value is being created (e.g. from within the action)::
+
+    add_cache_tags('podcast:%d' % podcast.id)
+
+Such values can be kept until one of their tags changes. Only media with a
+publish date in the future become visible (or disappear) without any
+change in the database, so values which contain published media should
+expire at that time::
+
+    @beaker_cache(expire=until_next_publication, tags=['media'])
+"""
+
+from datetime import datetime
+import os
+import time
+
+from pylons import app_globals, config, request
+from sqlalchemy import sql
+from sqlalchemy.orm import attributes
+
+from mediadrop.lib.app_globals import is_object_registered
+from mediadrop.lib.stamp_files import StampDirectory
+from mediadrop.lib.transactions import call_after_commit
+from mediadrop.plugin import events
+from mediadrop.plugin.events import observes
+
+
+__all__ = [
+    'add_cache_tags',
+    'collect_cache_tags',
+    'invalidate_cache_tags',
+    'setup_tag_stamps',
+    'tags_changed_since',
+    'until_next_publication',
+]
+
+STAMP_NAMESPACE = 'mediadrop.lib.cache_tags'
+COLLECTED_TAGS = 'mediadrop.cache_tags'
+PENDING_TAGS = 'mediadrop.cache_tags.pending'
+
+class CacheStamps(object):
+    """Store the invalidation times in a (shared) beaker cache."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def mtime(self, tag):
+        return self.cache.get_value(tag, createfunc=lambda: 0)
+
+    def touch(self, tag):
+        self.cache.put(tag, time.time())
+
+def setup_tag_stamps(config, cache_manager):
+    """Return the stamp store for the cache tags (a
+    :class:`~mediadrop.lib.stamp_files.StampDirectory` unless a shared
+    cache backend is configured)."""
+    stamp_dir = config.get('cache_tags.stamp_dir')
+    cache_type = config.get('beaker.cache.type', 'memory')
+    if not stamp_dir and cache_type == 'memory' and config.get('cache_dir'):
+        stamp_dir = os.path.join(config['cache_dir'], 'cache_tags')
+    if stamp_dir:
+        return StampDirectory(stamp_dir)
+    return CacheStamps(cache_manager.get_cache(STAMP_NAMESPACE))
+
+def _tag_stamps():
+    if not is_object_registered(app_globals):
+        return None
+    globals_ = app_globals._current_obj()
+    if globals_.cache_tag_stamps is None:
+        globals_.cache_tag_stamps = setup_tag_stamps(config, globals_.cache)
+    return globals_.cache_tag_stamps
+
+def _environ():
+    if not is_object_registered(request):
+        return None
+    return request.environ
+
+def tags_changed_since(tags, timestamp):
+    """Return True if one of the given tags was invalidated after the
+    given timestamp."""
+    stamps = _tag_stamps()
+    if stamps is None:
+        return False
+    for tag in tags:
+        if stamps.mtime(tag) >= timestamp:
+            return True
+    return False
+
+def _store_stamps(tags):
+    stamps = _tag_stamps()
+    if stamps is None:
+        return
+    for tag in tags:
+        stamps.touch(tag)
+
+def invalidate_cache_tags(*tags):
+    """Mark all cached values which depend on one of the tags as stale."""
+    _store_stamps(tags)
+    environ = _environ()
+    if environ is None:
+        return
+    # The mapper events are triggered before the transaction is committed so
+    # concurrent requests may still create (and cache) values from the old
+    # data. Invalidate the tags again once the change is visible to everyone.
+    pending = environ.get(PENDING_TAGS)
+    if pending is None:
+        pending = set()
+        def invalidate_pending_tags():
+            _store_stamps(environ.pop(PENDING_TAGS, ()))
+        if not call_after_commit(invalidate_pending_tags, rollback=True):
+            return
+        environ[PENDING_TAGS] = pending
+    pending.update(tags)
+
+def add_cache_tags(*tags):
+    """Declare additional tags for the value which is currently being
+    created by :func:`mediadrop.lib.decorators.beaker_cache` (if any)."""
+    environ = _environ()
+    if environ is None:
+        return
+    collected = environ.get(COLLECTED_TAGS)
+    if collected is not None:
+        collected.update(tags)
+
+def collect_cache_tags(func, tags=()):
+    """Call func and return its result together with all tags which were
+    added via :func:`add_cache_tags` during that call."""
+    environ = _environ()
+    if environ is None:
+        return func(), set(tags)
+    previous = environ.get(COLLECTED_TAGS)
+    environ[COLLECTED_TAGS] = collected = set(tags)
+    try:
+        result = func()
+    finally:
+        if previous is None:
+            del environ[COLLECTED_TAGS]
+        else:
+            environ[COLLECTED_TAGS] = previous
+            previous.update(collected)
+    return result, collected
+
+def until_next_publication():
+    """Return the number of seconds until the next media is published or
+    unpublished because of its publish dates (None if there is no such
+    media). Pass it as ``expire`` to
+    :func:`~mediadrop.lib.decorators.beaker_cache`."""
+    # imported here because the model imports modules which use this one
+    from mediadrop.model import DBSession, Media
+    now = datetime.now()
+    publishable = sql.and_(Media.reviewed == True, Media.encoded == True,
+        Media.publishable == True)
+    next_changes = [
+        DBSession.query(sql.func.min(column))\
+            .filter(publishable)\
+            .filter(column > now)\
+            .scalar()
+        for column in (Media.publish_on, Media.publish_until)
+    ]
+    next_changes = [change for change in next_changes if change is not None]
+    if not next_changes:
+        return None
+    delta = min(next_changes) - now
+    return max(delta.days * 86400 + delta.seconds + 1, 1)
+
+
+def _history_values(instance, key):
+    added, unchanged, deleted = attributes.get_history(instance, key)
+    return list(added or ()) + list(unchanged or ()) + list(deleted or ())
+
+def media_tags(media):
+    tags = set(['media', 'media:%s' % media.id])
+    for podcast_id in _history_values(media, 'podcast_id'):
+        if podcast_id is not None:
+            tags.add('podcast:%s' % podcast_id)
+    for category in _history_values(media, 'categories'):
+        for cat in category.ancestors() + [category]:
+            tags.add('category:%s' % cat.id)
+    return tags
+
+@observes(events.Media.after_insert, events.Media.after_update,
+          events.Media.after_delete)
+def invalidate_media(instance):
+    invalidate_cache_tags(*media_tags(instance))
+
+@observes(events.MediaFile.after_insert, events.MediaFile.after_update,
+          events.MediaFile.after_delete)
+def invalidate_media_file(instance):
+    if instance.media is not None:
+        invalidate_cache_tags(*media_tags(instance.media))
+    else:
+        invalidate_cache_tags('media')
+
+@observes(events.Comment.after_insert, events.Comment.after_update,
+          events.Comment.after_delete)
+def invalidate_comment(instance):
+    invalidate_cache_tags('comments', 'media:%s' % instance.media_id)
+
+@observes(events.Category.after_insert, events.Category.after_update,
+          events.Category.after_delete)
+def invalidate_category(instance):
+    invalidate_cache_tags('categories', 'category:%s' % instance.id)
+
+@observes(events.Podcast.after_insert, events.Podcast.after_update,
+          events.Podcast.after_delete)
+def invalidate_podcast(instance):
+    invalidate_cache_tags('podcasts', 'podcast:%s' % instance.id)
+
+@observes(events.Tag.after_insert, events.Tag.after_update,
+          events.Tag.after_delete)
+def invalidate_tag(instance):
+    invalidate_cache_tags('tags')
+
+@observes(events.Setting.after_insert, events.Setting.after_update,
+          events.Setting.after_delete)
+def invalidate_setting(instance):
+    invalidate_cache_tags('settings')
+
+@observes(events.PlayerPrefs.after_insert, events.PlayerPrefs.after_update,
+          events.PlayerPrefs.after_delete)
+def invalidate_player_prefs(instance):
+    invalidate_cache_tags('players')
+
+@observes(events.StorageEngine.after_insert, events.StorageEngine.after_update,
+          events.StorageEngine.after_delete)
+def invalidate_storage_engine(instance):
+    invalidate_cache_tags('storage')
@@ -0,0 +1,284 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Cached Category Tree
+
+Listing the category hierarchy (with the number of media in each category)
+used to require a query with correlated count subqueries on every request
+and walking the ancestors of each category in Python. Instead the tree is
+kept in memory (per process) as a :class:`CategoryTree` which also knows the
+descendants of every category and the media counts rolled up to the
+ancestors::
+
+    tree = category_tree()
+    for node, depth in tree.roots.traverse():
+        print '    ' * depth, node.name, tree.published_counts[node.id]
+
+The tree is only rebuilt when categories were changed. Changes to media only
+refresh the counts. Other processes notice changes via the cache tags
+``categories`` and ``media`` (see :mod:`mediadrop.lib.cache_tags`).
+"""
+
+from datetime import datetime
+import threading
+import time
+
+from pylons import app_globals
+from sqlalchemy import sql
+
+from mediadrop.lib.app_globals import is_object_registered
+from mediadrop.lib.cache_tags import tags_changed_since
+from mediadrop.lib.transactions import call_after_commit, has_uncommitted_changes
+from mediadrop.model.categories import CategoryList, traverse
+from mediadrop.plugin import events
+from mediadrop.plugin.events import observes
+
+
+__all__ = [
+    'category_tree',
+    'CategoryNode',
+    'CategoryTree',
+    'CategoryTreeCache',
+    'invalidate_category_tree',
+]
+
+class CategoryNode(object):
+    """A category in a :class:`CategoryTree`.
+
+    Provides the same attributes as
+    :class:`~mediadrop.model.categories.Category` which are needed to
+    render the tree but is not attached to a DBSession."""
+
+    def __init__(self, id, name, slug, parent_id):
+        self.id = id
+        self.name = name
+        self.slug = slug
+        self.parent_id = parent_id
+        self.children = CategoryList()
+        self.media_count = 0
+        """Number of media (published or not) in this category."""
+        self.media_count_published = 0
+        """Number of published media in this category (without
+        descendants)."""
+
+    def __repr__(self):
+        return '<CategoryNode: %r>' % self.name
+
+    def __unicode__(self):
+        return self.name
+
+    def traverse(self):
+        """Iterate over all nested categories in depth-first order."""
+        return traverse(self.children)
+
+
+class CategoryTree(object):
+    """An immutable snapshot of all categories and their media counts.
+
+    :param rows: ``(id, name, slug, parent_id)`` tuples of all categories,
+        ordered by name.
+    :param counts: A dict which maps category ids to a tuple
+        ``(media_count, media_count_published)``.
+    """
+
+    def __init__(self, rows, counts):
+        self.nodes = {}
+        self.roots = CategoryList()
+        for row in rows:
+            node = CategoryNode(*row)
+            node.media_count, node.media_count_published = \
+                counts.get(node.id, (0, 0))
+            self.nodes[node.id] = node
+        for id, name, slug, parent_id in rows:
+            if parent_id is None:
+                self.roots.append(self.nodes[id])
+            elif parent_id in self.nodes:
+                self.nodes[parent_id].children.append(self.nodes[id])
+        self._slugs = dict((node.slug, node) for node in self.nodes.itervalues())
+
+        self.descendant_ids = {}
+        """Maps every category id to a frozenset with the ids of its
+        descendants."""
+        for node in self.nodes.itervalues():
+            self.descendant_ids[node.id] = self._collect_descendant_ids(node)
+
+        self.published_counts = {}
+        """Maps every category id to the number of published media in the
+        category and all its descendants."""
+        for node in self.nodes.itervalues():
+            self.published_counts[node.id] = node.media_count_published + \
+                sum(self.nodes[id].media_count_published
+                    for id in self.descendant_ids[node.id])
+
+    def _collect_descendant_ids(self, node):
+        # does not loop forever on circular nesting
+        ids = set()
+        stack = list(node.children)
+        while stack:
+            child = stack.pop()
+            if child.id in ids or child.id == node.id:
+                continue
+            ids.add(child.id)
+            stack.extend(child.children)
+        return frozenset(ids)
+
+    def get(self, category_id):
+        """Return the :class:`CategoryNode` with the given id (or None)."""
+        return self.nodes.get(category_id)
+
+    def by_slug(self, slug):
+        """Return the :class:`CategoryNode` with the given slug (or None)."""
+        return self._slugs.get(slug)
+
+    def subtree_ids(self, category_id):
+        """Return a frozenset with the given category id and the ids of all
+        its descendants."""
+        return self.descendant_ids.get(category_id, frozenset()) | \
+            frozenset([category_id])
+
+    def ancestors(self, category_id):
+        """Return a list of the ancestor nodes, starting with the root."""
+        ancestors = CategoryList()
+        node = self.nodes.get(category_id)
+        while node is not None and node.parent_id is not None:
+            node = self.nodes.get(node.parent_id)
+            if node is None or node in ancestors or node.id == category_id:
+                break
+            ancestors.insert(0, node)
+        return ancestors
+
+
+def fetch_category_rows():
+    from mediadrop.model import Category, DBSession
+    query = DBSession.query(Category.id, Category.name, Category.slug,
+        Category.parent_id).order_by(Category.name)
+    return [tuple(row) for row in query]
+
+def fetch_category_counts():
+    from mediadrop.model import DBSession
+    from mediadrop.model.media import media, media_categories
+    now = datetime.now()
+    published = sql.and_(
+        media.c.reviewed == True,
+        media.c.encoded == True,
+        media.c.publishable == True,
+        media.c.publish_on <= now,
+        sql.or_(media.c.publish_until == None,
+                media.c.publish_until >= now),
+    )
+    select = sql.select([
+            media_categories.c.category_id,
+            sql.func.count(media_categories.c.media_id),
+            sql.func.sum(sql.case([(published, 1)], else_=0)),
+        ],
+        from_obj=media_categories.join(media,
+            media_categories.c.media_id == media.c.id),
+    ).group_by(media_categories.c.category_id)
+    return dict((category_id, (int(count), int(published_count or 0)))
+                for category_id, count, published_count
+                in DBSession.execute(select))
+
+
+class CategoryTreeCache(object):
+    """Keep a :class:`CategoryTree` per process and refresh it when the
+    categories or the media were changed."""
+
+    max_age = 300
+    """Number of seconds after which the counts are refreshed anyway (media
+    become published when their publish date is reached without any change
+    to the database)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tree = None
+        self._rows = None
+        self._rows_loaded = 0
+        self._counts = None
+        self._counts_loaded = 0
+
+    def invalidate(self, categories=True, counts=True):
+        """Mark (parts of) the tree as stale, it is reloaded on next access."""
+        self._lock.acquire()
+        try:
+            if categories:
+                self._rows = None
+            if counts:
+                self._counts = None
+            self._tree = None
+        finally:
+            self._lock.release()
+
+    def tree(self):
+        """Return the current :class:`CategoryTree`."""
+        self._lock.acquire()
+        try:
+            now = time.time()
+            if self._rows is not None and \
+                    tags_changed_since(['categories'], self._rows_loaded):
+                self._rows = None
+            if self._counts is not None and \
+                    (now - self._counts_loaded >= self.max_age or
+                     tags_changed_since(['categories', 'media'], self._counts_loaded)):
+                self._counts = None
+
+            tree = self._tree
+            rows, counts = self._rows, self._counts
+            if tree is None or rows is None or counts is None:
+                if rows is None:
+                    rows = fetch_category_rows()
+                if counts is None:
+                    counts = fetch_category_counts()
+                tree = CategoryTree(rows, counts)
+                # The changes of the current transaction (e.g. flushed during
+                # the load) might be rolled back, do not show them to others.
+                if not has_uncommitted_changes():
+                    if rows is not self._rows:
+                        self._rows, self._rows_loaded = rows, now
+                    if counts is not self._counts:
+                        self._counts, self._counts_loaded = counts, now
+                    self._tree = tree
+            return tree
+        finally:
+            self._lock.release()
+
+
+def category_tree():
+    """Return the :class:`CategoryTree` of the current application. Outside
+    of an application (e.g. in standalone scripts) the tree is not cached."""
+    if is_object_registered(app_globals):
+        globals_ = app_globals._current_obj()
+        if globals_.category_tree is None:
+            globals_.category_tree = CategoryTreeCache()
+        return globals_.category_tree.tree()
+    return CategoryTree(fetch_category_rows(), fetch_category_counts())
+
+def invalidate_category_tree(categories=True):
+    """Reload the (cached) category tree on next access. If ``categories`` is
+    False only the media counts are reloaded.
+
+    This is done automatically whenever a category or a media is changed
+    via the ORM. Call it after bulk updates (e.g. ``Query.delete()``)."""
+    if not is_object_registered(app_globals):
+        return
+    cache = app_globals._current_obj().category_tree
+    if cache is None:
+        return
+    cache.invalidate(categories=categories)
+    # The tree might be reloaded by another request before the transaction
+    # is committed (or rolled back) so invalidate it again afterwards.
+    call_after_commit(lambda: cache.invalidate(categories=categories),
+                      rollback=True)
+
+@observes(events.Category.after_insert, events.Category.after_update,
+          events.Category.after_delete)
+def _category_changed(instance):
+    invalidate_category_tree(categories=True)
+
+@observes(events.Media.after_insert, events.Media.after_update,
+          events.Media.after_delete)
+def _media_changed(instance):
+    invalidate_category_tree(categories=False)
@@ -20,6 +20,10 @@ from pylons.decorators.cache import create_cache_key, _make_dict_from_args
 from pylons.decorators.util import get_pylons
 from webob.exc import HTTPException, HTTPMethodNotAllowed
 
+from mediadrop.lib.cache_tags import (add_cache_tags, collect_cache_tags,
+    tags_changed_since)
+from mediadrop.lib.page_cache import (is_cacheable_request, page_cache_tags,
+    page_cache_vary)
 from mediadrop.lib.paginate import paginate
 from mediadrop.lib.templating import render
 
@@ -31,6 +35,7 @@ __all__ = [
     'expose_xhr',
     'memoize',
     'observable',
+    'page_cache',
     'paginate',
     'validate',
     'validate_xhr',
@@ -416,7 +421,8 @@ def beaker_cache(key="cache_default", expire="never", type=None,
                  query_args=False,
                  cache_headers=('content-type', 'content-length'),
                  invalidate_on_startup=False,
-                 cache_response=True, **b_kwargs):
+                 cache_response=True, vary=None, tags=None, stream=False,
+                 **b_kwargs):
     """Cache decorator utilizing Beaker. Caches action or other
     function that returns a pickle-able object as a result.
 
@@ -429,7 +435,9 @@ def beaker_cache(key="cache_default", expire="never", type=None,
         list - Use [kwargs[k] for k in list] as key
     ``expire``
         Time in seconds before cache expires, or the string "never".
-        Defaults to "never"
+        Defaults to "never". May also be a callable which returns the
+        time in seconds (or None for "never") when a new value is created,
+        e.g. :func:`~mediadrop.lib.cache_tags.until_next_publication`.
     ``type``
         Type of cache to use: dbm, memory, file, memcached, or None for
         Beaker's default
@@ -448,6 +456,21 @@ def beaker_cache(key="cache_default", expire="never", type=None,
         .. note::
             When cache_response is set to False, the cache_headers
             argument is ignored as none of the response is cached.
+    ``vary``
+        A callable which returns a dict of additional values for the
+        cache key (e.g. the current locale).
+    ``tags``
+        A list of tags (e.g. 'media', 'podcast:3') the cached value depends
+        on. Values are regenerated as soon as one of their tags is
+        invalidated (see :mod:`mediadrop.lib.cache_tags`). Additional tags
+        can be declared with :func:`~mediadrop.lib.cache_tags.add_cache_tags`
+        while the value is created.
+    ``stream``
+        If True the function returns an iterable of strings (e.g. from
+        :func:`~mediadrop.lib.templating.render_iter`). A cached value is
+        returned as a single string. Otherwise the iterable is returned
+        and its chunks are joined and cached after the last chunk was
+        consumed so the response can be streamed. Defaults to False.
 
     If cache_enabled is set to False in the .ini file, then cache is
     disabled globally.
@@ -490,6 +513,9 @@ def beaker_cache(key="cache_default", expire="never", type=None,
         else:
             key_dict = None
 
+        if vary is not None:
+            key_dict = dict(key_dict or {}, **vary())
+
         self = None
         if args:
             self = args[0]
@@ -505,30 +531,86 @@ def beaker_cache(key="cache_default", expire="never", type=None,
             raise Exception('No cache object found')
         my_cache = cache_obj.get_cache(namespace, **b_kwargs)
 
-        if expire == "never":
+        if expire == "never" or callable(expire):
             cache_expire = None
         else:
             cache_expire = expire
 
+        def cached_response(result, created, value_tags):
+            glob_response = pylons.response
+            headers = glob_response.headerlist
+            status = glob_response.status
+            full_response = dict(headers=headers, status=status,
+                                 cookies=None, content=result,
+                                 created=created, tags=value_tags)
+            if callable(expire):
+                # computed after the value so it can not miss a change
+                # which happened while the value was created
+                seconds = expire()
+                if seconds is not None:
+                    full_response['expires'] = created + seconds
+            return full_response
+
         def create_func():
             log.debug("Creating new cache copy with key: %s, type: %s",
                       cache_key, type)
-            result = func(*args, **kwargs)
+            created = time.time()
+            result, value_tags = collect_cache_tags(
+                lambda: func(*args, **kwargs), tags or ())
             # This is one of the two changes to the stock beaker_cache
             # decorator
             if hasattr(result, '__html__'):
                 # Genshi Markup object, can not be pickled
                 result = unicode(result.__html__())
-            glob_response = pylons.response
-            headers = glob_response.headerlist
-            status = glob_response.status
-            full_response = dict(headers=headers, status=status,
-                                 cookies=None, content=result)
-            return full_response
-
-        response = my_cache.get_value(cache_key, createfunc=create_func,
-                                      expiretime=cache_expire,
-                                      starttime=starttime)
+            return cached_response(result, created, value_tags)
+
+        def is_stale(response):
+            value_tags = response.get('tags')
+            expires = response.get('expires')
+            if (expires is not None) and (expires <= time.time()):
+                return True
+            return bool(value_tags) and \
+                tags_changed_since(value_tags, response['created'])
+
+        def cache_chunks(chunks, created, value_tags):
+            content = []
+            for chunk in chunks:
+                content.append(chunk)
+                yield chunk
+            full_response = cached_response(''.join(content), created,
+                                            value_tags)
+            my_cache.set_value(cache_key, full_response,
+                               expiretime=cache_expire, starttime=starttime)
+
+        if stream:
+            try:
+                response = my_cache.get_value(cache_key,
+                                              expiretime=cache_expire,
+                                              starttime=starttime)
+            except KeyError:
+                response = None
+            if (response is None) or is_stale(response):
+                log.debug("Streaming new cache copy with key: %s, type: %s",
+                          cache_key, type)
+                created = time.time()
+                chunks, value_tags = collect_cache_tags(
+                    lambda: func(*args, **kwargs), tags or ())
+                return cache_chunks(chunks, created, value_tags)
+            add_cache_tags(*(response.get('tags') or ()))
+        else:
+            response = my_cache.get_value(cache_key, createfunc=create_func,
+                                          expiretime=cache_expire,
+                                          starttime=starttime)
+            if is_stale(response):
+                my_cache.remove_value(cache_key)
+                response = my_cache.get_value(cache_key,
+                                              createfunc=create_func,
+                                              expiretime=cache_expire,
+                                              starttime=starttime)
+            else:
+                # add the tags of the cached value to an enclosing
+                # beaker_cache
+                add_cache_tags(*(response.get('tags') or ()))
         if cache_response:
             glob_response = pylons.response
             glob_response.headerlist = [header for header in response['headers']
@@ -538,6 +620,45 @@ def beaker_cache(key="cache_default", expire="never", type=None,
         return response['content']
     return decorator(wrapper)
 
+def page_cache(expire, on_hit=None):
+    """Cache the complete response of a public page for anonymous visitors.
+
+    Built on :func:`beaker_cache`: the cache key contains the action
+    arguments, the query string and the current locale. Requests with a
+    session or authentication cookie always bypass the cache, see
+    :mod:`mediadrop.lib.page_cache` for details.
+
+    ``expire``
+        Time in seconds before a cached page expires. Any change to media,
+        comments or settings invalidates all cached pages immediately
+        (see :data:`mediadrop.lib.page_cache.page_cache_tags`).
+    ``on_hit``
+        An optional callable which is called with the action arguments
+        when the page was served from the cache (e.g. to count views).
+
+    Must be applied above :func:`expose` so the rendered output is cached.
+    """
+    def mark_rendered(func, *args, **kwargs):
+        request.environ['mediadrop.page_cache.rendered'] = True
+        return func(*args, **kwargs)
+
+    def decorate(func):
+        cached_func = beaker_cache(expire=expire, query_args=True,
+            vary=page_cache_vary, tags=page_cache_tags)(
+                decorator(mark_rendered, func))
+
+        def wrapper(func, *args, **kwargs):
+            if not is_cacheable_request():
+                return func(*args, **kwargs)
+            environ = request.environ
+            environ['mediadrop.page_cache.rendered'] = False
+            result = cached_func(*args, **kwargs)
+            if (on_hit is not None) and not environ['mediadrop.page_cache.rendered']:
+                on_hit(*args, **kwargs)
+            return result
+        return decorator(wrapper, func)
+    return decorate
+
 def observable(event):
     """Filter the result of the decorated action through the events observers.
 
@@ -0,0 +1,311 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Derived Thumbnails
+
+The thumbnails in ``thumb_sizes`` are created when an image is uploaded.
+Other sizes and formats (e.g. for a theme or high resolution displays) are
+derived on demand from the original image by
+:class:`~mediadrop.controllers.thumbnails.ThumbnailsController`::
+
+    /thumbs/media/12-1120x630.webp
+    /thumbs/podcasts/3-l.jpg
+
+Only whitelisted sizes (and the names of the ``thumb_sizes``) and formats
+are rendered::
+
+    thumbnails.derived_sizes = 256x144 1120x630 256x256 1200x1200
+    thumbnails.derived_formats = jpg webp
+    thumbnails.cache_size = 500
+
+Derived images are stored in a disk cache (``thumbnails.cache_dir``,
+default: ``<cache_dir>/thumbnails``) which is limited to ``cache_size`` MB,
+the least recently used files are deleted first. The file names contain the
+modification time of the original image so replaced images never return
+stale thumbnails. Concurrent requests for the same image (in all processes
+using the cache directory) wait for a single process to render it.
+"""
+
+from __future__ import absolute_import
+
+from contextlib import contextmanager
+import os
+import re
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+from PIL import Image
+from pylons import app_globals, config
+
+from mediadrop.lib.compat import md5
+from mediadrop.lib.thumbnails import resize_thumbs, thumb_path
+
+__all__ = [
+    'derived_thumb_url',
+    'derived_thumbs',
+    'DerivedThumbs',
+    'DiskCache',
+    'parse_sizes',
+]
+
+FORMATS = {
+    # extension: (PIL format, content type, save options)
+    'jpg': ('JPEG', 'image/jpeg',
+            dict(quality=85, optimize=True, progressive=True)),
+    'webp': ('WEBP', 'image/webp', dict(quality=80)),
+    'png': ('PNG', 'image/png', dict(optimize=True)),
+}
+ORIG_EXTENSIONS = ('jpg', 'jpeg', 'png', 'gif')
+LOCK_STRIPES = 64
+
+_size_pattern = re.compile(r'^(\d+)x(\d+)$')
+
+def parse_sizes(value):
+    """Return a set of ``(width, height)`` tuples for a string like
+    ``'256x144 1120x630'``."""
+    sizes = set()
+    for size in (value or '').replace(',', ' ').split():
+        match = _size_pattern.match(size.strip())
+        if not match:
+            raise ValueError('Invalid thumbnail size %r' % size)
+        sizes.add((int(match.group(1)), int(match.group(2))))
+    return sizes
+
+
+class DiskCache(object):
+    """A directory of files which is limited to ``max_bytes``.
+
+    Files are touched (at most once per ``touch_interval`` seconds) when
+    they are used so their modification time can be used to delete the least
+    recently used ones.
+    """
+
+    def __init__(self, cache_dir, max_bytes, touch_interval=3600):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self._size = None
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def get(self, name):
+        """Return the path of the cached file or None."""
+        path = self.path(name)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        if time.time() - mtime > self.touch_interval:
+            try:
+                os.utime(path, None)
+            except OSError:
+                pass
+        return path
+
+    def added(self, nbytes):
+        """Record a new file, deletes old files if the cache is full."""
+        with self._lock:
+            if self._size is not None:
+                self._size += nbytes
+            if self._size is None or self._size > self.max_bytes:
+                self.evict()
+
+    def _files(self):
+        for dirpath, dirnames, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if filename.endswith('.tmp') or filename.endswith('.lock'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield st.st_mtime, st.st_size, path
+
+    def evict(self):
+        """If the cache is full, delete the least recently used files until
+        it uses less than 90% of ``max_bytes``. Other processes add files
+        too so the size is counted again."""
+        files = sorted(self._files())
+        total = sum(size for mtime, size, path in files)
+        if total > self.max_bytes:
+            limit = self.max_bytes * 0.9
+            for mtime, size, path in files:
+                if total <= limit:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+        self._size = total
+
+
+class DerivedThumbs(object):
+    """Render thumbnails in whitelisted sizes and formats.
+
+    :param sizes: Allowed ``(width, height)`` tuples.
+    :param formats: Allowed extensions (see :data:`FORMATS`).
+    :param cache: The :class:`DiskCache` for the rendered images.
+    """
+
+    def __init__(self, sizes, formats, cache):
+        self.sizes = set(sizes)
+        self.formats = set(f for f in formats if f in FORMATS)
+        self.cache = cache
+        self._thread_locks = [threading.Lock() for i in range(LOCK_STRIPES)]
+
+    def resolve_size(self, image_dir, size):
+        """Return the ``(width, height)`` for the given size (a name from
+        ``thumb_sizes`` or ``'<width>x<height>'``) or None if the size is
+        not allowed."""
+        named_sizes = config['thumb_sizes'].get(image_dir, {})
+        if size in named_sizes:
+            return tuple(named_sizes[size])
+        match = _size_pattern.match(size)
+        if match:
+            xy = (int(match.group(1)), int(match.group(2)))
+            if xy in self.sizes:
+                return xy
+        return None
+
+    def source_path(self, image_dir, item_id):
+        """Return the path of the best image to derive thumbnails from:
+        the original image if it was saved, else the largest thumbnail."""
+        source = self._source(image_dir, item_id)
+        return source and source[0]
+
+    def _source(self, image_dir, item_id):
+        # The files are checked directly, not via the thumbnail manifest
+        # (which might be a few seconds behind): The version is part of
+        # URLs which are cached for a long time.
+        item = (image_dir, item_id)
+        paths = [thumb_path(item, 'orig', ext=ext) for ext in ORIG_EXTENSIONS]
+        named_sizes = config['thumb_sizes'].get(image_dir, {})
+        largest_first = sorted(named_sizes.iteritems(),
+            key=lambda (key, xy): xy[0] * xy[1], reverse=True)
+        paths.extend(thumb_path(item, key) for key, xy in largest_first)
+        for path in paths:
+            try:
+                return path, os.path.getmtime(path)
+            except OSError:
+                continue
+        return None
+
+    def version(self, image_dir, item_id):
+        """Return a string which changes whenever the source image of the
+        given item is replaced (or None if there is no image)."""
+        source = self._source(image_dir, item_id)
+        if source is None:
+            return None
+        return '%x' % int(source[1] * 1000)
+
+    def derive(self, image_dir, item_id, xy, format):
+        """Return the path of the rendered thumbnail (from the cache if
+        possible) or None if the item has no image."""
+        source = self._source(image_dir, item_id)
+        if source is None:
+            return None
+        source, mtime = source
+        name = '%s/%d-%dx%d-%x.%s' % (image_dir, item_id, xy[0], xy[1],
+            int(mtime * 1000), format)
+        path = self.cache.get(name)
+        if path is not None:
+            return path
+        with self._render_lock(name):
+            # another thread or process might have rendered it already
+            path = self.cache.get(name)
+            if path is None:
+                path = self._render(source, name, xy, format)
+        return path
+
+    @contextmanager
+    def _render_lock(self, name):
+        stripe = int(md5(name).hexdigest()[:8], 16) % LOCK_STRIPES
+        with self._thread_locks[stripe]:
+            if fcntl is None:
+                yield
+                return
+            lock_dir = self.cache.path('.locks')
+            if not os.path.isdir(lock_dir):
+                try:
+                    os.makedirs(lock_dir)
+                except OSError:
+                    pass
+            lock_file = open(os.path.join(lock_dir, '%d.lock' % stripe), 'a')
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                yield
+            finally:
+                lock_file.close()
+
+    def _render(self, source, name, xy, format):
+        pil_format, content_type, options = FORMATS[format]
+        path = self.cache.path(name)
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                pass
+        thumb = resize_thumbs(Image.open(source), {'thumb': xy})['thumb']
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=dirname)
+        try:
+            tmp_file = os.fdopen(fd, 'wb')
+            try:
+                thumb.save(tmp_file, pil_format, **options)
+            finally:
+                tmp_file.close()
+            nbytes = os.path.getsize(tmp_path)
+            os.rename(tmp_path, path)
+        except:
+            os.remove(tmp_path)
+            raise
+        self.cache.added(nbytes)
+        return path
+
+
+def _supported_formats(formats):
+    Image.init()
+    return [f for f in formats if f in FORMATS and FORMATS[f][0] in Image.SAVE]
+
+def derived_thumbs():
+    """Return the :class:`DerivedThumbs` instance of the current process
+    (configured from the ``thumbnails.*`` options)."""
+    globals_ = app_globals._current_obj()
+    if globals_.derived_thumbs is None:
+        cache_dir = config.get('thumbnails.cache_dir') or \
+            os.path.join(config['cache_dir'], 'thumbnails')
+        max_bytes = int(config.get('thumbnails.cache_size', 500)) * 1024 * 1024
+        sizes = parse_sizes(config.get('thumbnails.derived_sizes', ''))
+        formats = config.get('thumbnails.derived_formats', 'jpg').split()
+        globals_.derived_thumbs = DerivedThumbs(sizes,
+            _supported_formats(formats), DiskCache(cache_dir, max_bytes))
+    return globals_.derived_thumbs
+
+def derived_thumb_url(item, size, format='jpg', qualified=False):
+    """Return the URL of the thumbnail of a media or podcast in the given
+    size (a name from ``thumb_sizes`` or ``'<width>x<height>'``) and format
+    or None if the item has no image.
+
+    The URL contains the version of the image so it can be cached forever.
+    """
+    from mediadrop.lib.helpers import url_for
+    image_dir, item_id = item._thumb_dir, item.id
+    version = derived_thumbs().version(image_dir, item_id)
+    if version is None:
+        return None
+    return url_for(controller='/thumbnails', action='derive',
+        image_dir=image_dir, id=item_id, size=size, format=format,
+        v=version, qualified=qualified)
@@ -0,0 +1,370 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Native File Serving
+
+:meth:`mediadrop.controllers.media.MediaController.serve` uses the
+:class:`FileServer` WSGI app (``file_serve_method = default``) to send local
+media files. It supports what video players need to seek efficiently:
+
+- single and multiple byte ranges (``Range``, ``If-Range``), multiple ranges
+  are returned as ``multipart/byteranges``
+- conditional requests (``If-None-Match``, ``If-Modified-Since``)
+- the server's ``wsgi.file_wrapper`` (which usually sends the file with the
+  ``sendfile()`` system call, without copying it through Python) for
+  complete files and open-ended ranges (``bytes=12345-``), other ranges are
+  read in blocks of :data:`BLOCK_SIZE` bytes
+
+File metadata (size, modification time) is kept in a :class:`StatCache` for
+a few seconds so requests for popular files (or requests answered with
+304 Not Modified) do not have to ``stat()`` the file every time::
+
+    file_serve_stat_cache_ttl = 10
+"""
+
+from __future__ import absolute_import
+
+from email.utils import formatdate, mktime_tz, parsedate_tz
+import os
+import stat
+import time
+import uuid
+
+from paste.util import mimeparse
+from pylons import app_globals, config
+
+from mediadrop.lib.app_globals import is_object_registered
+
+
+__all__ = [
+    'accepts',
+    'file_info',
+    'FileInfo',
+    'FileServer',
+    'parse_ranges',
+    'StatCache',
+]
+
+BLOCK_SIZE = 64 * 1024
+MAX_RANGES = 20
+"""Requests with more ranges get the complete file."""
+
+class FileInfo(object):
+    """The metadata of a file which is needed to serve it."""
+    __slots__ = ('path', 'size', 'mtime', 'etag', 'last_modified')
+
+    def __init__(self, path, size, mtime):
+        self.path = path
+        self.size = size
+        self.mtime = int(mtime)
+        self.etag = '"%x-%x"' % (self.mtime, size)
+        self.last_modified = formatdate(self.mtime, usegmt=True)
+
+    @classmethod
+    def from_stat(cls, path, st):
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        return cls(path, st.st_size, st.st_mtime)
+
+    def matches(self, st):
+        return self.size == st.st_size and self.mtime == int(st.st_mtime)
+
+
+class StatCache(object):
+    """Keep the :class:`FileInfo` of recently served files for ``ttl``
+    seconds."""
+
+    def __init__(self, ttl=10, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+
+    def get(self, path):
+        """Return the :class:`FileInfo` for the given path or None if it is
+        not a regular file."""
+        now = time.time()
+        entry = self._entries.get(path)
+        if entry is not None and now - entry[1] < self.ttl:
+            return entry[0]
+        try:
+            st = os.stat(path)
+        except OSError:
+            self._entries.pop(path, None)
+            return None
+        return self.update(path, st, now)
+
+    def update(self, path, st, now=None):
+        """Store (and return) the :class:`FileInfo` built from the given
+        ``os.stat()`` result."""
+        info = FileInfo.from_stat(path, st)
+        if info is None:
+            self._entries.pop(path, None)
+            return None
+        if len(self._entries) >= self.max_entries:
+            self._entries.clear()
+        self._entries[path] = (info, now or time.time())
+        return info
+
+
+def stat_cache():
+    """Return the :class:`StatCache` of the current application."""
+    if not is_object_registered(app_globals):
+        return StatCache(ttl=0)
+    globals_ = app_globals._current_obj()
+    if globals_.file_stat_cache is None:
+        ttl = int(config.get('file_serve_stat_cache_ttl', 10))
+        globals_.file_stat_cache = StatCache(ttl=ttl)
+    return globals_.file_stat_cache
+
+def file_info(path):
+    """Return the (cached) :class:`FileInfo` for the given path or None if
+    the file does not exist."""
+    return stat_cache().get(path)
+
+_accept_cache = {}
+
+def accepts(content_type, accept_header):
+    """Return True if the given ``Accept`` header allows the content type.
+    Results are cached as most clients always send the same header."""
+    key = (content_type, accept_header)
+    result = _accept_cache.get(key)
+    if result is None:
+        result = bool(mimeparse.best_match([content_type], accept_header))
+        if len(_accept_cache) >= 1000:
+            _accept_cache.clear()
+        _accept_cache[key] = result
+    return result
+
+
+def parse_ranges(header, size):
+    """Parse a ``Range`` header.
+
+    :returns: A list of ``(start, end)`` tuples (inclusive) of the
+        satisfiable ranges (which may be empty), or None if the header is
+        invalid (and should be ignored).
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+    ranges = []
+    for spec in header[len('bytes='):].split(','):
+        spec = spec.strip()
+        if not spec:
+            continue
+        if '-' not in spec:
+            return None
+        first, last = [part.strip() for part in spec.split('-', 1)]
+        try:
+            if not first:
+                # suffix range: the last N bytes
+                length = int(last)
+                if length <= 0:
+                    continue
+                start, end = max(size - length, 0), size - 1
+            else:
+                start = int(first)
+                if last:
+                    end = int(last)
+                    if end < start:
+                        return None
+                else:
+                    end = size - 1
+        except ValueError:
+            return None
+        if start < 0:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+def _parse_date(value):
+    parsed = value and parsedate_tz(value.split(';', 1)[0].strip())
+    if not parsed:
+        return None
+    try:
+        return mktime_tz(parsed)
+    except (OverflowError, ValueError):
+        return None
+
+def _etag_matches(info, header):
+    if header.strip() == '*':
+        return True
+    for etag in header.split(','):
+        etag = etag.strip()
+        if etag.startswith('W/'):
+            etag = etag[2:]
+        if etag == info.etag:
+            return True
+    return False
+
+
+class FileIterator(object):
+    """Return ``length`` bytes of a file (starting at its current position)
+    in blocks."""
+
+    def __init__(self, file, length, block_size=BLOCK_SIZE):
+        self.file = file
+        self.length = length
+        self.block_size = block_size
+
+    def __iter__(self):
+        remaining = self.length
+        while remaining > 0:
+            data = self.file.read(min(self.block_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+    def close(self):
+        self.file.close()
+
+
+class MultipartIterator(object):
+    """Return several ranges of a file as ``multipart/byteranges`` body."""
+
+    def __init__(self, file, parts, boundary, block_size=BLOCK_SIZE):
+        self.file = file
+        self.parts = parts
+        self.boundary = boundary
+        self.block_size = block_size
+
+    def __iter__(self):
+        for part_header, start, end in self.parts:
+            yield part_header
+            self.file.seek(start)
+            for data in FileIterator(self.file, end - start + 1, self.block_size):
+                yield data
+            yield '\r\n'
+        yield '--%s--\r\n' % self.boundary
+
+    def close(self):
+        self.file.close()
+
+
+class FileServer(object):
+    """WSGI app which serves a single file.
+
+    :param info: The :class:`FileInfo` of the file (e.g. from
+        :func:`file_info`).
+    :param content_type: The content type of the file.
+    :param headers: Additional response headers (list of tuples).
+    """
+
+    def __init__(self, info, content_type, headers=(), block_size=BLOCK_SIZE):
+        self.info = info
+        self.content_type = content_type
+        self.headers = list(headers)
+        self.block_size = block_size
+
+    def __call__(self, environ, start_response):
+        method = environ['REQUEST_METHOD']
+        if method not in ('GET', 'HEAD'):
+            start_response('405 Method Not Allowed',
+                [('Allow', 'GET, HEAD'), ('Content-Length', '0')])
+            return []
+        if self._not_modified(self.info, environ):
+            start_response('304 Not Modified', self._validators(self.info))
+            return []
+
+        try:
+            file = open(self.info.path, 'rb')
+        except IOError:
+            start_response('404 Not Found', [('Content-Length', '0')])
+            return []
+        # The cached metadata might be outdated (e.g. the file was replaced).
+        # fstat() on the open file is cheap and guarantees that the size
+        # matches the data which is sent.
+        st = os.fstat(file.fileno())
+        info = self.info
+        if not info.matches(st):
+            info = stat_cache().update(info.path, st) or \
+                FileInfo(info.path, st.st_size, st.st_mtime)
+
+        ranges = None
+        if 'HTTP_RANGE' in environ and self._if_range_matches(info, environ):
+            ranges = parse_ranges(environ['HTTP_RANGE'], info.size)
+
+        headers = self._validators(info) + [('Accept-Ranges', 'bytes')] + \
+            self.headers
+        if ranges == []:
+            file.close()
+            start_response('416 Requested Range Not Satisfiable', headers + [
+                ('Content-Range', 'bytes */%d' % info.size),
+                ('Content-Length', '0'),
+            ])
+            return []
+
+        if not ranges:
+            status = '200 OK'
+            headers += [('Content-Type', self.content_type),
+                        ('Content-Length', str(info.size))]
+            body = lambda: self._file_body(environ, file, info, 0, info.size)
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            status = '206 Partial Content'
+            headers += [
+                ('Content-Type', self.content_type),
+                ('Content-Range', 'bytes %d-%d/%d' % (start, end, info.size)),
+                ('Content-Length', str(end - start + 1)),
+            ]
+            body = lambda: self._file_body(environ, file, info, start,
+                end - start + 1)
+        else:
+            status = '206 Partial Content'
+            boundary = uuid.uuid4().hex
+            parts = []
+            length = len('--%s--\r\n' % boundary)
+            for start, end in ranges:
+                part_header = '--%s\r\nContent-Type: %s\r\n' \
+                    'Content-Range: bytes %d-%d/%d\r\n\r\n' % \
+                    (boundary, self.content_type, start, end, info.size)
+                parts.append((part_header, start, end))
+                length += len(part_header) + (end - start + 1) + len('\r\n')
+            headers += [
+                ('Content-Type', 'multipart/byteranges; boundary=%s' % boundary),
+                ('Content-Length', str(length)),
+            ]
+            body = lambda: MultipartIterator(file, parts, boundary,
+                self.block_size)
+
+        start_response(status, headers)
+        if method == 'HEAD':
+            file.close()
+            return []
+        return body()
+
+    def _file_body(self, environ, file, info, start, length):
+        file.seek(start)
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None and start + length == info.size:
+            # The server sends the rest of the file, usually via sendfile().
+            return file_wrapper(file, self.block_size)
+        return FileIterator(file, length, self.block_size)
+
+    def _validators(self, info):
+        return [('ETag', info.etag), ('Last-Modified', info.last_modified)]
+
+    def _not_modified(self, info, environ):
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            return _etag_matches(info, if_none_match)
+        since = _parse_date(environ.get('HTTP_IF_MODIFIED_SINCE'))
+        return since is not None and info.mtime <= since
+
+    def _if_range_matches(self, info, environ):
+        if_range = environ.get('HTTP_IF_RANGE')
+        if not if_range:
+            return True
+        if_range = if_range.strip()
+        if if_range.startswith('"') or if_range.startswith('W/'):
+            # only strong validators may be used with If-Range
+            return if_range == info.etag
+        since = _parse_date(if_range)
+        return since is not None and info.mtime <= since
@@ -5,7 +5,7 @@
 # (at your option) any later version.
 # See LICENSE.txt in the main project directory, for more information.
 
-from mediadrop.lib.i18n import _
+from mediadrop.lib.i18n import N_
 from mediadrop.plugin.events import (media_types as registered_media_types,
     observes)
 
@@ -23,11 +23,13 @@ CAPTIONS = u'captions'
 
 @observes(registered_media_types)
 def register_default_types():
+    # translated when displayed, the types are also needed without a
+    # translator (e.g. at import time)
     default_types = [
-        (VIDEO, _('Video')),
-        (AUDIO, _('Audio')),
-        (AUDIO_DESC, _('Audio Description')),
-        (CAPTIONS, _('Captions')),
+        (VIDEO, N_('Video')),
+        (AUDIO, N_('Audio')),
+        (AUDIO_DESC, N_('Audio Description')),
+        (CAPTIONS, N_('Captions')),
     ]
     for t in default_types:
         yield t
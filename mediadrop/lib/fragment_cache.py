@@ -0,0 +1,222 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Fragment Cache
+
+Even if a page can not be cached as a whole (e.g. for logged-in users) some
+parts of it are costly to render but look the same for every visitor: the
+player markup, the comment list or the category navigation. These fragments
+are cached in the Beaker CacheManager and can be used from helpers::
+
+    return cached_fragment('player', lambda: render(...), objects=[media])
+
+and from Genshi templates (the result of a ``py:def`` function is rendered
+once and then reused)::
+
+    ${h.cached_fragment('comment_list', lambda: comment_items(comments),
+                        objects=comments)}
+
+The cache key contains the fragment name, the id and ``modified_on`` of all
+given objects, the current locale and host and the optional ``vary`` dict.
+Every fragment also depends on the cache tags (see
+:mod:`mediadrop.lib.cache_tags`) of its objects (e.g. ``media:3``), the
+``settings`` tag and any additional ``tags`` so the mapper observers in
+:mod:`mediadrop.lib.cache_tags` drop fragments when the underlying data is
+changed.
+
+The number of hits and misses is counted per fragment name (and process),
+see :meth:`FragmentCache.stats`. Fragment caching is disabled by default.
+All processes must see the invalidated tags so only enable it if they share
+the ``cache_tags.stamp_dir`` (the default with the memory cache if all
+processes use the same ``cache_dir``) or a shared cache backend::
+
+    fragment_cache.enabled = true
+    fragment_cache.expire = 300
+"""
+
+import logging
+import threading
+import time
+
+from genshi.core import Markup, Stream
+from paste.deploy.converters import asbool, asint
+from pylons import app_globals, config, request, translator
+
+from mediadrop.lib.app_globals import is_object_registered
+from mediadrop.lib.cache_tags import (add_cache_tags, collect_cache_tags,
+    tags_changed_since)
+from mediadrop.lib.compat import sha1
+from mediadrop.lib.templating import render_stream
+
+
+__all__ = [
+    'cached_fragment',
+    'fragment_cache',
+    'FragmentCache',
+]
+
+log = logging.getLogger(__name__)
+
+NAMESPACE = 'mediadrop.lib.fragment_cache'
+
+def _object_kind(obj):
+    return obj.__class__.__name__.lower()
+
+def _render(value):
+    if isinstance(value, Stream):
+        value = render_stream(value, method='xhtml')
+    elif value is None:
+        value = u''
+    # Markup can not be pickled (e.g. for file or memcached backends)
+    return unicode(value)
+
+
+class FragmentCache(object):
+    """Cache rendered fragments in a Beaker cache and count hits/misses.
+
+    :param cache: A :class:`beaker.cache.Cache` instance.
+    :param expire: Number of seconds after which a fragment is rendered
+        again even if none of its tags was invalidated.
+    :param enabled: If False every fragment is rendered on each call.
+    """
+
+    def __init__(self, cache, expire=300, enabled=True):
+        self.cache = cache
+        self.expire = expire
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def fragment_key(self, name, objects=(), vary=None):
+        """Return the cache key for the given fragment."""
+        parts = [name]
+        for obj in objects:
+            modified_on = getattr(obj, 'modified_on', None)
+            parts.append(u'%s:%s:%s' % (_object_kind(obj), obj.id,
+                modified_on and modified_on.isoformat() or u''))
+        for key, value in sorted((vary or {}).items()):
+            parts.append(u'%s=%r' % (key, value))
+        key = u'|'.join(parts).encode('utf-8')
+        return '%s:%s' % (name, sha1(key).hexdigest())
+
+    def fragment_tags(self, objects=(), tags=()):
+        """Return the cache tags a fragment depends on."""
+        value_tags = set(tags)
+        value_tags.add('settings')
+        for obj in objects:
+            value_tags.add('%s:%s' % (_object_kind(obj), obj.id))
+        return value_tags
+
+    def get(self, name, createfunc, objects=(), vary=None, tags=(),
+            expire=None):
+        """Return the cached fragment (as :class:`genshi.core.Markup`) or
+        create it by calling ``createfunc``.
+
+        :param name: The name of the fragment (e.g. ``'player'``).
+        :param createfunc: A callable which returns the fragment as a
+            Genshi stream or a (unicode) string.
+        :param objects: Model instances which are displayed in the fragment.
+        :param vary: A dict of additional values for the cache key.
+        :param tags: Additional cache tags the fragment depends on.
+        :param expire: Overrides the default expiration time (seconds).
+        """
+        if not self.enabled:
+            return Markup(_render(createfunc()))
+        objects = list(objects)
+        key = self.fragment_key(name, objects, vary)
+        created = []
+        def create():
+            created.append(True)
+            timestamp = time.time()
+            content, value_tags = collect_cache_tags(
+                lambda: _render(createfunc()),
+                self.fragment_tags(objects, tags))
+            return dict(content=content, created=timestamp, tags=value_tags)
+
+        expiretime = expire or self.expire
+        entry = self.cache.get_value(key, createfunc=create,
+                                     expiretime=expiretime)
+        if not created and tags_changed_since(entry['tags'], entry['created']):
+            self.cache.remove_value(key)
+            entry = self.cache.get_value(key, createfunc=create,
+                                         expiretime=expiretime)
+        if not created:
+            # add the tags of the cached fragment to an enclosing beaker_cache
+            add_cache_tags(*entry['tags'])
+        self._count(name, hit=not created)
+        return Markup(entry['content'])
+
+    def _count(self, name, hit):
+        self._lock.acquire()
+        try:
+            hits, misses = self._stats.get(name, (0, 0))
+            if hit:
+                hits += 1
+            else:
+                misses += 1
+            self._stats[name] = (hits, misses)
+        finally:
+            self._lock.release()
+        log.debug('Fragment %r: %s (%d hits, %d misses)', name,
+                  hit and 'hit' or 'miss', hits, misses)
+
+    def stats(self):
+        """Return a dict which maps the fragment names to a dict with the
+        number of ``hits`` and ``misses`` (in this process)."""
+        self._lock.acquire()
+        try:
+            return dict((name, dict(hits=hits, misses=misses))
+                        for name, (hits, misses) in self._stats.items())
+        finally:
+            self._lock.release()
+
+    def reset_stats(self):
+        self._lock.acquire()
+        try:
+            self._stats.clear()
+        finally:
+            self._lock.release()
+
+
+def fragment_cache():
+    """Return the :class:`FragmentCache` of the current application (or
+    None outside of an application, e.g. in standalone scripts)."""
+    if not is_object_registered(app_globals):
+        return None
+    globals_ = app_globals._current_obj()
+    if globals_.fragment_cache is None:
+        enabled = asbool(config.get('cache_enabled', True)) and \
+            asbool(config.get('fragment_cache.enabled', False))
+        globals_.fragment_cache = FragmentCache(
+            globals_.cache.get_cache(NAMESPACE),
+            expire=asint(config.get('fragment_cache.expire', 300)),
+            enabled=enabled,
+        )
+    return globals_.fragment_cache
+
+def fragment_vary():
+    """Return the values of the current request which are part of the key of
+    every fragment (rendered fragments contain translated text and
+    qualified URLs)."""
+    if not is_object_registered(request):
+        return {}
+    return {
+        'locale': str(translator.locale),
+        'host': request.host,
+        'scheme': request.scheme,
+    }
+
+def cached_fragment(name, createfunc, objects=(), vary=None, tags=(),
+                    expire=None):
+    """Return the rendered fragment from the fragment cache, see
+    :meth:`FragmentCache.get` for the parameters."""
+    cache = fragment_cache()
+    if cache is None:
+        return Markup(_render(createfunc()))
+    vary = dict(fragment_vary(), **(vary or {}))
+    return cache.get(name, createfunc, objects=objects, vary=vary, tags=tags,
+                     expire=expire)
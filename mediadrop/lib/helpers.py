@@ -28,7 +28,9 @@ from webhelpers.html.converters import format_paragraphs
 
 from mediadrop.lib.auth import viewable_media
 from mediadrop.lib.compat import any, md5
+from mediadrop.lib.derived_thumbs import derived_thumb_url
 from mediadrop.lib.filesize import format_filesize
+from mediadrop.lib.fragment_cache import cached_fragment
 from mediadrop.lib.i18n import (N_, _, format_date, format_datetime, 
     format_decimal, format_time)
 from mediadrop.lib.players import (embed_player, embed_iframe, media_player,
@@ -47,6 +49,7 @@ from mediadrop.plugin.events import (meta_description, meta_keywords,
 __all__ = [
     # Imports that should be exported:
     'any',
+    'cached_fragment',
     'clean_xhtml',
     'current_url',
     'config', # is this appropriate to export here?
@@ -54,6 +57,7 @@ __all__ = [
     'content_type_for_response',
     'date',
     'decode_entities',
+    'derived_thumb_url',
     'encode_entities',
     'excerpt_xhtml',
     'feedgenerator',
@@ -0,0 +1,235 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Background Job Queue
+
+Slow work which does not need to finish within the request (downloading
+thumbnails, post-processing and transcoding new media files) can be queued
+in the ``jobs`` table (:class:`mediadrop.model.jobs.Job`) and is done by
+separate worker processes::
+
+    background_jobs.enabled = true
+    background_jobs.max_attempts = 5
+    background_jobs.retry_delay = 60
+
+    python batch-scripts/run_jobs.py deployment.ini
+
+Jobs are queued in the request transaction so they are only visible to the
+workers once the request committed. Each job is claimed with a conditional
+UPDATE so several workers (on one or more hosts) can share the queue. Failed
+jobs are retried after ``retry_delay * 2 ** (attempts - 1)`` seconds, after
+``max_attempts`` attempts they are marked as failed (and shown in the admin
+media table).
+
+Handlers are registered with :func:`job_handler`::
+
+    @job_handler(u'thumbnail')
+    def fetch_thumbnail(job):
+        ...
+"""
+
+from datetime import datetime, timedelta
+import logging
+import os
+import socket
+import time
+import traceback
+
+from sqlalchemy import sql
+
+from mediadrop.model.jobs import (Job, JOB_DONE, JOB_FAILED, JOB_PENDING,
+    JOB_RUNNING, jobs)
+from mediadrop.model.meta import DBSession
+
+__all__ = [
+    'background_jobs_enabled',
+    'enqueue_job',
+    'job_handler',
+    'JobWorker',
+    'use_background_jobs',
+]
+
+log = logging.getLogger(__name__)
+
+_enabled = False
+_max_attempts = 5
+_retry_delay = 60
+
+_handlers = {}
+
+def use_background_jobs(enabled=True, max_attempts=5, retry_delay=60):
+    """Queue slow work as background jobs instead of doing it during the
+    request."""
+    global _enabled, _max_attempts, _retry_delay
+    _enabled = enabled
+    _max_attempts = max_attempts
+    _retry_delay = retry_delay
+
+def background_jobs_enabled():
+    return _enabled
+
+def job_handler(job_type):
+    """Register the decorated function as handler for the given job type.
+
+    The handler is called with the :class:`~mediadrop.model.jobs.Job`. It
+    should raise an exception if the job should be retried later.
+    """
+    def register(func):
+        _handlers[job_type] = func
+        return func
+    return register
+
+def enqueue_job(job_type, media=None, media_file=None, data=None,
+                delay=0, flush=True):
+    """Add a new job to the queue (in the current transaction).
+
+    :param media: The :class:`~mediadrop.model.media.Media` the job is about
+        (used to show the processing state in the admin).
+    :param media_file: The :class:`~mediadrop.model.media.MediaFile`.
+    :param data: A JSON serializable dict with parameters for the handler.
+    :param delay: Seconds before the job may be started.
+    :param flush: Pass False while the session is flushing (e.g. in an
+        ``after_flush`` listener), the job is then written by the commit.
+    :rtype: :class:`~mediadrop.model.jobs.Job`
+    """
+    if media is None and media_file is not None:
+        media = media_file.media
+    job = Job()
+    job.type = job_type
+    job.media_id = media is not None and media.id or None
+    job.media_file_id = media_file is not None and media_file.id or None
+    job.status = JOB_PENDING
+    job.data = data or {}
+    job.attempts = 0
+    job.max_attempts = _max_attempts
+    job.run_after = datetime.now() + timedelta(seconds=delay)
+    DBSession.add(job)
+    if flush:
+        DBSession.flush()
+    return job
+
+
+class JobWorker(object):
+    """Claim and run queued jobs.
+
+    :param name: Identifies the worker in the ``jobs.worker`` column.
+    :param stale_timeout: Jobs which are 'running' for longer than this
+        many seconds are considered abandoned (e.g. the worker was killed)
+        and are queued again.
+    """
+
+    def __init__(self, name=None, stale_timeout=3600):
+        if name is None:
+            name = u'%s:%d' % (socket.gethostname(), os.getpid())
+        self.name = name
+        self.stale_timeout = stale_timeout
+
+    def claim(self):
+        """Mark the next due job as running and return it (or None)."""
+        now = datetime.now()
+        due_ids = DBSession.query(jobs.c.id)\
+            .filter(jobs.c.status == JOB_PENDING)\
+            .filter(jobs.c.run_after <= now)\
+            .order_by(jobs.c.run_after, jobs.c.id)\
+            .limit(10)
+        for job_id, in due_ids.all():
+            claimed = DBSession.execute(jobs.update()\
+                .where(sql.and_(jobs.c.id == job_id,
+                                jobs.c.status == JOB_PENDING))\
+                .values(status=JOB_RUNNING, worker=self.name, started_on=now,
+                        attempts=jobs.c.attempts + 1))
+            if claimed.rowcount == 1:
+                DBSession.commit()
+                return DBSession.query(Job).get(job_id)
+        DBSession.commit()
+        return None
+
+    def run(self, job):
+        """Run the handler of the given (claimed) job and record the
+        result. Returns True if the job was done successfully."""
+        job_id = job.id
+        handler = _handlers.get(job.type)
+        try:
+            if handler is None:
+                raise ValueError('No handler for job type %r' % job.type)
+            handler(job)
+            job.status = JOB_DONE
+            job.error = None
+            job.finished_on = datetime.now()
+            DBSession.commit()
+            return True
+        except Exception:
+            error = traceback.format_exc()
+            log.exception('Job %r failed', job_id)
+            DBSession.rollback()
+        self._record_failure(job_id, error)
+        return False
+
+    def _record_failure(self, job_id, error):
+        job = DBSession.query(Job).get(job_id)
+        if job is None:
+            # deleted together with its media
+            DBSession.commit()
+            return
+        job.error = error.decode('utf-8', 'replace')
+        job.finished_on = datetime.now()
+        if job.attempts < job.max_attempts:
+            delay = _retry_delay * 2 ** max(job.attempts - 1, 0)
+            job.status = JOB_PENDING
+            job.run_after = datetime.now() + timedelta(seconds=delay)
+        else:
+            job.status = JOB_FAILED
+        DBSession.commit()
+
+    def requeue_stale_jobs(self):
+        """Queue jobs again which are running for too long."""
+        started_before = datetime.now() - timedelta(seconds=self.stale_timeout)
+        result = DBSession.execute(jobs.update()\
+            .where(sql.and_(jobs.c.status == JOB_RUNNING,
+                            jobs.c.started_on < started_before))\
+            .values(status=JOB_PENDING))
+        DBSession.commit()
+        return result.rowcount
+
+    def run_pending(self, max_jobs=None):
+        """Run due jobs until the queue is empty (or ``max_jobs`` jobs
+        were run). Returns the number of jobs run."""
+        count = 0
+        while max_jobs is None or count < max_jobs:
+            job = self.claim()
+            if job is None:
+                break
+            self.run(job)
+            count += 1
+            DBSession.expunge_all()
+        return count
+
+    def run_forever(self, poll_interval=5):
+        """Process the queue until the process is stopped."""
+        last_requeue = 0
+        while True:
+            if time.time() - last_requeue > 60:
+                self.requeue_stale_jobs()
+                last_requeue = time.time()
+            if not self.run_pending():
+                time.sleep(poll_interval)
+
+
+def retry_failed_jobs():
+    """Queue all failed jobs again. Returns the number of jobs."""
+    result = DBSession.execute(jobs.update()\
+        .where(jobs.c.status == JOB_FAILED)\
+        .values(status=JOB_PENDING, attempts=0, run_after=datetime.now()))
+    return result.rowcount
+
+def delete_finished_jobs(days=7):
+    """Delete jobs which were done more than ``days`` days ago."""
+    finished_before = datetime.now() - timedelta(days=days)
+    result = DBSession.execute(jobs.delete()\
+        .where(sql.and_(jobs.c.status == JOB_DONE,
+                        jobs.c.finished_on < finished_before)))
+    return result.rowcount
@@ -0,0 +1,70 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Full-page Cache for Anonymous Visitors
+
+Public pages like the media listing or the media view page look the same for
+every anonymous visitor so the complete response can be cached (see
+:func:`mediadrop.lib.decorators.page_cache`). The cache is disabled by
+default, enable it in your ini file::
+
+    page_cache.enabled = true
+
+Cached pages vary on the query string and the locale. Requests which carry a
+session or an authentication cookie are never served from the cache.
+
+Whenever media, comments, categories, podcasts, tags or settings are changed
+all cached pages are considered stale (see :mod:`mediadrop.lib.cache_tags`).
+"""
+
+from paste.deploy.converters import asbool
+from pylons import config, request, translator
+
+
+__all__ = [
+    'is_cacheable_request',
+    'page_cache_tags',
+    'page_cache_vary',
+]
+
+# All data which is displayed on the public pages. Any change to these
+# invalidates all cached pages.
+page_cache_tags = ('media', 'comments', 'categories', 'podcasts', 'tags',
+    'settings')
+
+def is_cacheable_request():
+    """Return True if the current request may be served from the page cache.
+
+    Only GET requests without a session or authentication cookie are
+    cacheable: Logged-in users (or users with a session) might see
+    different content than anonymous visitors.
+    """
+    if not asbool(config.get('page_cache.enabled', False)):
+        return False
+    if request.method != 'GET':
+        return False
+    cookie_names = [
+        config.get('beaker.session.key', 'beaker.session.id'),
+        _auth_cookie_name(),
+    ]
+    for name in cookie_names:
+        if name in request.cookies:
+            return False
+    return True
+
+def _auth_cookie_name():
+    who_plugins = request.environ.get('repoze.who.plugins', {})
+    cookie_plugin = who_plugins.get('cookie')
+    return getattr(cookie_plugin, 'cookie_name', 'authtkt')
+
+def page_cache_vary():
+    """Return the values (besides the action arguments and the query
+    string) which determine the cache key of a page."""
+    return {
+        'locale': str(translator.locale),
+        'host': request.host,
+    }
@@ -18,6 +18,7 @@ from sqlalchemy import sql
 from mediadrop.forms.admin import players as player_forms
 from mediadrop.lib.compat import any
 from mediadrop.lib.filetypes import AUDIO, VIDEO, AUDIO_DESC, CAPTIONS
+from mediadrop.lib.fragment_cache import cached_fragment
 from mediadrop.lib.i18n import N_
 from mediadrop.lib.templating import render
 from mediadrop.lib.thumbnails import thumb_url
@@ -972,8 +973,9 @@ class iTunesPlayer(FileSupportMixin, AbstractPlayer):
 
 ###############################################################################
 
-def preferred_player_for_media(media, **kwargs):
-    uris = media.get_uris()
+def preferred_player_for_media(media, uris=None, **kwargs):
+    if uris is None:
+        uris = media.get_uris()
 
     from mediadrop.model.players import fetch_enabled_players
     # Find the first player that can play any uris
@@ -1017,25 +1019,35 @@ def media_player(media, is_widescreen=False, show_like=True, show_dislike=True,
 
     :param \*\*kwargs: Extra kwargs for :meth:`AbstractPlayer.__init__`.
 
-    :rtype: `str` or `None`
-    :returns: A rendered player.
+    :rtype: :class:`genshi.core.Markup`
+    :returns: The rendered player (cached, see
+        :mod:`mediadrop.lib.fragment_cache`).
     """
-    player = preferred_player_for_media(media, **kwargs)
-    return render('players/html5_or_flash.html', {
-        'player': player,
-        'media': media,
-        'uris': media.get_uris(),
-        'is_widescreen': is_widescreen,
-        'js_init': js_init,
-        'show_like': show_like,
-        'show_dislike': show_dislike,
-        'show_download': show_download,
-        'show_embed': show_embed,
-        'show_playerbar': show_playerbar,
-        'show_popout': show_popout,
-        'show_resize': show_resize and (player and player.supports_resizing),
-        'show_share': show_share,
-    })
+    options = dict(
+        is_widescreen=is_widescreen,
+        js_init=js_init,
+        show_like=show_like,
+        show_dislike=show_dislike,
+        show_download=show_download,
+        show_embed=show_embed,
+        show_playerbar=show_playerbar,
+        show_popout=show_popout,
+        show_resize=show_resize,
+        show_share=show_share,
+    )
+    def render_player():
+        uris = media.get_uris()
+        player = preferred_player_for_media(media, uris=uris, **kwargs)
+        return render('players/html5_or_flash.html', dict(options,
+            player=player,
+            media=media,
+            uris=uris,
+            show_resize=show_resize and (player and player.supports_resizing),
+        ))
+    # The markup only changes with the media (files), the player preferences
+    # and the settings, see mediadrop.lib.fragment_cache
+    return cached_fragment('player', render_player, objects=[media],
+        vary=dict(options, **kwargs), tags=['players'])
 
 def pick_podcast_media_file(media):
     """Return a file playable in the most podcasting client: iTunes.
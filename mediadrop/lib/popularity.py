@@ -0,0 +1,137 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Bulk Popularity Recalculation
+
+:meth:`mediadrop.model.media.Media.update_popularity` recalculates the
+popularity of a single media instance. After the popularity settings were
+changed the points of *all* media must be recalculated. This module does
+that without loading ORM instances:
+
+- On MySQL a single ``UPDATE`` statement calculates the points in the
+  database (using ``LOG()`` and ``TIMESTAMPDIFF()``).
+- Other databases (e.g. SQLite has no ``LOG()``) fetch only the required
+  columns in chunks, calculate the points with
+  :func:`mediadrop.lib.util.calculate_popularity` and write them back with
+  one (``executemany``) ``UPDATE`` per chunk.
+
+Both ways yield exactly the same points as :meth:`update_popularity`.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import sql
+
+from mediadrop.lib.cache_tags import invalidate_cache_tags
+from mediadrop.lib.settings_store import Settings
+from mediadrop.lib.util import calculate_popularity
+from mediadrop.model import DBSession, Media
+from mediadrop.model.media import media as media_table
+
+
+__all__ = ['recalculate_popularity']
+
+# see calculate_popularity()
+EPOCH = datetime(2000, 1, 1)
+
+def recalculate_popularity(settings, chunk_size=500, progress=None):
+    """Recalculate the popularity points (and likes/dislikes) of all media.
+
+    :param settings: The popularity settings (``popularity_decay_exponent``,
+        ``popularity_decay_lifetime``) as :class:`Settings` or a dict.
+    :param chunk_size: Number of media processed per chunk if the database
+        can not calculate the points itself.
+    :param progress: An optional callable, ``progress(done, total)`` is
+        called after every chunk.
+    :returns: The number of media updated.
+    """
+    if not isinstance(settings, Settings):
+        settings = Settings(settings)
+    if DBSession.connection().dialect.name == 'mysql':
+        count = _recalculate_in_database(settings)
+        if progress is not None:
+            progress(count, count)
+    else:
+        count = _recalculate_in_chunks(settings, chunk_size, progress)
+    invalidate_cache_tags('media')
+    return count
+
+def _published_condition():
+    return Media.query.published().whereclause
+
+def _recalculate_in_database(settings):
+    published = _published_condition()
+    def points(score):
+        # unpublished media (or a NULL in the condition) get 0 points
+        return sql.case([(published, _sql_popularity(score, settings))], else_=0)
+    values = {
+        'popularity_points': points(Media.likes - Media.dislikes),
+        'popularity_likes': points(Media.likes),
+        'popularity_dislikes': points(Media.dislikes),
+    }
+    return Media.query.update(values, synchronize_session=False)
+
+def _sql_popularity(score, settings):
+    """Return an SQL expression (MySQL only) which calculates the same
+    value as :func:`calculate_popularity`."""
+    log_base = settings.as_int('popularity_decay_exponent')
+    base_life = settings.as_int('popularity_decay_lifetime') * 3600
+    seconds = sql.func.timestampdiff(sql.literal_column('SECOND'),
+        EPOCH, Media.publish_on)
+    x = sql.func.sign(score) * seconds
+    # Python's integer division rounds down but "DIV" truncates towards zero.
+    # (MySQL's "/" returns a DECIMAL with a limited precision so FLOOR(x / y)
+    # is not exact either.)
+    periods = sql.case(
+        [(x >= 0, x.op('DIV')(base_life))],
+        else_=-(sql.literal(base_life - 1) - x).op('DIV')(base_life)
+    )
+    # MySQL's LOG(b, x) is LN(x) / LN(b) just like Python's math.log(x, b)
+    log = sql.func.log(log_base, sql.func.greatest(sql.func.abs(score), 1))
+    return sql.func.greatest(sql.func.truncate(log + periods, 0), 0)
+
+def _recalculate_in_chunks(settings, chunk_size, progress):
+    published = sql.case([(_published_condition(), True)], else_=False)
+    query = Media.query.order_by(Media.id).with_entities(Media.id,
+        Media.publish_on, Media.likes, Media.dislikes, published)
+    total = Media.query.count()
+    update = media_table.update()\
+        .where(media_table.c.id == sql.bindparam('media_id'))\
+        .values(
+            popularity_points=sql.bindparam('points'),
+            popularity_likes=sql.bindparam('likes_points'),
+            popularity_dislikes=sql.bindparam('dislikes_points'),
+        )
+
+    def popularity(publish_on, score, is_published):
+        if not is_published:
+            return 0
+        return calculate_popularity(publish_on, score, settings=settings)
+
+    done = 0
+    last_id = None
+    while True:
+        chunk = query
+        if last_id is not None:
+            chunk = chunk.filter(Media.id > last_id)
+        rows = chunk.limit(chunk_size).all()
+        if not rows:
+            break
+        DBSession.execute(update, [
+            dict(
+                media_id=media_id,
+                points=popularity(publish_on, likes - dislikes, is_published),
+                likes_points=popularity(publish_on, likes, is_published),
+                dislikes_points=popularity(publish_on, dislikes, is_published),
+            )
+            for media_id, publish_on, likes, dislikes, is_published in rows
+        ])
+        done += len(rows)
+        last_id = rows[-1][0]
+        if progress is not None:
+            progress(done, total)
+    return done
@@ -0,0 +1,131 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Versioned Registries
+
+Some configuration is stored in the database but read far more often than
+it changes, e.g. the enabled players (for every rendered player) or the
+enabled storage engines (for every upload). A :class:`VersionedRegistry`
+keeps such a value per process and loads it again after one of its cache
+tags was invalidated (see :mod:`mediadrop.lib.cache_tags`, the mapper
+observers invalidate the tags when the admin saves players or storage
+engines) or after ``max_age`` seconds::
+
+    def fetch_enabled_players():
+        return registry('players', load_enabled_players, tags=['players'])
+
+Other processes see the invalidation if they share the cache tag stamps
+(see ``cache_tags.stamp_dir``), otherwise they reload the value after
+``max_age`` seconds. A value which was loaded while the current transaction
+contains uncommitted changes is not kept.
+
+Every reload increments the registry's ``version``. Outside of an
+application (e.g. in standalone scripts) the value is loaded on every call.
+"""
+
+import threading
+import time
+
+from pylons import app_globals
+
+from mediadrop.lib.app_globals import is_object_registered
+from mediadrop.lib.cache_tags import invalidate_cache_tags, tags_changed_since
+from mediadrop.lib.transactions import call_after_commit, has_uncommitted_changes
+
+
+__all__ = [
+    'invalidate_registry',
+    'registry',
+    'registry_version',
+    'VersionedRegistry',
+]
+
+class VersionedRegistry(object):
+    """Keep the value returned by ``load`` until one of the ``tags`` was
+    invalidated.
+
+    :param load: A callable which returns the (new) value.
+    :param tags: The cache tags the value depends on.
+    :param max_age: Number of seconds after which the value is loaded again
+        anyway (e.g. if it was changed directly in the database).
+    """
+
+    def __init__(self, load, tags, max_age=300):
+        self.load = load
+        self.tags = tuple(tags)
+        self.max_age = max_age
+        self.version = 0
+        self._lock = threading.Lock()
+        self._value = None
+        self._loaded = 0
+
+    def invalidate(self):
+        """Load the value again on next access (in this process)."""
+        self._lock.acquire()
+        try:
+            self._value = None
+        finally:
+            self._lock.release()
+
+    def get(self):
+        """Return the current value."""
+        self._lock.acquire()
+        try:
+            now = time.time()
+            if self._value is not None and \
+                    (now - self._loaded >= self.max_age or
+                     tags_changed_since(self.tags, self._loaded)):
+                self._value = None
+            if self._value is None:
+                value = self.load()
+                # the changes of the current transaction might be rolled back
+                if has_uncommitted_changes():
+                    return value
+                self._value = value
+                self._loaded = now
+                self.version += 1
+            return self._value
+        finally:
+            self._lock.release()
+
+
+def _registries():
+    if not is_object_registered(app_globals):
+        return None
+    return app_globals._current_obj().registries
+
+def registry(name, load, tags, max_age=300):
+    """Return the value of the :class:`VersionedRegistry` with the given name
+    (which is created on first use)."""
+    registries = _registries()
+    if registries is None:
+        return load()
+    registry = registries.get(name)
+    if registry is None:
+        registry = registries.setdefault(name,
+            VersionedRegistry(load, tags, max_age=max_age))
+    return registry.get()
+
+def registry_version(name):
+    """Return the version of the registry with the given name (0 if it was
+    not loaded yet)."""
+    registry = (_registries() or {}).get(name)
+    if registry is None:
+        return 0
+    return registry.version
+
+def invalidate_registry(name, tags):
+    """Reload the registry with the given name on next access (in all
+    processes which share the cache tag stamps). This is done automatically
+    when the underlying objects are changed via the ORM. Call it after bulk
+    updates (e.g. raw SQL)."""
+    registry = (_registries() or {}).get(name)
+    if registry is not None:
+        registry.invalidate()
+        # the value might be loaded again before the transaction ended
+        call_after_commit(registry.invalidate, rollback=True)
+    invalidate_cache_tags(*tags)
@@ -0,0 +1,350 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Precomputed Related Media
+
+:meth:`mediadrop.model.media.MediaQuery.related` runs a (boolean) full text
+search built from the title and the tags of the media for every media page
+view (or an IN-query for its categories without full text search). With
+
+    related_media.precomputed = true
+
+the most similar media of every published media are stored in the
+``related_media`` table instead so the media page only needs one indexed
+lookup.
+
+Media are compared by the cosine similarity of TF-IDF weighted vectors of
+their tags, categories and words (title, subtitle and description). The
+similarities for a whole batch of media are accumulated at once by walking
+the postings of their features (a sparse matrix product), so only media
+which share at least one feature are ever compared.
+
+- ``batch-scripts/rebuild_related_media.py`` (re)computes the table for all
+  media.
+- Whenever a media is published, edited or deleted its own related media are
+  recomputed and it is added to (or removed from) the lists of similar media.
+  These updates only compare the media with the :data:`MAX_CANDIDATES` media
+  sharing most of its tags and categories, run the script regularly (e.g.
+  nightly) to recompute all lists with the statistics of the whole library.
+  If background jobs are enabled (see :mod:`mediadrop.lib.jobs`) the updates
+  are queued instead of slowing down saving the media.
+"""
+
+from collections import defaultdict
+import heapq
+import math
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import event, sql
+from sqlalchemy.orm import attributes
+
+from mediadrop.lib.jobs import background_jobs_enabled, enqueue_job, job_handler
+from mediadrop.lib.search.inverted_index import tokenize
+from mediadrop.model import DBSession, Media
+from mediadrop.model.jobs import JOB_PENDING, jobs
+from mediadrop.model.media import (media as media_table, media_categories,
+    media_tags, related_media)
+from mediadrop.plugin import events
+from mediadrop.plugin.events import observes
+
+
+__all__ = [
+    'precomputed_related_media',
+    'rebuild_related_media',
+    'SimilarityModel',
+    'update_related_media',
+    'use_precomputed_related_media',
+]
+
+UPDATE_JOB = u'update_related_media'
+
+RELATED_COUNT = 12
+"""Number of related media stored per media (some of them might not be
+published anymore when the list is displayed)."""
+
+MAX_CANDIDATES = 1000
+"""Number of media sharing tags or categories with a changed media which are
+compared with it (the ones sharing most of them)."""
+
+FEATURE_WEIGHTS = {
+    'tag': 2.0,
+    'category': 1.0,
+    'title': 1.5,
+    'subtitle': 1.0,
+    'description': 0.5,
+}
+
+_enabled = False
+
+def use_precomputed_related_media(enabled=True):
+    """Serve related media from the ``related_media`` table (and keep it up
+    to date when media are changed)."""
+    global _enabled
+    _enabled = enabled
+
+def precomputed_related_media():
+    return _enabled
+
+
+class SimilarityModel(object):
+    """Find the most similar documents of a corpus.
+
+    :param documents: A dict which maps media ids to a dict of features
+        (e.g. ``('tag', 3)`` or ``('word', u'kitchen')``) and their weighted
+        frequency in the media.
+    :param max_df: Features contained in more than this fraction of all
+        documents are ignored (they hardly add to the similarity but would
+        make nearly every document a candidate).
+    """
+
+    def __init__(self, documents, max_df=0.5):
+        self.document_count = len(documents)
+        frequencies = defaultdict(int)
+        for features in documents.itervalues():
+            for feature in features:
+                frequencies[feature] += 1
+        max_frequency = max(2, int(max_df * self.document_count))
+
+        self.vectors = {}
+        """Maps media ids to their normalized vectors (feature -> weight)."""
+        self.postings = defaultdict(list)
+        """Maps features to the list of (media_id, weight) containing it."""
+        for media_id, features in documents.iteritems():
+            vector = {}
+            for feature, frequency in features.iteritems():
+                if frequencies[feature] > max_frequency:
+                    continue
+                idf = math.log(1.0 + float(self.document_count) / frequencies[feature])
+                vector[feature] = math.log(1.0 + frequency) * idf
+            norm = math.sqrt(sum(weight ** 2 for weight in vector.itervalues()))
+            for feature in vector:
+                vector[feature] /= norm
+                self.postings[feature].append((media_id, vector[feature]))
+            self.vectors[media_id] = vector
+
+    def similarity(self, media_id, other_id):
+        vector = self.vectors.get(media_id, {})
+        other = self.vectors.get(other_id, {})
+        return sum(weight * other.get(feature, 0) for feature, weight
+                   in vector.iteritems())
+
+    def neighbours(self, media_ids, count=RELATED_COUNT):
+        """Return a dict which maps each of the given media ids to a list of
+        the ``count`` most similar (related_id, score) tuples."""
+        results = {}
+        for media_id in media_ids:
+            scores = defaultdict(float)
+            for feature, weight in self.vectors.get(media_id, {}).iteritems():
+                for other_id, other_weight in self.postings[feature]:
+                    scores[other_id] += weight * other_weight
+            scores.pop(media_id, None)
+            results[media_id] = heapq.nlargest(count, scores.iteritems(),
+                key=lambda (other_id, score): (score, -other_id))
+        return results
+
+
+def _add_words(features, text, weight):
+    for word in tokenize(text):
+        if len(word) > 2 and not word.isdigit():
+            features[('word', word)] += weight
+
+def _chunks(ids, size=500):
+    # The number of bind parameters is limited for some databases (e.g. 999
+    # for SQLite).
+    ids = sorted(ids)
+    return [ids[start:start + size] for start in range(0, len(ids), size)]
+
+def fetch_documents(media_ids=None):
+    """Return the features of the given published media (default: all
+    published media) for the :class:`SimilarityModel`."""
+    if media_ids is not None and len(media_ids) > 500:
+        documents = {}
+        for chunk in _chunks(media_ids):
+            documents.update(fetch_documents(chunk))
+        return documents
+    published = Media.query.published().whereclause
+    def restrict(select, id_column):
+        if media_ids is None:
+            return select
+        if not media_ids:
+            # SQLAlchemy complains about an empty IN-predicate
+            return select.where(id_column == -1)
+        return select.where(id_column.in_(sorted(media_ids)))
+
+    documents = {}
+    select = sql.select([media_table.c.id, media_table.c.title,
+        media_table.c.subtitle, media_table.c.description_plain], published)
+    for media_id, title, subtitle, description in \
+            DBSession.execute(restrict(select, media_table.c.id)):
+        features = documents[media_id] = defaultdict(float)
+        _add_words(features, title, FEATURE_WEIGHTS['title'])
+        _add_words(features, subtitle, FEATURE_WEIGHTS['subtitle'])
+        _add_words(features, description, FEATURE_WEIGHTS['description'])
+
+    for kind, assoc_table, key_column in (
+            ('tag', media_tags, media_tags.c.tag_id),
+            ('category', media_categories, media_categories.c.category_id)):
+        select = sql.select([assoc_table.c.media_id, key_column])
+        for media_id, key in DBSession.execute(restrict(select, assoc_table.c.media_id)):
+            if media_id in documents:
+                documents[media_id][(kind, key)] += FEATURE_WEIGHTS[kind]
+    return documents
+
+def _store_related(neighbours):
+    """Replace the related media of the media ids in ``neighbours``."""
+    if not neighbours:
+        return
+    for chunk in _chunks(neighbours):
+        DBSession.execute(related_media.delete().where(
+            related_media.c.media_id.in_(chunk)))
+    rows = []
+    for media_id, related in neighbours.iteritems():
+        for position, (related_id, score) in enumerate(related):
+            rows.append(dict(media_id=media_id, position=position,
+                related_id=related_id, score=score))
+    if rows:
+        DBSession.execute(related_media.insert(), rows)
+
+def rebuild_related_media(count=RELATED_COUNT, batch_size=500, progress=None):
+    """Recompute the related media of all published media.
+
+    :param count: Number of related media stored per media.
+    :param batch_size: Number of media whose related media are computed and
+        stored at once.
+    :param progress: An optional callable, ``progress(done, total)`` is
+        called after every batch.
+    :returns: The number of media processed.
+    """
+    model = SimilarityModel(fetch_documents())
+    DBSession.execute(related_media.delete())
+    media_ids = sorted(model.vectors)
+    for start in range(0, len(media_ids), batch_size):
+        batch = media_ids[start:start + batch_size]
+        _store_related(model.neighbours(batch, count))
+        if progress is not None:
+            progress(start + len(batch), len(media_ids))
+    return len(media_ids)
+
+def _candidate_ids(media_id, limit=MAX_CANDIDATES):
+    # the media sharing most tags and categories and the media listed
+    # together with this media so far (they must be updated if it changed)
+    shared = []
+    for assoc_table, key in ((media_tags, 'tag_id'),
+                             (media_categories, 'category_id')):
+        own = assoc_table.alias()
+        keys = sql.select([own.c[key]], own.c.media_id == media_id)
+        shared.append(sql.select([assoc_table.c.media_id],
+            sql.and_(assoc_table.c[key].in_(keys),
+                     assoc_table.c.media_id != media_id)))
+    shared = sql.union_all(*shared).alias('shared')
+    shared_count = sql.func.count().label('shared_count')
+    candidates = [sql.select([shared.c.media_id, shared_count])\
+        .group_by(shared.c.media_id)\
+        .order_by(shared_count.desc(), shared.c.media_id.desc())\
+        .limit(limit)]
+    candidates.append(sql.select([related_media.c.media_id],
+        related_media.c.related_id == media_id))
+    candidates.append(sql.select([related_media.c.related_id],
+        related_media.c.media_id == media_id))
+    ids = set()
+    for select in candidates:
+        ids.update(row[0] for row in DBSession.execute(select))
+    ids.discard(media_id)
+    return ids
+
+def update_related_media(media_id, count=RELATED_COUNT):
+    """Recompute the related media of the given media and add it to (or
+    remove it from) the lists of the media similar to it."""
+    candidate_ids = _candidate_ids(media_id)
+    documents = fetch_documents(candidate_ids | set([media_id]))
+    if media_id not in documents:
+        # unpublished or deleted
+        remove_related_media(media_id)
+        return
+    # All candidates share a feature with the media, do not ignore it.
+    model = SimilarityModel(documents, max_df=1.0)
+    neighbours = model.neighbours([media_id], count)
+
+    lists = defaultdict(list)
+    for chunk in _chunks(candidate_ids):
+        select = sql.select([related_media.c.media_id, related_media.c.related_id,
+            related_media.c.score], related_media.c.media_id.in_(chunk))\
+            .order_by(related_media.c.media_id, related_media.c.position)
+        for other_id, related_id, score in DBSession.execute(select):
+            lists[other_id].append((related_id, score))
+    for other_id in candidate_ids & set(documents):
+        current = lists.get(other_id, [])
+        related = [item for item in current if item[0] != media_id]
+        score = model.similarity(other_id, media_id)
+        if score > 0:
+            related.append((media_id, score))
+        related.sort(key=lambda (related_id, score): (-score, related_id))
+        if related[:count] != current:
+            neighbours[other_id] = related[:count]
+    _store_related(neighbours)
+
+def remove_related_media(media_id):
+    """Remove the given media from the ``related_media`` table."""
+    DBSession.execute(related_media.delete().where(sql.or_(
+        related_media.c.media_id == media_id,
+        related_media.c.related_id == media_id)))
+
+
+# -- keep the table up to date ------------------------------------------------
+# The tags/categories of a media are written at the end of the flush so the
+# changed media are collected per session until then.
+_pending = WeakKeyDictionary()
+
+_compared_attributes = ('title', 'subtitle', 'description_plain', 'tags',
+    'categories', 'reviewed', 'encoded', 'publishable', 'publish_on',
+    'publish_until')
+
+def _mark(media_id):
+    _pending.setdefault(DBSession(), set()).add(media_id)
+
+@observes(events.Media.after_insert, events.Media.after_update)
+def _media_changed(instance):
+    if not _enabled:
+        return
+    for key in _compared_attributes:
+        history = attributes.get_history(instance, key,
+            passive=attributes.PASSIVE_NO_INITIALIZE)
+        if history.has_changes():
+            _mark(instance.id)
+            return
+
+@observes(events.Media.before_delete)
+def _media_deleted(instance):
+    if _enabled:
+        _mark(instance.id)
+
+def _queue_update(media_ids):
+    queued = set()
+    select = sql.select([jobs.c.data], sql.and_(jobs.c.type == UPDATE_JOB,
+        jobs.c.status == JOB_PENDING))
+    for data, in DBSession.execute(select):
+        queued.update(data.get('media_ids', ()))
+    media_ids = sorted(set(media_ids) - queued)
+    if media_ids:
+        enqueue_job(UPDATE_JOB, data={'media_ids': media_ids}, flush=False)
+
+def _update_pending(session, flush_context):
+    media_ids = _pending.pop(session, None)
+    if not media_ids:
+        return
+    if background_jobs_enabled():
+        _queue_update(media_ids)
+        return
+    for media_id in sorted(media_ids):
+        update_related_media(media_id)
+
+event.listen(DBSession, 'after_flush', _update_pending)
+
+@job_handler(UPDATE_JOB)
+def update_related_media_job(job):
+    for media_id in job.data['media_ids']:
+        update_related_media(media_id)
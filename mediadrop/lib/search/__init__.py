@@ -0,0 +1,12 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from mediadrop.lib.search.api import *
+
+from mediadrop.lib.search.sql import FulltextSearchBackend, LikeSearchBackend
+from mediadrop.lib.search.inverted_index import (InvertedIndex,
+    InvertedIndexSearchBackend)
@@ -0,0 +1,185 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+import logging
+
+from pylons import app_globals, config
+from sqlalchemy.orm import attributes
+
+from mediadrop.lib.app_globals import is_object_registered
+from mediadrop.lib.transactions import call_after_commit
+from mediadrop.plugin import events
+from mediadrop.plugin.abc import AbstractClass, abstractmethod, abstractproperty
+from mediadrop.plugin.events import observes
+
+
+__all__ = [
+    'media_document',
+    'search_backend',
+    'SearchBackend',
+    'setup_search_backend',
+]
+
+log = logging.getLogger(__name__)
+
+DOCUMENT_FIELDS = ('title', 'subtitle', 'description', 'notes', 'tags',
+    'categories')
+
+# Fields searched by MediaQuery.search (public) and .admin_search (admin)
+SEARCH_FIELDS = {
+    'public': ('title', 'subtitle', 'description', 'tags', 'categories'),
+    'admin': DOCUMENT_FIELDS,
+}
+
+class SearchBackend(AbstractClass):
+    """
+    Base class for all search backends.
+
+    The backend is selected with the ``search.backend`` option in your
+    config file (see :func:`setup_search_backend`).
+    """
+
+    backend_type = abstractproperty()
+    """A unique identifying string, used as value for ``search.backend``."""
+
+    uses_index = False
+    """If True the backend maintains its own index: :meth:`update_index` and
+    :meth:`remove_from_index` are called whenever media are changed."""
+
+    @classmethod
+    def from_config(cls, config):
+        """Return a new backend instance configured from the given config."""
+        return cls()
+
+    @abstractmethod
+    def search(self, query, search, fields='public', bool=False, order_by=True):
+        """Filter the given media query for the given search terms.
+
+        :param query: A :class:`mediadrop.model.media.MediaQuery`.
+        :param search: The search string entered by the user.
+        :param fields: The key of the fields to search in (see
+            :data:`SEARCH_FIELDS`), 'public' or 'admin'.
+        :param bool: If True, treat the search as boolean search (``+foo
+            -bar baz*``), otherwise as natural language search.
+        :param order_by: If True, order the results by relevance.
+        :returns: The filtered query.
+        """
+
+    def related(self, query, media):
+        """Filter the given media query for media related to the given media.
+
+        The default implementation returns media in the same categories.
+        """
+        return query.in_categories(media.categories)
+
+    def update_index(self, media_id, document):
+        """Add or replace the document (see :func:`media_document`) of the
+        given media in the index."""
+
+    def remove_from_index(self, media_id):
+        """Remove the given media from the index."""
+
+
+def _backend_classes():
+    # imported here because the backends import this module
+    from mediadrop.lib.search.inverted_index import InvertedIndexSearchBackend
+    from mediadrop.lib.search.sql import FulltextSearchBackend, LikeSearchBackend
+    # the built-in backends do not depend on the registration (which might
+    # have been reset, e.g. by tests)
+    builtin = [FulltextSearchBackend, LikeSearchBackend,
+        InvertedIndexSearchBackend]
+    return builtin + [cls for cls in SearchBackend if cls not in builtin]
+
+def setup_search_backend(config):
+    """Return the search backend configured with ``search.backend`` (default
+    'fulltext': MySQL FULLTEXT search if available, LIKE otherwise)."""
+    backend_type = config.get('search.backend', 'fulltext')
+    for backend_class in _backend_classes():
+        if backend_class.backend_type == backend_type:
+            return backend_class.from_config(config)
+    raise ValueError('Unknown search backend %r' % backend_type)
+
+def _search_options(config):
+    return sorted((key, value) for key, value in config.items()
+                  if key.startswith('search.'))
+
+def _current_backend(backend, config):
+    """Return ``backend`` if it was created with the current ``search.*``
+    options, a new backend otherwise."""
+    options = _search_options(config)
+    if backend is None or backend._search_options != options:
+        backend = setup_search_backend(config)
+        backend._search_options = options
+    return backend
+
+_default_backend = None
+
+def search_backend():
+    """Return the search backend of the current application (created on
+    first use and whenever the ``search.*`` options were changed)."""
+    global _default_backend
+    if is_object_registered(app_globals):
+        globals_ = app_globals._current_obj()
+        globals_.search_backend = \
+            _current_backend(globals_.search_backend, config)
+        return globals_.search_backend
+    # no application loaded (e.g. standalone scripts)
+    _default_backend = _current_backend(_default_backend, {})
+    return _default_backend
+
+
+def media_document(media):
+    """Return a dict with the text of all searchable fields of the media."""
+    return dict(
+        title = media.title,
+        subtitle = media.subtitle,
+        description = media.description_plain,
+        notes = media.notes,
+        tags = u' '.join(tag.name for tag in media.tags),
+        categories = u' '.join(category.name for category in media.categories),
+    )
+
+_indexed_attributes = ('title', 'subtitle', 'description_plain', 'notes',
+    'tags', 'categories')
+
+def _update_index(media_id, document):
+    try:
+        search_backend().update_index(media_id, document)
+    except Exception:
+        log.exception('Unable to update the search index for media %r' % media_id)
+
+@observes(events.Media.after_insert, events.Media.after_update)
+def index_media(instance):
+    if not search_backend().uses_index:
+        return
+    # e.g. do not reindex if only the number of likes changed
+    changed = [attributes.get_history(instance, key).has_changes()
+               for key in _indexed_attributes]
+    if not any(changed):
+        return
+    media_id, document = instance.id, media_document(instance)
+    call_after_commit(lambda: _update_index(media_id, document))
+
+@observes(events.Media.after_delete)
+def remove_media_from_index(instance):
+    backend = search_backend()
+    if backend.uses_index:
+        media_id = instance.id
+        call_after_commit(lambda: backend.remove_from_index(media_id))
+
+@observes(events.Tag.after_update, events.Category.after_update)
+def reindex_renamed_tag_or_category(instance):
+    if not search_backend().uses_index:
+        return
+    if not attributes.get_history(instance, 'name').has_changes():
+        return
+    media_ids = [media.id for media in instance.media]
+    def reindex():
+        from mediadrop.model import Media
+        for media in Media.query.filter(Media.id.in_(media_ids)):
+            _update_index(media.id, media_document(media))
+    call_after_commit(reindex)
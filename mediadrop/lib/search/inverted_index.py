@@ -0,0 +1,408 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Inverted Index Search
+
+An embedded search engine which works with every database: For each word
+the index stores which media contain it (in which field and how often). The
+index is kept in a local SQLite file and updated whenever media are saved.
+Results are ranked with BM25F, matches in the title, subtitle and tags
+weigh more than matches in the description. Of all matches the best
+``search.max_results`` media which match the rest of the query (e.g. only
+published media) and which the current user may view are returned.
+
+    search.backend = index
+    search.index_file = %(here)s/data/search_index.sqlite
+    search.max_results = 500
+
+Build the index for existing media with
+``batch-scripts/rebuild_search_index.py``. Until then searches use a LIKE
+query.
+"""
+
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+
+from paste.deploy.converters import asint
+from pylons import request
+from sqlalchemy import sql
+
+from mediadrop.lib.app_globals import is_object_registered
+from mediadrop.lib.search.api import (media_document, SearchBackend,
+    SEARCH_FIELDS)
+from mediadrop.lib.search.sql import LikeSearchBackend
+
+
+__all__ = [
+    'InvertedIndex',
+    'InvertedIndexSearchBackend',
+    'parse_search',
+    'tokenize',
+]
+
+log = logging.getLogger(__name__)
+
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'subtitle': 2.0,
+    'tags': 2.0,
+    'categories': 1.5,
+    'description': 1.0,
+    'notes': 1.0,
+}
+
+_word_re = re.compile(r'\w+', re.UNICODE)
+
+def tokenize(text):
+    """Return the lowercased words of the given text."""
+    if not text:
+        return []
+    return _word_re.findall(text.lower())
+
+def parse_search(search, bool=False):
+    """Return a list of (operator, term, is_prefix) tuples for the search.
+
+    In boolean mode a word can be prefixed with '+' (must be present) or
+    '-' (must not be present) and end with '*' to match all words starting
+    with it, similar to MySQL's boolean full text search. The operator of
+    all other words is None.
+    """
+    terms = []
+    for chunk in (search or u'').split():
+        operator = None
+        is_prefix = False
+        if bool:
+            if chunk[0] in '+-':
+                operator, chunk = chunk[0], chunk[1:]
+            is_prefix = chunk.endswith('*')
+        words = tokenize(chunk)
+        for i, word in enumerate(words):
+            terms.append((operator, word, is_prefix and (i == len(words) - 1)))
+    return terms
+
+
+class InvertedIndex(object):
+    """A BM25F-ranked inverted index of media documents, stored in SQLite.
+
+    Documents are dicts which map field names (e.g. 'title') to text. The
+    file can be shared by all MediaDrop processes running on the same host.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, filename, timeout=10, field_weights=None):
+        self.filename = filename
+        self.timeout = timeout
+        self.field_weights = field_weights or FIELD_WEIGHTS
+        self._local = threading.local()
+        self._connection().executescript(
+            'CREATE TABLE IF NOT EXISTS postings ('
+            '  term TEXT NOT NULL, field TEXT NOT NULL,'
+            '  media_id INTEGER NOT NULL, frequency INTEGER NOT NULL,'
+            '  PRIMARY KEY (term, field, media_id));'
+            'CREATE INDEX IF NOT EXISTS postings_media_id ON postings (media_id);'
+            'CREATE TABLE IF NOT EXISTS documents ('
+            '  media_id INTEGER NOT NULL, field TEXT NOT NULL,'
+            '  length INTEGER NOT NULL, PRIMARY KEY (media_id, field));'
+            'CREATE TABLE IF NOT EXISTS field_stats ('
+            '  field TEXT PRIMARY KEY, documents INTEGER NOT NULL,'
+            '  total_length INTEGER NOT NULL);'
+            'CREATE TABLE IF NOT EXISTS info ('
+            '  key TEXT PRIMARY KEY, value INTEGER NOT NULL);'
+        )
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # autocommit mode, transactions are started explicitly
+            connection = sqlite3.connect(self.filename, timeout=self.timeout,
+                                         isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def _write(self, func, *args):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            func(connection, *args)
+        except:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def add(self, media_id, document):
+        """Add the document of the given media (replacing an existing one)."""
+        self._write(self._replace, media_id, document)
+
+    def remove(self, media_id):
+        """Remove the document of the given media (if indexed)."""
+        self._write(self._remove, media_id)
+
+    def rebuild(self, documents):
+        """Replace the complete index with the given (media_id, document)
+        pairs in a single transaction."""
+        def rebuild(connection):
+            for table in ('postings', 'documents', 'field_stats', 'info'):
+                connection.execute('DELETE FROM %s' % table)
+            for media_id, document in documents:
+                self._add(connection, media_id, document)
+            self._set_info(connection, 'built', 1)
+        self._write(rebuild)
+
+    def is_built(self):
+        """Return True if the index was built with :meth:`rebuild`."""
+        return bool(self._info(self._connection(), 'built'))
+
+    def document_count(self):
+        return self._info(self._connection(), 'documents')
+
+    def _info(self, connection, key):
+        row = connection.execute('SELECT value FROM info WHERE key = ?',
+            (key, )).fetchone()
+        return row and row[0] or 0
+
+    def _set_info(self, connection, key, value):
+        connection.execute('INSERT OR REPLACE INTO info (key, value) '
+            'VALUES (?, ?)', (key, value))
+
+    def _replace(self, connection, media_id, document):
+        self._remove(connection, media_id)
+        self._add(connection, media_id, document)
+
+    def _add(self, connection, media_id, document):
+        postings = []
+        lengths = []
+        for field, text in document.iteritems():
+            words = tokenize(text)
+            if not words:
+                continue
+            frequencies = {}
+            for word in words:
+                frequencies[word] = frequencies.get(word, 0) + 1
+            for term, frequency in frequencies.iteritems():
+                postings.append((term, field, media_id, frequency))
+            lengths.append((media_id, field, len(words)))
+        if not lengths:
+            return
+        connection.executemany('INSERT INTO postings '
+            '(term, field, media_id, frequency) VALUES (?, ?, ?, ?)', postings)
+        connection.executemany('INSERT INTO documents '
+            '(media_id, field, length) VALUES (?, ?, ?)', lengths)
+        for media_id, field, length in lengths:
+            connection.execute('INSERT OR IGNORE INTO field_stats '
+                '(field, documents, total_length) VALUES (?, 0, 0)', (field, ))
+            connection.execute('UPDATE field_stats SET documents = documents + 1, '
+                'total_length = total_length + ? WHERE field = ?', (length, field))
+        documents = self._info(connection, 'documents')
+        self._set_info(connection, 'documents', documents + 1)
+
+    def _remove(self, connection, media_id):
+        lengths = connection.execute('SELECT field, length FROM documents '
+            'WHERE media_id = ?', (media_id, )).fetchall()
+        if not lengths:
+            return
+        for field, length in lengths:
+            connection.execute('UPDATE field_stats SET documents = documents - 1, '
+                'total_length = total_length - ? WHERE field = ?', (length, field))
+        documents = self._info(connection, 'documents')
+        self._set_info(connection, 'documents', documents - 1)
+        connection.execute('DELETE FROM postings WHERE media_id = ?', (media_id, ))
+        connection.execute('DELETE FROM documents WHERE media_id = ?', (media_id, ))
+
+    def search(self, search, fields, bool=False, limit=None):
+        """Return a list of (media_id, score) tuples for all documents which
+        match the search (see :func:`parse_search`), best match first.
+
+        In natural language mode (and in boolean mode if no word is
+        required) a document must contain at least one of the words.
+        """
+        terms = parse_search(search, bool)
+        if not terms:
+            return []
+        connection = self._connection()
+        document_count = self._info(connection, 'documents')
+        average_lengths = dict(
+            (field, float(total_length) / documents) for field, documents, total_length
+            in connection.execute('SELECT field, documents, total_length '
+                                  'FROM field_stats WHERE documents > 0'))
+
+        scores = {}
+        required = []
+        excluded = set()
+        for operator, term, is_prefix in terms:
+            postings = self._postings(connection, term, is_prefix, fields)
+            media_ids = set(row[0] for row in postings)
+            if operator == '-':
+                excluded.update(media_ids)
+                continue
+            if operator == '+':
+                required.append(media_ids)
+            # "probabilistic" idf, always positive
+            df = len(media_ids)
+            idf = math.log(1 + (document_count - df + 0.5) / (df + 0.5))
+            # BM25F: normalize the term frequency per field and combine the
+            # weighted frequencies before applying the saturation
+            weighted_frequencies = {}
+            for media_id, field, frequency, length in postings:
+                average_length = average_lengths.get(field) or 1.0
+                normalization = 1 - self.b + self.b * length / average_length
+                weighted = self.field_weights.get(field, 1.0) * frequency / normalization
+                weighted_frequencies[media_id] = \
+                    weighted_frequencies.get(media_id, 0) + weighted
+            for media_id, tf in weighted_frequencies.iteritems():
+                score = idf * tf * (self.k1 + 1) / (self.k1 + tf)
+                scores[media_id] = scores.get(media_id, 0) + score
+
+        candidates = set(scores)
+        for media_ids in required:
+            candidates.intersection_update(media_ids)
+        candidates.difference_update(excluded)
+        results = sorted(((scores[media_id], media_id) for media_id in candidates),
+                         reverse=True)
+        if limit is not None:
+            results = results[:limit]
+        return [(media_id, score) for score, media_id in results]
+
+    def _postings(self, connection, term, is_prefix, fields):
+        statement = ('SELECT p.media_id, p.field, p.frequency, d.length '
+            'FROM postings p JOIN documents d '
+            'ON d.media_id = p.media_id AND d.field = p.field WHERE ')
+        if is_prefix:
+            statement += 'p.term >= ? AND p.term < ?'
+            params = [term, term + u'\uffff']
+        else:
+            statement += 'p.term = ?'
+            params = [term]
+        statement += ' AND p.field IN (%s)' % ', '.join('?' * len(fields))
+        params.extend(fields)
+        return connection.execute(statement, params).fetchall()
+
+
+class InvertedIndexSearchBackend(SearchBackend):
+    """
+    Search with the :class:`InvertedIndex`.
+
+    :param index: The :class:`InvertedIndex` to use.
+    :param max_results: Only the best matches are returned, the ranking is
+        passed to the database as part of the query. Matches which are
+        excluded by the query or the permissions do not count.
+    """
+    backend_type = 'index'
+    uses_index = True
+
+    def __init__(self, index, max_results=500):
+        self.index = index
+        self.max_results = max_results
+
+    @classmethod
+    def from_config(cls, config):
+        index_file = config.get('search.index_file')
+        if not index_file:
+            if not config.get('cache_dir'):
+                raise ValueError('Please set search.index_file in your config.')
+            index_file = os.path.join(config['cache_dir'], 'search_index.sqlite')
+        return cls(InvertedIndex(index_file),
+            max_results=asint(config.get('search.max_results', 500)))
+
+    def search(self, query, search, fields='public', bool=False, order_by=True):
+        if not self.index.is_built():
+            log.warn('Search index %r was not built yet, using LIKE search.' % \
+                self.index.filename)
+            return LikeSearchBackend().search(query, search, fields=fields,
+                bool=bool, order_by=order_by)
+        results = self.index.search(search, SEARCH_FIELDS[fields], bool=bool)
+        media_ids = self._matching_ids(query,
+            [media_id for media_id, score in results])
+        return self._filter_ranked(query, media_ids, order_by)
+
+    def related(self, query, media):
+        if not self.index.is_built():
+            return super(InvertedIndexSearchBackend, self).related(query, media)
+        document = media_document(media)
+        search = u' '.join((document['title'], document['tags'],
+            document['categories']))
+        results = self.index.search(search, SEARCH_FIELDS['public'])
+        media_ids = self._matching_ids(query,
+            [media_id for media_id, score in results if media_id != media.id])
+        return self._filter_ranked(query, media_ids, order_by=True)
+
+    def _matching_ids(self, query, media_ids):
+        """Return the first ``max_results`` of the given (ranked) media ids
+        which match the query and which the current user may view.
+
+        The index also contains unpublished media so the ids are checked in
+        batches, otherwise the best matches might all be filtered out after
+        the cut-off."""
+        from mediadrop.model.media import Media
+        matching = []
+        for start in range(0, len(media_ids), self.max_results):
+            batch = media_ids[start:start + self.max_results]
+            batch_query = query.order_by(None)\
+                .filter(Media.id.in_(_literal_ids(batch)))
+            found = set(media.id for media in _viewable(batch_query)[:len(batch)])
+            matching.extend(media_id for media_id in batch if media_id in found)
+            if len(matching) >= self.max_results:
+                break
+        return matching[:self.max_results]
+
+    def _filter_ranked(self, query, media_ids, order_by):
+        from mediadrop.model.media import Media
+        if not media_ids:
+            # SQLAlchemy complains about an empty IN-predicate
+            return query.filter(Media.id == -1)
+        literal_ids = _literal_ids(media_ids)
+        query = query.filter(Media.id.in_(literal_ids))
+        if order_by:
+            ranks = [(literal_id, sql.literal_column(str(rank)))
+                     for rank, literal_id in enumerate(literal_ids)]
+            query = query.order_by(None).order_by(sql.case(ranks, value=Media.id))
+        return query
+
+    def update_index(self, media_id, document):
+        self.index.add(media_id, document)
+
+    def remove_from_index(self, media_id):
+        self.index.remove(media_id)
+
+    def rebuild_index(self, media_query, chunk_size=500):
+        """Index all media of the given query (replacing the current index)."""
+        self.index.rebuild(self._documents(media_query, chunk_size))
+
+    def _documents(self, media_query, chunk_size):
+        from mediadrop.model.media import Media, preload_relations
+        media_query = media_query.order_by(None).order_by(Media.id.asc())
+        last_id = None
+        while True:
+            chunk_query = media_query
+            if last_id is not None:
+                chunk_query = chunk_query.filter(Media.id > last_id)
+            chunk = preload_relations(chunk_query.limit(chunk_size),
+                tags=True, categories=True)
+            if not chunk:
+                return
+            for media in chunk:
+                yield media.id, media_document(media)
+            last_id = chunk[-1].id
+
+def _literal_ids(media_ids):
+    # Use literal ids, the number of bind parameters is limited for some
+    # databases (e.g. 999 for SQLite).
+    return [sql.literal_column(str(int(media_id))) for media_id in media_ids]
+
+def _viewable(query):
+    # there are no permissions outside of requests (e.g. in scripts)
+    if not is_object_registered(request) or getattr(request, 'perm', None) is None:
+        return query
+    from mediadrop.lib.auth.util import viewable_media
+    return viewable_media(query)
+
+SearchBackend.register(InvertedIndexSearchBackend)
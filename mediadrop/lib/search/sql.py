@@ -0,0 +1,104 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+import time
+
+from sqlalchemy import sql
+
+from mediadrop.lib.search.api import SearchBackend
+
+
+__all__ = ['FulltextSearchBackend', 'LikeSearchBackend']
+
+class LikeSearchBackend(SearchBackend):
+    """
+    Search the title and the description with ``LIKE '%term%'``.
+
+    This works with every database but needs a full table scan for every
+    search and does not rank the results.
+    """
+    backend_type = 'like'
+
+    def search(self, query, search, fields='public', bool=False, order_by=True):
+        from mediadrop.model.media import Media
+        return query.filter(sql.or_(Media.title.ilike("%%%s%%" % search),
+                                    Media.description_plain.ilike("%%%s%%" % search)))
+
+
+class FulltextSearchBackend(LikeSearchBackend):
+    """
+    Use the MySQL FULLTEXT indexes of the ``media_fulltext`` table.
+
+    The ``media_fulltext`` table is maintained by MySQL triggers. If
+    MediaDrop does not run on MySQL (or the triggers were not installed)
+    the backend falls back to a LIKE search.
+    """
+    backend_type = 'fulltext'
+
+    probe_interval = 300
+    """Number of seconds to remember if the full text search is available."""
+
+    def __init__(self):
+        self._probes = {}
+
+    def search(self, query, search, fields='public', bool=False, order_by=True):
+        if not self.fulltext_enabled(query.session):
+            return super(FulltextSearchBackend, self).search(query, search,
+                fields=fields, bool=bool, order_by=order_by)
+
+        from mediadrop.model import MatchAgainstClause
+        from mediadrop.model.media import MediaFullText, _fulltext_indexes
+        search_cols = _fulltext_indexes[fields]
+        filter = MatchAgainstClause(search_cols, search, bool)
+        query = query.join(MediaFullText).filter(filter)
+        if order_by:
+            # MySQL automatically orders natural lang searches by relevance,
+            # so override any existing ordering
+            query = query.order_by(None)
+            if bool:
+                # To mimic the same behaviour in boolean mode, we must do an
+                # extra natural language search on our boolean-filtered results
+                relevance = MatchAgainstClause(search_cols, search, bool=False)
+                query = query.order_by(relevance)
+        return query
+
+    def related(self, query, media):
+        # XXX: If full text searching is not enabled, we simply return media
+        #      in the same categories.
+        if not self.fulltext_enabled(query.session):
+            return super(FulltextSearchBackend, self).related(query, media)
+
+        search_terms = '%s %s %s' % (
+            media.title,
+            media.fulltext and media.fulltext.tags or '',
+            media.fulltext and media.fulltext.categories or '',
+        )
+        return self.search(query, search_terms, bool=True)
+
+    def fulltext_enabled(self, session):
+        """Return True if the database supports the full text search.
+
+        The result is cached for :attr:`probe_interval` seconds so not every
+        search needs an extra query."""
+        connection = session.connection()
+        if connection.dialect.name != 'mysql':
+            return False
+        key = str(connection.engine.url)
+        enabled, probed_at = self._probes.get(key, (None, 0))
+        if time.time() - probed_at < self.probe_interval:
+            return enabled
+
+        from mediadrop.model.media import media_fulltext
+        # use a fun trick to see if the media_fulltext table is being used
+        # thanks to this guy: http://data.agaric.com/node/2241#comment-544
+        select = sql.select('1').select_from(media_fulltext).limit(1)
+        enabled = connection.execute(select).scalar() is not None
+        self._probes[key] = (enabled, time.time())
+        return enabled
+
+SearchBackend.register(LikeSearchBackend)
+SearchBackend.register(FulltextSearchBackend)
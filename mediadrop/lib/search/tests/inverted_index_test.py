@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from datetime import datetime, timedelta
+import os
+import shutil
+import tempfile
+
+from mediadrop.lib.search import search_backend
+from mediadrop.lib.search.inverted_index import InvertedIndex, parse_search
+from mediadrop.lib.test.db_testcase import DBTestCase
+from mediadrop.lib.test.pythonic_testcase import *
+from mediadrop.lib.test.request_mixin import RequestMixin
+from mediadrop.model import Category, DBSession, Media
+
+
+class InvertedIndexTest(PythonicTestCase):
+    def setUp(self):
+        super(InvertedIndexTest, self).setUp()
+        self.index_dir = tempfile.mkdtemp()
+        self.index = InvertedIndex(os.path.join(self.index_dir, 'index.sqlite'))
+        self.index.rebuild([
+            (1, dict(title=u'Python Tutorial', description=u'Learn to code.')),
+            (2, dict(title=u'Cooking Show',
+                     description=u'Snakes, pythons and other pets in the kitchen.')),
+            (3, dict(title=u'Python in the Kitchen', tags=u'cooking')),
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(self.index_dir)
+        super(InvertedIndexTest, self).tearDown()
+
+    def _search(self, search, bool=False, fields=('title', 'description', 'tags')):
+        return [media_id for media_id, score in self.index.search(search, fields, bool=bool)]
+
+    def test_can_parse_boolean_search(self):
+        assert_equals([('+', u'python', False), ('-', u'cooking', False),
+                       (None, u'kit', True)],
+                      parse_search(u'+Python -cooking kit*', bool=True))
+        assert_equals([(None, u'python', False), (None, u'kit', False)],
+                      parse_search(u'+Python kit*'))
+
+    def test_ranks_matches_in_title_higher(self):
+        assert_equals([1, 3], self._search(u'python'))
+        assert_equals([3, 2], self._search(u'kitchen'))
+        # 'code' is the rarest word
+        assert_equals([1, 3, 2], self._search(u'kitchen code'))
+
+    def test_supports_boolean_search(self):
+        assert_equals([1], self._search(u'+python -kitchen', bool=True))
+        assert_equals([2, 3], sorted(self._search(u'python* +kitchen', bool=True)))
+        assert_equals([], self._search(u'-python', bool=True))
+
+    def test_searches_only_given_fields(self):
+        assert_equals([3], self._search(u'cooking', fields=('tags', )))
+        assert_equals([2], self._search(u'cooking', fields=('title', )))
+
+    def test_can_replace_and_remove_documents(self):
+        self.index.add(1, dict(title=u'Java Tutorial'))
+        assert_equals([3], self._search(u'python'))
+        assert_equals([1], self._search(u'java'))
+        assert_equals(3, self.index.document_count())
+
+        self.index.remove(1)
+        self.index.remove(42)
+        assert_equals([], self._search(u'java'))
+        assert_equals(2, self.index.document_count())
+
+
+class InvertedIndexSearchBackendTest(DBTestCase, RequestMixin):
+    def setUp(self):
+        super(InvertedIndexSearchBackendTest, self).setUp()
+        self.init_fake_request()
+        self.index_dir = tempfile.mkdtemp()
+        self.pylons_config['search.backend'] = 'index'
+        self.pylons_config['search.index_file'] = \
+            os.path.join(self.index_dir, 'index.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.index_dir)
+        super(InvertedIndexSearchBackendTest, self).tearDown()
+
+    def _create_media(self, title, **kwargs):
+        yesterday = datetime.now() - timedelta(days=1)
+        return Media.example(title=title, reviewed=True, encoded=True,
+            publishable=True, publish_on=yesterday, **kwargs)
+
+    def _titles(self, query):
+        return [media.title for media in query]
+
+    def test_falls_back_to_like_search_until_index_is_built(self):
+        self._create_media(u'Python Tutorial')
+        DBSession.commit()
+        assert_equals([u'Python Tutorial'], self._titles(Media.query.search(u'python')))
+
+    def test_search_uses_index(self):
+        self._create_media(u'Cooking Show', description=u'<p>Python recipes</p>')
+        self._create_media(u'Python Tutorial')
+        self._create_media(u'Gardening')
+        DBSession.commit()
+        search_backend().rebuild_index(Media.query)
+
+        assert_equals([u'Python Tutorial', u'Cooking Show'],
+            self._titles(Media.query.search(u'python')))
+        assert_equals([], self._titles(Media.query.search(u'java')))
+
+    def test_limits_number_of_results_after_filtering(self):
+        self.pylons_config['search.max_results'] = '1'
+        # the best match is not published
+        Media.example(title=u'Python Python Tutorial')
+        self._create_media(u'Python Basics')
+        DBSession.commit()
+        search_backend().rebuild_index(Media.query)
+
+        assert_equals([u'Python Basics'],
+            self._titles(Media.query.published().search(u'python')))
+
+    def test_updates_index_when_media_change(self):
+        media = self._create_media(u'Python Tutorial')
+        DBSession.commit()
+        search_backend().rebuild_index(Media.query)
+
+        media.title = u'Java Tutorial'
+        self._create_media(u'Python Basics')
+        DBSession.commit()
+        assert_equals([u'Java Tutorial'], self._titles(Media.query.search(u'java')))
+        assert_equals([u'Python Basics'], self._titles(Media.query.search(u'python')))
+
+        DBSession.delete(media)
+        DBSession.commit()
+        assert_equals([], self._titles(Media.query.search(u'java')))
+
+    def test_finds_related_media(self):
+        category = Category.example(name=u'Programming')
+        media = self._create_media(u'Python Tutorial')
+        media.categories.append(category)
+        self._create_media(u'Advanced Python')
+        self._create_media(u'Gardening')
+        DBSession.commit()
+        search_backend().rebuild_index(Media.query)
+
+        assert_equals([u'Advanced Python'], self._titles(Media.query.related(media)))
+
+
+import unittest
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(InvertedIndexTest))
+    suite.addTest(unittest.makeSuite(InvertedIndexSearchBackendTest))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,183 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Settings Store
+
+All settings are kept in memory (per process) and shared by all requests as
+``request.settings``. Whenever a setting is saved, the store replaces a
+small stamp file. Every request only compares the stamp of that file (one
+``stat()`` call) with the stamp seen when the settings were loaded, so
+changes made by another process become visible with its next request::
+
+    settings.stamp_file = %(here)s/data/settings.stamp
+
+If all processes run on the same host (or share the ``cache_dir``) the
+default stamp file in ``cache_dir`` works out of the box. Without a stamp
+file the settings are reloaded after ``max_age`` seconds.
+
+Besides the raw (unicode) values :class:`Settings` provides the values
+parsed as boolean or integer so they are not converted on every access::
+
+    if request.settings.as_bool('rss_display'):
+        limit = request.settings.as_int('api_media_max_results')
+"""
+
+import os
+import threading
+import time
+
+from pylons import app_globals
+
+from mediadrop.lib.stamp_files import StampFile
+from mediadrop.lib.transactions import call_after_commit
+from mediadrop.plugin import events
+from mediadrop.plugin.events import observes
+
+
+__all__ = [
+    'invalidate_settings',
+    'parse_bool',
+    'Settings',
+    'SettingsStore',
+    'setup_settings_store',
+]
+
+def parse_bool(value):
+    """Return True for 'True' (checkboxes) and the other values accepted by
+    :func:`paste.deploy.converters.asbool`, False for everything else."""
+    if not value:
+        return False
+    return unicode(value).strip().lower() in \
+        (u'true', u'yes', u'on', u'y', u't', u'1')
+
+def parse_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Settings(dict):
+    """A dict of all settings (key -> unicode value) which also knows the
+    values parsed as boolean/integer."""
+
+    def __init__(self, values=(), previous=None):
+        dict.__init__(self, values)
+        self._bools = {}
+        self._ints = {}
+        for key, value in self.iteritems():
+            if previous is not None and key in previous and previous[key] == value:
+                # unchanged, keep the parsed values
+                self._bools[key] = previous._bools[key]
+                self._ints[key] = previous._ints[key]
+            else:
+                self._parse(key, value)
+
+    def _parse(self, key, value):
+        self._bools[key] = parse_bool(value)
+        self._ints[key] = parse_int(value)
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self._parse(key, value)
+
+    def as_bool(self, key):
+        """Return the setting as boolean (False if it does not exist)."""
+        return self._bools.get(key, False)
+
+    def as_int(self, key, default=None):
+        """Return the setting as integer.
+
+        :param default: Returned if the setting does not exist or is not a
+            number. Without a default a :class:`ValueError` is raised.
+        """
+        value = self._ints.get(key)
+        if value is None:
+            if default is None:
+                raise ValueError('Setting %r is not an integer: %r' % \
+                    (key, self.get(key)))
+            return default
+        return value
+
+
+def fetch_settings():
+    from mediadrop.model import DBSession, Setting
+    return DBSession.query(Setting.key, Setting.value).all()
+
+class SettingsStore(object):
+    """Keep the :class:`Settings` per process and reload them when the stamp
+    file changed.
+
+    :param stamp_file: The path of the stamp file (optional).
+    :param max_age: Number of seconds after which the settings are reloaded
+        anyway (e.g. if they were changed directly in the database).
+    """
+
+    def __init__(self, stamp_file=None, max_age=3600):
+        self.stamp_file = stamp_file
+        self._stamp_file = stamp_file and StampFile(stamp_file) or None
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._settings = None
+        self._stamp = None
+        self._loaded = 0
+
+    def _read_stamp(self):
+        if self._stamp_file is None:
+            return None
+        return self._stamp_file.read()
+
+    def settings(self):
+        """Return the current :class:`Settings`."""
+        stamp = self._read_stamp()
+        self._lock.acquire()
+        try:
+            if self._settings is None or stamp != self._stamp or \
+                    time.time() - self._loaded >= self.max_age:
+                self._settings = Settings(fetch_settings(), previous=self._settings)
+                self._stamp = stamp
+                self._loaded = time.time()
+            return self._settings
+        finally:
+            self._lock.release()
+
+    def invalidate(self):
+        """Reload the settings on next access (in all processes which use
+        the same stamp file)."""
+        self._lock.acquire()
+        try:
+            self._loaded = 0
+        finally:
+            self._lock.release()
+        if self._stamp_file is not None:
+            self._stamp_file.touch()
+
+
+def setup_settings_store(config):
+    """Return a :class:`SettingsStore` configured from the given config."""
+    stamp_file = config.get('settings.stamp_file')
+    if not stamp_file and config.get('cache_dir'):
+        stamp_file = os.path.join(config['cache_dir'], 'settings.stamp')
+    return SettingsStore(stamp_file=stamp_file)
+
+def invalidate_settings():
+    """Reload the settings (in all processes) on next access.
+
+    This is done automatically whenever a setting is changed via the ORM."""
+    from mediadrop.lib.app_globals import is_object_registered
+    if not is_object_registered(app_globals):
+        return
+    store = app_globals._current_obj().settings_store
+    store.invalidate()
+    # The settings might be reloaded before the transaction is committed (or
+    # rolled back) so invalidate them again afterwards.
+    call_after_commit(store.invalidate, rollback=True)
+
+@observes(events.Setting.after_insert, events.Setting.after_update,
+          events.Setting.after_delete)
+def _setting_changed(instance):
+    invalidate_settings()
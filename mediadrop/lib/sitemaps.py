@@ -0,0 +1,152 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Sitemap and MRSS Generation
+
+The Google video sitemap and the MediaRSS feed contain all published media
+so they are rendered incrementally: media are fetched in chunks (files,
+tags and categories are eager-loaded per chunk) and the XML is streamed to
+the client while the template is evaluated. The controller caches the
+complete document after it was streamed, :func:`write_static_sitemaps`
+writes the chunks to disk.
+
+For very large libraries the sitemaps can also be pre-generated on disk by
+``batch-scripts/generate_sitemaps.py``. If ``sitemaps.static_dir`` is set
+the controller serves the files from that directory (if they exist)::
+
+    sitemaps.static_dir = %(here)s/data/sitemaps
+"""
+
+import math
+import os
+import tempfile
+
+from pylons import config
+from sqlalchemy import orm
+
+from mediadrop.lib.auth.util import viewable_media
+from mediadrop.lib.helpers import url_for
+from mediadrop.lib.templating import render_iter
+from mediadrop.model import Media
+
+
+__all__ = [
+    'google_sitemap_filename',
+    'google_sitemap_vars',
+    'mrss_sitemap_vars',
+    'static_sitemap_file',
+    'write_static_sitemaps',
+]
+
+CHUNK_SIZE = 500
+
+def sitemap_media():
+    """Return the viewable published media with everything the sitemap
+    templates need eager-loaded (one query per relation and chunk).
+
+    The media are ordered by id so chunks can be fetched with keyset
+    pagination instead of an ever-growing OFFSET."""
+    query = Media.query.published().options(
+        orm.subqueryload(Media.files),
+        orm.subqueryload(Media.tags),
+        orm.subqueryload(Media.categories),
+    )
+    return viewable_media(query, keyset=[Media.id.asc()],
+        default_fetch=CHUNK_SIZE)
+
+def google_sitemap_vars(page=None, limit=10000):
+    """Return the template variables for ``sitemaps/google.xml``: a sitemap
+    index if there are more than ``limit`` media items (and no page was
+    requested), otherwise the media of the requested page."""
+    media = sitemap_media()
+    if page is None:
+        count = media.count()
+        if count > limit:
+            return dict(pages=int(math.ceil(count / float(limit))))
+    else:
+        media = media.offset(page * limit).limit(limit)
+
+    if page:
+        links = []
+    else:
+        links = [
+            url_for(controller='/', qualified=True),
+            url_for(controller='/media', show='popular', qualified=True),
+            url_for(controller='/media', show='latest', qualified=True),
+            url_for(controller='/categories', qualified=True),
+        ]
+
+    return dict(
+        media = media,
+        page = page,
+        links = links,
+    )
+
+def mrss_sitemap_vars():
+    """Return the template variables for the MediaRSS sitemap."""
+    return dict(
+        media = sitemap_media(),
+        title = 'MediaRSS Sitemap',
+    )
+
+def google_sitemap_filename(page=None):
+    if page is None:
+        return 'google.xml'
+    return 'google-%d.xml' % page
+
+def static_sitemap_file(filename):
+    """Return the path of a pre-generated sitemap file (or None if static
+    sitemaps are not configured or the file does not exist)."""
+    static_dir = config.get('sitemaps.static_dir')
+    if not static_dir:
+        return None
+    path = os.path.join(static_dir, filename)
+    if not os.path.isfile(path):
+        return None
+    return path
+
+def _write_file(directory, filename, chunks):
+    # write to a temporary file first so the web server never serves a
+    # partial sitemap
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + filename, dir=directory)
+    try:
+        tmp_file = os.fdopen(fd, 'wb')
+        try:
+            for chunk in chunks:
+                tmp_file.write(chunk)
+        finally:
+            tmp_file.close()
+        os.chmod(tmp_path, 0644)
+        os.rename(tmp_path, os.path.join(directory, filename))
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return filename
+
+def write_static_sitemaps(directory, limit=10000):
+    """Render all sitemaps into the given directory and return the names
+    of the written files. Needs a (fake) request for URL generation."""
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    written = []
+    index_vars = google_sitemap_vars(limit=limit)
+    written.append(_write_file(directory, google_sitemap_filename(),
+        render_iter('sitemaps/google.xml', index_vars)))
+    for page in range(index_vars.get('pages', 0)):
+        page_vars = google_sitemap_vars(page=page, limit=limit)
+        written.append(_write_file(directory, google_sitemap_filename(page),
+            render_iter('sitemaps/google.xml', page_vars)))
+    written.append(_write_file(directory, 'mrss.xml',
+        render_iter('sitemaps/mrss.xml', mrss_sitemap_vars())))
+
+    # remove pages which are not part of the sitemap index anymore
+    for filename in os.listdir(directory):
+        is_page = filename.startswith('google-') and filename.endswith('.xml')
+        if is_page and (filename not in written):
+            os.remove(os.path.join(directory, filename))
+    return written
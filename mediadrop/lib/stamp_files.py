@@ -0,0 +1,101 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Stamp Files
+
+Most of the caches are kept in memory per process. A stamp file tells all
+other processes (on the same host or with a shared ``cache_dir``) that their
+copy is stale: The file is replaced on every change and checking it is a
+single ``stat()`` call.
+
+The modification time of a stamp is rounded up to the next full second so a
+change is never missed on file systems with a coarse time resolution (at
+worst a value created in the same second is created again).
+"""
+
+import logging
+import math
+import os
+import re
+import tempfile
+import time
+
+
+__all__ = [
+    'StampDirectory',
+    'StampFile',
+]
+
+log = logging.getLogger(__name__)
+
+class StampFile(object):
+    """A file which is replaced whenever the data it stands for changed."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        """Return a value which changes whenever the file was replaced (or
+        None if the file does not exist)."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        # the mtime is rounded, the inode number and ctime change anyway
+        return (stat.st_ino, stat.st_mtime, stat.st_ctime)
+
+    def mtime(self):
+        """Return the time of the last change (0 if there was none)."""
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return 0
+
+    def touch(self):
+        """Replace the file. Errors are logged, not raised.
+
+        :returns: True if the file was replaced.
+        """
+        try:
+            self._replace()
+        except (IOError, OSError):
+            log.exception('Unable to replace the stamp file %r' % self.path)
+            return False
+        return True
+
+    def _replace(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        now = time.time()
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.stamp')
+        try:
+            os.write(fd, '%f\n' % now)
+        finally:
+            os.close(fd)
+        stamp = math.ceil(now)
+        os.utime(temp_path, (stamp, stamp))
+        os.rename(temp_path, self.path)
+
+
+class StampDirectory(object):
+    """A directory with one :class:`StampFile` per name."""
+
+    _unsafe_chars = re.compile(r'[^a-zA-Z0-9_.-]')
+
+    def __init__(self, path):
+        self.path = path
+
+    def stamp_file(self, name):
+        filename = self._unsafe_chars.sub('_', name) + '.stamp'
+        return StampFile(os.path.join(self.path, filename))
+
+    def mtime(self, name):
+        return self.stamp_file(name).mtime()
+
+    def touch(self, name):
+        return self.stamp_file(name).touch()
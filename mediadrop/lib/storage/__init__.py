@@ -6,6 +6,7 @@
 # See LICENSE.txt in the main project directory, for more information.
 
 from mediadrop.lib.storage.api import *
+from mediadrop.lib.storage.chunked_uploads import *
 
 from mediadrop.lib.storage.localfiles import LocalFileStorage
 from mediadrop.lib.storage.remoteurls import RemoteURLStorage
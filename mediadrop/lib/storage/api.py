@@ -9,21 +9,26 @@ import logging
 import os
 import re
 
+from copy import deepcopy
 from cStringIO import StringIO
 from operator import attrgetter
 from urllib2 import URLError, urlopen
 
+from sqlalchemy.orm.attributes import instance_dict
+
 from mediadrop.lib.compat import defaultdict, SEEK_END
 from mediadrop.lib.decorators import memoize
 from mediadrop.lib.filetypes import guess_container_format, guess_media_type
 from mediadrop.lib.i18n import _
+from mediadrop.lib.registry import invalidate_registry, registry
 from mediadrop.lib.thumbnails import (create_thumbs_for, has_thumbs,
     has_default_thumbs)
 from mediadrop.lib.xhtml import clean_xhtml
 from mediadrop.plugin.abc import (AbstractClass, abstractmethod,
     abstractproperty)
 
-__all__ = ['add_new_media_file', 'sort_engines', 'CannotTranscode', 
+__all__ = ['add_new_media_file', 'download_thumbnail', 'sort_engines',
+    'transcode_media_file', 'CannotTranscode', 
     'FileStorageEngine', 'StorageError', 'StorageEngine', 
     'UnsuitableEngineError', 'UserStorageError',
 ]
@@ -261,12 +266,16 @@ class FileStorageEngine(StorageEngine):
         name, ext = os.path.splitext(filename)
         ext = ext.lstrip('.').lower()
         container = guess_container_format(ext)
+        # chunked uploads know their size already
+        size = getattr(file, 'size', None)
+        if size is None:
+            size = get_file_size(file.file)
 
         return {
             'type': guess_media_type(container),
             'container': container,
             'display_name': u'%s.%s' % (name, container or ext),
-            'size': get_file_size(file.file),
+            'size': size,
         }
 
 class EmbedStorageEngine(StorageEngine):
@@ -316,10 +325,54 @@ class EmbedStorageEngine(StorageEngine):
         """
 
 def enabled_engines():
+    """Return the enabled storage engines in the order they should be tried.
+
+    The sorted engines are kept per process until a storage engine is
+    changed (see :mod:`mediadrop.lib.registry`). The returned instances are
+    copies attached to the current DBSession, no query is needed. Their
+    ``_data`` is copied too so changes do not leak into the shared engines.
+
+    :rtype: list
+    :returns: :class:`StorageEngine` instances.
+    """
+    from mediadrop.model import DBSession
+    from mediadrop.model.util import MutableDict
+    engines = registry('storage_engines', load_enabled_engines,
+        tags=['storage'])
+    copies = []
+    for engine in engines:
+        # merge(load=False) shares the MutableDict with the shared engine
+        # (even a deepcopy keeps its parents) so any change would flag the
+        # shared engine as dirty. The copy gets a dict which only reports
+        # changes to the copy.
+        engine_copy = DBSession.merge(engine, load=False)
+        copy_dict = instance_dict(engine_copy)
+        data = MutableDict(deepcopy(dict(copy_dict['_data'])))
+        data._parents[engine_copy] = '_data'
+        copy_dict['_data'] = data
+        copies.append(engine_copy)
+    return copies
+
+def invalidate_enabled_engines():
+    """Reload the enabled storage engines on next access (in all
+    processes)."""
+    invalidate_registry('storage_engines', tags=['storage'])
+
+def load_enabled_engines():
+    """Query and sort the enabled storage engines.
+
+    The engines are loaded in a separate session (which uses the connection
+    of the current DBSession) so the returned instances are detached and can
+    be shared between requests.
+    """
     from mediadrop.model import DBSession
-    engines = DBSession.query(StorageEngine)\
-        .filter(StorageEngine.enabled == True)\
-        .all()
+    session = DBSession.session_factory(bind=DBSession.connection())
+    try:
+        engines = session.query(StorageEngine)\
+            .filter(StorageEngine.enabled == True)\
+            .all()
+    finally:
+        session.close()
     return list(sort_engines(engines))
 
 def add_new_media_file(media, file=None, url=None):
@@ -329,7 +382,8 @@ def add_new_media_file(media, file=None, url=None):
 
     :type media: :class:`~mediadrop.model.media.Media` instance
     :param media: The media object that this file or URL will belong to.
-    :type file: :class:`cgi.FieldStorage` or None
+    :type file: :class:`cgi.FieldStorage`,
+        :class:`~mediadrop.lib.storage.chunked_uploads.ChunkedUpload` or None
     :param file: A freshly uploaded file object.
     :type url: unicode or None
     :param url: A remote URL string.
@@ -338,7 +392,14 @@ def add_new_media_file(media, file=None, url=None):
     :raises StorageError: If the input file or URL cannot be
         stored with any of the registered storage engines.
 
+    If background jobs are enabled (see :mod:`mediadrop.lib.jobs`) the
+    function returns once the file is stored, thumbnail downloads,
+    post-processing and transcoding are queued for the job worker.
+
     """
+    from mediadrop.lib.jobs import background_jobs_enabled
+    background = background_jobs_enabled()
+
     sorted_engines = enabled_engines()
     for engine in sorted_engines:
         try:
@@ -371,6 +432,11 @@ def add_new_media_file(media, file=None, url=None):
 
     unique_id = engine.store(media_file=mf, file=file, url=url, meta=meta)
 
+    from mediadrop.lib.storage.chunked_uploads import ChunkedUpload
+    if isinstance(file, ChunkedUpload):
+        # the engine moved or copied the data, the upload is not needed anymore
+        file.discard()
+
     if unique_id:
         mf.unique_id = unique_id
     elif not mf.unique_id:
@@ -388,41 +454,53 @@ def add_new_media_file(media, file=None, url=None):
     if ('thumbnail_url' in meta or 'thumbnail_file' in meta) \
     and (not has_thumbs(media) or has_default_thumbs(media)):
         thumb_file = meta.get('thumbnail_file', None)
-
         if thumb_file is not None:
-            thumb_filename = thumb_file.filename
-        else:
-            thumb_url = meta['thumbnail_url']
-            thumb_filename = os.path.basename(thumb_url)
-
-            # Download the image to a buffer and wrap it as a file-like object
+            create_thumbs_for(media, thumb_file, thumb_file.filename)
+            thumb_file.close()
+        elif not background:
             try:
-                temp_img = urlopen(thumb_url)
-                thumb_file = StringIO(temp_img.read())
-                temp_img.close()
+                download_thumbnail(media, meta['thumbnail_url'])
             except URLError, e:
                 log.exception(e)
 
-        if thumb_file is not None:
-            create_thumbs_for(media, thumb_file, thumb_filename)
-            thumb_file.close()
-
     DBSession.flush()
 
+    if background:
+        # The file is stored, the rest is done by the job worker.
+        from mediadrop.lib.storage.jobs import queue_media_file_processing
+        queue_media_file_processing(mf, thumbnail_url=meta.get('thumbnail_url'))
+        return mf
+
     engine.postprocess(mf)
+    transcode_media_file(mf, sorted_engines)
+    return mf
 
-    # Try to transcode the file.
-    for engine in sorted_engines:
+def download_thumbnail(media, thumb_url):
+    """Download the image from the given URL and use it as thumbnail.
+
+    :raises URLError: If the image could not be downloaded.
+    """
+    # Download the image to a buffer and wrap it as a file-like object
+    temp_img = urlopen(thumb_url)
+    thumb_file = StringIO(temp_img.read())
+    temp_img.close()
+    create_thumbs_for(media, thumb_file, os.path.basename(thumb_url))
+    thumb_file.close()
+
+def transcode_media_file(media_file, engines=None):
+    """Hand the given file over to the first engine which agrees to
+    transcode it (if any)."""
+    if engines is None:
+        engines = enabled_engines()
+    for engine in engines:
         try:
-            engine.transcode(mf)
-            log.debug('Engine %r has agreed to transcode %r', engine, mf)
+            engine.transcode(media_file)
+            log.debug('Engine %r has agreed to transcode %r', engine, media_file)
             break
         except CannotTranscode:
-            log.debug('Engine %r unsuitable for transcoding %r', engine, mf)
+            log.debug('Engine %r unsuitable for transcoding %r', engine, media_file)
             continue
 
-    return mf
-
 def sort_engines(engines):
     """Yield a topological sort of the given list of engines.
 
@@ -0,0 +1,326 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Chunked Uploads
+
+Large files can be uploaded in several requests so an upload can be resumed
+after a network error instead of starting over. The chunks are written to
+the upload directory (``chunked_uploads.dir``, default:
+``<media_dir>/.uploads``) where
+:class:`~mediadrop.lib.storage.localfiles.LocalFileStorage` renames the
+completed file to its final name, so the data is written only once. The
+size and a CRC32 checksum are computed while the chunks are written.
+
+The protocol (``/upload/chunk`` and ``/admin/media/upload_chunk``):
+
+1. ``POST ?filename=movie.mp4&size=123456789`` starts an upload and returns
+   ``{"success": true, "upload_id": "...", "offset": 0, ...}``.
+2. ``POST ?upload_id=...&offset=0`` with a part of the file as request body
+   (``Content-Type: application/octet-stream``) appends the chunk and
+   returns the new ``offset``. A chunk which does not start at the end of
+   the data received so far is rejected, the response contains the
+   ``offset`` to continue from.
+3. ``GET ?upload_id=...`` returns the current ``offset`` (e.g. to resume
+   an upload after a network error).
+4. When the upload is ``complete`` the regular upload form is submitted
+   with ``upload_id`` instead of ``file``.
+
+Uploads which are not finished within ``chunked_uploads.expire`` seconds
+are deleted.
+"""
+
+import errno
+import os
+import re
+import shutil
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+import simplejson as json
+from pylons import config
+
+from mediadrop.lib.i18n import _
+from mediadrop.lib.storage.api import UserStorageError
+
+__all__ = [
+    'ChunkedUpload',
+    'completed_upload',
+    'delete_expired_uploads',
+    'handle_chunk_request',
+    'start_chunked_upload',
+    'upload_dir',
+]
+
+BUFFER_SIZE = 64 * 1024
+
+_upload_id_pattern = re.compile(r'^[0-9a-f]{32}$')
+
+
+class ChunkedUpload(object):
+    """A file which is uploaded in several requests.
+
+    The data is appended to ``<upload_id>.part``, ``<upload_id>.json``
+    contains the name and announced size of the file and the number of
+    bytes (and their checksum) which were received completely.
+
+    Completed uploads can be passed to
+    :func:`~mediadrop.lib.storage.api.add_new_media_file` like a
+    :class:`cgi.FieldStorage` (they have ``filename`` and ``file``).
+    """
+
+    def __init__(self, upload_dir, upload_id, filename, size, offset=0,
+                 crc=0, started_on=None):
+        self.upload_dir = upload_dir
+        self.upload_id = upload_id
+        self.filename = filename
+        self.size = size
+        self.offset = offset
+        self.crc = crc
+        self.started_on = started_on or time.time()
+        self.path = os.path.join(upload_dir, upload_id + '.part')
+        self.meta_path = os.path.join(upload_dir, upload_id + '.json')
+        self._file = None
+
+    @classmethod
+    def start(cls, upload_dir, filename, size):
+        """Create a new (empty) upload."""
+        upload = cls(upload_dir, os.urandom(16).encode('hex'), filename, size)
+        open(upload.path, 'wb').close()
+        upload._save()
+        return upload
+
+    @classmethod
+    def load(cls, upload_dir, upload_id):
+        """Return the upload with the given ID or None if it does not exist
+        (or expired)."""
+        if not _upload_id_pattern.match(upload_id or ''):
+            return None
+        try:
+            meta_file = open(os.path.join(upload_dir, upload_id + '.json'), 'rb')
+            try:
+                meta = json.load(meta_file)
+            finally:
+                meta_file.close()
+        except (IOError, ValueError):
+            return None
+        return cls(upload_dir, upload_id, meta['filename'], meta['size'],
+            meta['offset'], meta['crc'], meta['started_on'])
+
+    def _save(self):
+        meta = dict(filename=self.filename, size=self.size,
+            offset=self.offset, crc=self.crc, started_on=self.started_on)
+        tmp_path = self.meta_path + '.tmp'
+        meta_file = open(tmp_path, 'wb')
+        try:
+            json.dump(meta, meta_file)
+        finally:
+            meta_file.close()
+        os.rename(tmp_path, self.meta_path)
+
+    @property
+    def complete(self):
+        return self.offset == self.size
+
+    @property
+    def checksum(self):
+        """The CRC32 of the data received so far (as hex string)."""
+        return '%08x' % (self.crc & 0xffffffff)
+
+    def append(self, offset, stream, length):
+        """Write ``length`` bytes read from ``stream`` at ``offset``.
+
+        :returns: False if ``offset`` is not the end of the data received
+            so far (e.g. a chunk was sent twice). The client should continue
+            at :attr:`offset`.
+        :raises UserStorageError: If the chunk exceeds the announced size.
+        :raises IOError: If the stream ended early. The partial chunk is
+            discarded.
+        """
+        try:
+            data_file = open(self.path, 'r+b')
+        except IOError:
+            raise UserStorageError(_('The upload does not exist or expired.'))
+        try:
+            if fcntl is not None:
+                fcntl.flock(data_file.fileno(), fcntl.LOCK_EX)
+            # another request might have written a chunk in the meantime
+            current = self.load(self.upload_dir, self.upload_id)
+            if current is None:
+                raise UserStorageError(_('The upload does not exist or expired.'))
+            self.offset, self.crc = current.offset, current.crc
+            if offset != self.offset:
+                return False
+            if offset + length > self.size:
+                raise UserStorageError(_('The file is larger than announced.'))
+
+            # drop the data of an interrupted chunk
+            data_file.truncate(offset)
+            data_file.seek(offset)
+            crc = self.crc
+            remaining = length
+            while remaining > 0:
+                data = stream.read(min(BUFFER_SIZE, remaining))
+                if not data:
+                    raise IOError('Chunk ended after %d of %d bytes' %
+                                  (length - remaining, length))
+                data_file.write(data)
+                crc = zlib.crc32(data, crc)
+                remaining -= len(data)
+            data_file.flush()
+            self.offset = offset + length
+            self.crc = crc
+            self._save()
+            return True
+        finally:
+            # also releases the lock
+            data_file.close()
+
+    @property
+    def file(self):
+        if self._file is None:
+            self._file = open(self.path, 'rb')
+        return self._file
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def move_to(self, path):
+        """Move the uploaded data to ``path`` and delete the upload.
+
+        This is a rename if the upload directory is on the same file system.
+        """
+        self.close()
+        try:
+            os.rename(self.path, path)
+        except OSError, e:
+            if e.errno != errno.EXDEV:
+                raise
+            tmp_path = path + '.tmp'
+            shutil.move(self.path, tmp_path)
+            os.rename(tmp_path, path)
+        self.discard()
+
+    def discard(self):
+        """Delete the upload (and its data unless it was moved)."""
+        self.close()
+        for path in (self.path, self.meta_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def __repr__(self):
+        return '<ChunkedUpload %s %r %d/%d>' % (self.upload_id, self.filename,
+            self.offset, self.size)
+
+
+def upload_dir():
+    """Return the directory for :class:`ChunkedUpload` files."""
+    path = config.get('chunked_uploads.dir') or \
+        os.path.join(config['media_dir'], '.uploads')
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            pass
+    return path
+
+def delete_expired_uploads(max_age=None):
+    """Delete uploads which were started more than ``max_age`` seconds
+    (default: ``chunked_uploads.expire``) ago.
+
+    :returns: The number of deleted uploads.
+    """
+    if max_age is None:
+        max_age = int(config.get('chunked_uploads.expire', 24 * 3600))
+    directory = upload_dir()
+    deleted = 0
+    for name in os.listdir(directory):
+        upload_id, ext = os.path.splitext(name)
+        if ext != '.json':
+            continue
+        upload = ChunkedUpload.load(directory, upload_id)
+        if upload is not None and time.time() - upload.started_on > max_age:
+            upload.discard()
+            deleted += 1
+    return deleted
+
+def start_chunked_upload(filename, size, max_size=None):
+    """Start a new :class:`ChunkedUpload` of a file with the given name
+    and size (in bytes).
+
+    :raises UserStorageError: If the size is invalid or exceeds ``max_size``.
+    """
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        size = -1
+    if not filename or size < 0:
+        raise UserStorageError(_('Please specify the name and size of the file.'))
+    if max_size and size > max_size:
+        raise UserStorageError(_('The file is too large.'))
+    delete_expired_uploads()
+    return ChunkedUpload.start(upload_dir(), os.path.basename(filename), size)
+
+def completed_upload(upload_id):
+    """Return the :class:`ChunkedUpload` with the given ID.
+
+    :raises UserStorageError: If the upload does not exist or is incomplete.
+    """
+    upload = ChunkedUpload.load(upload_dir(), upload_id)
+    if upload is None:
+        raise UserStorageError(_('The upload does not exist or expired.'))
+    if not upload.complete:
+        raise UserStorageError(_('The upload is not complete.'))
+    return upload
+
+def handle_chunk_request(request, upload_id=None, offset=None, filename=None,
+                         size=None, max_size=None):
+    """Process a request of the chunked upload protocol (see above) for a
+    controller action.
+
+    :rtype: dict
+    :returns: The JSON response: ``success``, ``upload_id``, ``offset``,
+        ``size``, ``complete``, ``checksum`` and ``message`` (if unsuccessful).
+    """
+    upload = None
+    try:
+        if not upload_id:
+            if request.method != 'POST':
+                raise UserStorageError(_('Please specify the upload.'))
+            upload = start_chunked_upload(filename, size, max_size)
+        else:
+            upload = ChunkedUpload.load(upload_dir(), upload_id)
+            if upload is None:
+                raise UserStorageError(_('The upload does not exist or expired.'))
+            if request.method == 'POST':
+                try:
+                    offset = int(offset)
+                except (TypeError, ValueError):
+                    raise UserStorageError(_('Please specify the offset of the chunk.'))
+                length = request.content_length or 0
+                if not upload.append(offset, request.body_file, length):
+                    raise UserStorageError(_('The chunk does not continue the upload.'))
+    except (UserStorageError, IOError), e:
+        data = dict(success=False, message=unicode(e))
+    else:
+        data = dict(success=True)
+    if upload is not None:
+        data.update(
+            upload_id = upload.upload_id,
+            offset = upload.offset,
+            size = upload.size,
+            complete = upload.complete,
+            checksum = upload.checksum,
+        )
+    return data
@@ -0,0 +1,57 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Background jobs for new media files (see :mod:`mediadrop.lib.jobs`).
+
+:func:`~mediadrop.lib.storage.api.add_new_media_file` stores the file and
+queues the remaining steps:
+
+- ``fetch_thumbnail``: download the thumbnail image returned by the storage
+  engine (e.g. for YouTube videos)
+- ``postprocess``: :meth:`StorageEngine.postprocess`, queues ``transcode``
+  when it is done
+- ``transcode``: hand the file over to the first engine which agrees to
+  transcode it
+"""
+
+from mediadrop.lib.jobs import enqueue_job, job_handler
+from mediadrop.lib.storage.api import download_thumbnail, transcode_media_file
+from mediadrop.lib.thumbnails import has_default_thumbs, has_thumbs
+
+__all__ = [
+    'queue_media_file_processing',
+]
+
+def queue_media_file_processing(media_file, thumbnail_url=None):
+    """Queue the post-processing of a newly stored media file."""
+    if thumbnail_url:
+        enqueue_job(u'fetch_thumbnail', media_file=media_file,
+            data={'url': thumbnail_url})
+    enqueue_job(u'postprocess', media_file=media_file)
+
+@job_handler(u'fetch_thumbnail')
+def fetch_thumbnail_job(job):
+    media = job.media
+    # the thumbnails might have been uploaded in the meantime
+    if media is None or (has_thumbs(media) and not has_default_thumbs(media)):
+        return
+    download_thumbnail(media, job.data['url'])
+
+@job_handler(u'postprocess')
+def postprocess_job(job):
+    media_file = job.media_file
+    if media_file is None:
+        return
+    media_file.storage.postprocess(media_file)
+    enqueue_job(u'transcode', media_file=media_file)
+
+@job_handler(u'transcode')
+def transcode_job(job):
+    media_file = job.media_file
+    if media_file is None:
+        return
+    transcode_media_file(media_file)
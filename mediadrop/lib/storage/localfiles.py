@@ -15,6 +15,7 @@ from pylons import config
 from mediadrop.forms.admin.storage.localfiles import LocalFileStorageForm
 from mediadrop.lib.i18n import N_
 from mediadrop.lib.storage.api import safe_file_name, FileStorageEngine
+from mediadrop.lib.storage.chunked_uploads import ChunkedUpload
 from mediadrop.lib.uri import StorageURI
 from mediadrop.lib.util import delete_files, url_for
 
@@ -38,7 +39,8 @@ class LocalFileStorage(FileStorageEngine):
 
         :type media_file: :class:`~mediadrop.model.media.MediaFile`
         :param media_file: The associated media file object.
-        :type file: :class:`cgi.FieldStorage` or None
+        :type file: :class:`cgi.FieldStorage`,
+            :class:`~mediadrop.lib.storage.chunked_uploads.ChunkedUpload` or None
         :param file: A freshly uploaded file object.
         :type url: unicode or None
         :param url: A remote URL string.
@@ -51,12 +53,25 @@ class LocalFileStorage(FileStorageEngine):
         file_name = safe_file_name(media_file, file.filename)
         file_path = self._get_path(file_name)
 
+        if isinstance(file, ChunkedUpload):
+            # the chunks were written to the upload dir already
+            file.move_to(file_path)
+            return file_name
+
+        # never serve a partially written file
+        partial_path = file_path + '.tmp'
         temp_file = file.file
         temp_file.seek(0)
-        permanent_file = open(file_path, 'wb')
-        copyfileobj(temp_file, permanent_file)
+        permanent_file = open(partial_path, 'wb')
+        try:
+            copyfileobj(temp_file, permanent_file)
+            permanent_file.close()
+            os.rename(partial_path, file_path)
+        except:
+            permanent_file.close()
+            os.remove(partial_path)
+            raise
         temp_file.close()
-        permanent_file.close()
 
         return file_name
 
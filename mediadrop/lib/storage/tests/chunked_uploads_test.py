@@ -0,0 +1,96 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from cStringIO import StringIO
+import os
+import zlib
+
+from pylons import config
+
+from mediadrop.lib.i18n import setup_global_translator
+from mediadrop.lib.storage import (add_new_media_file, completed_upload,
+    delete_expired_uploads, start_chunked_upload, ChunkedUpload,
+    UserStorageError)
+from mediadrop.lib.test.db_testcase import DBTestCase
+from mediadrop.lib.test.pythonic_testcase import *
+from mediadrop.model import DBSession, Media
+
+
+class ChunkedUploadTest(DBTestCase):
+    def setUp(self):
+        super(ChunkedUploadTest, self).setUp()
+        # the errors contain translated messages
+        setup_global_translator(registry=self.paste_registry)
+
+    def _append(self, upload, offset, data, length=None):
+        if length is None:
+            length = len(data)
+        return upload.append(offset, StringIO(data), length)
+
+    def _reload(self, upload):
+        return ChunkedUpload.load(upload.upload_dir, upload.upload_id)
+
+    def test_appends_chunks_in_order(self):
+        upload = start_chunked_upload(u'movie.mp4', 10)
+        assert_true(self._append(upload, 0, '01234'))
+        # a chunk which was sent twice
+        assert_false(self._append(upload, 0, '01234'))
+        assert_false(upload.complete)
+        assert_raises(UserStorageError, lambda: completed_upload(upload.upload_id))
+
+        assert_true(self._append(upload, 5, '56789'))
+        upload = completed_upload(upload.upload_id)
+        assert_equals(u'movie.mp4', upload.filename)
+        assert_equals('%08x' % (zlib.crc32('0123456789') & 0xffffffff),
+                      upload.checksum)
+        assert_equals('0123456789', upload.file.read())
+        upload.close()
+
+    def test_discards_interrupted_chunks(self):
+        upload = start_chunked_upload(u'movie.mp4', 10)
+        assert_raises(IOError, lambda: self._append(upload, 0, '012', length=5))
+        assert_equals(0, self._reload(upload).offset)
+
+        assert_true(self._append(upload, 0, '01234'))
+        assert_equals('01234', open(upload.path, 'rb').read())
+
+    def test_rejects_data_beyond_announced_size(self):
+        upload = start_chunked_upload(u'movie.mp4', 4)
+        assert_raises(UserStorageError, lambda: self._append(upload, 0, '01234'))
+        assert_raises(UserStorageError,
+            lambda: start_chunked_upload(u'movie.mp4', 100, max_size=10))
+
+    def test_local_storage_moves_completed_upload(self):
+        upload = start_chunked_upload(u'movie.mp4', 10)
+        self._append(upload, 0, '0123456789')
+        media = Media.example()
+        DBSession.flush()
+
+        media_file = add_new_media_file(media, file=upload)
+        assert_equals(10, media_file.size)
+        assert_equals(u'mp4', media_file.container)
+        stored_path = os.path.join(config['media_dir'], media_file.unique_id)
+        assert_equals('0123456789', open(stored_path, 'rb').read())
+        assert_false(os.path.exists(upload.path))
+        assert_none(self._reload(upload))
+
+    def test_deletes_expired_uploads(self):
+        upload = start_chunked_upload(u'movie.mp4', 10)
+        assert_equals(0, delete_expired_uploads(max_age=60))
+        assert_equals(1, delete_expired_uploads(max_age=-1))
+        assert_none(self._reload(upload))
+        assert_false(os.path.exists(upload.path))
+
+
+import unittest
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ChunkedUploadTest))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -21,7 +21,9 @@ __all__ = [
     'TemplateLoader',
     'XHTMLPlusSerializer',
     'render',
+    'render_iter',
     'render_stream',
+    'stream_response',
 ]
 
 log = logging.getLogger(__name__)
@@ -114,6 +116,78 @@ def render_stream(stream, method='auto', template_name=None):
     :returns: A subclassed `unicode` object.
 
     """
+    method = _serialization_method(method, template_name)
+    return Markup(stream.render(method=method, encoding=None))
+
+def render_iter(template, tmpl_vars=None, method='auto', encoding='utf-8',
+                buffer_size=64 * 1024):
+    """Render the given template incrementally.
+
+    Returns a generator which yields the encoded output in chunks of about
+    ``buffer_size`` bytes while the template is evaluated. Return it from a
+    controller action (see :func:`stream_response`) to stream the response
+    through the WSGI iterator instead of building the whole document in
+    memory.
+
+    :param template: A template path.
+    :param tmpl_vars: A dict of variables to pass into the template.
+    :param method: The serialization method, see :func:`render_stream`.
+    :rtype: generator
+    :returns: Encoded strings.
+
+    """
+    stream = render(template, tmpl_vars=tmpl_vars)
+    method = _serialization_method(method, template)
+    buffered = []
+    buffered_size = 0
+    for chunk in stream.serialize(method=method):
+        data = chunk.encode(encoding)
+        buffered.append(data)
+        buffered_size += len(data)
+        if buffered_size >= buffer_size:
+            yield ''.join(buffered)
+            buffered = []
+            buffered_size = 0
+    if buffered:
+        yield ''.join(buffered)
+
+def stream_response(chunks):
+    """Prepare the given chunks (e.g. from :func:`render_iter`) to be
+    returned by the current controller action.
+
+    The RegistryManager removes the request globals (``request``,
+    ``tmpl_context``, ``translator``...) as soon as the action returns but
+    the WSGI server iterates over the response later. The returned iterator
+    registers them again while each chunk is generated. Strings (e.g. a
+    cached response) are returned unchanged.
+
+    :param chunks: An iterable of encoded strings or a string.
+    :rtype: iterator or str
+    """
+    if isinstance(chunks, basestring):
+        return chunks
+    registry = request.environ['paste.registry']
+    registered = [item for context in registry.reglist
+                  for item in context.values()]
+    return _iter_with_registered(registry, registered, iter(chunks))
+
+def _iter_with_registered(registry, registered, chunks):
+    try:
+        while True:
+            registry.prepare()
+            registry.multiregister(registered)
+            try:
+                chunk = chunks.next()
+            except StopIteration:
+                return
+            finally:
+                registry.cleanup()
+            yield chunk
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+def _serialization_method(method, template_name=None):
     if method == 'auto':
         if template_name and template_name.endswith('.xml'):
             method = 'xml'
@@ -122,8 +196,7 @@ def render_stream(stream, method='auto', template_name=None):
 
     if method == 'xhtml':
         method = XHTMLPlusSerializer
-
-    return Markup(stream.render(method=method, encoding=None))
+    return method
 
 class XHTMLPlusSerializer(XHTMLSerializer):
     """
@@ -135,7 +208,50 @@ class XHTMLPlusSerializer(XHTMLSerializer):
     """
     _EMPTY_ELEMS = frozenset(set(['source']) | XHTMLSerializer._EMPTY_ELEMS)
 
+PRECOMPILED_EXTENSIONS = ('.html', '.xml')
+
 class TemplateLoader(_TemplateLoader):
+    """
+    Genshi TemplateLoader which treats absolute template paths as relative
+    to the search path.
+
+    With ``max_cache_size=0`` the cache is unbounded. If ``auto_reload`` is
+    disabled as well, cached templates are returned without acquiring the
+    lock or checking the template files (production mode).
+    """
+    def __init__(self, *args, **kwargs):
+        super(TemplateLoader, self).__init__(*args, **kwargs)
+        if not kwargs.get('max_cache_size', 25):
+            # In contrast to the LRUCache a dict can be read without holding
+            # the lock.
+            self._cache = {}
+
+    def precompile(self, directories):
+        """Load (and cache) all templates in the given directories.
+
+        :param directories: A list of ``(prefix, path)`` tuples, e.g.
+            ``('', '/.../mediadrop/templates')`` for the core templates and
+            ``('myplugin/', '/.../myplugin/templates')`` for a plugin.
+        :returns: The number of templates loaded.
+        """
+        count = 0
+        for prefix, path in directories:
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    if os.path.splitext(name)[1] not in PRECOMPILED_EXTENSIONS:
+                        continue
+                    relpath = os.path.relpath(os.path.join(dirpath, name), path)
+                    template_name = prefix + relpath.replace(os.sep, '/')
+                    try:
+                        self.load(template_name)
+                    except TemplateError, e:
+                        log.warn('Unable to precompile template %r: %s',
+                            template_name, e)
+                    else:
+                        count += 1
+        return count
+
     def load(self, filename, relative_to=None, cls=None, encoding=None):
         """Load the template with the given name.
 
@@ -182,6 +298,11 @@ class TemplateLoader(_TemplateLoader):
         filename = os.path.normpath(filename)
         cachekey = filename
 
+        if not self.auto_reload and isinstance(self._cache, dict):
+            tmpl = self._cache.get(cachekey)
+            if tmpl is not None:
+                return tmpl
+
         self._lock.acquire()
         try:
             # First check the cache to avoid reparsing the same file
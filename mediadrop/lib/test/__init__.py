@@ -17,6 +17,8 @@ from mediadrop.lib.test.support import *
 
 
 def suite():
+    from mediadrop.controllers.api.tests import (media_info_test,
+        media_pagination_test)
     from mediadrop.controllers.tests import login_test, upload_test
     from mediadrop.lib.auth.tests import (
         cookieplugin_test,
@@ -26,14 +28,23 @@ def suite():
         loginform_test,
         mediadrop_permission_system_test,
         permission_system_test, query_result_proxy_test, static_query_test)
-    from mediadrop.lib.tests import (css_delivery_test, current_url_test,
-        helpers_test, human_readable_size_test, js_delivery_test,
-        observable_test, players_test, request_mixin_test,
-        translator_test, url_for_test, xhtml_normalization_test)
+    from mediadrop.lib.tests import (cache_tags_test, category_tree_test,
+        css_delivery_test, current_url_test, derived_thumbs_test,
+        file_serving_test, fragment_cache_test, helpers_test,
+        human_readable_size_test, jobs_test, js_delivery_test,
+        observable_test, page_cache_test, players_test, popularity_test,
+        registry_test, related_media_test, request_mixin_test,
+        settings_store_test, sitemaps_test, template_loader_test,
+        thumb_manifest_test, thumbnails_test, transactions_test,
+        translator_test, uri_cache_test, url_for_test, view_counter_test,
+        xhtml_normalization_test)
+    from mediadrop.lib.search.tests import inverted_index_test
     from mediadrop.lib.services.tests import youtube_client_test
-    from mediadrop.lib.storage.tests import youtube_storage_test
-    from mediadrop.model.tests import (category_example_test, group_example_test, 
-        media_example_test, media_status_test, media_test, user_example_test)
+    from mediadrop.lib.storage.tests import (chunked_uploads_test,
+        youtube_storage_test)
+    from mediadrop.model.tests import (category_example_test, counters_test,
+        group_example_test, media_example_test, media_status_test, media_test,
+        user_example_test)
     from mediadrop.plugin.tests import abstract_class_registration_test, events_test, observes_test
     
     from mediadrop.validation.tests import (limit_feed_items_validator_test, 
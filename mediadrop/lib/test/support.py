@@ -19,6 +19,7 @@ import pylons
 from pylons.controllers.util import Request, Response
 from pylons.util import AttribSafeContextObj, ContextObj
 from routes.util import URLGenerator
+from sqlalchemy import event
 import tw
 from tw.mods.pylonshf import PylonsHostFramework
 from webob.request import environ_from_url
@@ -36,6 +37,7 @@ __all__ = [
     'build_http_body', 
     'create_wsgi_environ',
     'fake_request',
+    'QueryCounter',
     'register_instance',
     'remove_globals',
     'setup_session',
@@ -188,7 +190,7 @@ def remove_globals():
     # oddly enough popping "pylons.app_globals" was not enough to clear the
     # cached settings in all case (tests) so we do that explicitely.
     if is_object_registered(pylons.app_globals):
-        pylons.app_globals.settings_cache.clear()
+        pylons.app_globals.settings_store.invalidate()
     for name in ('request', 'response', 'session', 'tmpl_context', 'url',
                  'translator', 'app_globals', ):
         global_ = getattr(pylons, name)
@@ -196,6 +198,41 @@ def remove_globals():
             global_._pop_object()
 
 
+class QueryCounter(object):
+    """Record all SQL statements executed via the DBSession engine while the
+    counter is active (use it as context manager)::
+
+        with QueryCounter() as counter:
+            do_something()
+        assert_length(2, counter.statements)
+    """
+    def __init__(self, engine=None):
+        self.engine = engine or DBSession.bind
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __enter__(self):
+        # SQLAlchemy 0.7 can not remove engine listeners so there is only a
+        # single listener per engine which dispatches to the active counters.
+        counters = getattr(self.engine, '_mediadrop_query_counters', None)
+        if counters is None:
+            counters = self.engine._mediadrop_query_counters = []
+            event.listen(self.engine, 'before_cursor_execute', _record_statement)
+        counters.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.engine._mediadrop_query_counters.remove(self)
+        return False
+
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    for counter in conn.engine._mediadrop_query_counters:
+        counter.statements.append(statement)
+
+
 def setup_session(registry=None, if_not_registered=True):
     assert if_not_registered == True, 'only True supported right now'
     paste_registry = registry or _paste_registry(pylons.request)
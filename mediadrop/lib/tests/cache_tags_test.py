@@ -0,0 +1,146 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from datetime import datetime, timedelta
+import shutil
+import tempfile
+import time
+
+import pylons
+
+from mediadrop.lib.cache_tags import (add_cache_tags, invalidate_cache_tags,
+    media_tags, setup_tag_stamps, until_next_publication)
+from mediadrop.lib.decorators import beaker_cache
+from mediadrop.lib.test.db_testcase import DBTestCase
+from mediadrop.lib.test.pythonic_testcase import *
+from mediadrop.lib.test.request_mixin import RequestMixin
+from mediadrop.model import Category, DBSession, Media, Podcast
+
+
+class FakeController(object):
+    _py_object = pylons
+
+    def __init__(self):
+        self.renderings = 0
+
+    @beaker_cache(tags=['media'])
+    def feed(self, podcast_id, **kwargs):
+        self.renderings += 1
+        add_cache_tags('podcast:%s' % podcast_id)
+        return u'%s (%d)' % (podcast_id, self.renderings)
+
+    @beaker_cache(tags=['media'], stream=True)
+    def sitemap(self, **kwargs):
+        self.renderings += 1
+        return iter(['<urlset>', '%d' % self.renderings, '</urlset>'])
+
+    @beaker_cache(expire=lambda: 1)
+    def expiring(self, **kwargs):
+        self.renderings += 1
+        return self.renderings
+
+
+class CacheTagsTest(DBTestCase, RequestMixin):
+    def setUp(self):
+        super(CacheTagsTest, self).setUp()
+        self.init_fake_request()
+        self.controller = FakeController()
+
+    def test_only_invalidates_values_with_matching_tags(self):
+        assert_equals(u'1 (1)', self.controller.feed(podcast_id=1))
+        assert_equals(u'2 (2)', self.controller.feed(podcast_id=2))
+
+        invalidate_cache_tags('podcast:2', 'category:1')
+        assert_equals(u'1 (1)', self.controller.feed(podcast_id=1))
+        assert_equals(u'2 (3)', self.controller.feed(podcast_id=2))
+
+        invalidate_cache_tags('media')
+        assert_equals(u'1 (4)', self.controller.feed(podcast_id=1))
+        assert_equals(u'2 (5)', self.controller.feed(podcast_id=2))
+        assert_equals(5, self.controller.renderings)
+
+    def test_media_tags_contain_podcasts_and_categories_with_ancestors(self):
+        parent = Category.example(name=u'Parent')
+        child = Category.example(name=u'Child', parent_id=parent.id)
+        podcast = Podcast.example()
+        media = Media.example()
+        media.podcast = podcast
+        media.categories.append(child)
+        DBSession.flush()
+
+        expected_tags = set(['media', 'media:%d' % media.id,
+            'podcast:%d' % podcast.id,
+            'category:%d' % parent.id, 'category:%d' % child.id])
+        assert_equals(expected_tags, media_tags(media))
+
+    def test_changing_a_podcast_invalidates_its_tag(self):
+        podcast = Podcast.example()
+        self.controller.feed(podcast_id=podcast.id)
+
+        podcast.title = u'New Title'
+        DBSession.flush()
+        assert_equals(u'%d (2)' % podcast.id,
+            self.controller.feed(podcast_id=podcast.id))
+
+    def test_expires_values_at_the_next_scheduled_publication(self):
+        assert_none(until_next_publication())
+
+        media = Media.example(reviewed=True, encoded=True, publishable=True,
+            publish_on=datetime.now() + timedelta(hours=1))
+        DBSession.flush()
+        assert_almost_equals(60 * 60, until_next_publication(), max_delta=2)
+
+        media.publish_until = datetime.now() + timedelta(minutes=10)
+        media.publish_on = datetime.now() - timedelta(minutes=10)
+        DBSession.flush()
+        assert_almost_equals(10 * 60, until_next_publication(), max_delta=2)
+
+        media.publishable = False
+        DBSession.flush()
+        assert_none(until_next_publication())
+
+    def test_values_expire_after_the_time_returned_by_a_callable(self):
+        assert_equals(1, self.controller.expiring())
+        assert_equals(1, self.controller.expiring())
+
+        time.sleep(1.1)
+        assert_equals(2, self.controller.expiring())
+
+    def test_caches_streamed_values_after_the_last_chunk(self):
+        assert_equals(['<urlset>', '1', '</urlset>'],
+            list(self.controller.sitemap()))
+        assert_equals('<urlset>1</urlset>', self.controller.sitemap())
+
+        invalidate_cache_tags('media')
+        assert_equals(['<urlset>', '2', '</urlset>'],
+            list(self.controller.sitemap()))
+        assert_equals(2, self.controller.renderings)
+
+    def test_stamp_files_are_shared_by_all_processes(self):
+        directory = tempfile.mkdtemp()
+        try:
+            config = {'cache_dir': directory}
+            stamps = setup_tag_stamps(config, None)
+            other_process = setup_tag_stamps(config, None)
+            assert_equals(0, stamps.mtime('podcast:1'))
+
+            before = time.time()
+            other_process.touch('podcast:1')
+            assert_true(stamps.mtime('podcast:1') >= before)
+            assert_equals(0, stamps.mtime('podcast:2'))
+        finally:
+            shutil.rmtree(directory)
+
+
+import unittest
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(CacheTagsTest))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,113 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from datetime import datetime, timedelta
+
+from mediadrop.lib.category_tree import category_tree, CategoryTree
+from mediadrop.lib.test.db_testcase import DBTestCase
+from mediadrop.lib.test.pythonic_testcase import *
+from mediadrop.model import Category, DBSession, Media
+
+
+class CategoryTreeTest(PythonicTestCase):
+    def setUp(self):
+        super(CategoryTreeTest, self).setUp()
+        rows = [
+            (3, u'Animals', u'animals', None),
+            (1, u'Cats', u'cats', 3),
+            (4, u'Dogs', u'dogs', 3),
+            (2, u'Lions', u'lions', 1),
+            (5, u'Music', u'music', None),
+        ]
+        counts = {1: (3, 2), 2: (1, 1), 3: (1, 0), 5: (4, 4)}
+        self.tree = CategoryTree(rows, counts)
+
+    def test_builds_tree(self):
+        assert_equals([u'Animals', u'Music'], [node.name for node in self.tree.roots])
+        assert_equals([(u'Animals', 0), (u'Cats', 1), (u'Lions', 2),
+                       (u'Dogs', 1), (u'Music', 0)],
+                      [(node.name, depth) for node, depth in self.tree.roots.traverse()])
+        assert_equals(u'dogs', self.tree.get(4).slug)
+        assert_equals(4, self.tree.by_slug(u'dogs').id)
+
+    def test_knows_descendants_and_ancestors(self):
+        assert_equals(frozenset([1, 2, 3, 4]), self.tree.subtree_ids(3))
+        assert_equals(frozenset([2]), self.tree.subtree_ids(2))
+        assert_equals([u'Animals', u'Cats'],
+                      [node.name for node in self.tree.ancestors(2)])
+        assert_equals([], self.tree.ancestors(5))
+
+    def test_rolls_up_published_counts(self):
+        assert_equals({1: 3, 2: 1, 3: 3, 4: 0, 5: 4}, self.tree.published_counts)
+        assert_equals(3, self.tree.get(1).media_count)
+
+    def test_ignores_circular_nesting(self):
+        tree = CategoryTree([(1, u'A', u'a', 2), (2, u'B', u'b', 1)], {})
+        assert_equals([], tree.roots)
+        assert_equals(frozenset([1, 2]), tree.subtree_ids(1))
+        assert_equals([tree.get(2)], tree.ancestors(1))
+
+
+class CachedCategoryTreeTest(DBTestCase):
+    def setUp(self):
+        super(CachedCategoryTreeTest, self).setUp()
+        self.parent = Category.example(name=u'Parent', parent_id=None)
+        self.child = Category.example(name=u'Child', parent_id=self.parent.id)
+        self.media = Media.example(reviewed=True, encoded=True,
+            publishable=True, publish_on=datetime.now() - timedelta(days=1))
+        self.media.categories.append(self.child)
+        DBSession.commit()
+
+    def test_reloads_counts_when_media_change(self):
+        tree = category_tree()
+        assert_equals(1, tree.published_counts[self.parent.id])
+        assert_true(category_tree() is tree)
+
+        self.media.publishable = False
+        DBSession.commit()
+        tree = category_tree()
+        assert_equals(0, tree.published_counts[self.parent.id])
+        assert_equals(1, tree.get(self.child.id).media_count)
+
+    def _root_names(self):
+        # "Featured" and "Instructional" are part of the default data
+        return [node.name for node in category_tree().roots]
+
+    def test_reloads_tree_when_categories_change(self):
+        assert_equals([u'Featured', u'Instructional', u'Parent'], self._root_names())
+
+        self.child.parent_id = None
+        self.parent.name = u'Former Parent'
+        DBSession.commit()
+        assert_equals([u'Child', u'Featured', u'Former Parent', u'Instructional'],
+                      self._root_names())
+
+    def test_does_not_cache_uncommitted_changes(self):
+        self.parent.name = u'Renamed'
+        DBSession.flush()
+        assert_equals([u'Featured', u'Instructional', u'Renamed'], self._root_names())
+
+        DBSession.rollback()
+        assert_equals([u'Featured', u'Instructional', u'Parent'], self._root_names())
+
+    def test_media_query_includes_descendants(self):
+        assert_equals([self.media], Media.query.in_category(self.parent).all())
+
+        other = Category.example(name=u'Other', parent_id=None)
+        DBSession.commit()
+        assert_equals([], Media.query.in_category(other).all())
+
+
+import unittest
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(CategoryTreeTest))
+    suite.addTest(unittest.makeSuite(CachedCategoryTreeTest))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,107 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+import os
+import shutil
+import tempfile
+import time
+
+from PIL import Image
+
+from mediadrop.lib.derived_thumbs import (DerivedThumbs, DiskCache,
+    parse_sizes)
+from mediadrop.lib.test.db_testcase import DBTestCase
+from mediadrop.lib.test.pythonic_testcase import *
+from mediadrop.lib.thumbnails import thumb_path
+from mediadrop.model import DBSession, Media
+
+
+class DiskCacheTest(PythonicTestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def _add(self, cache, name, nbytes, age):
+        path = cache.path(name)
+        open(path, 'wb').write('x' * nbytes)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        cache.added(nbytes)
+
+    def test_deletes_least_recently_used_files(self):
+        cache = DiskCache(self.cache_dir, max_bytes=1000)
+        self._add(cache, 'old', 400, age=5000)
+        self._add(cache, 'used', 400, age=7200)
+        assert_not_none(cache.get('used'))
+        self._add(cache, 'new', 400, age=0)
+
+        assert_none(cache.get('old'))
+        assert_not_none(cache.get('used'))
+        assert_not_none(cache.get('new'))
+
+
+class DerivedThumbsTest(DBTestCase):
+    def setUp(self):
+        super(DerivedThumbsTest, self).setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.thumbs = DerivedThumbs(parse_sizes('320x180, 64x64'),
+            ['jpg', 'png'], DiskCache(self.cache_dir, 10 * 1024 * 1024))
+        self.media = Media.example()
+        DBSession.flush()
+        self.orig_path = thumb_path(self.media, 'orig')
+        Image.new('RGB', (1280, 720), 'red').save(self.orig_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        super(DerivedThumbsTest, self).tearDown()
+
+    def _derive(self, xy, format='jpg'):
+        return self.thumbs.derive(Media._thumb_dir, self.media.id, xy, format)
+
+    def test_only_allows_whitelisted_sizes(self):
+        assert_equals((320, 180), self.thumbs.resolve_size('media', '320x180'))
+        assert_equals((128, 72), self.thumbs.resolve_size('media', 's'))
+        assert_none(self.thumbs.resolve_size('media', '321x180'))
+        assert_none(self.thumbs.resolve_size('media', 'orig'))
+
+    def test_renders_thumbs_once(self):
+        path = self._derive((320, 180))
+        assert_equals((320, 180), Image.open(path).size)
+        assert_equals('JPEG', Image.open(path).format)
+        mtime = os.path.getmtime(path)
+        assert_equals(path, self._derive((320, 180)))
+        assert_equals(mtime, os.path.getmtime(path))
+
+        png_path = self._derive((64, 64), format='png')
+        assert_equals((64, 64), Image.open(png_path).size)
+
+    def test_replaced_images_get_new_thumbs(self):
+        version = self.thumbs.version('media', self.media.id)
+        path = self._derive((320, 180))
+
+        Image.new('RGB', (1280, 720), 'blue').save(self.orig_path)
+        mtime = time.time() + 10
+        os.utime(self.orig_path, (mtime, mtime))
+        assert_not_equals(version, self.thumbs.version('media', self.media.id))
+        assert_not_equals(path, self._derive((320, 180)))
+
+    def test_returns_none_without_image(self):
+        os.remove(self.orig_path)
+        assert_none(self._derive((320, 180)))
+
+
+import unittest
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(DiskCacheTest))
+    suite.addTest(unittest.makeSuite(DerivedThumbsTest))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,117 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+import os
+import tempfile
+
+from mediadrop.lib.file_serving import (accepts, file_info, FileServer,
+    parse_ranges)
+from mediadrop.lib.test.pythonic_testcase import *
+
+
+class ParseRangesTest(PythonicTestCase):
+    def test_can_parse_ranges(self):
+        assert_equals([(0, 99)], parse_ranges('bytes=0-99', 1000))
+        assert_equals([(500, 999)], parse_ranges('bytes=500-', 1000))
+        assert_equals([(900, 999)], parse_ranges('bytes=-100', 1000))
+        assert_equals([(0, 0), (10, 999)], parse_ranges('bytes=0-0, 10-2000', 1000))
+
+    def test_ignores_invalid_headers(self):
+        assert_none(parse_ranges('items=0-10', 1000))
+        assert_none(parse_ranges('bytes=10-5', 1000))
+        assert_none(parse_ranges('bytes=a-b', 1000))
+        assert_none(parse_ranges('bytes=' + ','.join(['0-1'] * 30), 1000))
+
+    def test_returns_empty_list_for_unsatisfiable_ranges(self):
+        assert_equals([], parse_ranges('bytes=1000-', 1000))
+        assert_equals([], parse_ranges('bytes=-0', 1000))
+
+
+class FileServerTest(PythonicTestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        self.data = ''.join(chr(i % 256) for i in range(1000))
+        os.write(fd, self.data)
+        os.close(fd)
+        self.info = file_info(self.path)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def _request(self, method='GET', **headers):
+        environ = {'REQUEST_METHOD': method}
+        for name, value in headers.items():
+            environ['HTTP_' + name.upper()] = value
+        response = {}
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+        app = FileServer(self.info, 'video/mp4', block_size=64)
+        body = app(environ, start_response)
+        response['body'] = ''.join(body)
+        if hasattr(body, 'close'):
+            body.close()
+        return response
+
+    def test_returns_complete_file(self):
+        response = self._request()
+        assert_equals('200 OK', response['status'])
+        assert_equals(self.data, response['body'])
+        assert_equals('1000', response['headers']['Content-Length'])
+        assert_equals('bytes', response['headers']['Accept-Ranges'])
+
+        response = self._request('HEAD')
+        assert_equals('200 OK', response['status'])
+        assert_equals('', response['body'])
+
+    def test_returns_single_range(self):
+        response = self._request(range='bytes=100-199')
+        assert_equals('206 Partial Content', response['status'])
+        assert_equals(self.data[100:200], response['body'])
+        assert_equals('bytes 100-199/1000', response['headers']['Content-Range'])
+        assert_equals('100', response['headers']['Content-Length'])
+
+    def test_returns_multiple_ranges(self):
+        response = self._request(range='bytes=0-9,990-')
+        assert_equals('206 Partial Content', response['status'])
+        content_type = response['headers']['Content-Type']
+        assert_true(content_type.startswith('multipart/byteranges; boundary='))
+        assert_equals(str(len(response['body'])), response['headers']['Content-Length'])
+        assert_contains(self.data[:10], response['body'])
+        assert_contains('Content-Range: bytes 990-999/1000', response['body'])
+
+    def test_rejects_unsatisfiable_ranges(self):
+        response = self._request(range='bytes=5000-')
+        assert_equals('416 Requested Range Not Satisfiable', response['status'])
+        assert_equals('bytes */1000', response['headers']['Content-Range'])
+
+    def test_supports_conditional_requests(self):
+        response = self._request(if_none_match=self.info.etag)
+        assert_equals('304 Not Modified', response['status'])
+        response = self._request(if_modified_since=self.info.last_modified)
+        assert_equals('304 Not Modified', response['status'])
+
+        response = self._request(range='bytes=0-9', if_range='"other"')
+        assert_equals('200 OK', response['status'])
+        response = self._request(range='bytes=0-9', if_range=self.info.etag)
+        assert_equals('206 Partial Content', response['status'])
+
+    def test_checks_accept_header(self):
+        assert_true(accepts('video/mp4', '*/*'))
+        assert_true(accepts('video/mp4', 'video/*'))
+        assert_false(accepts('video/mp4', 'text/html'))
+
+
+import unittest
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ParseRangesTest))
+    suite.addTest(unittest.makeSuite(FileServerTest))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,71 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from mediadrop.lib.fragment_cache import cached_fragment, fragment_cache
+from mediadrop.lib.test.db_testcase import DBTestCase
+from mediadrop.lib.test.pythonic_testcase import *
+from mediadrop.lib.test.request_mixin import RequestMixin
+from mediadrop.model import DBSession, Media, PlayerPrefs
+from mediadrop.model.players import cleanup_players_table
+
+
+class FragmentCacheTest(DBTestCase, RequestMixin):
+    def setUp(self):
+        super(FragmentCacheTest, self).setUp()
+        self.init_fake_request()
+        # the default players are not part of the default data
+        cleanup_players_table(enabled=True)
+        DBSession.commit()
+        self.cache = fragment_cache()
+        self.cache.enabled = True
+        self.cache.cache.clear()
+        self.cache.reset_stats()
+        self.renderings = 0
+
+    def _render(self, name, **kwargs):
+        def create():
+            self.renderings += 1
+            return u'<p>%s (%d)</p>' % (name, self.renderings)
+        return cached_fragment(name, create, **kwargs)
+
+    def test_caches_fragments_and_counts_hits(self):
+        assert_equals(u'<p>player (1)</p>', self._render('player'))
+        assert_equals(u'<p>player (1)</p>', self._render('player'))
+        assert_equals(u'<p>player (2)</p>', self._render('player', vary={'width': 400}))
+        assert_equals({'player': dict(hits=1, misses=2)}, self.cache.stats())
+
+    def test_changed_objects_are_rendered_again(self):
+        media = Media.example()
+        other = Media.example()
+        DBSession.flush()
+        assert_equals(u'<p>player (1)</p>', self._render('player', objects=[media]))
+        assert_equals(u'<p>player (2)</p>', self._render('player', objects=[other]))
+
+        media.title = u'New Title'
+        DBSession.flush()
+        assert_equals(u'<p>player (3)</p>', self._render('player', objects=[media]))
+        assert_equals(u'<p>player (2)</p>', self._render('player', objects=[other]))
+
+    def test_changing_player_preferences_invalidates_players_tag(self):
+        assert_equals(u'<p>player (1)</p>', self._render('player', tags=['players']))
+        assert_equals(u'<p>list (2)</p>', self._render('list'))
+
+        player = PlayerPrefs.query.first()
+        player.enabled = not player.enabled
+        DBSession.flush()
+        assert_equals(u'<p>player (3)</p>', self._render('player', tags=['players']))
+        assert_equals(u'<p>list (2)</p>', self._render('list'))
+
+
+import unittest
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(FragmentCacheTest))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
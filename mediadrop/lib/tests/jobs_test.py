@@ -0,0 +1,101 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from datetime import datetime, timedelta
+
+from mediadrop.lib.i18n import setup_global_translator
+from mediadrop.lib.jobs import (enqueue_job, job_handler, JobWorker,
+    retry_failed_jobs, use_background_jobs)
+from mediadrop.lib.storage.api import add_new_media_file
+from mediadrop.lib.test.db_testcase import DBTestCase
+from mediadrop.lib.test.pythonic_testcase import *
+from mediadrop.lib.test.request_mixin import RequestMixin
+from mediadrop.model import DBSession, Job, Media
+from mediadrop.model.jobs import JOB_DONE, JOB_FAILED, JOB_PENDING
+
+
+class JobsTest(DBTestCase, RequestMixin):
+    def setUp(self):
+        super(JobsTest, self).setUp()
+        self.init_fake_request()
+        setup_global_translator(registry=self.paste_registry)
+        self.calls = []
+        self.worker = JobWorker(name=u'test')
+
+        @job_handler(u'test')
+        def run_test_job(job):
+            self.calls.append(job.data['value'])
+            if job.data.get('fail'):
+                raise ValueError('failed')
+
+    def tearDown(self):
+        use_background_jobs(False)
+        super(JobsTest, self).tearDown()
+
+    def test_runs_queued_jobs(self):
+        job = enqueue_job(u'test', data={'value': 1})
+        job_id = job.id
+        DBSession.commit()
+
+        assert_equals(1, self.worker.run_pending())
+        assert_equals([1], self.calls)
+        job = Job.query.get(job_id)
+        assert_equals(JOB_DONE, job.status)
+        assert_equals(1, job.attempts)
+        assert_equals(u'test', job.worker)
+        assert_equals(0, self.worker.run_pending())
+
+    def test_retries_failed_jobs(self):
+        use_background_jobs(True, max_attempts=2, retry_delay=60)
+        job = enqueue_job(u'test', data={'value': 1, 'fail': True})
+        job_id = job.id
+        DBSession.commit()
+
+        assert_equals(1, self.worker.run_pending())
+        job = Job.query.get(job_id)
+        assert_equals(JOB_PENDING, job.status)
+        assert_contains('ValueError', job.error)
+        assert_true(job.run_after > datetime.now() + timedelta(seconds=30))
+        # not due yet
+        assert_equals(0, self.worker.run_pending())
+
+        job.run_after = datetime.now()
+        DBSession.commit()
+        assert_equals(1, self.worker.run_pending())
+        assert_equals(JOB_FAILED, Job.query.get(job_id).status)
+
+        assert_equals(1, retry_failed_jobs())
+        assert_equals(JOB_PENDING, Job.query.get(job_id).status)
+
+    def test_queues_processing_of_new_media_files(self):
+        use_background_jobs(True)
+        media = Media.example()
+        media_file = add_new_media_file(media,
+            url=u'http://site.example/videos.mp4')
+        assert_not_none(media_file.unique_id)
+        DBSession.commit()
+        media_id = media.id
+
+        media = Media.query.get(media_id)
+        assert_equals(1, media.jobs_pending)
+        assert_equals(0, media.jobs_failed)
+
+        # postprocessing queues the transcode job
+        assert_equals(2, self.worker.run_pending())
+        assert_equals(0, Media.query.get(media_id).jobs_pending)
+        job_types = [job.type for job in Job.query.filter(Job.media_id == media_id)]
+        assert_equals(set([u'postprocess', u'transcode']), set(job_types))
+
+
+import unittest
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(JobsTest))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
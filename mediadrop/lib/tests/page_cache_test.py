@@ -0,0 +1,104 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+import pylons
+
+from mediadrop.lib.decorators import page_cache
+from mediadrop.lib.cache_tags import invalidate_cache_tags
+from mediadrop.lib.page_cache import is_cacheable_request
+from mediadrop.lib.test.db_testcase import DBTestCase
+from mediadrop.lib.test.pythonic_testcase import *
+from mediadrop.lib.test.request_mixin import RequestMixin
+from mediadrop.model import DBSession, Media
+
+
+class FakeController(object):
+    _py_object = pylons
+
+    def __init__(self):
+        self.renderings = 0
+        self.hits = []
+
+    def _record_hit(self, slug, **kwargs):
+        self.hits.append(slug)
+
+    @page_cache(expire=60, on_hit=_record_hit)
+    def view(self, slug, **kwargs):
+        self.renderings += 1
+        return u'%s (%d)' % (slug, self.renderings)
+
+
+class PageCacheTest(DBTestCase, RequestMixin):
+    def setUp(self):
+        super(PageCacheTest, self).setUp()
+        self.pylons_config['page_cache.enabled'] = 'true'
+        self.controller = FakeController()
+
+    def test_caches_pages_for_anonymous_users(self):
+        self.init_fake_request()
+        assert_equals(u'foo (1)', self.controller.view(slug=u'foo'))
+        assert_equals(u'foo (1)', self.controller.view(slug=u'foo'))
+        assert_equals(u'bar (2)', self.controller.view(slug=u'bar'))
+        assert_equals(2, self.controller.renderings)
+        assert_equals([u'foo'], self.controller.hits)
+
+    def test_varies_on_query_string(self):
+        self.init_fake_request(request_uri='/?page=1')
+        assert_equals(u'foo (1)', self.controller.view(slug=u'foo'))
+        self.init_fake_request(request_uri='/?page=2')
+        assert_equals(u'foo (2)', self.controller.view(slug=u'foo'))
+
+    def test_varies_on_locale(self):
+        self.init_fake_request(language='en')
+        assert_equals(u'foo (1)', self.controller.view(slug=u'foo'))
+        self.init_fake_request(language='de')
+        assert_equals(u'foo (2)', self.controller.view(slug=u'foo'))
+
+    def test_bypasses_cache_if_session_or_auth_cookie_is_present(self):
+        request = self.init_fake_request()
+        assert_true(is_cacheable_request())
+
+        request.environ['HTTP_COOKIE'] = 'authtkt=abc'
+        assert_false(is_cacheable_request())
+        request.environ['HTTP_COOKIE'] = 'beaker.session.id=abc'
+        assert_false(is_cacheable_request())
+        self.controller.view(slug=u'foo')
+        self.controller.view(slug=u'foo')
+        assert_equals(2, self.controller.renderings)
+
+    def test_only_caches_get_requests(self):
+        self.init_fake_request(method='POST', post_vars={'foo': 'bar'})
+        assert_false(is_cacheable_request())
+
+    def test_cache_is_disabled_by_default(self):
+        del self.pylons_config['page_cache.enabled']
+        self.init_fake_request()
+        assert_false(is_cacheable_request())
+
+    def test_can_invalidate_cached_pages(self):
+        self.init_fake_request()
+        self.controller.view(slug=u'foo')
+        invalidate_cache_tags('podcasts')
+        assert_equals(u'foo (2)', self.controller.view(slug=u'foo'))
+        assert_equals(u'foo (2)', self.controller.view(slug=u'foo'))
+
+    def test_media_changes_invalidate_cached_pages(self):
+        self.init_fake_request()
+        self.controller.view(slug=u'foo')
+        Media.example()
+        DBSession.flush()
+        assert_equals(u'foo (2)', self.controller.view(slug=u'foo'))
+
+
+import unittest
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(PageCacheTest))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,85 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from datetime import datetime, timedelta
+
+from mediadrop.lib.popularity import recalculate_popularity
+from mediadrop.lib.test.db_testcase import DBTestCase
+from mediadrop.lib.test.pythonic_testcase import *
+from mediadrop.lib.util import calculate_popularity
+from mediadrop.model import DBSession, Media
+
+
+class RecalculatePopularityTest(DBTestCase):
+    def setUp(self):
+        super(RecalculatePopularityTest, self).setUp()
+        now = datetime.now()
+        self.published = [
+            self._create_media(now - timedelta(days=1), likes=3, dislikes=1),
+            self._create_media(now - timedelta(days=400), likes=0, dislikes=0),
+            self._create_media(now - timedelta(hours=5), likes=2, dislikes=7),
+            # math.log(1000, 10) is slightly less than 3
+            self._create_media(datetime(2014, 3, 5, 10, 11, 12), likes=1000, dislikes=0),
+            self._create_media(datetime(2001, 1, 1), likes=12, dislikes=0),
+        ]
+        self.unpublished = [
+            self._create_media(now + timedelta(days=1), likes=5, dislikes=0),
+            self._create_media(None, likes=5, dislikes=0),
+            self._create_media(now - timedelta(days=1), likes=5, dislikes=0,
+                reviewed=False),
+        ]
+        DBSession.commit()
+
+    def _create_media(self, publish_on, **kwargs):
+        values = dict(reviewed=True, encoded=True, publishable=True,
+            publish_on=publish_on, popularity_points=-1,
+            popularity_likes=-1, popularity_dislikes=-1)
+        values.update(kwargs)
+        return Media.example(**values)
+
+    def _points(self, media):
+        DBSession.expire(media)
+        return (media.popularity_points, media.popularity_likes,
+                media.popularity_dislikes)
+
+    def test_matches_calculate_popularity(self):
+        for exponent, lifetime in ((u'4', u'36'), (u'10', u'1'), (u'2', u'1000')):
+            settings = dict(popularity_decay_exponent=exponent,
+                popularity_decay_lifetime=lifetime)
+            recalculate_popularity(settings, chunk_size=3)
+            DBSession.commit()
+
+            for media in self.published:
+                expected = tuple([
+                    calculate_popularity(media.publish_on, score, settings=settings)
+                    for score in (media.likes - media.dislikes, media.likes, media.dislikes)
+                ])
+                assert_equals(expected, self._points(media))
+            for media in self.unpublished:
+                assert_equals((0, 0, 0), self._points(media))
+
+    def test_reports_progress(self):
+        settings = dict(popularity_decay_exponent=u'4',
+            popularity_decay_lifetime=u'36')
+        # includes the media from the default data
+        total = Media.query.count()
+        progress = []
+        count = recalculate_popularity(settings, chunk_size=3,
+            progress=lambda done, total: progress.append((done, total)))
+        assert_equals(total, count)
+        expected = [(min(done, total), total) for done in range(3, total + 3, 3)]
+        assert_equals(expected, progress)
+
+
+import unittest
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(RecalculatePopularityTest))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,93 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from mediadrop.lib.cache_tags import invalidate_cache_tags
+from mediadrop.lib.registry import registry, registry_version
+from mediadrop.lib.storage.api import enabled_engines, StorageEngine
+from mediadrop.lib.test.db_testcase import DBTestCase
+from mediadrop.lib.test.pythonic_testcase import *
+from mediadrop.lib.test.request_mixin import RequestMixin
+from mediadrop.model import DBSession, PlayerPrefs
+from mediadrop.model.players import cleanup_players_table, fetch_enabled_players
+
+
+class RegistryTest(DBTestCase, RequestMixin):
+    def setUp(self):
+        super(RegistryTest, self).setUp()
+        self.init_fake_request()
+        # the default players are not part of the default data
+        cleanup_players_table(enabled=True)
+        DBSession.commit()
+        self.loaded = 0
+
+    def _load(self):
+        self.loaded += 1
+        return [self.loaded]
+
+    def test_reloads_value_when_tags_were_invalidated(self):
+        assert_equals([1], registry('numbers', self._load, tags=['numbers']))
+        assert_equals([1], registry('numbers', self._load, tags=['numbers']))
+        assert_equals(1, registry_version('numbers'))
+
+        invalidate_cache_tags('media')
+        assert_equals([1], registry('numbers', self._load, tags=['numbers']))
+        invalidate_cache_tags('numbers')
+        assert_equals([2], registry('numbers', self._load, tags=['numbers']))
+        assert_equals(2, registry_version('numbers'))
+
+    def test_reloads_value_after_max_age(self):
+        assert_equals([1], registry('numbers', self._load, tags=['numbers'], max_age=0))
+        assert_equals([2], registry('numbers', self._load, tags=['numbers'], max_age=0))
+
+    def test_changed_players_are_reloaded(self):
+        player = PlayerPrefs.query.filter(PlayerPrefs.enabled == True).first()
+        player_classes = [cls for cls, data in fetch_enabled_players()]
+        assert_contains(player.player_cls, player_classes)
+
+        player.enabled = False
+        DBSession.flush()
+        player_classes = [cls for cls, data in fetch_enabled_players()]
+        assert_not_contains(player.player_cls, player_classes)
+
+    def test_returns_engines_attached_to_the_current_session(self):
+        engines = enabled_engines()
+        assert_not_equals(0, len(engines))
+        for engine in engines:
+            assert_true(engine in DBSession)
+
+        engine = DBSession.query(StorageEngine).get(engines[0].id)
+        engine.enabled = False
+        DBSession.commit()
+        assert_not_contains(engine.id, [e.id for e in enabled_engines()])
+
+    def test_does_not_keep_values_loaded_with_uncommitted_changes(self):
+        player = PlayerPrefs.query.filter(PlayerPrefs.enabled == True).first()
+        player.enabled = False
+        DBSession.flush()
+        player_classes = [cls for cls, data in fetch_enabled_players()]
+        assert_not_contains(player.player_cls, player_classes)
+
+        DBSession.rollback()
+        player_classes = [cls for cls, data in fetch_enabled_players()]
+        assert_contains(player.player_cls, player_classes)
+
+    def test_engine_copies_do_not_share_data(self):
+        engine = enabled_engines()[0]
+        engine._data['foo'] = u'bar'
+        DBSession.expunge(engine)
+        copies = dict((e.id, e) for e in enabled_engines())
+        assert_not_contains('foo', copies[engine.id]._data)
+
+
+import unittest
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(RegistryTest))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
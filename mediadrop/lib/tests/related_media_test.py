@@ -0,0 +1,139 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import sql
+
+from mediadrop.lib.jobs import JobWorker, use_background_jobs
+from mediadrop.lib.related_media import (_candidate_ids, rebuild_related_media,
+    SimilarityModel, use_precomputed_related_media)
+from mediadrop.lib.test.db_testcase import DBTestCase
+from mediadrop.lib.test.pythonic_testcase import *
+from mediadrop.model import DBSession, Media, Tag
+from mediadrop.model.media import related_media
+
+
+class SimilarityModelTest(PythonicTestCase):
+    def setUp(self):
+        super(SimilarityModelTest, self).setUp()
+        self.model = SimilarityModel({
+            1: {('tag', 1): 2.0, ('word', u'kitchen'): 1.5},
+            2: {('tag', 1): 2.0, ('word', u'code'): 1.5},
+            3: {('word', u'kitchen'): 1.5, ('word', u'code'): 1.5},
+            4: {('tag', 9): 2.0},
+        })
+
+    def test_ranks_by_similarity(self):
+        neighbours = self.model.neighbours([1, 3, 4], count=2)
+        assert_equals([2, 3], [media_id for media_id, score in neighbours[1]])
+        # equal scores are ordered by id
+        assert_equals([1, 2], [media_id for media_id, score in neighbours[3]])
+        assert_equals([], neighbours[4])
+
+    def test_similarity_is_symmetric(self):
+        assert_almost_equals(self.model.similarity(1, 2), self.model.similarity(2, 1))
+        assert_equals(0, self.model.similarity(1, 4))
+
+    def test_ignores_too_common_features(self):
+        documents = dict((media_id, {('tag', 1): 2.0}) for media_id in range(1, 6))
+        documents[1][('tag', 2)] = 2.0
+        documents[2][('tag', 2)] = 2.0
+        model = SimilarityModel(documents)
+        assert_equals({1: [(2, 1.0)]}, model.neighbours([1]))
+        assert_length(4, SimilarityModel(documents, max_df=1.0).neighbours([1])[1])
+
+
+class RelatedMediaTest(DBTestCase):
+    def setUp(self):
+        super(RelatedMediaTest, self).setUp()
+        self.cooking = Tag(u'cooking')
+        self.music = Tag(u'music')
+        DBSession.add_all([self.cooking, self.music])
+        self.pasta = self._create_media(u'Pasta Recipes', [self.cooking])
+        self.pizza = self._create_media(u'Pizza Recipes', [self.cooking])
+        self.guitar = self._create_media(u'Guitar Lessons', [self.music])
+        DBSession.commit()
+        use_precomputed_related_media()
+        rebuild_related_media()
+        DBSession.commit()
+
+    def tearDown(self):
+        use_precomputed_related_media(False)
+        super(RelatedMediaTest, self).tearDown()
+
+    def _create_media(self, title, tags):
+        media = Media.example(title=title, reviewed=True, encoded=True,
+            publishable=True, publish_on=datetime.now() - timedelta(days=1))
+        media.tags = tags
+        return media
+
+    def _related_ids(self, media_id):
+        select = sql.select([related_media.c.related_id],
+            related_media.c.media_id == media_id).order_by(related_media.c.position)
+        return [row[0] for row in DBSession.execute(select)]
+
+    def test_can_rebuild_related_media(self):
+        DBSession.execute(related_media.delete())
+        # the default data contains published media as well
+        assert_equals(Media.query.published().count(), rebuild_related_media())
+        assert_equals([self.pizza.id], self._related_ids(self.pasta.id))
+        assert_equals([], self._related_ids(self.guitar.id))
+        assert_equals([self.pizza], Media.query.related(self.pasta).all())
+
+    def test_updates_related_media_of_changed_media(self):
+        assert_equals([self.pizza.id], self._related_ids(self.pasta.id))
+
+        self.guitar.tags.append(self.cooking)
+        DBSession.commit()
+        assert_contains(self.guitar.id, self._related_ids(self.pasta.id))
+        assert_contains(self.pasta.id, self._related_ids(self.guitar.id))
+
+        self.pizza.publishable = False
+        DBSession.commit()
+        assert_not_contains(self.pizza.id, self._related_ids(self.pasta.id))
+        assert_equals([], self._related_ids(self.pizza.id))
+
+    def test_removes_deleted_media(self):
+        DBSession.delete(self.pizza)
+        DBSession.commit()
+        assert_equals([], self._related_ids(self.pasta.id))
+
+    def test_compares_only_media_sharing_most_tags(self):
+        self.pasta.tags.append(self.music)
+        self.guitar.tags.append(self.cooking)
+        DBSession.commit()
+        DBSession.execute(related_media.delete())
+
+        assert_equals(set([self.pasta.id, self.pizza.id]),
+            _candidate_ids(self.guitar.id))
+        assert_equals(set([self.pasta.id]), _candidate_ids(self.guitar.id, limit=1))
+
+    def test_can_queue_updates_as_background_jobs(self):
+        use_background_jobs(True)
+        try:
+            self.guitar.tags.append(self.cooking)
+            DBSession.commit()
+            # the worker detaches all instances after each job
+            guitar_id, pasta_id = self.guitar.id, self.pasta.id
+            assert_not_contains(guitar_id, self._related_ids(pasta_id))
+
+            assert_equals(1, JobWorker().run_pending())
+            assert_contains(guitar_id, self._related_ids(pasta_id))
+        finally:
+            use_background_jobs(False)
+
+
+import unittest
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(SimilarityModelTest))
+    suite.addTest(unittest.makeSuite(RelatedMediaTest))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,94 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+import os
+import shutil
+import tempfile
+
+from pylons import app_globals
+
+from mediadrop.lib.settings_store import Settings, SettingsStore
+from mediadrop.lib.test.db_testcase import DBTestCase
+from mediadrop.lib.test.pythonic_testcase import *
+from mediadrop.model import DBSession, Setting
+from mediadrop.model.settings import settings as settings_table
+
+
+class SettingsTest(PythonicTestCase):
+    def test_parses_values(self):
+        settings = Settings({u'rss_display': u'True', u'show_like': u'',
+            u'required': u'false', u'max_results': u'50', u'name': u'Foo'})
+        assert_true(settings.as_bool(u'rss_display'))
+        assert_false(settings.as_bool(u'show_like'))
+        assert_false(settings.as_bool(u'required'))
+        assert_false(settings.as_bool(u'unknown'))
+        assert_equals(50, settings.as_int(u'max_results'))
+        assert_equals(10, settings.as_int(u'name', default=10))
+        assert_raises(ValueError, lambda: settings.as_int(u'name'))
+        assert_equals(u'Foo', settings[u'name'])
+
+    def test_updates_parsed_values(self):
+        settings = Settings({u'max_results': u'50'})
+        settings[u'max_results'] = u'20'
+        assert_equals(20, settings.as_int(u'max_results'))
+
+
+class SettingsStoreTest(DBTestCase):
+    def setUp(self):
+        super(SettingsStoreTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.stamp_file = os.path.join(self.directory, 'settings.stamp')
+        self.store = SettingsStore(stamp_file=self.stamp_file)
+        self.setting = Setting(key=u'foo', value=u'1')
+        DBSession.add(self.setting)
+        DBSession.commit()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(SettingsStoreTest, self).tearDown()
+
+    def _change_setting(self, value):
+        DBSession.execute(settings_table.update()
+            .where(settings_table.c.key == u'foo').values(value=value))
+        DBSession.commit()
+
+    def test_keeps_settings_until_stamp_changes(self):
+        settings = self.store.settings()
+        assert_equals(1, settings.as_int(u'foo'))
+        self._change_setting(u'2')
+        assert_true(self.store.settings() is settings)
+
+        # e.g. another process saved the settings
+        SettingsStore(stamp_file=self.stamp_file).invalidate()
+        assert_equals(2, self.store.settings().as_int(u'foo'))
+        # the file is replaced on every change
+        SettingsStore(stamp_file=self.stamp_file).invalidate()
+        self._change_setting(u'3')
+        SettingsStore(stamp_file=self.stamp_file).invalidate()
+        assert_equals(3, self.store.settings().as_int(u'foo'))
+
+    def test_reloads_settings_after_max_age(self):
+        store = SettingsStore(max_age=0)
+        settings = store.settings()
+        assert_false(store.settings() is settings)
+
+    def test_invalidates_settings_when_saved(self):
+        assert_equals(u'1', app_globals.settings[u'foo'])
+        self.setting.value = u'5'
+        DBSession.commit()
+        assert_equals(u'5', app_globals.settings[u'foo'])
+
+
+import unittest
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(SettingsTest))
+    suite.addTest(unittest.makeSuite(SettingsStoreTest))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,80 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from datetime import datetime, timedelta
+import os
+import shutil
+import tempfile
+
+from mediadrop.lib.sitemaps import (google_sitemap_vars,
+    static_sitemap_file, write_static_sitemaps)
+from mediadrop.lib.test.db_testcase import DBTestCase
+from mediadrop.lib.test.pythonic_testcase import *
+from mediadrop.lib.test.request_mixin import RequestMixin
+from mediadrop.model import DBSession, Media
+
+
+class SitemapsTest(DBTestCase, RequestMixin):
+    def setUp(self):
+        super(SitemapsTest, self).setUp()
+        self.init_fake_request()
+        self.set_authenticated_user(None)
+        self.sitemap_dir = tempfile.mkdtemp()
+        # get rid of default media (sqlite does not cascade the deletion so
+        # the categories must be removed explicitly)
+        for media in Media.query:
+            media.categories = []
+            DBSession.delete(media)
+        yesterday = datetime.now() - timedelta(days=1)
+        for title in (u'First', u'Second', u'Third'):
+            Media.example(title=title, reviewed=True, encoded=True,
+                publishable=True, publish_on=yesterday)
+        Media.example(title=u'Draft')
+        DBSession.commit()
+
+    def tearDown(self):
+        shutil.rmtree(self.sitemap_dir)
+        super(SitemapsTest, self).tearDown()
+
+    def test_returns_sitemap_index_if_there_are_too_many_media(self):
+        assert_equals(dict(pages=2), google_sitemap_vars(limit=2))
+
+    def test_iterates_over_published_media(self):
+        tmpl_vars = google_sitemap_vars(page=0, limit=10)
+        titles = [media.title for media in tmpl_vars['media']]
+        assert_equals([u'First', u'Second', u'Third'], titles)
+        assert_length(4, tmpl_vars['links'])
+
+    def test_can_write_static_sitemaps(self):
+        stale_page = os.path.join(self.sitemap_dir, 'google-5.xml')
+        file(stale_page, 'wb').write('<urlset />')
+
+        filenames = write_static_sitemaps(self.sitemap_dir, limit=2)
+        assert_equals(['google.xml', 'google-0.xml', 'google-1.xml', 'mrss.xml'],
+            filenames)
+        assert_equals(sorted(filenames), sorted(os.listdir(self.sitemap_dir)))
+        index = file(os.path.join(self.sitemap_dir, 'google.xml'), 'rb').read()
+        assert_contains('<sitemapindex', index)
+
+    def test_serves_static_sitemaps_only_if_configured_and_present(self):
+        assert_none(static_sitemap_file('mrss.xml'))
+        self.pylons_config['sitemaps.static_dir'] = self.sitemap_dir
+        assert_none(static_sitemap_file('mrss.xml'))
+
+        write_static_sitemaps(self.sitemap_dir)
+        assert_equals(os.path.join(self.sitemap_dir, 'mrss.xml'),
+            static_sitemap_file('mrss.xml'))
+
+
+import unittest
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(SitemapsTest))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,86 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+import os
+import shutil
+import tempfile
+
+from genshi.template.loader import prefixed
+
+from mediadrop.lib.templating import TemplateLoader
+from mediadrop.lib.test.pythonic_testcase import *
+
+
+class TemplateLoaderTest(PythonicTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.plugin_directory = tempfile.mkdtemp()
+        self._write(self.directory, 'index.html', u'<p>index</p>')
+        self._write(self.directory, 'media/view.html', u'<p>view</p>')
+        self._write(self.directory, 'media/view.py', u'# not a template')
+        self._write(self.plugin_directory, 'widget.html', u'<p>widget</p>')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        shutil.rmtree(self.plugin_directory)
+
+    def _write(self, directory, name, content):
+        path = os.path.join(directory, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        template_file = open(path, 'wb')
+        template_file.write(content.encode('utf-8'))
+        template_file.close()
+        return path
+
+    def _render(self, loader, name):
+        return loader.load(name).generate().render(encoding=None)
+
+    def test_production_mode_does_not_check_for_changes(self):
+        loader = TemplateLoader(search_path=[self.directory],
+            auto_reload=False, max_cache_size=0)
+        assert_equals(u'<p>index</p>', self._render(loader, 'index.html'))
+        self._write(self.directory, 'index.html', u'<p>changed</p>')
+        assert_equals(u'<p>index</p>', self._render(loader, 'index.html'))
+
+    def test_reloads_changed_templates_with_auto_reload(self):
+        path = self._write(self.directory, 'index.html', u'<p>old</p>')
+        # make sure the modification time changes
+        os.utime(path, (1000, 1000))
+        loader = TemplateLoader(search_path=[self.directory],
+            auto_reload=True, max_cache_size=0)
+        assert_equals(u'<p>old</p>', self._render(loader, 'index.html'))
+        self._write(self.directory, 'index.html', u'<p>new</p>')
+        assert_equals(u'<p>new</p>', self._render(loader, 'index.html'))
+
+    def test_can_limit_cache_size(self):
+        loader = TemplateLoader(search_path=[self.directory],
+            auto_reload=False, max_cache_size=1)
+        first = loader.load('index.html')
+        loader.load('media/view.html')
+        assert_false(loader.load('index.html') is first)
+
+    def test_can_precompile_all_templates(self):
+        # same as PluginManager.template_loaders()
+        plugin_loader = prefixed(**{'myplugin/': self.plugin_directory})
+        loader = TemplateLoader(search_path=[self.directory, plugin_loader],
+            auto_reload=False, max_cache_size=0)
+        count = loader.precompile([('', self.directory),
+            ('myplugin/', self.plugin_directory)])
+        assert_equals(3, count)
+        assert_equals(set(['index.html', 'media/view.html', 'myplugin/widget.html']),
+            set(loader._cache))
+
+
+import unittest
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TemplateLoaderTest))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,119 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from cStringIO import StringIO
+import os
+import shutil
+import tempfile
+
+from PIL import Image
+
+from mediadrop.lib.test.db_testcase import DBTestCase
+from mediadrop.lib.test.pythonic_testcase import *
+from mediadrop.lib.thumb_manifest import DirectoryManifest, thumb_manifest
+from mediadrop.lib.thumbnails import (create_thumbs_for, delete_thumbs,
+    has_thumbs, thumb_path)
+from mediadrop.model import DBSession, Media
+
+
+class DirectoryManifestTest(PythonicTestCase):
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.path = os.path.join(self.dirname, '1s.jpg')
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def _write(self, path, content):
+        open(path, 'wb').write(content)
+
+    def test_answers_from_directory_listing(self):
+        self._write(self.path, 'abc')
+        manifest = DirectoryManifest(check_interval=60)
+        manifest.preload(self.dirname)
+        assert_true(manifest.exists(self.path))
+        assert_false(manifest.exists(os.path.join(self.dirname, '2s.jpg')))
+        assert_equals(3, manifest.stat(self.path)[0])
+
+        # the listing is not read again within the check interval
+        os.remove(self.path)
+        assert_true(manifest.exists(self.path))
+        manifest.refresh(self.path)
+        assert_false(manifest.exists(self.path))
+        assert_none(manifest.stat(self.path))
+
+    def test_refresh_updates_replaced_files(self):
+        self._write(self.path, 'abc')
+        manifest = DirectoryManifest(check_interval=60)
+        assert_equals(3, manifest.stat(self.path)[0])
+        self._write(self.path, 'abcdef')
+        assert_equals(3, manifest.stat(self.path)[0])
+        manifest.refresh(self.path)
+        assert_equals(6, manifest.stat(self.path)[0])
+
+    def test_notices_changes_of_other_processes(self):
+        manifest = DirectoryManifest(check_interval=0, reconcile_interval=0)
+        assert_false(manifest.exists(self.path))
+        self._write(self.path, 'abc')
+        assert_true(manifest.exists(self.path))
+        self._write(self.path, 'abcdef')
+        assert_equals(6, manifest.stat(self.path)[0])
+        os.remove(self.path)
+        assert_false(manifest.exists(self.path))
+
+    def test_notices_stamp_file_replaced_by_other_processes(self):
+        stamp_dir = tempfile.mkdtemp()
+        try:
+            stamp_file = os.path.join(stamp_dir, 'manifest.stamp')
+            self._write(self.path, 'abc')
+            manifest = DirectoryManifest(check_interval=0, stamp_file=stamp_file)
+            assert_equals(3, manifest.stat(self.path)[0])
+
+            # replacing a file does not change the directory
+            self._write(self.path, 'abcdef')
+            assert_equals(3, manifest.stat(self.path)[0])
+            DirectoryManifest(stamp_file=stamp_file).touch_stamp()
+            assert_equals(6, manifest.stat(self.path)[0])
+        finally:
+            shutil.rmtree(stamp_dir)
+
+
+class ThumbManifestTest(DBTestCase):
+    def setUp(self):
+        super(ThumbManifestTest, self).setUp()
+        self.media = Media.example()
+        DBSession.flush()
+
+    def _upload_image(self):
+        image_file = StringIO()
+        Image.new('RGB', (1280, 720), 'red').save(image_file, 'JPEG')
+        image_file.seek(0)
+        create_thumbs_for(self.media, image_file, u'image.jpg')
+
+    def test_tracks_created_and_deleted_thumbs(self):
+        manifest = thumb_manifest()
+        assert_not_none(manifest)
+        assert_false(has_thumbs(self.media))
+
+        self._upload_image()
+        assert_true(has_thumbs(self.media))
+        assert_true(manifest.exists(thumb_path(self.media, 'orig')))
+
+        delete_thumbs(self.media)
+        assert_false(has_thumbs(self.media))
+        assert_false(manifest.exists(thumb_path(self.media, 'orig')))
+
+
+import unittest
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(DirectoryManifestTest))
+    suite.addTest(unittest.makeSuite(ThumbManifestTest))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,73 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+import os
+
+from PIL import Image
+from pylons import config
+
+from mediadrop.lib.test.db_testcase import DBTestCase
+from mediadrop.lib.test.pythonic_testcase import *
+from mediadrop.lib.thumbnails import (regenerate_thumbs, resize_thumbs,
+    thumb_path)
+from mediadrop.model import DBSession, Media
+
+
+class ThumbnailsTest(DBTestCase):
+    def setUp(self):
+        super(ThumbnailsTest, self).setUp()
+        self.media = Media.example()
+        DBSession.flush()
+        self.orig_path = thumb_path(self.media, 'orig')
+        Image.new('RGB', (1280, 720), 'red').save(self.orig_path, quality=90)
+        self.sizes = config['thumb_sizes'][Media._thumb_dir]
+
+    def _regenerate(self):
+        return regenerate_thumbs(Media._thumb_dir, [self.media.id], processes=1)
+
+    def _thumb_size(self, key):
+        return Image.open(thumb_path(self.media, key)).size
+
+    def test_can_resize_to_several_sizes(self):
+        thumbs = resize_thumbs(Image.open(self.orig_path),
+            {'s': (128, 72), 'l': (560, 315), 'square': (100, 100)})
+        assert_equals((128, 72), thumbs['s'].size)
+        assert_equals((560, 315), thumbs['l'].size)
+        assert_equals((100, 100), thumbs['square'].size)
+        assert_equals('RGB', thumbs['s'].mode)
+
+    def test_regenerates_missing_and_outdated_thumbs(self):
+        stats = self._regenerate()
+        assert_equals(1, stats['regenerated'])
+        assert_equals(len(self.sizes), stats['thumbs'])
+        for key, xy in self.sizes.items():
+            assert_equals(tuple(xy), self._thumb_size(key))
+
+        stats = self._regenerate()
+        assert_equals(1, stats['skipped'])
+        assert_equals(0, stats['thumbs'])
+
+        self.sizes['l'] = (640, 360)
+        stats = self._regenerate()
+        assert_equals(1, stats['thumbs'])
+        assert_equals((640, 360), self._thumb_size('l'))
+
+    def test_skips_items_without_original_image(self):
+        os.remove(self.orig_path)
+        stats = self._regenerate()
+        assert_equals(1, stats['missing'])
+        assert_equals(0, stats['regenerated'])
+
+
+import unittest
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ThumbnailsTest))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
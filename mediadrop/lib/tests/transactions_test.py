@@ -0,0 +1,69 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from mediadrop.lib.test.db_testcase import DBTestCase
+from mediadrop.lib.test.pythonic_testcase import *
+from mediadrop.lib.test.request_mixin import RequestMixin
+from mediadrop.lib.transactions import call_after_commit, has_uncommitted_changes
+from mediadrop.model import DBSession, Media
+
+
+class Counter(object):
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+
+    def increment(self):
+        self.calls += 1
+
+
+class CallAfterCommitTest(DBTestCase, RequestMixin):
+    def test_calls_callback_immediately_outside_of_transactions(self):
+        counter = Counter()
+        assert_false(call_after_commit(counter))
+        assert_equals(1, counter.calls)
+
+    def test_registers_callbacks_once(self):
+        request = self.init_fake_request()
+        request.commit_callbacks = []
+        request.rollback_callbacks = []
+        counter = Counter()
+
+        assert_true(call_after_commit(counter.increment))
+        assert_true(call_after_commit(counter.increment, rollback=True))
+        assert_equals(0, counter.calls)
+        assert_equals([counter.increment], request.commit_callbacks)
+        assert_equals([counter.increment], request.rollback_callbacks)
+
+
+class HasUncommittedChangesTest(DBTestCase):
+    def test_tracks_changes_until_transaction_ends(self):
+        assert_false(has_uncommitted_changes())
+        media = Media.example()
+        DBSession.flush()
+        assert_true(has_uncommitted_changes())
+        DBSession.commit()
+        assert_false(has_uncommitted_changes())
+
+        media.title = u'New Title'
+        assert_true(has_uncommitted_changes())
+        DBSession.flush()
+        DBSession.rollback()
+        assert_false(has_uncommitted_changes())
+
+
+import unittest
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(CallAfterCommitTest))
+    suite.addTest(unittest.makeSuite(HasUncommittedChangesTest))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,70 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from mediadrop.lib.i18n import setup_global_translator
+from mediadrop.lib.storage.api import add_new_media_file
+from mediadrop.lib.test.db_testcase import DBTestCase
+from mediadrop.lib.test.pythonic_testcase import *
+from mediadrop.lib.test.request_mixin import RequestMixin
+from mediadrop.lib.uri import StorageURI
+from mediadrop.lib.uri_cache import cached_storage_uris, use_shared_uri_cache
+from mediadrop.model import DBSession, Media
+
+
+class URICacheTest(DBTestCase, RequestMixin):
+    def setUp(self):
+        super(URICacheTest, self).setUp()
+        self.init_fake_request()
+        setup_global_translator(registry=self.paste_registry)
+        media = Media.example()
+        self.media_file = add_new_media_file(media,
+            url=u'http://site.example/videos.mp4')
+        DBSession.flush()
+        self.generated = 0
+
+    def tearDown(self):
+        use_shared_uri_cache(False)
+        super(URICacheTest, self).tearDown()
+
+    def _uris(self):
+        def create():
+            self.generated += 1
+            return [StorageURI(self.media_file, 'http', u'http://site.example/%d' % self.generated)]
+        return [uri.file_uri for uri in cached_storage_uris(self.media_file, create)]
+
+    def test_generates_uris_once_per_request(self):
+        assert_equals([u'http://site.example/1'], self._uris())
+        assert_equals([u'http://site.example/1'], self._uris())
+        uris = self.media_file.get_uris()
+        assert_true(all(uri.file is self.media_file for uri in uris))
+
+        self.init_fake_request()
+        assert_equals([u'http://site.example/2'], self._uris())
+
+    def test_does_not_cache_unsaved_files(self):
+        assert_equals([u'http://site.example/1'], self._uris())
+        self.media_file.unique_id = u'http://site.example/other.mp4'
+        assert_equals([u'http://site.example/2'], self._uris())
+        assert_equals([u'http://site.example/3'], self._uris())
+
+    def test_can_share_uris_between_requests(self):
+        use_shared_uri_cache(True)
+        assert_equals([u'http://site.example/1'], self._uris())
+        self.init_fake_request()
+        assert_equals([u'http://site.example/1'], self._uris())
+        self.init_fake_request(server_name='other.example')
+        assert_equals([u'http://site.example/2'], self._uris())
+
+
+import unittest
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(URICacheTest))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
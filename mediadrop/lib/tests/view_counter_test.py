@@ -0,0 +1,109 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+import os
+import tempfile
+
+from mediadrop.lib.test.db_testcase import DBTestCase
+from mediadrop.lib.test.pythonic_testcase import *
+from mediadrop.lib.view_counter import (MemoryViewCountSpool,
+    SQLiteViewCountSpool, ViewCounter)
+from mediadrop.model import DBSession, Media
+
+
+class ViewCounterTest(DBTestCase):
+    def setUp(self):
+        super(ViewCounterTest, self).setUp()
+        self.media = Media.example()
+        DBSession.commit()
+        self.now = 0
+        self.counter = ViewCounter(MemoryViewCountSpool(),
+            flush_interval=60, flush_threshold=3, clock=lambda: self.now)
+
+    def stored_views(self, media):
+        DBSession.expire(media)
+        return media.views
+
+    def test_buffers_views_until_threshold_is_reached(self):
+        self.counter.increment(self.media.id)
+        self.counter.increment(self.media.id)
+        assert_equals(0, self.stored_views(self.media))
+
+        self.counter.increment(self.media.id)
+        assert_equals(3, self.stored_views(self.media))
+        assert_equals(0, self.counter.spool.pending())
+
+    def test_flushes_after_interval(self):
+        self.counter.increment(self.media.id)
+        assert_equals(0, self.stored_views(self.media))
+
+        self.now += 60
+        self.counter.increment(self.media.id)
+        assert_equals(2, self.stored_views(self.media))
+
+    def test_flushes_multiple_media_in_one_batch(self):
+        other = Media.example(title=u'Bar Media')
+        DBSession.commit()
+        self.counter.increment(self.media.id, 2)
+        assert_equals(0, self.stored_views(self.media))
+
+        # the third view reaches the threshold
+        self.counter.increment(other.id)
+        assert_equals(0, self.counter.spool.pending())
+        assert_equals(2, self.stored_views(self.media))
+        assert_equals(1, self.stored_views(other))
+
+    def test_media_shows_buffered_view_for_current_request(self):
+        self.media.increment_views(self.counter)
+        assert_equals(1, self.media.views)
+        assert_equals(1, self.counter.spool.pending())
+
+    def test_keeps_pending_views_if_database_update_fails(self):
+        def broken_write(counts):
+            raise ValueError('database is gone')
+        self.counter._write = broken_write
+        self.counter.increment(self.media.id, 5)
+
+        assert_equals(0, self.counter.flush())
+        assert_equals(5, self.counter.spool.pending())
+
+
+class SQLiteViewCountSpoolTest(PythonicTestCase):
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        self.spool = SQLiteViewCountSpool(self.filename)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_can_share_increments_between_spool_instances(self):
+        self.spool.add(1)
+        SQLiteViewCountSpool(self.filename).add(1, 2)
+        self.spool.add(4)
+
+        assert_equals(4, self.spool.pending())
+        assert_equals({1: 3, 4: 1}, self.spool.drain())
+        assert_equals(0, self.spool.pending())
+
+    def test_can_restore_drained_increments(self):
+        self.spool.add(1, 3)
+        counts = self.spool.drain()
+        self.spool.add(1)
+        self.spool.restore(counts)
+        assert_equals({1: 4}, self.spool.drain())
+
+
+import unittest
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ViewCounterTest))
+    suite.addTest(unittest.makeSuite(SQLiteViewCountSpoolTest))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,210 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Thumbnail Manifest
+
+Listings show thumbnails for many items and :func:`~mediadrop.lib.thumbnails.thumb_url`,
+:func:`~mediadrop.lib.thumbnails.has_thumbs` etc. check if the files exist.
+On network file systems one ``stat()`` per item and size dominates the
+response time.
+
+The :class:`DirectoryManifest` keeps the names of the files in the image
+directories (read with one ``listdir()``) and the size and modification
+time of the files which were needed. :mod:`mediadrop.lib.thumbnails`
+calls :func:`thumbs_changed` when thumbnails are created, replaced or
+deleted which updates the manifest and replaces a stamp file (default:
+``<image_dir>/.manifest.stamp``). Every process checks the stamp file and
+the modification time of the directories at most every ``check_interval``
+seconds and reads the listings again if one of them changed. Changes which
+do not replace the stamp file (e.g. files replaced manually) are noticed
+after ``reconcile_interval`` seconds when all cached details are dropped::
+
+    thumbnails.manifest = true
+    thumbnails.manifest_check_interval = 5
+    thumbnails.manifest_reconcile_interval = 600
+    thumbnails.manifest_stamp_file = %(here)s/data/images/.manifest.stamp
+"""
+
+import os
+import threading
+import time
+
+from paste.deploy.converters import asbool, asint
+from pylons import app_globals, config
+
+from mediadrop.lib.app_globals import is_object_registered
+from mediadrop.lib.stamp_files import StampFile
+
+__all__ = [
+    'DirectoryManifest',
+    'thumb_manifest',
+    'thumbs_changed',
+]
+
+
+class _Listing(object):
+    __slots__ = ('names', 'stats', 'dir_mtime', 'stamp', 'loaded_at',
+                 'checked_at')
+
+    def __init__(self, names, dir_mtime, stamp, now):
+        self.names = names
+        self.stats = {}
+        self.dir_mtime = dir_mtime
+        self.stamp = stamp
+        self.loaded_at = now
+        self.checked_at = now
+
+
+class DirectoryManifest(object):
+    """Answer "does this file exist" and "when was it modified" for files
+    in a few (large) directories without a ``stat()`` per file.
+
+    :param stamp_file: The path of a file which is replaced whenever files
+        were created, replaced or deleted (optional, see
+        :meth:`touch_stamp`).
+    """
+
+    def __init__(self, check_interval=5, reconcile_interval=600,
+                 stamp_file=None):
+        self.check_interval = check_interval
+        self.reconcile_interval = reconcile_interval
+        self.stamp_file = stamp_file
+        self._listings = {}
+        self._lock = threading.Lock()
+
+    def _read_stamp(self):
+        if not self.stamp_file:
+            return None
+        return StampFile(self.stamp_file).read()
+
+    def touch_stamp(self):
+        """Tell all processes which use the same stamp file that files were
+        created, replaced or deleted."""
+        if self.stamp_file:
+            StampFile(self.stamp_file).touch()
+
+    def _load(self, dirname, now, stamp, previous=None):
+        try:
+            dir_mtime = os.stat(dirname).st_mtime
+            names = set(os.listdir(dirname))
+        except OSError:
+            return _Listing(set(), None, stamp, now)
+        listing = _Listing(names, dir_mtime, stamp, now)
+        if previous is not None:
+            # keep the details of the files which were not deleted
+            listing.stats = dict((name, st) for name, st
+                                 in previous.stats.iteritems() if name in names)
+            listing.loaded_at = previous.loaded_at
+        return listing
+
+    def _listing(self, dirname):
+        now = time.time()
+        listing = self._listings.get(dirname)
+        if listing is not None and now - listing.checked_at < self.check_interval:
+            return listing
+        with self._lock:
+            listing = self._listings.get(dirname)
+            # read before the listing so no change is missed
+            stamp = self._read_stamp()
+            if listing is None or stamp != listing.stamp or \
+                    now - listing.loaded_at >= self.reconcile_interval:
+                listing = self._load(dirname, now, stamp)
+            elif now - listing.checked_at >= self.check_interval:
+                try:
+                    dir_mtime = os.stat(dirname).st_mtime
+                except OSError:
+                    dir_mtime = None
+                if dir_mtime != listing.dir_mtime:
+                    listing = self._load(dirname, now, stamp, previous=listing)
+                else:
+                    listing.checked_at = now
+            self._listings[dirname] = listing
+        return listing
+
+    def preload(self, dirname):
+        """Read the listing of the given directory now."""
+        self._listing(dirname)
+
+    def exists(self, path):
+        """Return True if the given file exists."""
+        dirname, name = os.path.split(path)
+        return name in self._listing(dirname).names
+
+    def stat(self, path):
+        """Return the ``(size, mtime)`` of the given file or None if it does
+        not exist."""
+        dirname, name = os.path.split(path)
+        listing = self._listing(dirname)
+        if name not in listing.names:
+            return None
+        st = listing.stats.get(name)
+        if st is None:
+            try:
+                os_stat = os.stat(path)
+            except OSError:
+                listing.names.discard(name)
+                return None
+            st = listing.stats[name] = (os_stat.st_size, os_stat.st_mtime)
+        return st
+
+    def refresh(self, path):
+        """Update the entry of a file after it was created, replaced or
+        deleted."""
+        dirname, name = os.path.split(path)
+        listing = self._listings.get(dirname)
+        if listing is None:
+            return
+        listing.stats.pop(name, None)
+        if os.path.isfile(path):
+            listing.names.add(name)
+        else:
+            listing.names.discard(name)
+
+    def clear(self):
+        self._listings.clear()
+
+
+def thumb_manifest():
+    """Return the :class:`DirectoryManifest` of the current application or
+    None if the manifest is disabled (or no application is loaded)."""
+    if not is_object_registered(app_globals):
+        return None
+    globals_ = app_globals._current_obj()
+    if globals_.thumb_manifest is None:
+        if not asbool(config.get('thumbnails.manifest', True)):
+            return None
+        manifest = DirectoryManifest(
+            check_interval=asint(config.get('thumbnails.manifest_check_interval', 5)),
+            reconcile_interval=asint(config.get('thumbnails.manifest_reconcile_interval', 600)),
+            stamp_file=manifest_stamp_file(),
+        )
+        for image_dir in config['thumb_sizes']:
+            manifest.preload(os.path.join(config['image_dir'], image_dir))
+        globals_.thumb_manifest = manifest
+    return globals_.thumb_manifest
+
+def manifest_stamp_file():
+    """Return the path of the stamp file which is shared by the manifests of
+    all processes."""
+    return config.get('thumbnails.manifest_stamp_file') or \
+        os.path.join(config['image_dir'], '.manifest.stamp')
+
+def thumbs_changed(paths=None):
+    """Update the manifests (of all processes) after the given thumbnail
+    files were created, replaced or deleted. Without ``paths`` all cached
+    details of this process are dropped (e.g. after a batch run).
+
+    The stamp file is replaced even if this process does not use a manifest
+    (e.g. in a batch script) so the web processes notice the change."""
+    manifest = thumb_manifest()
+    if manifest is None:
+        manifest = DirectoryManifest(stamp_file=manifest_stamp_file())
+    elif paths is None:
+        manifest.clear()
+    for path in paths or ():
+        manifest.refresh(path)
+    manifest.touch_stamp()
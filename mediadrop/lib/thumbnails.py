@@ -6,6 +6,8 @@
 # See LICENSE.txt in the main project directory, for more information.
 
 import filecmp
+from itertools import imap
+import multiprocessing
 import os
 import re
 import shutil
@@ -17,12 +19,14 @@ from PIL import Image
 from pylons import config, url as url_for
 
 import mediadrop
+from mediadrop.lib.thumb_manifest import thumb_manifest, thumbs_changed
 from mediadrop.lib.util import delete_files
 
 __all__ = [
     'create_default_thumbs_for', 'create_thumbs_for', 'delete_thumbs',
-    'has_thumbs', 'has_default_thumbs',
-    'ThumbDict', 'thumb', 'thumb_path', 'thumb_paths', 'thumb_url',
+    'has_thumbs', 'has_default_thumbs', 'regenerate_thumbs', 'resize_thumbs',
+    'ThumbDict', 'ThumbTemplates', 'thumb', 'thumb_path', 'thumb_paths',
+    'thumb_url',
 ]
 
 def _normalize_thumb_item(item):
@@ -32,6 +36,12 @@ def _normalize_thumb_item(item):
     except AttributeError:
         return item
 
+def _file_exists(path):
+    manifest = thumb_manifest()
+    if manifest is None:
+        return os.path.isfile(path)
+    return manifest.exists(path)
+
 def thumb_path(item, size, exists=False, ext='jpg'):
     """Get the thumbnail path for the given item and size.
 
@@ -58,7 +68,7 @@ def thumb_path(item, size, exists=False, ext='jpg'):
     image = '%s/%s%s.%s' % (image_dir, item_id, size, ext)
     image_path = os.path.join(config['image_dir'], image)
 
-    if exists and not os.path.isfile(image_path):
+    if exists and not _file_exists(image_path):
         return None
     return image_path
 
@@ -112,7 +122,7 @@ def thumb_url(item, size, qualified=False, exists=False):
     image = '%s/%s%s.jpg' % (image_dir, item_id, size)
     image_path = os.path.join(config['image_dir'], image)
 
-    if exists and not os.path.isfile(image_path):
+    if exists and not _file_exists(image_path):
         return None
     return url_for('/images/%s' % image, qualified=qualified)
 
@@ -156,6 +166,32 @@ def thumb(item, size, qualified=False, exists=False):
         return None
     return ThumbDict(url, config['thumb_sizes'][image_dir][size])
 
+class ThumbTemplates(object):
+    """Build the thumbnail dicts for many items of the same kind.
+
+    Generating URLs with routes is relatively expensive so the URL prefix
+    for the image directory is generated only once. The result for each
+    item is the same as calling :func:`thumb` for every configured size.
+
+    :param image_dir: The subdir name, e.g. ``Media._thumb_dir``.
+    :param qualified: If ``True`` return the full URL including the domain.
+
+    """
+    def __init__(self, image_dir, qualified=False):
+        self.image_dir = image_dir
+        self.sizes = config['thumb_sizes'][image_dir]
+        self.url_prefix = url_for('/images/%s/' % image_dir, qualified=qualified)
+
+    def thumbs(self, item):
+        """Return a dict of :class:`ThumbDict` instances keyed by size."""
+        image_dir, item_id = _normalize_thumb_item(item)
+        assert image_dir == self.image_dir
+        thumbs = {}
+        for size, dimensions in self.sizes.iteritems():
+            url = '%s%s%s.jpg' % (self.url_prefix, item_id, size)
+            thumbs[size] = ThumbDict(url, dimensions)
+        return thumbs
+
 def resize_thumb(img, size, filter=Image.ANTIALIAS):
     """Resize an image without any stretching by cropping when necessary.
 
@@ -198,6 +234,45 @@ def resize_thumb(img, size, filter=Image.ANTIALIAS):
 
     return img.resize(size, filter)
 
+def _same_ratio(size, other_size):
+    return abs(size[0] * other_size[1] - size[1] * other_size[0]) \
+        <= 0.01 * size[0] * other_size[1]
+
+def resize_thumbs(img, sizes):
+    """Resize an image to several thumbnail sizes.
+
+    Instead of resizing the full original image for every size, JPEGs are
+    decoded at the smallest scale which still covers all sizes (draft mode)
+    and each thumbnail is scaled down from the next larger one if they have
+    the same aspect ratio.
+
+    :param img: An open (not yet loaded) image
+    :type img: :class:`PIL.Image`
+    :param sizes: Width and height tuples keyed by size key.
+    :type sizes: dict
+    :returns: RGB images keyed by size key.
+    :rtype: dict
+
+    """
+    if not sizes:
+        return {}
+    max_x = max(xy[0] for xy in sizes.itervalues())
+    max_y = max(xy[1] for xy in sizes.itervalues())
+    img.draft(img.mode, (max_x, max_y))
+
+    thumbs = {}
+    source = img
+    largest_first = sorted(sizes.iteritems(),
+        key=lambda (key, xy): xy[0] * xy[1], reverse=True)
+    for key, xy in largest_first:
+        if source is not img and not _same_ratio(source.size, xy):
+            source = img
+        thumb_img = resize_thumb(source, xy)
+        if thumb_img.mode != "RGB":
+            thumb_img = thumb_img.convert("RGB")
+        thumbs[key] = source = thumb_img
+    return thumbs
+
 _ext_filter = re.compile(r'^\.([a-z0-9]*)')
 
 def create_thumbs_for(item, image_file, image_filename):
@@ -218,12 +293,12 @@ def create_thumbs_for(item, image_file, image_filename):
     img = Image.open(image_file)
 
     # TODO: Allow other formats?
-    for key, xy in config['thumb_sizes'][item._thumb_dir].iteritems():
+    thumbs = resize_thumbs(img, config['thumb_sizes'][image_dir])
+    changed = []
+    for key, thumb_img in thumbs.iteritems():
         path = thumb_path(item, key)
-        thumb_img = resize_thumb(img, xy)
-        if thumb_img.mode != "RGB":
-            thumb_img = thumb_img.convert("RGB")
         thumb_img.save(path, quality=90)
+        changed.append(path)
 
     # Backup the original image, ensuring there's no odd chars in the ext.
     # Thumbs from DailyMotion include an extra query string that needs to be
@@ -238,6 +313,8 @@ def create_thumbs_for(item, image_file, image_filename):
         shutil.copyfileobj(image_file, backup_file)
         image_file.close()
         backup_file.close()
+        changed.append(backup_path)
+    thumbs_changed(changed)
 
 def create_default_thumbs_for(item):
     """Create copies of the default thumbs for the given item.
@@ -254,6 +331,7 @@ def create_default_thumbs_for(item):
     """
     mediadrop_dir = os.path.join(os.path.dirname(mediadrop.__file__), '..')
     image_dir, item_id = _normalize_thumb_item(item)
+    changed = []
     for key in config['thumb_sizes'][image_dir].iterkeys():
         src_file = thumb_path((image_dir, 'new'), key)
         if not os.path.exists(src_file):
@@ -261,6 +339,8 @@ def create_default_thumbs_for(item):
             src_file = thumb_path((default_image_dir, 'new'), key)
         dst_file = thumb_path(item, key)
         shutil.copyfile(src_file, dst_file)
+        changed.append(dst_file)
+    thumbs_changed(changed)
 
 def delete_thumbs(item):
     """Delete the thumbnails associated with the given item.
@@ -271,8 +351,9 @@ def delete_thumbs(item):
     :type item: ``tuple`` or mapped class instance
     """
     image_dir, item_id = _normalize_thumb_item(item)
-    thumbs = thumb_paths(item, exists=True).itervalues()
+    thumbs = thumb_paths(item, exists=True).values()
     delete_files(thumbs, image_dir)
+    thumbs_changed(thumbs)
 
 def has_thumbs(item):
     """Return True if a thumb exists for this item.
@@ -293,5 +374,123 @@ def has_default_thumbs(item):
     :type item: ``tuple`` or mapped class instance
     """
     image_dir, item_id = _normalize_thumb_item(item)
-    return filecmp.cmp(thumb_path((image_dir, item_id), 's'),
-                       thumb_path((image_dir, 'new'), 's'))
+    path = thumb_path((image_dir, item_id), 's')
+    default_path = thumb_path((image_dir, 'new'), 's')
+    manifest = thumb_manifest()
+    if manifest is not None:
+        st, default_st = manifest.stat(path), manifest.stat(default_path)
+        # most custom thumbnails differ in size, no need to read them
+        if st and default_st and st[0] != default_st[0]:
+            return False
+    return filecmp.cmp(path, default_path)
+
+_orig_filename = re.compile(r'^(\d+)orig\.[a-z0-9]+$')
+
+def find_orig_thumbs(image_dir):
+    """Return the paths of the backed up original images (see
+    :func:`create_thumbs_for`) keyed by item id.
+
+    :param image_dir: The subdir name, e.g. ``Media._thumb_dir``.
+    """
+    path = os.path.join(config['image_dir'], image_dir)
+    origs = {}
+    for filename in os.listdir(path):
+        match = _orig_filename.match(filename)
+        if match:
+            origs[int(match.group(1))] = os.path.join(path, filename)
+    return origs
+
+def _thumb_is_current(path, size, orig_mtime):
+    try:
+        if os.path.getmtime(path) < orig_mtime:
+            return False
+        # only reads the header
+        return Image.open(path).size == tuple(size)
+    except (IOError, OSError):
+        return False
+
+def regenerate_thumb_files(orig_path, targets, force=False):
+    """Create thumbnails from the given original image.
+
+    Runs in the worker processes of :func:`regenerate_thumbs` so it must not
+    use the pylons config.
+
+    :param targets: ``(size key, (width, height), path)`` tuples.
+    :param force: Also replace thumbnails which are up to date (newer
+        than the original and of the right size).
+    :returns: The number of thumbnails written.
+    """
+    if not force:
+        orig_mtime = os.path.getmtime(orig_path)
+        targets = [(key, size, path) for key, size, path in targets
+                   if not _thumb_is_current(path, size, orig_mtime)]
+        if not targets:
+            return 0
+    img = Image.open(orig_path)
+    thumbs = resize_thumbs(img, dict((key, size) for key, size, path in targets))
+    for key, size, path in targets:
+        thumbs[key].save(path, quality=90)
+    return len(targets)
+
+def _regenerate_task(task):
+    orig_path, targets, force = task
+    try:
+        return orig_path, regenerate_thumb_files(orig_path, targets, force), None
+    except Exception, e:
+        return orig_path, 0, '%s: %s' % (e.__class__.__name__, e)
+
+def regenerate_thumbs(image_dir, item_ids, processes=None, force=False,
+                      progress=None):
+    """Regenerate the thumbnails of the given items from their original
+    images in all configured sizes (e.g. after ``thumb_sizes`` changed).
+
+    :param image_dir: The subdir name, e.g. ``Media._thumb_dir``.
+    :param item_ids: The ids of the media or podcasts.
+    :param processes: Number of worker processes (default: number of CPUs).
+    :param force: Also regenerate thumbnails which are up to date.
+    :param progress: Called with the number of processed and total items
+        which have an original image.
+    :returns: Counts of ``items``, ``missing`` (no original image),
+        ``skipped`` (up to date), ``regenerated`` items and written
+        ``thumbs`` and a list of ``errors``.
+    :rtype: dict
+    """
+    origs = find_orig_thumbs(image_dir)
+    sizes = config['thumb_sizes'][image_dir]
+    stats = dict(items=0, missing=0, skipped=0, regenerated=0, thumbs=0,
+                 errors=[])
+    tasks = []
+    for item_id in item_ids:
+        stats['items'] += 1
+        orig_path = origs.get(item_id)
+        if orig_path is None:
+            stats['missing'] += 1
+            continue
+        targets = [(key, xy, thumb_path((image_dir, item_id), key))
+                   for key, xy in sizes.iteritems()]
+        tasks.append((orig_path, targets, force))
+
+    pool = None
+    if processes == 1 or len(tasks) < 2:
+        results = imap(_regenerate_task, tasks)
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(_regenerate_task, tasks, chunksize=4)
+    try:
+        for done, (orig_path, written, error) in enumerate(results):
+            if error:
+                stats['errors'].append((orig_path, error))
+            elif written:
+                stats['regenerated'] += 1
+                stats['thumbs'] += written
+            else:
+                stats['skipped'] += 1
+            if progress:
+                progress(done + 1, len(tasks))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        # the thumbnails were replaced by the worker processes
+        thumbs_changed()
+    return stats
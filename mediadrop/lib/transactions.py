@@ -0,0 +1,99 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Transaction Callbacks
+
+The mapper observers (e.g. ``events.Media.after_update``) are triggered
+during the flush, before the changes are visible to other transactions.
+A process-wide cache which is invalidated then can be filled again with
+the old data by a concurrent request (or with data which is rolled back
+later), so caches should be invalidated again once the transaction ended::
+
+    cache.invalidate()
+    call_after_commit(cache.invalidate, rollback=True)
+
+Values which were loaded while the current transaction contains changes
+(see :func:`has_uncommitted_changes`) must not be cached at all, the
+transaction might be rolled back.
+"""
+
+from weakref import WeakKeyDictionary
+
+from pylons import request
+from sqlalchemy import event
+
+
+__all__ = [
+    'call_after_commit',
+    'has_uncommitted_changes',
+    'track_changes',
+]
+
+# sessions which flushed changes in their current transaction
+_flushed_sessions = WeakKeyDictionary()
+
+def _current_request():
+    # imported here because mediadrop.lib.app_globals imports modules which
+    # use this one
+    from mediadrop.lib.app_globals import is_object_registered
+    if not is_object_registered(request):
+        return None
+    return request._current_obj()
+
+def call_after_commit(callback, rollback=False):
+    """Call ``callback`` once the transaction of the current
+    :func:`~mediadrop.lib.decorators.autocommit` action was committed (and
+    also after a rollback if ``rollback`` is True). The callback is
+    registered only once per transaction.
+
+    Outside of an autocommit action (e.g. in scripts) the callback is
+    called immediately.
+
+    :returns: True if the callback was deferred.
+    """
+    req = _current_request()
+    commit_callbacks = getattr(req, 'commit_callbacks', None)
+    if commit_callbacks is None:
+        callback()
+        return False
+    if callback not in commit_callbacks:
+        commit_callbacks.append(callback)
+    if rollback:
+        rollback_callbacks = req.rollback_callbacks
+        if callback not in rollback_callbacks:
+            rollback_callbacks.append(callback)
+    return True
+
+def has_uncommitted_changes(session=None):
+    """Return True if the session (default: ``DBSession``) contains changes
+    which were not committed yet (pending or already flushed)."""
+    if session is None:
+        # imported here because the model imports modules which use this one
+        from mediadrop.model.meta import DBSession
+        session = DBSession()
+    if session in _flushed_sessions:
+        return True
+    return bool(session.new or session.dirty or session.deleted)
+
+def track_changes(target):
+    """Track the flushed changes of the given session (class, sessionmaker
+    or scoped session) for :func:`has_uncommitted_changes`.
+
+    ``DBSession`` is tracked already (see :mod:`mediadrop.model.meta`):
+    SQLAlchemy 0.7 does not pass the listeners of the Session class on to a
+    sessionmaker which gets own listeners later (e.g. from
+    :mod:`mediadrop.model.counters`).
+    """
+    event.listen(target, 'after_flush', _session_flushed)
+    event.listen(target, 'after_commit', _transaction_ended)
+    event.listen(target, 'after_rollback', _transaction_ended)
+
+def _session_flushed(session, flush_context):
+    _flushed_sessions[session] = True
+
+def _transaction_ended(session):
+    _flushed_sessions.pop(session, None)
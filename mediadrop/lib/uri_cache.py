@@ -0,0 +1,91 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+StorageURI Cache
+
+:meth:`mediadrop.model.media.MediaFile.get_uris` asks the storage engine
+for the URIs of a file. For local files that means several ``url_for``
+calls per file (which are slow) and the URIs of the same file are needed
+several times while rendering a page (player selection, player markup,
+podcast feeds).
+
+The URIs are kept for the rest of the request and optionally in the Beaker
+cache so they are shared between requests (and processes)::
+
+    uri_cache.shared = true
+    uri_cache.expire = 3600
+
+The key contains the ids and ``modified_on`` of the file and its storage
+engine, the slug of the media and the host, scheme and script name of the
+request (the URLs are qualified) so cached URIs are never stale. Files with
+unsaved changes are not cached.
+"""
+
+from pylons import app_globals, request
+from sqlalchemy.orm.attributes import instance_state
+
+from mediadrop.lib.app_globals import is_object_registered
+from mediadrop.lib.compat import sha1
+from mediadrop.lib.uri import StorageURI
+
+
+__all__ = [
+    'cached_storage_uris',
+    'use_shared_uri_cache',
+]
+
+REQUEST_CACHE = 'mediadrop.uri_cache'
+NAMESPACE = 'mediadrop.lib.uri_cache'
+
+_shared = False
+_expire = 3600
+
+def use_shared_uri_cache(enabled=True, expire=3600):
+    """Share the generated URIs between requests via the Beaker cache."""
+    global _shared, _expire
+    _shared = enabled
+    _expire = expire
+
+def _is_unsaved(instance):
+    return instance.id is None or instance_state(instance).modified
+
+def uri_cache_key(media_file):
+    """Return the cache key for the URIs of the given file or None if the
+    URIs must not be cached."""
+    if not is_object_registered(request):
+        return None
+    storage = media_file.storage
+    if storage is None or _is_unsaved(media_file) or _is_unsaved(storage):
+        return None
+    environ = request.environ
+    parts = (media_file.id, storage.id, media_file.modified_on,
+        storage.modified_on, media_file.media.slug, request.scheme,
+        request.host, environ.get('SCRIPT_NAME', ''))
+    return sha1(repr(parts)).hexdigest()
+
+def cached_storage_uris(media_file, create):
+    """Return the :class:`~mediadrop.lib.uri.StorageURI` list of the given
+    file from the cache or by calling ``create``."""
+    key = uri_cache_key(media_file)
+    if key is None:
+        return create()
+    request_cache = request.environ.setdefault(REQUEST_CACHE, {})
+    values = request_cache.get(key)
+    if values is None:
+        if _shared:
+            cache = app_globals.cache.get_cache(NAMESPACE)
+            values = cache.get_value(key, expiretime=_expire,
+                createfunc=lambda: _uri_values(create()))
+        else:
+            values = _uri_values(create())
+        request_cache[key] = values
+    return [StorageURI(media_file, scheme, file_uri, server_uri)
+            for scheme, file_uri, server_uri in values]
+
+def _uri_values(uris):
+    # StorageURI refers to the (session bound) file, only keep the strings
+    return [(uri.scheme, uri.file_uri, uri.server_uri) for uri in uris]
@@ -17,6 +17,8 @@ from urlparse import urlparse
 from pylons import app_globals, config, request, url as pylons_url
 from webob.exc import HTTPFound
 
+from mediadrop.lib.settings_store import Settings
+
 __all__ = [
     'calculate_popularity',
     'current_url',
@@ -166,7 +168,7 @@ def merge_dicts(dst, *srcs):
                     current_dst[key] = current_src[key]
     return dst
 
-def calculate_popularity(publish_date, score):
+def calculate_popularity(publish_date, score, settings=None):
     """Calculate how 'hot' an item is given its response since publication.
 
     In our ranking algorithm, being base_life_hours newer is equivalent
@@ -176,13 +178,18 @@ def calculate_popularity(publish_date, score):
     :param publish_date: The date of publication. An older date reduces
         the popularity score.
     :param int score: The number of likes, dislikes or likes - dislikes.
+    :param settings: The popularity settings (:class:`Settings` or a dict),
+        defaults to ``request.settings``.
     :rtype: int
     :returns: Popularity points.
 
     """
-    settings = request.settings
-    log_base = int(settings['popularity_decay_exponent'])
-    base_life = int(settings['popularity_decay_lifetime']) * 3600
+    if settings is None:
+        settings = request.settings
+    elif not isinstance(settings, Settings):
+        settings = Settings(settings)
+    log_base = settings.as_int('popularity_decay_exponent')
+    base_life = settings.as_int('popularity_decay_lifetime') * 3600
     # FIXME: The current algorithm assumes that the earliest publication
     #        date is January 1, 2000.
     if score > 0:
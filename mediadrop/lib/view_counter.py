@@ -0,0 +1,241 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Write-behind View Counter
+
+Instead of issuing an ``UPDATE media SET views = views + 1`` (plus a commit)
+for every page view, increments are collected in a spool and written to the
+database in batches, either when enough views were collected or when the
+flush interval has passed. Pending views are also written when the process
+shuts down.
+
+The default spool keeps the counts in memory (per process). If multiple
+processes should share one spool (and views should survive a crash) you can
+configure an SQLite file instead::
+
+    view_counter.enabled = true
+    view_counter.flush_interval = 30
+    view_counter.flush_threshold = 100
+    view_counter.spool_file = %(here)s/data/view_counts.sqlite
+"""
+
+import atexit
+import logging
+import sqlite3
+import threading
+import time
+
+from paste.deploy.converters import asbool, asint
+
+
+__all__ = [
+    'MemoryViewCountSpool',
+    'SQLiteViewCountSpool',
+    'ViewCounter',
+    'setup_view_counter',
+]
+
+log = logging.getLogger(__name__)
+
+class MemoryViewCountSpool(object):
+    """Collect pending view increments in a process-local dict."""
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, media_id, views=1):
+        self._lock.acquire()
+        try:
+            self._counts[media_id] = self._counts.get(media_id, 0) + views
+        finally:
+            self._lock.release()
+
+    def pending(self):
+        """Return the number of views which were not written yet."""
+        return sum(self._counts.values())
+
+    def drain(self):
+        """Return all pending increments as a dict and empty the spool."""
+        self._lock.acquire()
+        try:
+            counts = self._counts
+            self._counts = {}
+        finally:
+            self._lock.release()
+        return counts
+
+    def restore(self, counts):
+        """Put back increments which could not be written to the database."""
+        for media_id, views in counts.iteritems():
+            self.add(media_id, views)
+
+
+class SQLiteViewCountSpool(object):
+    """Collect pending view increments in a local SQLite database.
+
+    The file can be shared by all MediaDrop processes running on the same
+    host and pending views are not lost if a process crashes.
+    """
+
+    def __init__(self, filename, timeout=10):
+        self.filename = filename
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS view_counts ('
+            'media_id INTEGER PRIMARY KEY, views INTEGER NOT NULL)'
+        )
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # autocommit mode, transactions are started explicitly
+            connection = sqlite3.connect(self.filename, timeout=self.timeout,
+                                         isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def add(self, media_id, views=1):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('INSERT OR IGNORE INTO view_counts '
+                '(media_id, views) VALUES (?, 0)', (media_id, ))
+            connection.execute('UPDATE view_counts SET views = views + ? '
+                'WHERE media_id = ?', (views, media_id))
+        except:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def pending(self):
+        cursor = self._connection().execute(
+            'SELECT COALESCE(SUM(views), 0) FROM view_counts')
+        return cursor.fetchone()[0]
+
+    def drain(self):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            counts = dict(connection.execute(
+                'SELECT media_id, views FROM view_counts'))
+            connection.execute('DELETE FROM view_counts')
+        except:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return counts
+
+    def restore(self, counts):
+        for media_id, views in counts.iteritems():
+            self.add(media_id, views)
+
+
+class ViewCounter(object):
+    """Buffer view increments and write them to the ``media`` table in batches.
+
+    :param spool: Storage for pending increments, e.g.
+        :class:`MemoryViewCountSpool`.
+    :param flush_interval: Maximum number of seconds between two flushes
+        (checked whenever a view is counted).
+    :param flush_threshold: Flush as soon as this many views are pending.
+    :param bind: SQLAlchemy engine to use, defaults to the engine of the
+        MediaDrop metadata.
+    """
+
+    def __init__(self, spool, flush_interval=30, flush_threshold=100,
+                 bind=None, clock=time.time):
+        self.spool = spool
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.bind = bind
+        self._clock = clock
+        self._last_flush = clock()
+        self._flush_lock = threading.Lock()
+
+    def increment(self, media_id, views=1):
+        self.spool.add(media_id, views)
+        if self._should_flush():
+            self.flush()
+
+    def _should_flush(self):
+        if (self._clock() - self._last_flush) >= self.flush_interval:
+            return True
+        return self.spool.pending() >= self.flush_threshold
+
+    def flush(self):
+        """Write all pending increments to the database.
+
+        Returns the number of views written. If the database update fails,
+        the increments are put back into the spool so they can be written
+        during the next flush.
+        """
+        # Only one thread per process needs to flush, all others can just
+        # continue serving their requests.
+        if not self._flush_lock.acquire(False):
+            return 0
+        try:
+            self._last_flush = self._clock()
+            counts = self.spool.drain()
+            if not counts:
+                return 0
+            try:
+                self._write(counts)
+            except Exception:
+                log.exception('Unable to write %d pending media views' % \
+                    sum(counts.values()))
+                self.spool.restore(counts)
+                return 0
+            return sum(counts.values())
+        finally:
+            self._flush_lock.release()
+
+    def _write(self, counts):
+        from mediadrop.model.media import media
+        from mediadrop.model.meta import metadata
+
+        # Media items with the same number of pending views can be updated
+        # with a single statement.
+        ids_by_views = {}
+        for media_id, views in counts.iteritems():
+            ids_by_views.setdefault(views, []).append(media_id)
+
+        bind = self.bind or metadata.bind
+        connection = bind.connect()
+        try:
+            transaction = connection.begin()
+            try:
+                for views, media_ids in sorted(ids_by_views.iteritems()):
+                    connection.execute(media.update()\
+                        .values(views=media.c.views + views)\
+                        .where(media.c.id.in_(sorted(media_ids))))
+            except:
+                transaction.rollback()
+                raise
+            transaction.commit()
+        finally:
+            connection.close()
+
+
+def setup_view_counter(config):
+    """Return a :class:`ViewCounter` configured from the given config (or
+    ``None`` if the write-behind view counter is disabled)."""
+    if not asbool(config.get('view_counter.enabled', False)):
+        return None
+    spool_file = config.get('view_counter.spool_file')
+    if spool_file:
+        spool = SQLiteViewCountSpool(spool_file)
+    else:
+        spool = MemoryViewCountSpool()
+    view_counter = ViewCounter(spool,
+        flush_interval=asint(config.get('view_counter.flush_interval', 30)),
+        flush_threshold=asint(config.get('view_counter.flush_threshold', 100)),
+    )
+    # Do not lose pending views when the server process is shut down.
+    atexit.register(view_counter.flush)
+    return view_counter
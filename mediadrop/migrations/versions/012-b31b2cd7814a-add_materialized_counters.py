@@ -0,0 +1,115 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""add materialized counter columns
+
+add the counter columns for the media counts of tags/categories and the
+comment counts of media (see mediadrop.model.counters)
+
+added: 2015-06-08 (v0.11dev)
+
+Revision ID: b31b2cd7814a
+Revises: 4979e106cad8
+Create Date: 2015-06-08 11:24:37.104581
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b31b2cd7814a'
+down_revision = '4979e106cad8'
+
+from alembic.op import add_column, drop_column, execute
+from sqlalchemy import and_, func, or_, select, text
+from sqlalchemy import Boolean, Column, DateTime, Integer
+from sqlalchemy.sql import column, table
+
+# -- table definition ---------------------------------------------------------
+media = table('media',
+    column('id', Integer),
+    column('reviewed', Boolean),
+    column('encoded', Boolean),
+    column('publishable', Boolean),
+    column('publish_on', DateTime),
+    column('publish_until', DateTime),
+    column('comment_count_cached', Integer),
+    column('comment_count_published_cached', Integer),
+)
+comments = table('comments',
+    column('id', Integer),
+    column('media_id', Integer),
+    column('publishable', Boolean),
+)
+tags = table('tags',
+    column('id', Integer),
+    column('media_count_cached', Integer),
+    column('media_count_published_cached', Integer),
+)
+categories = table('categories',
+    column('id', Integer),
+    column('media_count_cached', Integer),
+    column('media_count_published_cached', Integer),
+)
+media_tags = table('media_tags',
+    column('media_id', Integer),
+    column('tag_id', Integer),
+)
+media_categories = table('media_categories',
+    column('media_id', Integer),
+    column('category_id', Integer),
+)
+
+# -- helpers ------------------------------------------------------------------
+def count_media(parent, assoc_table, parent_key, published=False):
+    where = [
+        media.c.id == assoc_table.c.media_id,
+        parent.c.id == assoc_table.c[parent_key],
+    ]
+    if published:
+        where += [
+            media.c.reviewed == True,
+            media.c.encoded == True,
+            media.c.publishable == True,
+            media.c.publish_on <= func.current_timestamp(),
+            or_(media.c.publish_until == None,
+                media.c.publish_until >= func.current_timestamp()),
+        ]
+    return select([func.count(text('*'))], and_(*where)).as_scalar()
+
+def count_comments(published=False):
+    where = [comments.c.media_id == media.c.id]
+    if published:
+        where.append(comments.c.publishable == True)
+    return select([func.count(comments.c.id)], and_(*where)).as_scalar()
+# -----------------------------------------------------------------------------
+
+COUNTER_COLUMNS = (
+    ('tags', 'media_count_cached'),
+    ('tags', 'media_count_published_cached'),
+    ('categories', 'media_count_cached'),
+    ('categories', 'media_count_published_cached'),
+    ('media', 'comment_count_cached'),
+    ('media', 'comment_count_published_cached'),
+)
+
+def upgrade():
+    for table_name, column_name in COUNTER_COLUMNS:
+        add_column(table_name,
+            Column(column_name, Integer, nullable=False, server_default='0'))
+
+    for parent, assoc_table, parent_key in ((tags, media_tags, 'tag_id'),
+            (categories, media_categories, 'category_id')):
+        execute(parent.update().values({
+            'media_count_cached': count_media(parent, assoc_table, parent_key),
+            'media_count_published_cached':
+                count_media(parent, assoc_table, parent_key, published=True),
+        }))
+    execute(media.update().values({
+        'comment_count_cached': count_comments(),
+        'comment_count_published_cached': count_comments(published=True),
+    }))
+
+def downgrade():
+    for table_name, column_name in COUNTER_COLUMNS:
+        drop_column(table_name, column_name)
@@ -0,0 +1,41 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""add related media table
+
+add the table for the precomputed related media (see
+mediadrop.lib.related_media)
+
+added: 2015-06-15 (v0.11dev)
+
+Revision ID: 6a1b9f2c3d4e
+Revises: b31b2cd7814a
+Create Date: 2015-06-15 09:41:12.350218
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6a1b9f2c3d4e'
+down_revision = 'b31b2cd7814a'
+
+from alembic.op import create_index, create_table, drop_table
+from sqlalchemy import Column, Float, ForeignKey, Integer
+
+
+def upgrade():
+    create_table('related_media',
+        Column('media_id', Integer, ForeignKey('media.id', onupdate='CASCADE', ondelete='CASCADE'),
+            primary_key=True),
+        Column('position', Integer, primary_key=True, autoincrement=False),
+        Column('related_id', Integer, ForeignKey('media.id', onupdate='CASCADE', ondelete='CASCADE'),
+            nullable=False),
+        Column('score', Float, nullable=False),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8',
+    )
+    create_index('ix_related_media_related_id', 'related_media', ['related_id'])
+
+def downgrade():
+    drop_table('related_media')
@@ -0,0 +1,51 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""add jobs table
+
+add the table for the background job queue (see mediadrop.lib.jobs)
+
+added: 2015-06-22 (v0.11dev)
+
+Revision ID: 3c7e2a9d5f10
+Revises: 6a1b9f2c3d4e
+Create Date: 2015-06-22 10:12:45.802317
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3c7e2a9d5f10'
+down_revision = '6a1b9f2c3d4e'
+
+from alembic.op import create_index, create_table, drop_table
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, Text, Unicode, UnicodeText
+
+
+def upgrade():
+    create_table('jobs',
+        Column('id', Integer, primary_key=True, autoincrement=True),
+        Column('type', Unicode(50), nullable=False),
+        Column('media_id', Integer, ForeignKey('media.id', onupdate='CASCADE', ondelete='CASCADE'),
+            nullable=True),
+        Column('media_file_id', Integer, ForeignKey('media_files.id', onupdate='CASCADE', ondelete='CASCADE'),
+            nullable=True),
+        Column('status', Unicode(20), nullable=False),
+        Column('data', Text, nullable=False),
+        Column('attempts', Integer, nullable=False),
+        Column('max_attempts', Integer, nullable=False),
+        Column('error', UnicodeText),
+        Column('worker', Unicode(100)),
+        Column('created_on', DateTime, nullable=False),
+        Column('run_after', DateTime, nullable=False),
+        Column('started_on', DateTime),
+        Column('finished_on', DateTime),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8',
+    )
+    create_index('ix_jobs_status_run_after', 'jobs', ['status', 'run_after'])
+    create_index('ix_jobs_media_id', 'jobs', ['media_id'])
+
+def downgrade():
+    drop_table('jobs')
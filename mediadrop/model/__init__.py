@@ -198,6 +198,14 @@ def _mtm_count_property(label, assoc_table,
     :param \**kwargs:
       Any additional arguments are passed to sqlalchemy.orm.column_property
     """
+    subselect = _mtm_count_select(assoc_table, where)
+    if label is not None:
+        subselect = subselect.label(label)
+
+    return orm.column_property(subselect, deferred=deferred, **kwargs)
+
+def _mtm_count_select(assoc_table, where=None):
+    """Return the correlated subquery used by :func:`_mtm_count_property`."""
     where_clauses = []
     for assoc_column in assoc_table.primary_key:
         fk = tuple(assoc_column.foreign_keys)[0]
@@ -207,14 +215,10 @@ def _mtm_count_property(label, assoc_table,
     elif where is not None:
         where_clauses.append(where)
 
-    subselect = sql.select(
+    return sql.select(
         [sql.func.coalesce(sql.func.count(sql.text('*')), sql.text('0'))],
         sql.and_(*where_clauses),
     )
-    if label is not None:
-        subselect = subselect.label(label)
-
-    return orm.column_property(subselect, deferred=deferred, **kwargs)
 
 class MatchAgainstClause(ColumnElement):
     """
@@ -249,6 +253,7 @@ __all__ = [
     'Media', 'MediaFile',
     'Podcast',
     'PlayerPrefs',
+    'Job',
 ]
 
 from mediadrop.model.auth import User, Group, Permission
@@ -261,3 +266,5 @@ from mediadrop.model.media import Media, MediaFile
 from mediadrop.model.podcasts import Podcast
 from mediadrop.model.players import PlayerPrefs, players, cleanup_players_table
 from mediadrop.model.storage import storage
+from mediadrop.model.jobs import Job
+from mediadrop.model.counters import reconcile_counters, use_materialized_counters
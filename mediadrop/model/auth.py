@@ -236,6 +236,7 @@ mapper(
 
 mapper(
     Group, groups,
+    extension=events.MapperObserver(events.Group),
     properties={
         'users': relation(User, secondary=users_groups, backref='groups'),
     },
@@ -243,6 +244,7 @@ mapper(
 
 mapper(
     Permission, permissions,
+    extension=events.MapperObserver(events.Permission),
     properties={
         'groups': relation(Group,
             secondary=groups_permissions,
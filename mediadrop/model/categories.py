@@ -21,6 +21,9 @@ categories = Table('categories', metadata,
     Column('name', Unicode(50), nullable=False, index=True),
     Column('slug', Unicode(SLUG_LENGTH), nullable=False, unique=True),
     Column('parent_id', Integer, ForeignKey('categories.id', onupdate='CASCADE', ondelete='CASCADE')),
+    # see mediadrop.model.counters
+    Column('media_count_cached', Integer, default=0, nullable=False),
+    Column('media_count_published_cached', Integer, default=0, nullable=False),
     mysql_engine='InnoDB',
     mysql_charset='utf8'
 )
@@ -190,6 +193,7 @@ class Category(object):
 mapper(Category, categories,
     order_by=categories.c.name,
     extension=events.MapperObserver(events.Category),
+    exclude_properties=['media_count_cached', 'media_count_published_cached'],
     properties={
         'children': relation(Category,
             backref=backref('parent', remote_side=[categories.c.id]),
@@ -0,0 +1,187 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Materialized Counters
+
+By default the ``media_count`` and ``media_count_published`` properties of
+:class:`~mediadrop.model.tags.Tag` and
+:class:`~mediadrop.model.categories.Category` (as well as
+``comment_count`` and ``comment_count_published`` of
+:class:`~mediadrop.model.media.Media`) are correlated subqueries, so every
+listing which undefers them runs one ``COUNT(*)`` per row.
+
+The same numbers are stored in counter columns (``*_cached``). They are
+updated within the same transaction whenever media, comments or the
+tags/categories of a media are changed via the ORM. With
+``counters.materialized = true`` in your config file the properties read
+the stored counters instead of running the subqueries.
+
+Published counts also change when media reach their publish date (or their
+"publish until" date passes) and bulk updates (``Query.update()``,
+``Query.delete()``) bypass the ORM events. Run
+``batch-scripts/reconcile_counters.py`` regularly (e.g. from cron) to
+recount everything (see :func:`reconcile_counters`).
+"""
+
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import event, sql
+from sqlalchemy.orm import attributes, class_mapper, column_property
+
+from mediadrop.model import _mtm_count_select
+from mediadrop.model.categories import Category, categories
+from mediadrop.model.comments import comments
+from mediadrop.model.media import (Media, media, media_categories,
+    media_published_clauses, media_tags)
+from mediadrop.model.meta import DBSession
+from mediadrop.model.tags import Tag, tags
+from mediadrop.plugin import events
+from mediadrop.plugin.events import observes
+
+
+__all__ = [
+    'reconcile_counters',
+    'update_counters',
+    'use_materialized_counters',
+]
+
+COUNTERS = (
+    # (kind, mapped class, property, counter column, counting subquery)
+    ('tags', Tag, 'media_count', tags.c.media_count_cached,
+        _mtm_count_select(media_tags)),
+    ('tags', Tag, 'media_count_published', tags.c.media_count_published_cached,
+        _mtm_count_select(media_tags, media_published_clauses())),
+    ('categories', Category, 'media_count', categories.c.media_count_cached,
+        _mtm_count_select(media_categories)),
+    ('categories', Category, 'media_count_published',
+        categories.c.media_count_published_cached,
+        _mtm_count_select(media_categories, media_published_clauses())),
+    ('media', Media, 'comment_count', media.c.comment_count_cached,
+        sql.select([sql.func.count(comments.c.id)],
+                   comments.c.media_id == media.c.id)),
+    ('media', Media, 'comment_count_published',
+        media.c.comment_count_published_cached,
+        sql.select([sql.func.count(comments.c.id)],
+                   sql.and_(comments.c.media_id == media.c.id,
+                            comments.c.publishable == True))),
+)
+
+def update_counters(kind, ids=None, session=None):
+    """Recount the stored counters of the given kind.
+
+    :param kind: 'tags', 'categories' or 'media' (comment counts).
+    :param ids: Only update the rows with these ids (default: all rows).
+    """
+    session = session or DBSession
+    if ids is not None:
+        ids = sorted(ids)
+        if not ids:
+            return
+    for kind_, mapped_class, key, column, subselect in COUNTERS:
+        if kind_ != kind:
+            continue
+        table = column.table
+        values = {column.key: subselect.as_scalar()}
+        for table_column in table.c:
+            # e.g. media.modified_on must not change
+            if table_column.onupdate is not None:
+                values[table_column.key] = table_column
+        update = table.update().values(values)
+        if ids is not None:
+            update = update.where(table.c.id.in_(ids))
+        session.execute(update)
+
+def reconcile_counters(session=None):
+    """Recount all stored counters."""
+    for kind in ('tags', 'categories', 'media'):
+        update_counters(kind, session=session)
+
+def use_materialized_counters(enabled=True):
+    """Map the count properties to the stored counters (or back to the
+    correlated subqueries if ``enabled`` is False)."""
+    for kind, mapped_class, key, column, subselect in COUNTERS:
+        if enabled:
+            prop = column_property(column, deferred=True)
+        else:
+            prop = column_property(subselect.label(key), deferred=True)
+        class_mapper(mapped_class).add_property(key, prop)
+
+
+# -- keep the counters up to date ---------------------------------------------
+# The counters can only be updated after the flush when the rows of the
+# association tables were written. Until then the changed objects are
+# collected per session.
+_pending = WeakKeyDictionary()
+
+def _mark(kind, objects_or_ids):
+    pending = _pending.setdefault(DBSession(), {})
+    pending.setdefault(kind, set()).update(objects_or_ids)
+
+def _history_values(instance, key):
+    history = attributes.get_history(instance, key,
+        passive=attributes.PASSIVE_NO_INITIALIZE)
+    return list(history.sum())
+
+def _has_changes(instance, keys):
+    for key in keys:
+        history = attributes.get_history(instance, key,
+            passive=attributes.PASSIVE_NO_INITIALIZE)
+        if history.has_changes():
+            return True
+    return False
+
+def _associated_ids(column, media_id):
+    select = sql.select([column], column.table.c.media_id == media_id)
+    return [row[0] for row in DBSession.execute(select)]
+
+_media_counted_attributes = ('tags', 'categories', 'reviewed', 'encoded',
+    'publishable', 'publish_on', 'publish_until')
+
+@observes(events.Media.after_insert)
+def _media_inserted(instance):
+    _mark('tags', _history_values(instance, 'tags'))
+    _mark('categories', _history_values(instance, 'categories'))
+
+@observes(events.Media.after_update)
+def _media_updated(instance):
+    if _has_changes(instance, _media_counted_attributes):
+        _mark_tags_and_categories(instance)
+
+@observes(events.Media.before_delete)
+def _media_deleted(instance):
+    _mark_tags_and_categories(instance)
+
+def _mark_tags_and_categories(instance):
+    # The tags/categories are not necessarily loaded, the association table
+    # knows about the existing ones, the history about new/removed ones.
+    _mark('tags', _history_values(instance, 'tags') +
+        _associated_ids(media_tags.c.tag_id, instance.id))
+    _mark('categories', _history_values(instance, 'categories') +
+        _associated_ids(media_categories.c.category_id, instance.id))
+
+@observes(events.Comment.after_insert, events.Comment.after_delete)
+def _comment_inserted_or_deleted(instance):
+    _mark('media', _history_values(instance, 'media_id'))
+
+@observes(events.Comment.after_update)
+def _comment_updated(instance):
+    if _has_changes(instance, ('media_id', 'publishable')):
+        _mark('media', _history_values(instance, 'media_id'))
+
+def _update_pending_counters(session, flush_context):
+    pending = _pending.pop(session, None)
+    if not pending:
+        return
+    for kind, objects_or_ids in pending.items():
+        ids = set()
+        for value in objects_or_ids:
+            id = getattr(value, 'id', value)
+            if id is not None:
+                ids.add(id)
+        update_counters(kind, ids, session=session)
+
+event.listen(DBSession, 'after_flush', _update_pending_counters)
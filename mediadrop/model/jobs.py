@@ -0,0 +1,120 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+"""
+Background Jobs
+
+The :attr:`jobs` table is a durable queue of work which is done after the
+request, e.g. downloading thumbnails and handing new media files over to
+transcoding engines. See :mod:`mediadrop.lib.jobs` for the worker.
+
+"""
+
+from datetime import datetime
+
+from sqlalchemy import Column, ForeignKey, Index, sql, Table
+from sqlalchemy.orm import class_mapper, column_property, mapper
+from sqlalchemy.types import DateTime, Integer, Unicode, UnicodeText
+
+from mediadrop.model.media import Media, MediaFile, media
+from mediadrop.model.meta import DBSession, metadata
+from mediadrop.model.util import JSONType
+
+__all__ = [
+    'Job',
+    'JOB_DONE',
+    'JOB_FAILED',
+    'JOB_PENDING',
+    'JOB_RUNNING',
+    'jobs',
+]
+
+JOB_PENDING = u'pending'
+JOB_RUNNING = u'running'
+JOB_DONE = u'done'
+JOB_FAILED = u'failed'
+
+jobs = Table('jobs', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+
+    Column('type', Unicode(50), nullable=False, doc=\
+        """The name of the handler which runs this job, see
+        :func:`mediadrop.lib.jobs.job_handler`."""),
+
+    Column('media_id', Integer, ForeignKey('media.id', onupdate='CASCADE',
+        ondelete='CASCADE'), nullable=True),
+
+    Column('media_file_id', Integer, ForeignKey('media_files.id',
+        onupdate='CASCADE', ondelete='CASCADE'), nullable=True),
+
+    Column('status', Unicode(20), nullable=False, default=JOB_PENDING, doc=\
+        """One of 'pending', 'running', 'done' or 'failed'."""),
+
+    Column('data', JSONType, nullable=False, default=dict, doc=\
+        """Parameters for the handler."""),
+
+    Column('attempts', Integer, nullable=False, default=0),
+    Column('max_attempts', Integer, nullable=False, default=5),
+    Column('error', UnicodeText, doc=\
+        """The error message of the last failed attempt (if any)."""),
+
+    Column('worker', Unicode(100), doc=\
+        """The name of the worker which ran the job most recently."""),
+
+    Column('created_on', DateTime, nullable=False, default=datetime.now),
+    Column('run_after', DateTime, nullable=False, default=datetime.now, doc=\
+        """The job is not started before this time (used for retries)."""),
+    Column('started_on', DateTime),
+    Column('finished_on', DateTime),
+
+    mysql_engine='InnoDB',
+    mysql_charset='utf8',
+)
+Index('ix_jobs_status_run_after', jobs.c.status, jobs.c.run_after)
+Index('ix_jobs_media_id', jobs.c.media_id)
+
+
+class Job(object):
+    """A unit of work for the background worker."""
+    query = DBSession.query_property()
+
+    def __repr__(self):
+        return '<Job: %r %r media=%r file=%r %s>' % (self.id, self.type,
+            self.media_id, self.media_file_id, self.status)
+
+    @property
+    def media_file(self):
+        if self.media_file_id is None:
+            return None
+        return DBSession.query(MediaFile).get(self.media_file_id)
+
+    @property
+    def media(self):
+        if self.media_id is None:
+            return None
+        return DBSession.query(Media).get(self.media_id)
+
+mapper(Job, jobs)
+
+
+def _job_count_property(label, statuses, doc):
+    return column_property(
+        sql.select([sql.func.count(jobs.c.id)],
+                   sql.and_(jobs.c.media_id == media.c.id,
+                            jobs.c.status.in_(statuses)))\
+            .label(label),
+        deferred=True,
+        doc=doc)
+
+# Show the processing state in the admin media table (undeferred there).
+_media_mapper = class_mapper(Media, compile=False)
+_media_mapper.add_properties({
+    'jobs_pending': _job_count_property('jobs_pending',
+        [JOB_PENDING, JOB_RUNNING],
+        doc="The number of unfinished background jobs of this media."),
+    'jobs_failed': _job_count_property('jobs_failed', [JOB_FAILED],
+        doc="The number of failed background jobs of this media."),
+})
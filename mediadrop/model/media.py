@@ -28,12 +28,15 @@ from sqlalchemy.orm import (attributes, backref, class_mapper, column_property,
     composite, dynamic_loader, mapper, Query, relation, validates)
 from sqlalchemy.orm.collections import attribute_mapped_collection
 from sqlalchemy.schema import DDL
-from sqlalchemy.types import Boolean, DateTime, Integer, Unicode, UnicodeText
+from sqlalchemy.types import (Boolean, DateTime, Float, Integer, Unicode,
+    UnicodeText)
 
 from mediadrop.lib.auth import Resource
 from mediadrop.lib.compat import any
 from mediadrop.lib.filetypes import AUDIO, AUDIO_DESC, VIDEO, guess_mimetype
 from mediadrop.lib.players import pick_any_media_file, pick_podcast_media_file
+from mediadrop.lib.search import search_backend
+from mediadrop.lib.uri_cache import cached_storage_uris
 from mediadrop.lib.util import calculate_popularity
 from mediadrop.lib.xhtml import line_break_xhtml, strip_xhtml
 from mediadrop.model import (get_available_slug, SLUG_LENGTH, 
@@ -145,6 +148,13 @@ media = Table('media', metadata,
     Column('author_name', Unicode(50), nullable=False),
     Column('author_email', Unicode(255), nullable=False),
 
+    Column('comment_count_cached', Integer, default=0, nullable=False, doc=\
+        """The number of comments, see :mod:`mediadrop.model.counters`."""),
+
+    Column('comment_count_published_cached', Integer, default=0, nullable=False, doc=\
+        """The number of published comments, see
+        :mod:`mediadrop.model.counters`."""),
+
     mysql_engine='InnoDB',
     mysql_charset='utf8',
 )
@@ -209,6 +219,18 @@ media_categories = Table('media_categories', metadata,
     mysql_charset='utf8',
 )
 
+related_media = Table('related_media', metadata,
+    Column('media_id', Integer, ForeignKey('media.id', onupdate='CASCADE', ondelete='CASCADE'),
+        primary_key=True),
+    Column('position', Integer, primary_key=True, autoincrement=False, doc=\
+        """The most similar media comes first (position 0)."""),
+    Column('related_id', Integer, ForeignKey('media.id', onupdate='CASCADE', ondelete='CASCADE'),
+        nullable=False, index=True),
+    Column('score', Float, nullable=False),
+    mysql_engine='InnoDB',
+    mysql_charset='utf8',
+)
+
 media_fulltext = Table('media_fulltext', metadata,
     Column('media_id', Integer, ForeignKey('media.id'), primary_key=True),
     Column('title', Unicode(255), nullable=False),
@@ -293,43 +315,10 @@ class MediaQuery(Query):
         return self.order_by(Media.popularity_points.desc())
 
     def search(self, search, bool=False, order_by=True):
-        search_cols = _fulltext_indexes['public']
-        return self._search(search_cols, search, bool, order_by)
+        return search_backend().search(self, search, 'public', bool, order_by)
 
     def admin_search(self, search, bool=False, order_by=True):
-        search_cols = _fulltext_indexes['admin']
-        return self._search(search_cols, search, bool, order_by)
-
-    def _search(self, search_cols, search, bool=False, order_by=True):
-        # XXX: If full text searching is not enabled, we use a very
-        #      rudimentary fallback.
-        if not self._fulltext_enabled():
-            return self.filter(sql.or_(Media.title.ilike("%%%s%%" % search),
-                                       Media.description_plain.ilike("%%%s%%" % search)))
-
-        filter = MatchAgainstClause(search_cols, search, bool)
-        query = self.join(MediaFullText).filter(filter)
-        if order_by:
-            # MySQL automatically orders natural lang searches by relevance,
-            # so override any existing ordering
-            query = query.order_by(None)
-            if bool:
-                # To mimic the same behaviour in boolean mode, we must do an
-                # extra natural language search on our boolean-filtered results
-                relevance = MatchAgainstClause(search_cols, search, bool=False)
-                query = query.order_by(relevance)
-        return query
-
-    def _fulltext_enabled(self):
-        connection = self.session.connection()
-        if connection.dialect.name == 'mysql':
-            # use a fun trick to see if the media_fulltext table is being used
-            # thanks to this guy: http://data.agaric.com/node/2241#comment-544
-            select = sql.select('1').select_from(media_fulltext).limit(1)
-            result = connection.execute(select)
-            if result.scalar() is not None:
-                return True
-        return False
+        return search_backend().search(self, search, 'admin', bool, order_by)
 
     def in_category(self, cat):
         """Filter results to Media in the given category"""
@@ -340,14 +329,16 @@ class MediaQuery(Query):
         if len(cats) == 0:
             # SQLAlchemy complains about an empty IN-predicate
             return self.filter(media_categories.c.media_id == -1)
-        all_cats = cats[:]
+        # imported here to avoid a circular import
+        from mediadrop.lib.category_tree import category_tree
+        tree = category_tree()
+        all_ids = set()
         for cat in cats:
-            all_cats.extend(cat.descendants())
-        all_ids = [c.id for c in all_cats]
+            all_ids.update(tree.subtree_ids(cat.id))
         return self.filter(sql.exists(sql.select(
             [media_categories.c.media_id],
             sql.and_(media_categories.c.media_id == Media.id,
-                     media_categories.c.category_id.in_(all_ids))
+                     media_categories.c.category_id.in_(sorted(all_ids)))
         )))
 
     def exclude(self, *args):
@@ -373,19 +364,13 @@ class MediaQuery(Query):
             return self
 
     def related(self, media):
+        from mediadrop.lib.related_media import precomputed_related_media
         query = self.published().filter(Media.id != media.id)
-
-        # XXX: If full text searching is not enabled, we simply return media
-        #      in the same categories.
-        if not self._fulltext_enabled():
-            return query.in_categories(media.categories)
-
-        search_terms = '%s %s %s' % (
-            media.title,
-            media.fulltext and media.fulltext.tags or '',
-            media.fulltext and media.fulltext.categories or '',
-        )
-        return query.search(search_terms, bool=True)
+        if precomputed_related_media():
+            return query.join((related_media, related_media.c.related_id == Media.id))\
+                .filter(related_media.c.media_id == media.id)\
+                .order_by(None).order_by(related_media.c.position)
+        return search_backend().related(query, media)
 
 class Meta(object):
     """
@@ -517,20 +502,27 @@ class Media(object):
     def resource(self):
         return Resource('media', self.id, media=self)
 
-    def increment_views(self):
+    def increment_views(self, view_counter=None):
         """Increment the number of views in the database.
 
         We avoid concurrency issues by incrementing JUST the views and
         not allowing modified_on to be updated automatically.
 
+        :param view_counter: An optional
+            :class:`mediadrop.lib.view_counter.ViewCounter` which collects
+            the increment and writes it to the database in a later batch.
+
         """
         if self.id is None:
             self.views += 1
             return self.views
 
-        DBSession.execute(media.update()\
-            .values(views=media.c.views + 1)\
-            .where(media.c.id == self.id))
+        if view_counter is not None:
+            view_counter.increment(self.id)
+        else:
+            DBSession.execute(media.update()\
+                .values(views=media.c.views + 1)\
+                .where(media.c.id == self.id))
 
         # Increment the views by one for the rest of the request,
         # but don't allow the ORM to increment the views too.
@@ -612,11 +604,13 @@ class MediaFile(object):
     def get_uris(self):
         """Return a list all possible playback URIs for this file.
 
+        The URIs are cached, see :mod:`mediadrop.lib.uri_cache`.
+
         :rtype: list
         :returns: :class:`mediadrop.lib.storage.StorageURI` instances.
 
         """
-        return self.storage.get_uris(self)
+        return cached_storage_uris(self, lambda: self.storage.get_uris(self))
 
 class MediaFullText(object):
     query = DBSession.query_property()
@@ -641,6 +635,8 @@ _media_mapper = mapper(
     Media, media,
     order_by=media.c.title,
     extension=events.MapperObserver(events.Media),
+    # mapped as 'comment_count(_published)' if enabled (see .counters)
+    exclude_properties=['comment_count_cached', 'comment_count_published_cached'],
     properties={
         'fulltext': relation(
             MediaFullText,
@@ -711,11 +707,11 @@ _media_mapper = mapper(
         ),
 })
 
-# Add properties for counting how many media items have a given Tag
-_tags_mapper = class_mapper(Tag, compile=False)
-_tags_mapper.add_properties(_properties_dict_from_labels(
-    _mtm_count_property('media_count', media_tags),
-    _mtm_count_property('media_count_published', media_tags, [
+def media_published_clauses():
+    """Return the conditions for published media as a list of SQL clauses
+    (evaluated in the database, in contrast to :meth:`MediaQuery.published`).
+    """
+    return [
         media.c.reviewed == True,
         media.c.encoded == True,
         media.c.publishable == True,
@@ -724,21 +720,70 @@ _tags_mapper.add_properties(_properties_dict_from_labels(
             media.c.publish_until == None,
             media.c.publish_until >= sql.func.current_timestamp(),
         ),
-    ]),
+    ]
+
+# Add properties for counting how many media items have a given Tag
+_tags_mapper = class_mapper(Tag, compile=False)
+_tags_mapper.add_properties(_properties_dict_from_labels(
+    _mtm_count_property('media_count', media_tags),
+    _mtm_count_property('media_count_published', media_tags,
+        media_published_clauses()),
 ))
 
 # Add properties for counting how many media items have a given Category
 _categories_mapper = class_mapper(Category, compile=False)
 _categories_mapper.add_properties(_properties_dict_from_labels(
     _mtm_count_property('media_count', media_categories),
-    _mtm_count_property('media_count_published', media_categories, [
-        media.c.reviewed == True,
-        media.c.encoded == True,
-        media.c.publishable == True,
-        media.c.publish_on <= sql.func.current_timestamp(),
-        sql.or_(
-            media.c.publish_until == None,
-            media.c.publish_until >= sql.func.current_timestamp(),
-        ),
-    ]),
+    _mtm_count_property('media_count_published', media_categories,
+        media_published_clauses()),
 ))
+
+def preload_relations(media_list, files=False, tags=False, categories=False,
+                      podcast=False):
+    """Load the given relations for many media items at once.
+
+    Accessing a relation of a list of media usually triggers one query per
+    media item. This function instead loads each requested relation for
+    all items with a single IN-query and populates the relations without
+    marking the media as modified.
+
+    :param media_list: :class:`Media` instances (or any iterable of them).
+    :returns: The media as a list.
+    """
+    media_list = list(media_list)
+    media_by_id = dict((m.id, m) for m in media_list)
+    if not media_by_id:
+        return media_list
+    media_ids = media_by_id.keys()
+
+    def _populate(key, rows):
+        grouped = dict((media_id, []) for media_id in media_ids)
+        for media_id, item in rows:
+            grouped[media_id].append(item)
+        for media_id, items in grouped.iteritems():
+            attributes.set_committed_value(media_by_id[media_id], key, items)
+
+    if files:
+        files_query = MediaFile.query\
+            .filter(MediaFile.media_id.in_(media_ids))\
+            .order_by(media_files.c.type.asc())
+        _populate('files', ((f.media_id, f) for f in files_query))
+    if tags:
+        _populate('tags', DBSession.query(media_tags.c.media_id, Tag)\
+            .filter(media_tags.c.tag_id == Tag.id)\
+            .filter(media_tags.c.media_id.in_(media_ids)))
+    if categories:
+        _populate('categories', DBSession.query(media_categories.c.media_id, Category)\
+            .filter(media_categories.c.category_id == Category.id)\
+            .filter(media_categories.c.media_id.in_(media_ids)))
+    if podcast:
+        from mediadrop.model.podcasts import Podcast
+        podcast_ids = set(m.podcast_id for m in media_list if m.podcast_id)
+        podcasts = {}
+        if podcast_ids:
+            podcasts = dict((p.id, p) for p in
+                Podcast.query.filter(Podcast.id.in_(list(podcast_ids))))
+        for m in media_list:
+            attributes.set_committed_value(m, 'podcast',
+                podcasts.get(m.podcast_id))
+    return media_list
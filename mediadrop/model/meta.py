@@ -9,6 +9,8 @@
 from sqlalchemy import MetaData
 from sqlalchemy.orm import scoped_session, sessionmaker
 
+from mediadrop.lib.transactions import track_changes
+
 __all__ = [
     'DBSession',
     'metadata',
@@ -18,5 +20,6 @@ __all__ = [
 # DBSession() returns the session object appropriate for the current request.
 maker = sessionmaker()
 DBSession = scoped_session(maker)
+track_changes(DBSession)
 
 metadata = MetaData()
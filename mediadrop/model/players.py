@@ -23,8 +23,10 @@ from sqlalchemy.types import Boolean, DateTime, Integer, Unicode
 from mediadrop.lib.decorators import memoize
 from mediadrop.lib.i18n import _
 from mediadrop.lib.players import AbstractPlayer
+from mediadrop.lib.registry import invalidate_registry, registry
 from mediadrop.model.meta import DBSession, metadata
 from mediadrop.model.util import JSONType
+from mediadrop.plugin import events
 
 log = logging.getLogger(__name__)
 
@@ -117,6 +119,7 @@ mapper(
         players.c.priority,
         players.c.id.desc(),
     ),
+    extension=events.MapperObserver(events.PlayerPrefs),
 )
 
 def fetch_enabled_players():
@@ -126,11 +129,22 @@ def fetch_enabled_players():
     one of the classes that are currently registered. A warning will also
     be raised if there are no players configured/enabled.
 
+    The result is kept per process until the players are changed, see
+    :mod:`mediadrop.lib.registry`.
+
     :rtype: list of tuples
     :returns: :class:`~mediadrop.lib.players.AbstractPlayer` subclasses
         and the configured data associated with them.
 
     """
+    return list(registry('players', load_enabled_players, tags=['players']))
+
+def invalidate_enabled_players():
+    """Reload the enabled players on next access (in all processes)."""
+    invalidate_registry('players', tags=['players'])
+
+def load_enabled_players():
+    """Query the enabled players, see :func:`fetch_enabled_players`."""
     player_classes = dict((p.name, p) for p in AbstractPlayer)
     query = sql.select((players.c.name, players.c.data))\
         .where(players.c.enabled == True)\
@@ -197,3 +211,5 @@ def cleanup_players_table(enabled=False):
                 data=player_cls.default_data,
                 priority=priority,
             ))
+
+    invalidate_enabled_players()
@@ -100,6 +100,22 @@ class Podcast(object):
     def __repr__(self):
         return '<Podcast: %r>' % self.slug
 
+    @classmethod
+    def example(cls, **kwargs):
+        podcast = Podcast()
+        defaults = dict(
+            title=u'Foo Podcast',
+            author=Author(u'Joe', u'joe@site.example'),
+        )
+        defaults.update(kwargs)
+        defaults.setdefault('slug', get_available_slug(Podcast, defaults['title']))
+        for key, value in defaults.items():
+            assert hasattr(podcast, key)
+            setattr(podcast, key, value)
+        DBSession.add(podcast)
+        DBSession.flush()
+        return podcast
+
     @validates('slug')
     def validate_slug(self, key, slug):
         return slugify(slug)
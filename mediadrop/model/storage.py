@@ -17,6 +17,7 @@ from mediadrop.lib.storage import StorageEngine
 from mediadrop.model.media import MediaFile, MediaFileQuery, media_files
 from mediadrop.model.meta import metadata
 from mediadrop.model.util import JSONType
+from mediadrop.plugin import events
 
 log = logging.getLogger(__name__)
 
@@ -36,6 +37,7 @@ storage = Table('storage', metadata,
 storage_mapper = mapper(
     StorageEngine, storage,
     polymorphic_on=storage.c.engine_type,
+    extension=events.MapperObserver(events.StorageEngine),
     properties={
         '_data': storage.c.data,
 
@@ -28,6 +28,9 @@ tags = Table('tags', metadata,
     Column('id', Integer, autoincrement=True, primary_key=True),
     Column('name', Unicode(50), unique=True, nullable=False),
     Column('slug', Unicode(SLUG_LENGTH), unique=True, nullable=False),
+    # see mediadrop.model.counters
+    Column('media_count_cached', Integer, default=0, nullable=False),
+    Column('media_count_published_cached', Integer, default=0, nullable=False),
     mysql_engine='InnoDB',
     mysql_charset='utf8'
 )
@@ -81,7 +84,8 @@ class TagList(list):
     def __unicode__(self):
         return ', '.join([tag.name for tag in self.values()])
 
-mapper(Tag, tags, order_by=tags.c.name, extension=events.MapperObserver(events.Tag))
+mapper(Tag, tags, order_by=tags.c.name, extension=events.MapperObserver(events.Tag),
+    exclude_properties=['media_count_cached', 'media_count_published_cached'])
 
 excess_whitespace = re.compile('\s\s+', re.M)
 
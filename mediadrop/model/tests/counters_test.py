@@ -0,0 +1,132 @@
+# This file is a part of MediaDrop (http://www.mediadrop.net),
+# Copyright 2009-2015 MediaDrop contributors
+# For the exact contribution history, see the git revision log.
+# The source code contained in this file is licensed under the GPLv3 or
+# (at your option) any later version.
+# See LICENSE.txt in the main project directory, for more information.
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import sql
+
+from mediadrop.lib.test.db_testcase import DBTestCase
+from mediadrop.lib.test.pythonic_testcase import *
+from mediadrop.model import (AuthorWithIP, Category, Comment, DBSession,
+    Media, Tag, reconcile_counters, use_materialized_counters)
+from mediadrop.model.categories import categories
+from mediadrop.model.media import media
+from mediadrop.model.tags import tags
+
+
+class CountersTest(DBTestCase):
+    def setUp(self):
+        super(CountersTest, self).setUp()
+        self.tag = Tag(u'foo')
+        self.category = Category.example(name=u'Bar')
+        DBSession.add(self.tag)
+        self.media = Media.example(reviewed=True, encoded=True,
+            publishable=True, publish_on=datetime.now() - timedelta(days=1))
+        self.media.tags.append(self.tag)
+        self.media.categories.append(self.category)
+        DBSession.commit()
+
+    def _stored(self, column, id):
+        select = sql.select([column], column.table.c.id == id)
+        return DBSession.execute(select).scalar()
+
+    def _tag_counts(self):
+        return (self._stored(tags.c.media_count_cached, self.tag.id),
+                self._stored(tags.c.media_count_published_cached, self.tag.id))
+
+    def _category_counts(self):
+        return (self._stored(categories.c.media_count_cached, self.category.id),
+                self._stored(categories.c.media_count_published_cached,
+                             self.category.id))
+
+    def _comment_counts(self, media_):
+        return (self._stored(media.c.comment_count_cached, media_.id),
+                self._stored(media.c.comment_count_published_cached, media_.id))
+
+    def _add_comment(self, media_, publishable=True):
+        comment = Comment()
+        comment.author = AuthorWithIP(u'Jane', u'jane@site.example', u'127.0.0.1')
+        comment.subject = u'Re: %s' % media_.title
+        comment.body = u'Nice one'
+        comment.media = media_
+        comment.publishable = publishable
+        DBSession.add(comment)
+        DBSession.commit()
+        return comment
+
+    def test_counts_media_of_tags_and_categories(self):
+        assert_equals((1, 1), self._tag_counts())
+        assert_equals((1, 1), self._category_counts())
+
+        self.media.publishable = False
+        DBSession.commit()
+        assert_equals((1, 0), self._tag_counts())
+        assert_equals((1, 0), self._category_counts())
+
+        self.media.tags.remove(self.tag)
+        DBSession.commit()
+        assert_equals((0, 0), self._tag_counts())
+        assert_equals((1, 0), self._category_counts())
+
+    def test_counts_deleted_media(self):
+        DBSession.delete(self.media)
+        DBSession.commit()
+        assert_equals((0, 0), self._tag_counts())
+        assert_equals((0, 0), self._category_counts())
+
+    def test_counts_comments(self):
+        comment = self._add_comment(self.media)
+        self._add_comment(self.media, publishable=False)
+        assert_equals((2, 1), self._comment_counts(self.media))
+
+        comment.publishable = False
+        DBSession.commit()
+        assert_equals((2, 0), self._comment_counts(self.media))
+
+        DBSession.delete(comment)
+        DBSession.commit()
+        assert_equals((1, 0), self._comment_counts(self.media))
+
+    def test_does_not_change_modification_date(self):
+        modified_on = self._stored(media.c.modified_on, self.media.id)
+        self._add_comment(self.media)
+        assert_equals(modified_on, self._stored(media.c.modified_on, self.media.id))
+
+    def test_can_reconcile_counters(self):
+        DBSession.execute(tags.update().values(media_count_cached=42))
+        DBSession.execute(media.update().values(comment_count_published_cached=7))
+        reconcile_counters()
+        DBSession.commit()
+        assert_equals((1, 1), self._tag_counts())
+        assert_equals((0, 0), self._comment_counts(self.media))
+
+    def test_can_map_properties_to_stored_counters(self):
+        self._add_comment(self.media)
+        DBSession.execute(tags.update().values(media_count_published_cached=42))
+        DBSession.commit()
+        # the instances are detached below
+        tag_id, media_id = self.tag.id, self.media.id
+        use_materialized_counters()
+        try:
+            DBSession.expunge_all()
+            tag = Tag.query.get(tag_id)
+            assert_equals(42, tag.media_count_published)
+            assert_equals(1, Media.query.get(media_id).comment_count)
+        finally:
+            use_materialized_counters(False)
+        DBSession.expunge_all()
+        assert_equals(1, Tag.query.get(tag_id).media_count_published)
+
+
+import unittest
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(CountersTest))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -174,6 +174,7 @@ class Admin(object):
         edit = Event(['**kwargs'])
         save = Event(['**kwargs'])
         add_file = Event(['**kwargs'])
+        upload_chunk = Event(['**kwargs'])
         edit_file = Event(['**kwargs'])
         merge_stubs = Event(['**kwargs'])
         save_thumb = Event(['**kwargs'])
@@ -305,6 +306,7 @@ class UploadController(object):
     index = Event(['**kwargs'])
     submit = Event(['**kwargs'])
     submit_async = Event(['**kwargs'])
+    chunk = Event(['**kwargs'])
     success = Event(['**kwargs'])
     failure = Event(['**kwargs'])
 
@@ -379,6 +381,22 @@ class MultiSetting(object):
     before_update = Event(['instance'])
     after_update = Event(['instance'])
 
+class PlayerPrefs(object):
+    before_delete = Event(['instance'])
+    after_delete = Event(['instance'])
+    before_insert = Event(['instance'])
+    after_insert = Event(['instance'])
+    before_update = Event(['instance'])
+    after_update = Event(['instance'])
+
+class StorageEngine(object):
+    before_delete = Event(['instance'])
+    after_delete = Event(['instance'])
+    before_insert = Event(['instance'])
+    after_insert = Event(['instance'])
+    before_update = Event(['instance'])
+    after_update = Event(['instance'])
+
 class User(object):
     before_delete = Event(['instance'])
     after_delete = Event(['instance'])
@@ -387,6 +405,22 @@ class User(object):
     before_update = Event(['instance'])
     after_update = Event(['instance'])
 
+class Group(object):
+    before_delete = Event(['instance'])
+    after_delete = Event(['instance'])
+    before_insert = Event(['instance'])
+    after_insert = Event(['instance'])
+    before_update = Event(['instance'])
+    after_update = Event(['instance'])
+
+class Permission(object):
+    before_delete = Event(['instance'])
+    after_delete = Event(['instance'])
+    before_insert = Event(['instance'])
+    after_insert = Event(['instance'])
+    before_update = Event(['instance'])
+    after_update = Event(['instance'])
+
 ###############################################################################
 # Forms
 